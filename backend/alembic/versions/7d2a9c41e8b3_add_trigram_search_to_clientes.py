@@ -0,0 +1,62 @@
+"""Add trigram search indexes and telefone_normalizado to clientes
+
+Revision ID: 7d2a9c41e8b3
+Revises: 5be6e2f3794a
+Create Date: 2026-10-19 09:12:31.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2a9c41e8b3'
+down_revision: Union[str, Sequence[str], None] = '5be6e2f3794a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Extensões: pg_trgm (ilike '%termo%' e similaridade) e btree_gin
+    #    (estabelecimento_id no mesmo índice GIN, filtrando o tenant no índice)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+
+    # 2. Telefone só com dígitos, mantido pelo ClienteService
+    op.add_column('clientes', sa.Column('telefone_normalizado', sa.String(length=20), nullable=True))
+    op.execute("""
+        UPDATE clientes
+        SET telefone_normalizado = regexp_replace(telefone, '\\D', '', 'g')
+    """)
+
+    # 3. Índices GIN trigram por estabelecimento
+    op.execute("""
+        CREATE INDEX ix_clientes_nome_trgm
+        ON clientes USING gin (estabelecimento_id, nome gin_trgm_ops)
+    """)
+    op.execute("""
+        CREATE INDEX ix_clientes_email_trgm
+        ON clientes USING gin (estabelecimento_id, email gin_trgm_ops)
+    """)
+    op.execute("""
+        CREATE INDEX ix_clientes_telefone_normalizado_trgm
+        ON clientes USING gin (estabelecimento_id, telefone_normalizado gin_trgm_ops)
+    """)
+
+    # 4. Listagem ordenada por nome e busca por prefixo (termos curtos)
+    op.create_index(
+        'ix_clientes_estabelecimento_nome', 'clientes', ['estabelecimento_id', 'nome'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_clientes_estabelecimento_nome', table_name='clientes')
+    op.execute("DROP INDEX IF EXISTS ix_clientes_telefone_normalizado_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_clientes_email_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_clientes_nome_trgm")
+    op.drop_column('clientes', 'telefone_normalizado')
+    # As extensões ficam instaladas (podem estar em uso por outros objetos)
@@ -0,0 +1,71 @@
+"""Add partial unique indexes for cpf, telefone and email per estabelecimento
+
+Revision ID: a4e8f2b6c913
+Revises: 7d2a9c41e8b3
+Create Date: 2026-10-19 10:03:47.215934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e8f2b6c913'
+down_revision: Union[str, Sequence[str], None] = '7d2a9c41e8b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (nome do índice, coluna)
+UNIQUE_INDEXES = [
+    ('uq_clientes_estabelecimento_cpf', 'cpf'),
+    ('uq_clientes_estabelecimento_telefone', 'telefone_normalizado'),
+    ('uq_clientes_estabelecimento_email', 'email'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+
+    # 1. Verificar duplicados antes de criar os índices (a migration falharia no meio)
+    duplicados = []
+    for _, coluna in UNIQUE_INDEXES:
+        rows = bind.execute(sa.text(f"""
+            SELECT estabelecimento_id, {coluna} AS valor, count(*) AS total
+            FROM clientes
+            WHERE {coluna} IS NOT NULL AND {coluna} <> ''
+            GROUP BY estabelecimento_id, {coluna}
+            HAVING count(*) > 1
+            ORDER BY total DESC
+            LIMIT 20
+        """)).fetchall()
+        duplicados.extend(f"{coluna}={row.valor} (estabelecimento {row.estabelecimento_id}, {row.total}x)" for row in rows)
+
+    if duplicados:
+        raise RuntimeError(
+            "Clientes duplicados impedem a criação dos índices únicos. "
+            "Unifique ou corrija os registros antes de migrar:\n  " + "\n  ".join(duplicados) + "\n"
+            "Para unificar (mantém o cadastro mais antigo e move agendamentos/resgates/pontos):\n"
+            "  python unificar_clientes_duplicados.py            # lista os grupos\n"
+            "  python unificar_clientes_duplicados.py --aplicar\n"
+            "Para conferir manualmente (troque a coluna por cpf ou email):\n"
+            "  SELECT estabelecimento_id, telefone_normalizado, array_agg(id ORDER BY id), array_agg(telefone ORDER BY id)\n"
+            "  FROM clientes WHERE telefone_normalizado <> ''\n"
+            "  GROUP BY 1, 2 HAVING count(*) > 1;"
+        )
+
+    # 2. Índices únicos parciais (valores nulos/vazios não conflitam)
+    for nome, coluna in UNIQUE_INDEXES:
+        op.create_index(
+            nome, 'clientes', ['estabelecimento_id', coluna], unique=True,
+            postgresql_where=sa.text(f"{coluna} IS NOT NULL AND {coluna} <> ''")
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for nome, _ in reversed(UNIQUE_INDEXES):
+        op.drop_index(nome, table_name='clientes')
@@ -0,0 +1,66 @@
+"""Add transacoes_pontos (loyalty points ledger)
+
+Revision ID: a7d3e9c1b5f4
+Revises: f5c1a7e3d9b2
+Create Date: 2026-10-19 23:41:12.508316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e9c1b5f4'
+down_revision: Union[str, Sequence[str], None] = 'f5c1a7e3d9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'transacoes_pontos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cliente_id', sa.Integer(), nullable=False),
+        sa.Column('estabelecimento_id', sa.Integer(), nullable=True),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('pontos', sa.Integer(), nullable=False),
+        sa.Column('agendamento_id', sa.Integer(), nullable=True),
+        sa.Column('resgate_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['cliente_id'], ['clientes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['estabelecimento_id'], ['estabelecimentos.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['agendamento_id'], ['agendamentos.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['resgate_id'], ['resgates_premios.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_transacoes_pontos_id'), 'transacoes_pontos', ['id'], unique=False)
+    op.create_index(op.f('ix_transacoes_pontos_cliente_id'), 'transacoes_pontos', ['cliente_id'], unique=False)
+    # Crédito idempotente: um lançamento por origem e tipo
+    op.create_index(
+        'uq_transacoes_pontos_agendamento_tipo', 'transacoes_pontos', ['agendamento_id', 'tipo'], unique=True,
+        postgresql_where=sa.text("agendamento_id IS NOT NULL")
+    )
+    op.create_index(
+        'uq_transacoes_pontos_resgate_tipo', 'transacoes_pontos', ['resgate_id', 'tipo'], unique=True,
+        postgresql_where=sa.text("resgate_id IS NOT NULL")
+    )
+
+    # Saldo atual vira o lançamento inicial de cada cliente: extrato e saldo começam batendo
+    op.execute("""
+        INSERT INTO transacoes_pontos (cliente_id, estabelecimento_id, tipo, pontos)
+        SELECT id, estabelecimento_id, 'SALDO_INICIAL', pontos
+        FROM clientes
+        WHERE pontos <> 0
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_transacoes_pontos_resgate_tipo', table_name='transacoes_pontos')
+    op.drop_index('uq_transacoes_pontos_agendamento_tipo', table_name='transacoes_pontos')
+    op.drop_index(op.f('ix_transacoes_pontos_cliente_id'), table_name='transacoes_pontos')
+    op.drop_index(op.f('ix_transacoes_pontos_id'), table_name='transacoes_pontos')
+    op.drop_table('transacoes_pontos')
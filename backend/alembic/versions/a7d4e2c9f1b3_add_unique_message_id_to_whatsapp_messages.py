@@ -0,0 +1,53 @@
+"""Add unique (estabelecimento_id, message_id) to whatsapp_messages
+
+Revision ID: a7d4e2c9f1b3
+Revises: f3c8a1d6b4e9
+Create Date: 2026-10-19 16:02:44.718305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4e2c9f1b3'
+down_revision: Union[str, Sequence[str], None] = 'f3c8a1d6b4e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Mensagens duplicadas: mantém a primeira linha com o ack mais avançado
+    op.execute("""
+        WITH ranking AS (
+            SELECT id,
+                   first_value(id) OVER w AS manter,
+                   max(array_position(
+                       ARRAY['error', 'pending', 'server', 'delivery', 'read', 'played']::text[], ack_status::text
+                   )) OVER (PARTITION BY estabelecimento_id, message_id) AS ack_posicao
+            FROM whatsapp_messages
+            WINDOW w AS (PARTITION BY estabelecimento_id, message_id ORDER BY id)
+        ),
+        atualizados AS (
+            UPDATE whatsapp_messages m
+            SET ack_status = (ARRAY['error', 'pending', 'server', 'delivery', 'read', 'played'])[r.ack_posicao]
+            FROM ranking r
+            WHERE m.id = r.id AND r.id = r.manter AND r.ack_posicao IS NOT NULL
+        )
+        DELETE FROM whatsapp_messages m
+        USING ranking r
+        WHERE m.id = r.id AND r.id <> r.manter
+    """)
+
+    # 2. Constraint usada pelo upsert da ingestão do webhook
+    op.create_unique_constraint(
+        'uq_whatsapp_messages_estabelecimento_message', 'whatsapp_messages', ['estabelecimento_id', 'message_id']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_whatsapp_messages_estabelecimento_message', 'whatsapp_messages', type_='unique')
@@ -0,0 +1,49 @@
+"""Add indexes for loyalty points recalculation
+
+Revision ID: b4e8f2a6c0d7
+Revises: a7d3e9c1b5f4
+Create Date: 2026-10-20 00:27:40.116902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e8f2a6c0d7'
+down_revision: Union[str, Sequence[str], None] = 'a7d3e9c1b5f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Crédito continua único por agendamento; recálculos (RECALCULO) podem se repetir
+    op.drop_index('uq_transacoes_pontos_agendamento_tipo', table_name='transacoes_pontos')
+    op.create_index(
+        'uq_transacoes_pontos_agendamento_credito', 'transacoes_pontos', ['agendamento_id'], unique=True,
+        postgresql_where=sa.text("agendamento_id IS NOT NULL AND tipo = 'CREDITO'")
+    )
+    op.create_index(
+        'ix_transacoes_pontos_agendamento_id', 'transacoes_pontos', ['agendamento_id'], unique=False,
+        postgresql_where=sa.text("agendamento_id IS NOT NULL")
+    )
+
+    # Recálculo: agendamentos concluídos do estabelecimento, em lotes por id
+    op.create_index(
+        'ix_agendamentos_concluidos_estabelecimento', 'agendamentos', ['estabelecimento_id', 'id'], unique=False,
+        postgresql_where=sa.text("status = 'CONCLUIDO' AND deleted_at IS NULL")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_agendamentos_concluidos_estabelecimento', table_name='agendamentos')
+    op.drop_index('ix_transacoes_pontos_agendamento_id', table_name='transacoes_pontos')
+    op.drop_index('uq_transacoes_pontos_agendamento_credito', table_name='transacoes_pontos')
+    op.create_index(
+        'uq_transacoes_pontos_agendamento_tipo', 'transacoes_pontos', ['agendamento_id', 'tipo'], unique=True,
+        postgresql_where=sa.text("agendamento_id IS NOT NULL")
+    )
@@ -0,0 +1,162 @@
+"""Partition whatsapp_messages by month, JSONB payloads and retention per estabelecimento
+
+Revision ID: b9e3f5a2c8d1
+Revises: a7d4e2c9f1b3
+Create Date: 2026-10-19 17:10:52.384106
+
+"""
+from typing import Sequence, Union
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9e3f5a2c8d1'
+down_revision: Union[str, Sequence[str], None] = 'a7d4e2c9f1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Partições criadas na migração: histórico existente (mínimo 12 meses) até 3 meses à frente
+MESES_ATRAS = 12
+MESES_A_FRENTE = 3
+
+COLUNAS = """
+    message_id, session_name, from_number, to_number, from_me, body, has_media, media_url,
+    event_type, message_timestamp, ack_status, estabelecimento_id, created_at
+"""
+
+
+def _somar_meses(dia: date, meses: int) -> date:
+    total = dia.year * 12 + dia.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+
+    # 1. Retenção configurável por estabelecimento (NULL = padrão da aplicação)
+    op.add_column('whatsapp_configs', sa.Column('retencao_mensagens_meses', sa.Integer(), nullable=True))
+
+    # 2. Tabela atual vira legado (índices liberam os nomes para a nova tabela)
+    op.execute("ALTER TABLE whatsapp_messages RENAME TO whatsapp_messages_legado")
+    op.execute("ALTER TABLE whatsapp_messages_legado DROP CONSTRAINT uq_whatsapp_messages_estabelecimento_message")
+    op.execute("ALTER TABLE whatsapp_messages_legado DROP CONSTRAINT whatsapp_messages_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_whatsapp_messages_id")
+    op.execute("DROP INDEX IF EXISTS ix_whatsapp_messages_message_id")
+    op.execute("DROP INDEX IF EXISTS ix_whatsapp_messages_from_number")
+
+    # 3. Tabela particionada por mês (a chave de partição entra na PK e na unique)
+    op.execute("""
+        CREATE TABLE whatsapp_messages (
+            id integer NOT NULL DEFAULT nextval('whatsapp_messages_id_seq'),
+            message_id varchar(255) NOT NULL,
+            session_name varchar(100) NOT NULL,
+            from_number varchar(50) NOT NULL,
+            to_number varchar(50),
+            from_me boolean DEFAULT false,
+            body text,
+            has_media boolean DEFAULT false,
+            media_url varchar(1000),
+            event_type varchar(50) NOT NULL,
+            message_timestamp timestamptz NOT NULL,
+            ack_status varchar(20),
+            payload_json jsonb,
+            estabelecimento_id integer NOT NULL,
+            created_at timestamptz DEFAULT now(),
+            CONSTRAINT whatsapp_messages_estabelecimento_id_fkey FOREIGN KEY (estabelecimento_id)
+                REFERENCES estabelecimentos(id) ON DELETE CASCADE,
+            CONSTRAINT whatsapp_messages_pkey PRIMARY KEY (id, message_timestamp),
+            CONSTRAINT uq_whatsapp_messages_estabelecimento_message
+                UNIQUE (estabelecimento_id, message_id, message_timestamp)
+        ) PARTITION BY RANGE (message_timestamp)
+    """)
+    op.execute("ALTER SEQUENCE whatsapp_messages_id_seq OWNED BY whatsapp_messages.id")
+
+    # 4. Índices dos acessos reais (estatísticas por período e conversa por número)
+    op.create_index(
+        'ix_whatsapp_messages_estabelecimento_timestamp', 'whatsapp_messages',
+        ['estabelecimento_id', 'message_timestamp']
+    )
+    op.create_index(
+        'ix_whatsapp_messages_estabelecimento_from_timestamp', 'whatsapp_messages',
+        ['estabelecimento_id', 'from_number', 'message_timestamp']
+    )
+
+    # 5. Partições mensais em UTC + default (timestamps fora das partições existentes)
+    primeiro = bind.execute(sa.text("SELECT min(message_timestamp)::date FROM whatsapp_messages_legado")).scalar()
+    hoje = date.today().replace(day=1)
+    inicio = _somar_meses(hoje, -MESES_ATRAS)
+    if primeiro and primeiro < inicio:
+        inicio = primeiro.replace(day=1)
+
+    mes = inicio
+    while mes <= _somar_meses(hoje, MESES_A_FRENTE):
+        proximo = _somar_meses(mes, 1)
+        op.execute(f"""
+            CREATE TABLE whatsapp_messages_{mes.year:04d}_{mes.month:02d}
+            PARTITION OF whatsapp_messages
+            FOR VALUES FROM ('{mes.isoformat()} 00:00:00+00') TO ('{proximo.isoformat()} 00:00:00+00')
+        """)
+        mes = proximo
+    op.execute("CREATE TABLE whatsapp_messages_default PARTITION OF whatsapp_messages DEFAULT")
+
+    # 6. Copia os dados com o payload compacto (sem _data/environment e sem mídia em base64)
+    op.execute(f"""
+        INSERT INTO whatsapp_messages (id, {COLUNAS}, payload_json)
+        SELECT id, {COLUNAS},
+               (payload_json::jsonb - 'environment') #- '{{payload,_data}}' #- '{{payload,media,data}}'
+        FROM whatsapp_messages_legado
+    """)
+    op.execute("DROP TABLE whatsapp_messages_legado")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE whatsapp_messages RENAME TO whatsapp_messages_particionada")
+    op.execute("ALTER TABLE whatsapp_messages_particionada DROP CONSTRAINT uq_whatsapp_messages_estabelecimento_message")
+    op.execute("ALTER TABLE whatsapp_messages_particionada DROP CONSTRAINT whatsapp_messages_pkey")
+    op.drop_index('ix_whatsapp_messages_estabelecimento_from_timestamp', table_name='whatsapp_messages_particionada')
+    op.drop_index('ix_whatsapp_messages_estabelecimento_timestamp', table_name='whatsapp_messages_particionada')
+
+    op.execute("""
+        CREATE TABLE whatsapp_messages (
+            id integer NOT NULL DEFAULT nextval('whatsapp_messages_id_seq') PRIMARY KEY,
+            message_id varchar(255) NOT NULL,
+            session_name varchar(100) NOT NULL,
+            from_number varchar(50) NOT NULL,
+            to_number varchar(50),
+            from_me boolean DEFAULT false,
+            body text,
+            has_media boolean DEFAULT false,
+            media_url varchar(1000),
+            event_type varchar(50) NOT NULL,
+            message_timestamp timestamptz NOT NULL,
+            ack_status varchar(20),
+            payload_json json,
+            estabelecimento_id integer NOT NULL
+                REFERENCES estabelecimentos(id) ON DELETE CASCADE,
+            created_at timestamptz DEFAULT now()
+        )
+    """)
+    op.execute("ALTER SEQUENCE whatsapp_messages_id_seq OWNED BY whatsapp_messages.id")
+    op.create_index('ix_whatsapp_messages_id', 'whatsapp_messages', ['id'])
+    op.create_index('ix_whatsapp_messages_message_id', 'whatsapp_messages', ['message_id'])
+    op.create_index('ix_whatsapp_messages_from_number', 'whatsapp_messages', ['from_number'])
+
+    # Na tabela sem partição a unique volta a ser por mensagem: mantém a primeira linha
+    op.execute(f"""
+        INSERT INTO whatsapp_messages (id, {COLUNAS}, payload_json)
+        SELECT DISTINCT ON (estabelecimento_id, message_id) id, {COLUNAS}, payload_json::json
+        FROM whatsapp_messages_particionada
+        ORDER BY estabelecimento_id, message_id, id
+    """)
+    op.create_unique_constraint(
+        'uq_whatsapp_messages_estabelecimento_message', 'whatsapp_messages', ['estabelecimento_id', 'message_id']
+    )
+    op.execute("DROP TABLE whatsapp_messages_particionada")
+
+    op.drop_column('whatsapp_configs', 'retencao_mensagens_meses')
@@ -0,0 +1,77 @@
+"""Add denormalized stats to clientes (visitas, gasto, faltas, ultimo servico)
+
+Revision ID: c2f7a8d4e1b5
+Revises: a4e8f2b6c913
+Create Date: 2026-10-19 11:26:05.774310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f7a8d4e1b5'
+down_revision: Union[str, Sequence[str], None] = 'a4e8f2b6c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Colunas de estatísticas (last_visit já existe, mas nunca era preenchida)
+    op.add_column('clientes', sa.Column('total_visitas', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('clientes', sa.Column('total_gasto', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'))
+    op.add_column('clientes', sa.Column('total_faltas', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('clientes', sa.Column('ultimo_servico_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'clientes_ultimo_servico_id_fkey', 'clientes', 'servicos',
+        ['ultimo_servico_id'], ['id'], ondelete='SET NULL'
+    )
+
+    # 2. Histórico por cliente (recálculo das estatísticas e GET /clientes/{id}/agendamentos)
+    op.create_index(
+        'ix_agendamentos_cliente_id_data_inicio', 'agendamentos', ['cliente_id', 'data_inicio'], unique=False
+    )
+
+    # 3. Listagem/filtro por recência dentro do estabelecimento
+    op.create_index(
+        'ix_clientes_estabelecimento_last_visit', 'clientes',
+        ['estabelecimento_id', sa.text('last_visit DESC NULLS LAST')], unique=False
+    )
+
+    # 4. Backfill a partir do histórico de agendamentos
+    #    (para recalcular depois: python backfill_cliente_stats.py)
+    op.execute("""
+        UPDATE clientes c
+        SET total_visitas = s.total_visitas,
+            total_gasto = coalesce(s.total_gasto, 0),
+            total_faltas = s.total_faltas,
+            last_visit = s.last_visit,
+            ultimo_servico_id = s.ultimo_servico_id
+        FROM (
+            SELECT cliente_id,
+                   count(*) FILTER (WHERE status = 'CONCLUIDO') AS total_visitas,
+                   sum(valor_final) FILTER (WHERE status = 'CONCLUIDO') AS total_gasto,
+                   count(*) FILTER (WHERE status = 'NAO_COMPARECEU') AS total_faltas,
+                   max(data_inicio) FILTER (WHERE status = 'CONCLUIDO') AS last_visit,
+                   (array_agg(servico_id ORDER BY data_inicio DESC)
+                       FILTER (WHERE status = 'CONCLUIDO'))[1] AS ultimo_servico_id
+            FROM agendamentos
+            WHERE deleted_at IS NULL
+            GROUP BY cliente_id
+        ) s
+        WHERE c.id = s.cliente_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_clientes_estabelecimento_last_visit', table_name='clientes')
+    op.drop_index('ix_agendamentos_cliente_id_data_inicio', table_name='agendamentos')
+    op.drop_constraint('clientes_ultimo_servico_id_fkey', 'clientes', type_='foreignkey')
+    op.drop_column('clientes', 'ultimo_servico_id')
+    op.drop_column('clientes', 'total_faltas')
+    op.drop_column('clientes', 'total_gasto')
+    op.drop_column('clientes', 'total_visitas')
@@ -0,0 +1,110 @@
+"""Add whatsapp_mensagens_diarias rollup maintained by triggers on whatsapp_messages
+
+Revision ID: c4f8b2d6e9a1
+Revises: b9e3f5a2c8d1
+Create Date: 2026-10-19 18:42:17.903511
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f8b2d6e9a1'
+down_revision: Union[str, Sequence[str], None] = 'b9e3f5a2c8d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Contribuição de um conjunto de linhas (com coluna sinal: +1 entra, -1 sai) para o resumo
+AGREGAR_SQL = """
+    INSERT INTO whatsapp_mensagens_diarias AS d (
+        estabelecimento_id, dia, enviadas, recebidas, entregues, lidas, falhas
+    )
+    SELECT estabelecimento_id,
+           (message_timestamp AT TIME ZONE 'America/Sao_Paulo')::date,
+           coalesce(sum(sinal) FILTER (WHERE event_type <> 'message.ack' AND from_me), 0),
+           coalesce(sum(sinal) FILTER (WHERE event_type <> 'message.ack' AND NOT coalesce(from_me, false)), 0),
+           coalesce(sum(sinal) FILTER (WHERE ack_status IN ('delivery', 'read', 'played')), 0),
+           coalesce(sum(sinal) FILTER (WHERE ack_status IN ('read', 'played')), 0),
+           coalesce(sum(sinal) FILTER (WHERE ack_status = 'error'), 0)
+    FROM ({linhas}) l
+    GROUP BY 1, 2
+    ON CONFLICT (estabelecimento_id, dia) DO UPDATE SET
+        enviadas = d.enviadas + EXCLUDED.enviadas,
+        recebidas = d.recebidas + EXCLUDED.recebidas,
+        entregues = d.entregues + EXCLUDED.entregues,
+        lidas = d.lidas + EXCLUDED.lidas,
+        falhas = d.falhas + EXCLUDED.falhas,
+        updated_at = now()
+"""
+
+COLUNAS = "estabelecimento_id, message_timestamp, event_type, from_me, ack_status"
+
+LINHAS_POR_OPERACAO = {
+    'INSERT': f"SELECT {COLUNAS}, 1 AS sinal FROM novas",
+    'UPDATE': f"SELECT {COLUNAS}, -1 AS sinal FROM antigas UNION ALL SELECT {COLUNAS}, 1 FROM novas",
+    'DELETE': f"SELECT {COLUNAS}, -1 AS sinal FROM antigas",
+}
+
+TRIGGERS = {
+    'INSERT': "REFERENCING NEW TABLE AS novas",
+    'UPDATE': "REFERENCING OLD TABLE AS antigas NEW TABLE AS novas",
+    'DELETE': "REFERENCING OLD TABLE AS antigas",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'whatsapp_mensagens_diarias',
+        sa.Column('estabelecimento_id', sa.Integer(), nullable=False),
+        sa.Column('dia', sa.Date(), nullable=False),
+        sa.Column('enviadas', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('recebidas', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('entregues', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('lidas', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('falhas', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['estabelecimento_id'], ['estabelecimentos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('estabelecimento_id', 'dia')
+    )
+
+    # Triggers por statement (transition tables): um upsert agregado por lote gravado.
+    # Statement triggers não disparam em DELETE direto numa partição, então a
+    # retenção e a movimentação de partições não alteram o resumo.
+    corpo = "\n".join(
+        f"    {'IF' if i == 0 else 'ELSIF'} TG_OP = '{operacao}' THEN\n"
+        + AGREGAR_SQL.format(linhas=linhas) + ";"
+        for i, (operacao, linhas) in enumerate(LINHAS_POR_OPERACAO.items())
+    )
+    op.execute(f"""
+        CREATE FUNCTION whatsapp_mensagens_diarias_atualizar() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+        {corpo}
+            END IF;
+            RETURN NULL;
+        END;
+        $$
+    """)
+    for operacao, referencias in TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER whatsapp_messages_resumo_{operacao.lower()}
+            AFTER {operacao} ON whatsapp_messages
+            {referencias}
+            FOR EACH STATEMENT EXECUTE FUNCTION whatsapp_mensagens_diarias_atualizar()
+        """)
+
+    # Backfill com as mensagens existentes
+    op.execute(AGREGAR_SQL.format(linhas=f"SELECT {COLUNAS}, 1 AS sinal FROM whatsapp_messages"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for operacao in TRIGGERS:
+        op.execute(f"DROP TRIGGER whatsapp_messages_resumo_{operacao.lower()} ON whatsapp_messages")
+    op.execute("DROP FUNCTION whatsapp_mensagens_diarias_atualizar()")
+    op.drop_table('whatsapp_mensagens_diarias')
@@ -0,0 +1,51 @@
+"""Add redemption expiry settings and reminder flag
+
+Revision ID: c9f1d5b3e7a2
+Revises: b4e8f2a6c0d7
+Create Date: 2026-10-20 01:12:58.340715
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f1d5b3e7a2'
+down_revision: Union[str, Sequence[str], None] = 'b4e8f2a6c0d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Colunas anuláveis sem default: só metadados, sem reescrever as tabelas
+    op.add_column('configuracao_fidelidade', sa.Column(
+        'dias_validade_resgate', sa.Integer(), nullable=True,
+        comment='Dias de validade dos resgates (vazio = não expiram)'
+    ))
+    op.add_column('premios', sa.Column(
+        'dias_validade', sa.Integer(), nullable=True,
+        comment='Dias de validade do resgate (vazio = padrão da configuração)'
+    ))
+    op.add_column('resgates_premios', sa.Column('aviso_expiracao_em', sa.DateTime(timezone=True), nullable=True))
+
+    # CONCURRENTLY: não bloqueia escrita em resgates_premios durante a criação
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_resgates_premios_disponiveis_expiracao', 'resgates_premios', ['data_expiracao'], unique=False,
+            postgresql_where=sa.text("status = 'DISPONIVEL' AND data_expiracao IS NOT NULL"),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_resgates_premios_disponiveis_expiracao', table_name='resgates_premios', postgresql_concurrently=True
+        )
+    op.drop_column('resgates_premios', 'aviso_expiracao_em')
+    op.drop_column('premios', 'dias_validade')
+    op.drop_column('configuracao_fidelidade', 'dias_validade_resgate')
@@ -0,0 +1,56 @@
+"""Add whatsapp_envios (outbound sends linked to WAHA acks)
+
+Revision ID: d7a3e9c1f5b8
+Revises: c4f8b2d6e9a1
+Create Date: 2026-10-19 19:27:40.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3e9c1f5b8'
+down_revision: Union[str, Sequence[str], None] = 'c4f8b2d6e9a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'whatsapp_envios',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('estabelecimento_id', sa.Integer(), nullable=False),
+        sa.Column('cliente_id', sa.Integer(), nullable=True),
+        sa.Column('agendamento_id', sa.Integer(), nullable=True),
+        sa.Column('tipo', sa.String(length=30), nullable=False),
+        sa.Column('message_id', sa.String(length=255), nullable=True),
+        sa.Column('erro', sa.String(length=500), nullable=True),
+        sa.Column('ack_status', sa.String(length=20), nullable=True),
+        sa.Column('enviado_em', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('servidor_em', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('entregue_em', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('lido_em', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('falha_em', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['estabelecimento_id'], ['estabelecimentos.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['cliente_id'], ['clientes.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['agendamento_id'], ['agendamentos.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_whatsapp_envios_id'), 'whatsapp_envios', ['id'], unique=False)
+    op.create_index('ix_whatsapp_envios_message_id', 'whatsapp_envios', ['message_id'], unique=False)
+    op.create_index(
+        'ix_whatsapp_envios_estabelecimento_enviado', 'whatsapp_envios',
+        ['estabelecimento_id', 'enviado_em'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_whatsapp_envios_estabelecimento_enviado', table_name='whatsapp_envios')
+    op.drop_index('ix_whatsapp_envios_message_id', table_name='whatsapp_envios')
+    op.drop_index(op.f('ix_whatsapp_envios_id'), table_name='whatsapp_envios')
+    op.drop_table('whatsapp_envios')
@@ -0,0 +1,78 @@
+"""Add clientes_inatividade index table and reciclagem_envios ledger
+
+Revision ID: d8b3e5f9a2c7
+Revises: c2f7a8d4e1b5
+Create Date: 2026-10-19 12:40:18.093561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b3e5f9a2c7'
+down_revision: Union[str, Sequence[str], None] = 'c2f7a8d4e1b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Último agendamento por cliente
+    op.create_table('clientes_inatividade',
+        sa.Column('cliente_id', sa.Integer(), nullable=False),
+        sa.Column('estabelecimento_id', sa.Integer(), nullable=False),
+        sa.Column('ultimo_agendamento', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('reciclagem_enviada_em', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('atualizado_em', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['cliente_id'], ['clientes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['estabelecimento_id'], ['estabelecimentos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('cliente_id')
+    )
+    # Listagem de inativos: faixa por estabelecimento
+    op.create_index(
+        'ix_clientes_inatividade_estabelecimento_ultimo', 'clientes_inatividade',
+        ['estabelecimento_id', 'ultimo_agendamento'], unique=False
+    )
+    # Cron de reciclagem: só os ainda não contatados no período
+    op.create_index(
+        'ix_clientes_inatividade_pendentes', 'clientes_inatividade',
+        ['estabelecimento_id', 'ultimo_agendamento'], unique=False,
+        postgresql_where=sa.text('reciclagem_enviada_em IS NULL')
+    )
+
+    # 2. Registro de envios de reciclagem (um por cliente por período)
+    op.create_table('reciclagem_envios',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cliente_id', sa.Integer(), nullable=False),
+        sa.Column('estabelecimento_id', sa.Integer(), nullable=False),
+        sa.Column('ultimo_agendamento', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('mensagem_id', sa.String(length=255), nullable=True),
+        sa.Column('enviado_em', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['cliente_id'], ['clientes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['estabelecimento_id'], ['estabelecimentos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('cliente_id', 'ultimo_agendamento', name='uq_reciclagem_envios_cliente_periodo')
+    )
+    op.create_index(op.f('ix_reciclagem_envios_id'), 'reciclagem_envios', ['id'], unique=False)
+
+    # 3. Carga inicial
+    op.execute("""
+        INSERT INTO clientes_inatividade (cliente_id, estabelecimento_id, ultimo_agendamento)
+        SELECT c.id, c.estabelecimento_id, max(a.data_inicio)
+        FROM agendamentos a
+        JOIN clientes c ON c.id = a.cliente_id
+        WHERE a.deleted_at IS NULL AND c.estabelecimento_id IS NOT NULL
+        GROUP BY c.id, c.estabelecimento_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_reciclagem_envios_id'), table_name='reciclagem_envios')
+    op.drop_table('reciclagem_envios')
+    op.drop_index('ix_clientes_inatividade_pendentes', table_name='clientes_inatividade')
+    op.drop_index('ix_clientes_inatividade_estabelecimento_ultimo', table_name='clientes_inatividade')
+    op.drop_table('clientes_inatividade')
@@ -0,0 +1,93 @@
+"""Add whatsapp_agendados (scheduled sends), post-service template and quiet hours
+
+Revision ID: e2b8d4f6a9c3
+Revises: d7a3e9c1f5b8
+Create Date: 2026-10-19 21:04:17.562310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b8d4f6a9c3'
+down_revision: Union[str, Sequence[str], None] = 'd7a3e9c1f5b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Configuração: pós-atendimento, antecedência do lembrete e horário de silêncio
+    op.add_column('whatsapp_configs', sa.Column('template_pos_atendimento', sa.Text(), nullable=True))
+    op.add_column('whatsapp_configs', sa.Column(
+        'enviar_pos_atendimento', sa.Boolean(), server_default=sa.text('false'), nullable=True
+    ))
+    op.add_column('whatsapp_configs', sa.Column(
+        'lembrete_horas_antes', sa.Integer(), server_default=sa.text('24'), nullable=True
+    ))
+    op.add_column('whatsapp_configs', sa.Column(
+        'pos_atendimento_horas', sa.Integer(), server_default=sa.text('2'), nullable=True
+    ))
+    op.add_column('whatsapp_configs', sa.Column('silencio_inicio', sa.Time(), nullable=True))
+    op.add_column('whatsapp_configs', sa.Column('silencio_fim', sa.Time(), nullable=True))
+
+    # 2. Envios programados
+    op.create_table(
+        'whatsapp_agendados',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('estabelecimento_id', sa.Integer(), nullable=False),
+        sa.Column('cliente_id', sa.Integer(), nullable=False),
+        sa.Column('agendamento_id', sa.Integer(), nullable=True),
+        sa.Column('tipo', sa.String(length=30), nullable=False),
+        sa.Column('enviar_em', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('erro', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('processado_em', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['estabelecimento_id'], ['estabelecimentos.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['cliente_id'], ['clientes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['agendamento_id'], ['agendamentos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_whatsapp_agendados_id'), 'whatsapp_agendados', ['id'], unique=False)
+    # Carga do horizonte do agendador: só as pendentes, por horário
+    op.create_index(
+        'ix_whatsapp_agendados_pendentes', 'whatsapp_agendados', ['enviar_em'], unique=False,
+        postgresql_where=sa.text("status = 'pendente'")
+    )
+    # Um envio pendente por tipo por agendamento
+    op.create_index(
+        'uq_whatsapp_agendados_agendamento_tipo', 'whatsapp_agendados', ['agendamento_id', 'tipo'], unique=True,
+        postgresql_where=sa.text("status = 'pendente'")
+    )
+
+    # 3. Lembretes dos agendamentos futuros (substitui o cron de janela 23h-25h)
+    op.execute("""
+        INSERT INTO whatsapp_agendados (estabelecimento_id, cliente_id, agendamento_id, tipo, enviar_em, status)
+        SELECT a.estabelecimento_id, a.cliente_id, a.id, 'LEMBRETE', a.data_inicio - interval '24 hours', 'pendente'
+        FROM agendamentos a
+        JOIN whatsapp_configs c ON c.estabelecimento_id = a.estabelecimento_id
+        WHERE a.status = 'AGENDADO'
+          AND a.deleted_at IS NULL
+          AND NOT coalesce(a.lembrete_enviado, false)
+          AND a.data_inicio - interval '24 hours' > now()
+          AND c.ativado AND c.enviar_lembrete AND c.template_lembrete IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_whatsapp_agendados_agendamento_tipo', table_name='whatsapp_agendados')
+    op.drop_index('ix_whatsapp_agendados_pendentes', table_name='whatsapp_agendados')
+    op.drop_index(op.f('ix_whatsapp_agendados_id'), table_name='whatsapp_agendados')
+    op.drop_table('whatsapp_agendados')
+
+    op.drop_column('whatsapp_configs', 'silencio_fim')
+    op.drop_column('whatsapp_configs', 'silencio_inicio')
+    op.drop_column('whatsapp_configs', 'pos_atendimento_horas')
+    op.drop_column('whatsapp_configs', 'lembrete_horas_antes')
+    op.drop_column('whatsapp_configs', 'enviar_pos_atendimento')
+    op.drop_column('whatsapp_configs', 'template_pos_atendimento')
@@ -0,0 +1,42 @@
+"""Add generated aniversario_dia/aniversario_mes to clientes
+
+Revision ID: e5a1c9d3b7f2
+Revises: d8b3e5f9a2c7
+Create Date: 2026-10-19 13:52:44.610238
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1c9d3b7f2'
+down_revision: Union[str, Sequence[str], None] = 'd8b3e5f9a2c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Colunas geradas a partir de data_aniversario ("DD/MM"); valores fora do formato ficam NULL
+    op.add_column('clientes', sa.Column('aniversario_dia', sa.SmallInteger(), sa.Computed(
+        "CASE WHEN data_aniversario ~ '^[0-9]{2}/[0-9]{2}$' THEN substr(data_aniversario, 1, 2)::smallint END"
+    ), nullable=True))
+    op.add_column('clientes', sa.Column('aniversario_mes', sa.SmallInteger(), sa.Computed(
+        "CASE WHEN data_aniversario ~ '^[0-9]{2}/[0-9]{2}$' THEN substr(data_aniversario, 4, 2)::smallint END"
+    ), nullable=True))
+
+    # Aniversariantes do dia (cron diário, todos os estabelecimentos)
+    op.create_index(
+        'ix_clientes_aniversario', 'clientes', ['aniversario_mes', 'aniversario_dia'], unique=False,
+        postgresql_where=sa.text('is_active = true')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_clientes_aniversario', table_name='clientes')
+    op.drop_column('clientes', 'aniversario_mes')
+    op.drop_column('clientes', 'aniversario_dia')
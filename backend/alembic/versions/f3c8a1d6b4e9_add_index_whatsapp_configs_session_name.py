@@ -0,0 +1,31 @@
+"""Add index on whatsapp_configs.waha_session_name
+
+Revision ID: f3c8a1d6b4e9
+Revises: e5a1c9d3b7f2
+Create Date: 2026-10-19 15:21:09.602417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c8a1d6b4e9'
+down_revision: Union[str, Sequence[str], None] = 'e5a1c9d3b7f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Webhook e cache buscam a configuração pelo nome da sessão
+    op.create_index(
+        op.f('ix_whatsapp_configs_waha_session_name'), 'whatsapp_configs', ['waha_session_name'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_whatsapp_configs_waha_session_name'), table_name='whatsapp_configs')
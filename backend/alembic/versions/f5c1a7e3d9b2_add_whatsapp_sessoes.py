@@ -0,0 +1,47 @@
+"""Add whatsapp_sessoes (additional WAHA sessions per estabelecimento)
+
+Revision ID: f5c1a7e3d9b2
+Revises: e2b8d4f6a9c3
+Create Date: 2026-10-19 22:18:05.907431
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5c1a7e3d9b2'
+down_revision: Union[str, Sequence[str], None] = 'e2b8d4f6a9c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'whatsapp_sessoes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('estabelecimento_id', sa.Integer(), nullable=False),
+        sa.Column('waha_url', sa.String(length=500), nullable=False),
+        sa.Column('waha_api_key', sa.String(length=500), nullable=False),
+        sa.Column('waha_session_name', sa.String(length=100), nullable=False),
+        sa.Column('ativo', sa.Boolean(), server_default=sa.text('true'), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['estabelecimento_id'], ['estabelecimentos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('waha_session_name')
+    )
+    op.create_index(op.f('ix_whatsapp_sessoes_id'), 'whatsapp_sessoes', ['id'], unique=False)
+    op.create_index(
+        op.f('ix_whatsapp_sessoes_estabelecimento_id'), 'whatsapp_sessoes', ['estabelecimento_id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_whatsapp_sessoes_estabelecimento_id'), table_name='whatsapp_sessoes')
+    op.drop_index(op.f('ix_whatsapp_sessoes_id'), table_name='whatsapp_sessoes')
+    op.drop_table('whatsapp_sessoes')
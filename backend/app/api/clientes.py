@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Optional, Literal
+from datetime import datetime
 from app.database import get_db
 from app.utils.auth import get_current_active_user
 from app.models.user import User
 from app.schemas.cliente import (
-    ClienteCreate, ClienteUpdate, ClienteResponse, ClienteList
+    ClienteCreate, ClienteUpdate, ClienteResponse, ClienteList, ClienteImportResponse
 )
 from app.services.cliente_service import ClienteService
 
@@ -20,10 +21,13 @@ async def listar_clientes(
     telefone: Optional[str] = None,
     email: Optional[str] = None,
     ativo: Optional[bool] = True,
+    ordenar_por: Literal["nome", "last_visit"] = "nome",
+    ultima_visita_antes: Optional[datetime] = None,
+    ultima_visita_depois: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Listar clientes com filtros"""
+    """Listar clientes com filtros (nome, contato, recência da última visita)"""
     if not current_user.estabelecimento_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -38,7 +42,10 @@ async def listar_clientes(
         nome=nome,
         telefone=telefone,
         email=email,
-        ativo=ativo
+        ativo=ativo,
+        ordenar_por=ordenar_por,
+        ultima_visita_antes=ultima_visita_antes,
+        ultima_visita_depois=ultima_visita_depois
     )
 
     return ClienteList(clientes=clientes, total=total)
@@ -65,6 +72,29 @@ async def criar_cliente(
     return cliente
 
 
+@router.post("/import", response_model=ClienteImportResponse)
+def importar_clientes(
+    arquivo: UploadFile = File(..., description="CSV com cabeçalho (nome, telefone, email, cpf, ...)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Importar clientes em lote a partir de um CSV.
+    Endpoint síncrono (threadpool): a importação pode levar segundos.
+    """
+    if not current_user.estabelecimento_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Usuário deve estar vinculado a um estabelecimento"
+        )
+
+    return ClienteService.import_clientes(
+        db=db,
+        arquivo=arquivo.file,
+        estabelecimento_id=current_user.estabelecimento_id
+    )
+
+
 @router.get("/buscar", response_model=ClienteList)
 async def buscar_clientes(
     q: str = Query(..., min_length=2, description="Termo de busca (nome, telefone, email)"),
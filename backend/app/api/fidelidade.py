@@ -7,6 +7,7 @@ from app.models import User
 from app.utils.auth import get_current_active_user
 from app.utils.permissions import check_admin_or_manager
 from app.services.fidelidade_service import FidelidadeService
+from app.services.fidelidade_recalculo import RecalculoFidelidade
 from app.schemas.fidelidade import (
     ConfiguracaoFidelidadeCreate,
     ConfiguracaoFidelidadeUpdate,
@@ -17,6 +18,9 @@ from app.schemas.fidelidade import (
     ResgatePremioCreate,
     ResgatePremioResponse,
     PremiosDisponiveisResponse,
+    RecalculoPontosRequest,
+    RecalculoPontosSimulacao,
+    RecalculoPontosTarefa,
 )
 
 router = APIRouter(prefix="/fidelidade", tags=["fidelidade"])
@@ -67,6 +71,55 @@ def update_configuracao(
     )
 
 
+# ==================== Recálculo de pontos ====================
+
+@router.post("/recalcular/simular", response_model=RecalculoPontosSimulacao)
+def simular_recalculo(
+    dados: RecalculoPontosRequest,
+    limite: int = 100,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Mostra o que o recálculo faria no período com o reais_por_ponto atual,
+    por cliente, sem gravar nada (Admin/Manager apenas)
+    """
+    check_admin_or_manager(current_user)
+    return RecalculoFidelidade.simular(
+        db, current_user.estabelecimento_id, dados.data_inicio, dados.data_fim, limite=limite
+    )
+
+
+@router.post("/recalcular", response_model=RecalculoPontosTarefa, status_code=status.HTTP_202_ACCEPTED)
+def recalcular_pontos(
+    dados: RecalculoPontosRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Credita/ajusta os pontos dos agendamentos concluídos do período em segundo
+    plano. Acompanhe em GET /fidelidade/recalcular/{tarefa_id} (Admin/Manager apenas)
+    """
+    check_admin_or_manager(current_user)
+    return RecalculoFidelidade.iniciar(db, current_user.estabelecimento_id, dados.data_inicio, dados.data_fim)
+
+
+@router.get("/recalcular/{tarefa_id}", response_model=RecalculoPontosTarefa)
+def status_recalculo(
+    tarefa_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Progresso de um recálculo de pontos (Admin/Manager apenas)"""
+    check_admin_or_manager(current_user)
+    tarefa = RecalculoFidelidade.tarefa(tarefa_id)
+    if not tarefa or tarefa["estabelecimento_id"] != current_user.estabelecimento_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recálculo não encontrado"
+        )
+    return tarefa
+
+
 # ==================== Premios ====================
 
 @router.get("/premios", response_model=List[PremioResponse])
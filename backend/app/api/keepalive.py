@@ -5,6 +5,12 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.services.keepalive_service import KeepAliveService
+from app.services.whatsapp_config_cache import WhatsAppConfigCache
+from app.services.waha_estado import WAHACircuito
+from app.services.whatsapp_fila_envio import FilaEnvioWhatsApp
+from app.services.whatsapp_agendador import WhatsAppAgendador
+from app.services.eventos_dominio import EventosDominio
+from app.utils.bulkhead import Bulkhead
 
 router = APIRouter(prefix="/keepalive", tags=["keepalive"])
 
@@ -35,20 +41,28 @@ def ping_waha_services(db: Session = Depends(get_db)):
     2. O endpoint automaticamente faz ping em todos os serviços WAHA configurados
     3. Mantém o WAHA ativo no Render free tier
 
+    Cada URL WAHA é pingada uma vez (mesmo com vários estabelecimentos), em
+    paralelo. Enquanto o último resultado for recente (KEEPALIVE_CACHE_TTL)
+    ele é retornado sem pingar de novo; chamadas simultâneas compartilham a
+    mesma varredura.
+
     **Retorna:**
-    - Estatísticas dos pings (total, sucesso, falhas)
-    - Lista detalhada de resultados por estabelecimento
+    - Estatísticas dos pings (instâncias, sucesso, falhas)
+    - Lista detalhada de resultados por instância WAHA
     """
-    stats = KeepAliveService.ping_waha_instances(db)
+    stats = KeepAliveService.resultado_recente(db)
 
     return {
         "status": "completed",
         "statistics": {
             "total_instances": stats['total'],
             "successful_pings": stats['success'],
-            "failed_pings": stats['failed']
+            "failed_pings": stats['failed'],
+            "establishments": stats.get('estabelecimentos', 0)
         },
         "details": stats.get('results', []),
+        "executed_at": stats.get('executado_em'),
+        "cached": stats.get('cache', False),
         "message": f"Ping realizado em {stats['total']} instâncias WAHA"
     }
 
@@ -60,24 +74,31 @@ def system_status(db: Session = Depends(get_db)):
 
     **Endpoint público** para monitoramento.
     """
+    from sqlalchemy import func
     from app.models.whatsapp_config import WhatsAppConfig
 
-    # Contar configurações WAHA ativas
-    total_configs = db.query(WhatsAppConfig).count()
-    active_configs = db.query(WhatsAppConfig).filter(
-        WhatsAppConfig.ativado == True
-    ).count()
-    waha_configs = db.query(WhatsAppConfig).filter(
-        WhatsAppConfig.waha_url.isnot(None),
-        WhatsAppConfig.ativado == True
-    ).count()
+    # Contar configurações WAHA ativas (uma única consulta)
+    contagens = db.query(
+        func.count().label("total"),
+        func.count().filter(WhatsAppConfig.ativado == True).label("ativas"),
+        func.count().filter(
+            WhatsAppConfig.waha_url.isnot(None),
+            WhatsAppConfig.ativado == True
+        ).label("waha")
+    ).select_from(WhatsAppConfig).one()
 
     return {
         "backend": "operational",
         "database": "connected",
         "whatsapp": {
-            "total_configs": total_configs,
-            "active_configs": active_configs,
-            "waha_instances": waha_configs
+            "total_configs": contagens.total,
+            "active_configs": contagens.ativas,
+            "waha_instances": contagens.waha,
+            "config_cache": WhatsAppConfigCache.stats(),
+            "waha_circuitos": WAHACircuito.stats(),
+            "fila_envio": FilaEnvioWhatsApp.stats(),
+            "envios_programados": WhatsAppAgendador.stats(),
+            "bulkheads": Bulkhead.stats_todos(),
+            "eventos": EventosDominio.stats()
         }
     }
@@ -1,59 +1,71 @@
 """
 Endpoints para gerenciar sessões WAHA (WhatsApp HTTP API)
 """
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import executar_com_sessao
 from app.models import User
-from app.utils.auth import get_current_active_user
+from app.utils.auth import get_current_active_user_detached
 from app.utils.permissions import check_admin_or_manager
 from app.services.waha_service import WAHAService
+from app.services.waha_estado import WAHASessaoCache
 from app.services.whatsapp_service import WhatsAppService
+from app.services.whatsapp_sessoes_service import SessaoWAHA, WhatsAppSessoesService
+from app.utils.bulkhead import WAHA
 
+# As rotas que chamam o WAHA são async e rodam o trabalho no bulkhead WAHA
+# (app/utils/bulkhead.py), com sessão de banco própria; a conexão do request
+# volta ao pool após a autenticação. WAHA lento não prende threads nem
+# conexões das outras rotas. Cheio: 503; sem resposta no prazo: 504.
 router = APIRouter()
 
 
-@router.post("/start-session")
-def start_waha_session(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Inicia uma sessão WAHA (cria instância WhatsApp).
+def _sessao_waha(db: Session, estabelecimento_id: int, sessao_id: Optional[int]) -> SessaoWAHA:
+    """Sessão principal (configuração) ou a sessão adicional `sessao_id` do estabelecimento"""
+    if sessao_id is not None:
+        sessao = WhatsAppSessoesService.obter(db, estabelecimento_id, sessao_id)
+        return SessaoWAHA(sessao.waha_url, sessao.waha_api_key, sessao.waha_session_name)
 
-    **Fluxo:**
-    1. Busca configuração WAHA do estabelecimento
-    2. Cria/inicia sessão no servidor WAHA
-    3. Retorna dados da sessão (incluindo URL do webhook)
-
-    **Requer:** Admin ou Manager
-    """
-    check_admin_or_manager(current_user)
-
-    # Busca configuração
-    config = WhatsAppService.get_config(db, current_user.estabelecimento_id)
-    if not config:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Configuração do WhatsApp não encontrada"
-        )
-
-    if not config.waha_url or not config.waha_api_key or not config.waha_session_name:
+    config = WhatsAppService.get_config_cached(db, estabelecimento_id)
+    if not config or not config.waha_url or not config.waha_api_key or not config.waha_session_name:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Configuração WAHA incompleta. Configure URL, API Key e Session Name."
+            detail="Configuração WAHA não encontrada ou incompleta"
         )
+    return SessaoWAHA(config.waha_url, config.waha_api_key, config.waha_session_name)
+
+
+def _iniciar_sessao(db: Session, estabelecimento_id: int, sessao_id: Optional[int]):
+    # Busca configuração (ou a sessão adicional informada)
+    if sessao_id is not None:
+        sessao = _sessao_waha(db, estabelecimento_id, sessao_id)
+    else:
+        config = WhatsAppService.get_config_cached(db, estabelecimento_id)
+        if not config:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Configuração do WhatsApp não encontrada"
+            )
+
+        if not config.waha_url or not config.waha_api_key or not config.waha_session_name:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Configuração WAHA incompleta. Configure URL, API Key e Session Name."
+            )
+        sessao = SessaoWAHA(config.waha_url, config.waha_api_key, config.waha_session_name)
 
     # Configurar webhook para receber notificações de status
     import os
     backend_url = os.getenv("BACKEND_URL", "https://agenda-production-fdff.up.railway.app")
-    webhook_url = f"{backend_url}/waha-webhook/events/{config.waha_session_name}"
+    webhook_url = f"{backend_url}/waha-webhook/events/{sessao.session_name}"
 
     result = WAHAService.start_session(
-        waha_url=config.waha_url,
-        waha_api_key=config.waha_api_key,
-        session_name=config.waha_session_name,
+        waha_url=sessao.waha_url,
+        waha_api_key=sessao.waha_api_key,
+        session_name=sessao.session_name,
         webhook_url=webhook_url
     )
 
@@ -64,27 +76,36 @@ def start_waha_session(
     }
 
 
-@router.post("/stop-session")
-def stop_waha_session(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+@router.post("/start-session")
+async def start_waha_session(
+    sessao_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user_detached)
 ):
     """
-    Para uma sessão WAHA (mas não deleta).
+    Inicia uma sessão WAHA (cria instância WhatsApp).
+
+    **Fluxo:**
+    1. Busca configuração WAHA do estabelecimento
+    2. Cria/inicia sessão no servidor WAHA
+    3. Retorna dados da sessão (incluindo URL do webhook)
+
+    `sessao_id` inicia uma sessão adicional (padrão: a principal).
+
+    **Requer:** Admin ou Manager
     """
     check_admin_or_manager(current_user)
+    return await WAHA.executar(
+        executar_com_sessao, _iniciar_sessao, current_user.estabelecimento_id, sessao_id
+    )
 
-    config = WhatsAppService.get_config(db, current_user.estabelecimento_id)
-    if not config or not config.waha_url or not config.waha_api_key or not config.waha_session_name:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Configuração WAHA não encontrada ou incompleta"
-        )
+
+def _parar_sessao(db: Session, estabelecimento_id: int, sessao_id: Optional[int]):
+    sessao = _sessao_waha(db, estabelecimento_id, sessao_id)
 
     result = WAHAService.stop_session(
-        waha_url=config.waha_url,
-        waha_api_key=config.waha_api_key,
-        session_name=config.waha_session_name
+        waha_url=sessao.waha_url,
+        waha_api_key=sessao.waha_api_key,
+        session_name=sessao.session_name
     )
 
     return {
@@ -94,10 +115,34 @@ def stop_waha_session(
     }
 
 
+@router.post("/stop-session")
+async def stop_waha_session(
+    sessao_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user_detached)
+):
+    """
+    Para uma sessão WAHA (mas não deleta).
+    """
+    check_admin_or_manager(current_user)
+    return await WAHA.executar(
+        executar_com_sessao, _parar_sessao, current_user.estabelecimento_id, sessao_id
+    )
+
+
+def _qrcode(db: Session, estabelecimento_id: int, sessao_id: Optional[int]):
+    sessao = _sessao_waha(db, estabelecimento_id, sessao_id)
+
+    return WAHAService.get_qr_code(
+        waha_url=sessao.waha_url,
+        waha_api_key=sessao.waha_api_key,
+        session_name=sessao.session_name
+    )
+
+
 @router.get("/qrcode")
-def get_waha_qrcode(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+async def get_waha_qrcode(
+    sessao_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user_detached)
 ):
     """
     Obtém QR Code para conectar WhatsApp via WAHA.
@@ -115,62 +160,34 @@ def get_waha_qrcode(
     - `WORKING`: Já conectado
     - `STOPPED`: Sessão parada
     - `FAILED`: Erro na sessão
-    """
-    config = WhatsAppService.get_config(db, current_user.estabelecimento_id)
-    if not config or not config.waha_url or not config.waha_api_key or not config.waha_session_name:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Configuração WAHA não encontrada ou incompleta"
-        )
 
-    result = WAHAService.get_qr_code(
-        waha_url=config.waha_url,
-        waha_api_key=config.waha_api_key,
-        session_name=config.waha_session_name
+    `sessao_id` seleciona uma sessão adicional (padrão: a principal).
+    """
+    return await WAHA.executar(
+        executar_com_sessao, _qrcode, current_user.estabelecimento_id, sessao_id
     )
 
-    return result
 
+def _status_sessao(db: Session, estabelecimento_id: int, sessao_id: Optional[int]):
+    sessao = _sessao_waha(db, estabelecimento_id, sessao_id)
 
-@router.get("/status")
-def get_waha_status(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Verifica status de conexão da sessão WAHA.
-
-    **Retorna:**
-    ```json
-    {
-      "name": "session_name",
-      "status": "WORKING",
-      "me": {
-        "id": "5511999999999@c.us",
-        "pushName": "Nome do WhatsApp"
-      }
-    }
-    ```
-
-    **Status possíveis:**
-    - `WORKING`: Conectado e funcionando
-    - `SCAN_QR_CODE`: Aguardando escaneamento do QR Code
-    - `STARTING`: Iniciando sessão
-    - `STOPPED`: Sessão parada
-    - `FAILED`: Erro na sessão
-    """
-    config = WhatsAppService.get_config(db, current_user.estabelecimento_id)
-    if not config or not config.waha_url or not config.waha_api_key or not config.waha_session_name:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Configuração WAHA não encontrada ou incompleta"
-        )
+    # Status mantido pelos eventos do webhook (e pela última consulta ao WAHA)
+    cache = WAHASessaoCache.obter(sessao.waha_url, sessao.session_name)
+    if cache:
+        return {
+            "connected": cache["status"] == "WORKING",
+            "session": sessao.session_name,
+            "status": cache["status"],
+            "me": cache["me"],
+            "qrcode": None,
+            "atualizado_em": cache["atualizado_em"]
+        }
 
     try:
         result = WAHAService.get_session_status(
-            waha_url=config.waha_url,
-            waha_api_key=config.waha_api_key,
-            session_name=config.waha_session_name
+            waha_url=sessao.waha_url,
+            waha_api_key=sessao.waha_api_key,
+            session_name=sessao.session_name
         )
 
         # Normaliza resposta para formato similar ao Evolution API
@@ -185,9 +202,10 @@ def get_waha_status(
     except HTTPException as e:
         # Se sessão não existe, retorna status desconectado
         if "404" in str(e.detail) or "not found" in str(e.detail).lower():
+            WAHASessaoCache.atualizar(sessao.waha_url, sessao.session_name, "NOT_STARTED")
             return {
                 "connected": False,
-                "session": config.waha_session_name,
+                "session": sessao.session_name,
                 "status": "NOT_STARTED",
                 "me": None,
                 "qrcode": None
@@ -195,28 +213,49 @@ def get_waha_status(
         raise
 
 
-@router.post("/logout")
-def logout_waha_session(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+@router.get("/status")
+async def get_waha_status(
+    sessao_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user_detached)
 ):
     """
-    Faz logout da sessão WAHA (desconecta WhatsApp mas mantém sessão).
-    Útil para reconectar com outro número.
+    Verifica status de conexão da sessão WAHA.
+
+    **Retorna:**
+    ```json
+    {
+      "name": "session_name",
+      "status": "WORKING",
+      "me": {
+        "id": "5511999999999@c.us",
+        "pushName": "Nome do WhatsApp"
+      }
+    }
+    ```
+
+    **Status possíveis:**
+    - `WORKING`: Conectado e funcionando
+    - `SCAN_QR_CODE`: Aguardando escaneamento do QR Code
+    - `STARTING`: Iniciando sessão
+    - `STOPPED`: Sessão parada
+    - `FAILED`: Erro na sessão
+
+    Responde do status em cache (eventos session.status/state.change do
+    webhook) enquanto ele tiver menos de WAHA_SESSAO_CACHE_TTL segundos.
+    `sessao_id` seleciona uma sessão adicional (padrão: a principal).
     """
-    check_admin_or_manager(current_user)
+    return await WAHA.executar(
+        executar_com_sessao, _status_sessao, current_user.estabelecimento_id, sessao_id
+    )
 
-    config = WhatsAppService.get_config(db, current_user.estabelecimento_id)
-    if not config or not config.waha_url or not config.waha_api_key or not config.waha_session_name:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Configuração WAHA não encontrada ou incompleta"
-        )
+
+def _logout(db: Session, estabelecimento_id: int, sessao_id: Optional[int]):
+    sessao = _sessao_waha(db, estabelecimento_id, sessao_id)
 
     result = WAHAService.logout_session(
-        waha_url=config.waha_url,
-        waha_api_key=config.waha_api_key,
-        session_name=config.waha_session_name
+        waha_url=sessao.waha_url,
+        waha_api_key=sessao.waha_api_key,
+        session_name=sessao.session_name
     )
 
     return {
@@ -226,18 +265,23 @@ def logout_waha_session(
     }
 
 
-@router.get("/sessions")
-def list_waha_sessions(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+@router.post("/logout")
+async def logout_waha_session(
+    sessao_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user_detached)
 ):
     """
-    Lista todas as sessões WAHA (Debug).
-    Útil para verificar se a sessão foi criada corretamente.
+    Faz logout da sessão WAHA (desconecta WhatsApp mas mantém sessão).
+    Útil para reconectar com outro número.
     """
     check_admin_or_manager(current_user)
+    return await WAHA.executar(
+        executar_com_sessao, _logout, current_user.estabelecimento_id, sessao_id
+    )
 
-    config = WhatsAppService.get_config(db, current_user.estabelecimento_id)
+
+def _listar_sessoes(db: Session, estabelecimento_id: int):
+    config = WhatsAppService.get_config_cached(db, estabelecimento_id)
     if not config or not config.waha_url or not config.waha_api_key:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -255,20 +299,19 @@ def list_waha_sessions(
     }
 
 
-@router.get("/health")
-def waha_health_check(db: Session = Depends(get_db)):
+@router.get("/sessions")
+async def list_waha_sessions(
+    current_user: User = Depends(get_current_active_user_detached)
+):
     """
-    Health check público para UptimeRobot/monitoramento (sem autenticação).
+    Lista todas as sessões WAHA (Debug).
+    Útil para verificar se a sessão foi criada corretamente.
+    """
+    check_admin_or_manager(current_user)
+    return await WAHA.executar(executar_com_sessao, _listar_sessoes, current_user.estabelecimento_id)
 
-    Este endpoint faz duas coisas:
-    1. Mantém o backend ativo
-    2. Faz ping no servidor WAHA para mantê-lo ativo também
 
-    Configure no UptimeRobot:
-    - URL: https://seu-backend.onrender.com/waha/health
-    - Intervalo: 10 minutos
-    - Não precisa de headers customizados
-    """
+def _ping_waha(db: Session):
     import requests
 
     # Busca primeira configuração WAHA ativa
@@ -299,3 +342,20 @@ def waha_health_check(db: Session = Depends(get_db)):
         "service": "WAHA Integration",
         "waha_ping": waha_status
     }
+
+
+@router.get("/health")
+async def waha_health_check():
+    """
+    Health check público para UptimeRobot/monitoramento (sem autenticação).
+
+    Este endpoint faz duas coisas:
+    1. Mantém o backend ativo
+    2. Faz ping no servidor WAHA para mantê-lo ativo também
+
+    Configure no UptimeRobot:
+    - URL: https://seu-backend.onrender.com/waha/health
+    - Intervalo: 10 minutos
+    - Não precisa de headers customizados
+    """
+    return await WAHA.executar(executar_com_sessao, _ping_waha)
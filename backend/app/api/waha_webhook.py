@@ -1,22 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from pydantic import ValidationError
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import Optional
+import json
 import logging
 
 from app.database import get_db
 from app.models.whatsapp_message import WhatsAppMessage
-from app.models.whatsapp_config import WhatsAppConfig
+from app.models.whatsapp_mensagem_diaria import WhatsAppMensagemDiaria
+from app.services.whatsapp_config_cache import WhatsAppConfigCache
+from app.services.waha_estado import WAHACircuito, WAHASessaoCache
+from app.services.whatsapp_sessoes_service import WhatsAppSessoesService
+from app.services.webhook_ingestao_service import WebhookIngestaoService, extrair_mensagem
 from app.schemas.whatsapp import WAHAWebhookEvent
 
 router = APIRouter(prefix="/waha-webhook", tags=["waha-webhook"])
 logger = logging.getLogger(__name__)
 
 
+async def _corpo_requisicao(request: Request) -> bytes:
+    """Corpo bruto (lido no event loop; o endpoint roda no threadpool)"""
+    return await request.body()
+
+
+# Endpoint síncrono: cache da config, sessão adicional e gravação direta com a
+# fila cheia acessam o banco e bloqueariam o event loop num `async def`
 @router.post("/events/{session_name}")
-async def receive_waha_event(
+def receive_waha_event(
     session_name: str,
-    request: Request,
+    corpo: bytes = Depends(_corpo_requisicao),
     db: Session = Depends(get_db),
     x_api_key: Optional[str] = Header(None, alias="X-Api-Key")
 ):
@@ -50,10 +64,10 @@ async def receive_waha_event(
     ```
 
     **O que este endpoint faz:**
-    1. Recebe o evento
-    2. Busca a config do estabelecimento (via session_name)
-    3. Salva a mensagem no PostgreSQL
-    4. Retorna sucesso para o WAHA (evita retry)
+    1. Valida o evento (WAHAWebhookEvent)
+    2. Busca a config do estabelecimento (via session_name, em cache)
+    3. Coloca a mensagem na fila de gravação (gravada em lote, com upsert do ack)
+    4. Retorna sucesso para o WAHA imediatamente (evita retry)
 
     **Nota**: Este endpoint NÃO requer autenticação JWT pois é chamado
     pelo WAHA (servidor externo). Validação é feita via session_name.
@@ -63,18 +77,17 @@ async def receive_waha_event(
     # 1. PARSE DO EVENTO
     # ========================================
     try:
-        event_data = await request.json()
-        logger.info(f"📨 Webhook recebido: {event_data.get('event')} para sessão {session_name}")
-    except Exception as e:
-        logger.error(f"❌ Erro ao parsear JSON: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+        event_data = json.loads(corpo)
+        evento = WAHAWebhookEvent.model_validate(event_data)
+        logger.debug(f"📨 Webhook recebido: {evento.event} para sessão {session_name}")
+    except (ValueError, ValidationError) as e:
+        logger.error(f"❌ Erro ao parsear evento: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid event: {str(e)}")
 
     # ========================================
     # 2. BUSCAR CONFIGURAÇÃO (para pegar estabelecimento_id)
     # ========================================
-    config = db.query(WhatsAppConfig).filter(
-        WhatsAppConfig.waha_session_name == session_name
-    ).first()
+    config = WhatsAppConfigCache.get_por_sessao(db, session_name)
 
     if not config:
         # Log warning mas não falha (permite debugging)
@@ -89,12 +102,19 @@ async def receive_waha_event(
     # ========================================
     # 3. FILTRAR EVENTOS (processar mensagens + status)
     # ========================================
-    event_type = event_data.get("event", "unknown")
+    event_type = evento.event
 
     # EVENTOS DE STATUS DA SESSÃO (logar mas não salvar no DB)
     if event_type in ["session.status", "state.change", "session"]:
-        payload = event_data.get("payload", {})
-        status = payload.get("status", "unknown")
+        payload = evento.payload
+        status = payload.get("status") or payload.get("state") or "unknown"
+
+        # Cache do status da sessão (usado por /waha/status e pelo aquecimento dos envios)
+        if status != "unknown":
+            waha_url = WhatsAppSessoesService.url_da_sessao(db, config, session_name)
+            WAHASessaoCache.atualizar(waha_url, session_name, status, payload.get("me"), fonte="webhook")
+            if status in ["WORKING", "CONNECTED"]:
+                WAHACircuito.registrar_sucesso(waha_url)
 
         logger.warning(
             f"🔔 WAHA STATUS CHANGE - Sessão: {session_name} | "
@@ -125,110 +145,37 @@ async def receive_waha_event(
         }
 
     # ========================================
-    # 4. EXTRAIR DADOS DA MENSAGEM
-    # ========================================
-    payload = event_data.get("payload", {})
-
-    message_id = payload.get("id", "")
-    from_raw = payload.get("from", "")
-    to_raw = payload.get("to", "")
-    from_me = payload.get("fromMe", False)
-    body = payload.get("body", "")
-    has_media = payload.get("hasMedia", False)
-    timestamp_ms = payload.get("timestamp", 0)
-
-    # Limpar números (remover @c.us e @s.whatsapp.net)
-    from_number = from_raw.replace("@c.us", "").replace("@s.whatsapp.net", "")
-    to_number = to_raw.replace("@c.us", "").replace("@s.whatsapp.net", "") if to_raw else None
-
-    # Converter timestamp (milliseconds → datetime)
-    if timestamp_ms:
-        try:
-            message_timestamp = datetime.fromtimestamp(timestamp_ms / 1000)
-        except:
-            message_timestamp = datetime.now()
-    else:
-        message_timestamp = datetime.now()
-
-    # Status de confirmação (se for evento message.ack)
-    ack_status = None
-    if event_type == "message.ack":
-        # WAHA retorna ack em payload._data.ack ou payload.ack
-        ack_status = payload.get("ack") or payload.get("_data", {}).get("ack")
-        if ack_status:
-            # Converter número para nome: 0=error, 1=pending, 2=server, 3=delivery, 4=read, 5=played
-            ack_map = {0: "error", 1: "pending", 2: "server", 3: "delivery", 4: "read", 5: "played"}
-            ack_status = ack_map.get(int(ack_status), str(ack_status))
-
-    # ========================================
-    # 5. VERIFICAR DUPLICATA (evitar salvar 2x)
+    # 4. ENFILEIRAR PARA GRAVAÇÃO EM LOTE
     # ========================================
-    existing = db.query(WhatsAppMessage).filter(
-        WhatsAppMessage.message_id == message_id,
-        WhatsAppMessage.estabelecimento_id == config.estabelecimento_id
-    ).first()
-
-    if existing:
-        # Se for message.ack, atualiza status
-        if event_type == "message.ack" and ack_status:
-            existing.ack_status = ack_status
-            db.commit()
-            logger.info(f"✅ Status atualizado: {message_id} → {ack_status}")
-            return {
-                "status": "updated",
-                "message_id": message_id,
-                "ack_status": ack_status
-            }
-        else:
-            logger.debug(f"🔕 Mensagem duplicada ignorada: {message_id}")
-            return {
-                "status": "duplicate",
-                "message_id": message_id
-            }
-
-    # ========================================
-    # 6. SALVAR MENSAGEM NO POSTGRESQL
-    # ========================================
-    new_message = WhatsAppMessage(
-        message_id=message_id,
-        session_name=session_name,
-        from_number=from_number,
-        to_number=to_number,
-        from_me=from_me,
-        body=body,
-        has_media=has_media,
-        media_url=None,  # WAHA pode fornecer URL de mídia depois
-        event_type=event_type,
-        message_timestamp=message_timestamp,
-        ack_status=ack_status,
-        payload_json=event_data,  # Salva payload completo para análise
-        estabelecimento_id=config.estabelecimento_id
-    )
-
-    try:
-        db.add(new_message)
-        db.commit()
-        logger.info(f"✅ Mensagem salva: {message_id} | De: {from_number} | fromMe: {from_me}")
+    # Duplicatas e acks são resolvidos no upsert (estabelecimento_id, message_id)
+    mensagem = extrair_mensagem(evento, session_name, config.estabelecimento_id, event_data)
 
+    if not mensagem["message_id"]:
         return {
-            "status": "received",
-            "message_id": message_id,
-            "from": from_number,
-            "fromMe": from_me,
-            "estabelecimento_id": config.estabelecimento_id
+            "status": "ignored",
+            "reason": "missing_message_id",
+            "event": event_type
         }
 
+    try:
+        enfileirado = WebhookIngestaoService.enfileirar(mensagem)
     except Exception as e:
-        db.rollback()
         logger.error(f"❌ Erro ao salvar mensagem: {str(e)}")
         # Não falha o webhook (WAHA vai tentar de novo)
         # Mas retorna erro para debug
         return {
             "status": "error",
-            "message_id": message_id,
+            "message_id": mensagem["message_id"],
             "error": str(e)
         }
 
+    return {
+        "status": "queued" if enfileirado else "received",
+        "message_id": mensagem["message_id"],
+        "ack_status": mensagem["ack_status"],
+        "estabelecimento_id": config.estabelecimento_id
+    }
+
 
 @router.get("/health")
 def webhook_health():
@@ -236,7 +183,8 @@ def webhook_health():
     return {
         "status": "healthy",
         "service": "waha-webhook",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "ingestao": WebhookIngestaoService.stats()
     }
 
 
@@ -252,33 +200,65 @@ def webhook_stats(
     """
 
     # Buscar config
-    config = db.query(WhatsAppConfig).filter(
-        WhatsAppConfig.waha_session_name == session_name
-    ).first()
+    config = WhatsAppConfigCache.get_por_sessao(db, session_name)
 
     if not config:
         raise HTTPException(status_code=404, detail="Sessão não encontrada")
 
-    # Contar mensagens
-    total_messages = db.query(WhatsAppMessage).filter(
+    # Contar mensagens (uma única varredura)
+    contagens = db.query(
+        func.count().label("total"),
+        func.count().filter(WhatsAppMessage.from_me == False).label("recebidas"),
+        func.count().filter(WhatsAppMessage.from_me == True).label("enviadas")
+    ).filter(
         WhatsAppMessage.estabelecimento_id == config.estabelecimento_id
-    ).count()
+    ).one()
 
-    received_messages = db.query(WhatsAppMessage).filter(
-        WhatsAppMessage.estabelecimento_id == config.estabelecimento_id,
-        WhatsAppMessage.from_me == False
-    ).count()
+    return {
+        "session": session_name,
+        "estabelecimento_id": config.estabelecimento_id,
+        "total_messages": contagens.total,
+        "received": contagens.recebidas,
+        "sent": contagens.enviadas,
+        "webhook_url": f"/waha-webhook/events/{session_name}"
+    }
+
+
+@router.get("/stats/{session_name}/diario")
+def webhook_stats_diario(
+    session_name: str,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    📈 Mensagens por dia (enviadas, recebidas, entregues, lidas, falhas).
 
-    sent_messages = db.query(WhatsAppMessage).filter(
-        WhatsAppMessage.estabelecimento_id == config.estabelecimento_id,
-        WhatsAppMessage.from_me == True
-    ).count()
+    Lê o resumo diário (whatsapp_mensagens_diarias), sem varrer as mensagens.
+    Padrão: últimos 30 dias.
+    """
+    config = WhatsAppConfigCache.get_por_sessao(db, session_name)
 
+    if not config:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+
+    data_fim = data_fim or date.today()
+    data_inicio = data_inicio or data_fim - timedelta(days=29)
+    if data_inicio > data_fim:
+        raise HTTPException(status_code=400, detail="data_inicio deve ser anterior a data_fim")
+
+    dias = db.query(WhatsAppMensagemDiaria).filter(
+        WhatsAppMensagemDiaria.estabelecimento_id == config.estabelecimento_id,
+        WhatsAppMensagemDiaria.dia >= data_inicio,
+        WhatsAppMensagemDiaria.dia <= data_fim
+    ).order_by(WhatsAppMensagemDiaria.dia).all()
+
+    campos = ["enviadas", "recebidas", "entregues", "lidas", "falhas"]
     return {
         "session": session_name,
         "estabelecimento_id": config.estabelecimento_id,
-        "total_messages": total_messages,
-        "received": received_messages,
-        "sent": sent_messages,
-        "webhook_url": f"/waha-webhook/events/{session_name}"
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "totais": {campo: sum(getattr(d, campo) for d in dias) for campo in campos},
+        "dias": [{"dia": d.dia, **{campo: getattr(d, campo) for campo in campos}} for d in dias]
     }
@@ -1,11 +1,20 @@
+from datetime import date, timedelta
+from typing import List, Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, executar_com_sessao
 from app.models import User
-from app.utils.auth import get_current_active_user
+from app.utils.auth import get_current_active_user, get_current_active_user_detached
 from app.utils.permissions import check_admin_or_manager
 from app.services.whatsapp_service import WhatsAppService
+from app.services.whatsapp_envio_service import WhatsAppEnvioService
+from app.services.whatsapp_sessoes_service import SessaoWAHA, WhatsAppSessoesService
+from app.services.waha_estado import WAHASessaoCache
+from app.utils.timezone import get_brazil_now
+from app.utils.bulkhead import WAHA, ROTINAS_WHATSAPP
 from app.schemas.whatsapp import (
     WhatsAppConfigCreate,
     WhatsAppConfigUpdate,
@@ -13,6 +22,9 @@ from app.schemas.whatsapp import (
     WhatsAppMessageRequest,
     WhatsAppMessageResponse,
     WhatsAppTestRequest,
+    WhatsAppSessaoCreate,
+    WhatsAppSessaoUpdate,
+    WhatsAppSessaoResponse,
 )
 
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
@@ -81,10 +93,9 @@ def delete_config(
 # ==================== Envio de Mensagens ====================
 
 @router.post("/send", response_model=WhatsAppMessageResponse)
-def send_message(
+async def send_message(
     message_request: WhatsAppMessageRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user_detached)
 ):
     """
     Envia mensagem WhatsApp para um cliente.
@@ -109,19 +120,27 @@ def send_message(
     - `{vendedor}`: Nome do vendedor
     - `{valor}`: Valor do agendamento (R$ XX,XX)
     - `{status}`: Status do agendamento
+    - `{veiculo}`: Veículo do agendamento
+    - `{link_agendamento}`: Link direto para agendamento online
+
+    Quebras de linha do template são mantidas. Placeholders fora desta lista
+    são rejeitados ao salvar a configuração.
+
+    O envio roda no bulkhead do WAHA: 503 se ele estiver cheio, 504 se o
+    WAHA não responder em BULKHEAD_WAHA_PRAZO segundos.
     """
-    return WhatsAppService.send_message(
-        db=db,
+    return await WAHA.executar(
+        executar_com_sessao,
+        WhatsAppService.send_message,
         estabelecimento_id=current_user.estabelecimento_id,
         message_request=message_request
     )
 
 
 @router.post("/test", response_model=WhatsAppMessageResponse)
-def send_test_message(
+async def send_test_message(
     test_request: WhatsAppTestRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user_detached)
 ):
     """
     Envia mensagem de teste para validar configuração do WhatsApp.
@@ -129,8 +148,9 @@ def send_test_message(
     Use para testar se as credenciais (meta_token e telefone_id) estão corretas.
     """
     check_admin_or_manager(current_user)
-    return WhatsAppService.send_test_message(
-        db=db,
+    return await WAHA.executar(
+        executar_com_sessao,
+        WhatsAppService.send_test_message,
         estabelecimento_id=current_user.estabelecimento_id,
         test_request=test_request
     )
@@ -138,6 +158,17 @@ def send_test_message(
 
 # ==================== Reciclagem de Clientes Inativos ====================
 
+def _cron_em_andamento() -> JSONResponse:
+    """Resposta dos crons que passam do prazo: o processamento continua em segundo plano"""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "status": "processing",
+            "message": "Processamento em andamento; as estatísticas ficam nos logs"
+        }
+    )
+
+
 @router.get("/clientes-inativos")
 def get_clientes_inativos(
     current_user: User = Depends(get_current_active_user),
@@ -149,7 +180,7 @@ def get_clientes_inativos(
     Retorna lista com informações do cliente e data do último serviço.
     O número de meses é configurável nas configurações do WhatsApp.
     """
-    config = WhatsAppService.get_config(db, current_user.estabelecimento_id)
+    config = WhatsAppService.get_config_cached(db, current_user.estabelecimento_id)
     if not config:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -164,10 +195,9 @@ def get_clientes_inativos(
 
 
 @router.post("/send-reciclagem/{cliente_id}", response_model=WhatsAppMessageResponse)
-def send_reciclagem_message(
+async def send_reciclagem_message(
     cliente_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user_detached)
 ):
     """
     Envia mensagem de reciclagem para um cliente específico.
@@ -178,17 +208,16 @@ def send_reciclagem_message(
     - `{data_ultimo_servico}`: Data do último agendamento (dd/Mês)
     - `{link_agendamento}`: Link direto para agendamento online
     """
-    return WhatsAppService.send_reciclagem_message(
-        db=db,
+    return await WAHA.executar(
+        executar_com_sessao,
+        WhatsAppService.send_reciclagem_message,
         estabelecimento_id=current_user.estabelecimento_id,
         cliente_id=cliente_id
     )
 
 
 @router.post("/process-reciclagem-cron")
-def process_reciclagem_cron(
-    db: Session = Depends(get_db)
-):
+async def process_reciclagem_cron():
     """
     Processa envio de mensagens de reciclagem para todos estabelecimentos.
 
@@ -198,35 +227,46 @@ def process_reciclagem_cron(
     que têm WhatsApp ativado e reciclagem habilitada.
 
     Retorna estatísticas do processamento (mensagens enviadas, falhas, etc.).
+    Se passar de BULKHEAD_ROTINAS_PRAZO segundos, responde 202 e o
+    processamento continua em segundo plano (503 se já houver rotinas demais
+    em andamento).
     """
-    return WhatsAppService.process_reciclagem_cron(db=db)
+    return await ROTINAS_WHATSAPP.executar(
+        executar_com_sessao,
+        WhatsAppService.process_reciclagem_cron,
+        ao_expirar=_cron_em_andamento
+    )
 
 
 # ==================== Lembretes de Agendamento ====================
 
 @router.post("/process-lembretes-cron")
-def process_lembretes_cron(
-    db: Session = Depends(get_db)
-):
+async def process_lembretes_cron():
     """
-    Processa envio de lembretes 24h antes dos agendamentos.
-
-    **IMPORTANTE**: Este endpoint deve ser chamado por um Cron Job a cada hora.
-
-    Busca agendamentos que estão entre 23h e 25h de distância e envia lembrete
-    para clientes, desde que o estabelecimento tenha WhatsApp ativo e enviar_lembrete habilitado.
-
-    Retorna estatísticas do processamento (lembretes enviados, falhas, etc.).
+    Reconciliação dos lembretes de agendamento.
+
+    Os lembretes são programados ao criar/remarcar o agendamento e enviados
+    pelo agendador interno no horário exato (lembrete_horas_antes, fora do
+    horário de silêncio). Este endpoint só programa os lembretes dos
+    agendamentos das próximas 48h que ainda não têm envio programado
+    (ex: criados antes do agendador); não precisa mais de Cron Job por hora.
+
+    Retorna estatísticas do processamento (agendamentos processados, erros).
+    Se passar de BULKHEAD_ROTINAS_PRAZO segundos, responde 202 e o
+    processamento continua em segundo plano (503 se já houver rotinas demais
+    em andamento).
     """
-    return WhatsAppService.process_lembretes_cron(db=db)
+    return await ROTINAS_WHATSAPP.executar(
+        executar_com_sessao,
+        WhatsAppService.process_lembretes_cron,
+        ao_expirar=_cron_em_andamento
+    )
 
 
 # ==================== Aniversários ====================
 
 @router.post("/process-aniversarios-cron")
-def process_aniversarios_cron(
-    db: Session = Depends(get_db)
-):
+async def process_aniversarios_cron():
     """
     Processa envio de mensagens de aniversário para clientes.
 
@@ -241,5 +281,125 @@ def process_aniversarios_cron(
     - `{nome_empresa}`: Nome da empresa/estabelecimento
 
     Retorna estatísticas do processamento (mensagens enviadas, falhas, etc.).
+    Se passar de BULKHEAD_ROTINAS_PRAZO segundos, responde 202 e o
+    processamento continua em segundo plano (503 se já houver rotinas demais
+    em andamento).
     """
-    return WhatsAppService.process_aniversarios_cron(db=db)
+    return await ROTINAS_WHATSAPP.executar(
+        executar_com_sessao,
+        WhatsAppService.process_aniversarios_cron,
+        ao_expirar=_cron_em_andamento
+    )
+
+
+# ==================== Funil de Entrega ====================
+
+@router.get("/funil")
+def get_funil_entrega(
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Funil de entrega das mensagens enviadas pelo sistema, por tipo.
+
+    enviadas -> servidor -> entregues -> lidas (acks do WAHA), com falhas,
+    taxas e percentis do tempo até a leitura. Padrão: últimos 30 dias.
+    """
+    data_fim = data_fim or get_brazil_now().date()
+    data_inicio = data_inicio or data_fim - timedelta(days=29)
+    if data_inicio > data_fim:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="data_inicio deve ser anterior a data_fim"
+        )
+
+    return WhatsAppEnvioService.funil(
+        db=db,
+        estabelecimento_id=current_user.estabelecimento_id,
+        data_inicio=data_inicio,
+        data_fim=data_fim
+    )
+
+
+# ==================== Sessões WAHA ====================
+
+def _resposta_sessao(sessao, principal: bool = False, ativo: bool = True) -> WhatsAppSessaoResponse:
+    cache = WAHASessaoCache.obter(sessao.waha_url, sessao.waha_session_name)
+    return WhatsAppSessaoResponse(
+        id=None if principal else sessao.id,
+        principal=principal,
+        waha_url=sessao.waha_url,
+        waha_session_name=sessao.waha_session_name,
+        ativo=ativo,
+        status=cache["status"] if cache else None,
+        saudavel=ativo and WhatsAppSessoesService.saudavel(
+            SessaoWAHA(sessao.waha_url, sessao.waha_api_key, sessao.waha_session_name)
+        )
+    )
+
+
+@router.get("/sessoes", response_model=List[WhatsAppSessaoResponse])
+def list_sessoes(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Sessões WAHA do estabelecimento: a principal (configuração) e as adicionais.
+
+    Os envios são distribuídos entre as sessões saudáveis; cada cliente fica
+    na sessão em que conversou por último ou, senão, sempre na mesma sessão
+    enquanto ela estiver saudável.
+    """
+    config = WhatsAppService.get_config_cached(db, current_user.estabelecimento_id)
+    if not config:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Configuração do WhatsApp não encontrada"
+        )
+
+    sessoes = [_resposta_sessao(config, principal=True, ativo=bool(config.ativado))]
+    sessoes.extend(
+        _resposta_sessao(sessao, ativo=sessao.ativo)
+        for sessao in WhatsAppSessoesService.listar(db, current_user.estabelecimento_id)
+    )
+    return sessoes
+
+
+@router.post("/sessoes", response_model=WhatsAppSessaoResponse, status_code=status.HTTP_201_CREATED)
+def create_sessao(
+    sessao_data: WhatsAppSessaoCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Adiciona uma sessão WAHA ao estabelecimento (Admin/Manager apenas)"""
+    check_admin_or_manager(current_user)
+    sessao = WhatsAppSessoesService.criar(db, current_user.estabelecimento_id, sessao_data.model_dump())
+    return _resposta_sessao(sessao, ativo=sessao.ativo)
+
+
+@router.put("/sessoes/{sessao_id}", response_model=WhatsAppSessaoResponse)
+def update_sessao(
+    sessao_id: int,
+    sessao_data: WhatsAppSessaoUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Altera uma sessão adicional; `ativo=false` tira a sessão da distribuição (Admin/Manager apenas)"""
+    check_admin_or_manager(current_user)
+    sessao = WhatsAppSessoesService.atualizar(
+        db, current_user.estabelecimento_id, sessao_id, sessao_data.model_dump(exclude_unset=True)
+    )
+    return _resposta_sessao(sessao, ativo=sessao.ativo)
+
+
+@router.delete("/sessoes/{sessao_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_sessao(
+    sessao_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Remove uma sessão adicional (Admin/Manager apenas)"""
+    check_admin_or_manager(current_user)
+    WhatsAppSessoesService.remover(db, current_user.estabelecimento_id, sessao_id)
@@ -22,6 +22,50 @@ class Settings(BaseSettings):
     # Timezone do Brasil (Horário de Brasília)
     timezone: str = "America/Sao_Paulo"
 
+    # Cache das configurações de WhatsApp (segundos)
+    whatsapp_config_cache_ttl: int = int(os.getenv("WHATSAPP_CONFIG_CACHE_TTL", "60"))
+
+    # Retenção padrão das mensagens do webhook WhatsApp (meses)
+    whatsapp_retencao_meses: int = int(os.getenv("WHATSAPP_RETENCAO_MESES", "12"))
+
+    # Keep-alive WAHA: pings simultâneos e validade do último resultado no endpoint público (segundos)
+    keepalive_concorrencia: int = int(os.getenv("KEEPALIVE_CONCORRENCIA", "8"))
+    keepalive_cache_ttl: int = int(os.getenv("KEEPALIVE_CACHE_TTL", "300"))
+
+    # WAHA: circuit breaker por instância e cache do status das sessões (segundos)
+    waha_circuito_falhas: int = int(os.getenv("WAHA_CIRCUITO_FALHAS", "3"))
+    waha_circuito_espera: int = int(os.getenv("WAHA_CIRCUITO_ESPERA", "30"))
+    waha_sessao_cache_ttl: int = int(os.getenv("WAHA_SESSAO_CACHE_TTL", "300"))
+
+    # Fila de envio WhatsApp: mensagens/s e rajada por sessão WAHA, envios simultâneos
+    whatsapp_envio_taxa: float = float(os.getenv("WHATSAPP_ENVIO_TAXA", "1"))
+    whatsapp_envio_rajada: int = int(os.getenv("WHATSAPP_ENVIO_RAJADA", "5"))
+    whatsapp_envio_workers: int = int(os.getenv("WHATSAPP_ENVIO_WORKERS", "4"))
+
+    # Envios programados: janela (segundos) carregada na timing wheel em memória (máximo ~24h)
+    whatsapp_agendador_horizonte: int = int(os.getenv("WHATSAPP_AGENDADOR_HORIZONTE", "3600"))
+    # Envio reivindicado (enviando) há mais que isso (segundos) foi interrompido: volta a pendente
+    whatsapp_agendador_timeout_envio: int = int(os.getenv("WHATSAPP_AGENDADOR_TIMEOUT_ENVIO", "900"))
+
+    # Bulkheads das integrações WhatsApp: chamadas simultâneas, fila máxima e prazo por request (segundos)
+    bulkhead_waha_workers: int = int(os.getenv("BULKHEAD_WAHA_WORKERS", "8"))
+    bulkhead_waha_fila: int = int(os.getenv("BULKHEAD_WAHA_FILA", "16"))
+    bulkhead_waha_prazo: float = float(os.getenv("BULKHEAD_WAHA_PRAZO", "30"))
+    bulkhead_rotinas_workers: int = int(os.getenv("BULKHEAD_ROTINAS_WORKERS", "2"))
+    bulkhead_rotinas_fila: int = int(os.getenv("BULKHEAD_ROTINAS_FILA", "2"))
+    bulkhead_rotinas_prazo: float = float(os.getenv("BULKHEAD_ROTINAS_PRAZO", "25"))
+    bulkhead_notificacoes_workers: int = int(os.getenv("BULKHEAD_NOTIFICACOES_WORKERS", "4"))
+    bulkhead_notificacoes_fila: int = int(os.getenv("BULKHEAD_NOTIFICACOES_FILA", "200"))
+
+    # Recálculo de pontos de fidelidade: agendamentos por transação, recálculos simultâneos e na fila
+    fidelidade_recalculo_lote: int = int(os.getenv("FIDELIDADE_RECALCULO_LOTE", "5000"))
+    bulkhead_recalculo_workers: int = int(os.getenv("BULKHEAD_RECALCULO_WORKERS", "2"))
+    bulkhead_recalculo_fila: int = int(os.getenv("BULKHEAD_RECALCULO_FILA", "8"))
+
+    # Resgates de prêmios: linhas por transação na expiração e antecedência do aviso (dias)
+    fidelidade_expiracao_lote: int = int(os.getenv("FIDELIDADE_EXPIRACAO_LOTE", "5000"))
+    fidelidade_aviso_expiracao_dias: int = int(os.getenv("FIDELIDADE_AVISO_EXPIRACAO_DIAS", "3"))
+
     # CORS Origins - Permite configurar via variável de ambiente
     cors_origins: str = os.getenv("CORS_ORIGINS", "*")
 
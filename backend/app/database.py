@@ -27,4 +27,12 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def executar_com_sessao(fn, *args, **kwargs):
+    """Executa fn(db, *args, **kwargs) com uma sessão própria (trabalho fora do request, ex: bulkheads)"""
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
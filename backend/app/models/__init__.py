@@ -11,6 +11,13 @@ from .premio import Premio
 from .resgate_premio import ResgatePremio
 from .whatsapp_config import WhatsAppConfig
 from .whatsapp_message import WhatsAppMessage
+from .whatsapp_mensagem_diaria import WhatsAppMensagemDiaria
+from .whatsapp_envio import WhatsAppEnvio
+from .whatsapp_agendado import WhatsAppAgendado
+from .whatsapp_sessao import WhatsAppSessao
+from .cliente_inatividade import ClienteInatividade
+from .reciclagem_envio import ReciclagemEnvio
+from .transacao_pontos import TransacaoPontos
 
 __all__ = [
     "User",
@@ -29,5 +36,12 @@ __all__ = [
     "Premio",
     "ResgatePremio",
     "WhatsAppConfig",
-    "WhatsAppMessage"
+    "WhatsAppMessage",
+    "WhatsAppMensagemDiaria",
+    "WhatsAppEnvio",
+    "WhatsAppAgendado",
+    "WhatsAppSessao",
+    "ClienteInatividade",
+    "ReciclagemEnvio",
+    "TransacaoPontos"
 ]
\ No newline at end of file
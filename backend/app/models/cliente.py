@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Date, ForeignKey
+from sqlalchemy import Column, Integer, SmallInteger, String, Boolean, DateTime, Text, Date, ForeignKey, Numeric, Computed
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -11,10 +11,18 @@ class Cliente(Base):
     nome = Column(String(255), nullable=False)
     email = Column(String(255), nullable=True, index=True)
     telefone = Column(String(20), nullable=False, index=True)
+    telefone_normalizado = Column(String(20), nullable=True)  # Apenas dígitos (busca por telefone)
     cpf = Column(String(14), nullable=True, index=True)
 
     # Dados pessoais
     data_aniversario = Column(String(5), nullable=True)  # Formato DD/MM (ex: "15/03")
+    # Dia/mês derivados de data_aniversario pelo banco (coluna gerada), indexados para o cron
+    aniversario_dia = Column(SmallInteger, Computed(
+        "CASE WHEN data_aniversario ~ '^[0-9]{2}/[0-9]{2}$' THEN substr(data_aniversario, 1, 2)::smallint END"
+    ), nullable=True)
+    aniversario_mes = Column(SmallInteger, Computed(
+        "CASE WHEN data_aniversario ~ '^[0-9]{2}/[0-9]{2}$' THEN substr(data_aniversario, 4, 2)::smallint END"
+    ), nullable=True)
     genero = Column(String(20), nullable=True)  # M, F, Outro
     endereco = Column(Text, nullable=True)
     cidade = Column(String(100), nullable=True)
@@ -28,6 +36,12 @@ class Cliente(Base):
     # Programa de fidelidade
     pontos = Column(Integer, default=0, nullable=False)
 
+    # Estatísticas desnormalizadas (mantidas pelo ClienteStatsService)
+    total_visitas = Column(Integer, default=0, server_default='0', nullable=False)  # Agendamentos CONCLUIDOS
+    total_gasto = Column(Numeric(12, 2), default=0, server_default='0', nullable=False)  # Soma de valor_final dos CONCLUIDOS
+    total_faltas = Column(Integer, default=0, server_default='0', nullable=False)  # Agendamentos NAO_COMPARECEU
+    ultimo_servico_id = Column(Integer, ForeignKey("servicos.id", ondelete="SET NULL"), nullable=True)
+
     # Status
     is_active = Column(Boolean, default=True)
 
@@ -37,7 +51,7 @@ class Cliente(Base):
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    last_visit = Column(DateTime(timezone=True), nullable=True)
+    last_visit = Column(DateTime(timezone=True), nullable=True)  # data_inicio do último CONCLUIDO
 
     # Relationships
     estabelecimento = relationship("Estabelecimento", back_populates="clientes")
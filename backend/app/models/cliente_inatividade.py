@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+
+class ClienteInatividade(Base):
+    """
+    Último agendamento (não excluído) de cada cliente, para a reciclagem.
+
+    Recalculada toda noite (InatividadeService.refresh) e adiantada ao criar
+    agendamentos, para listar inativos com uma consulta por faixa no índice
+    (estabelecimento_id, ultimo_agendamento).
+    """
+    __tablename__ = "clientes_inatividade"
+
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="CASCADE"), primary_key=True)
+    estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=False)
+    ultimo_agendamento = Column(DateTime(timezone=True), nullable=False)
+
+    # Reciclagem já enviada neste período de inatividade (volta a NULL quando o cliente agenda de novo)
+    reciclagem_enviada_em = Column(DateTime(timezone=True), nullable=True)
+
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    cliente = relationship("Cliente")
@@ -16,6 +16,13 @@ class ConfiguracaoFidelidade(Base):
         comment="Valor em reais para ganhar 1 ponto (ex: 100.00 = R$ 100 = 1 ponto)"
     )
 
+    # Validade padrão dos resgates (dias); vazio = resgates não expiram
+    dias_validade_resgate = Column(
+        Integer,
+        nullable=True,
+        comment="Dias de validade dos resgates (vazio = não expiram)"
+    )
+
     # Status
     ativo = Column(Boolean, default=False, nullable=False)
 
@@ -36,6 +36,13 @@ class Premio(Base):
         comment="Serviço gratuito (se aplicável)"
     )
 
+    # Validade do resgate (dias); vazio = usa a da configuração de fidelidade
+    dias_validade = Column(
+        Integer,
+        nullable=True,
+        comment="Dias de validade do resgate (vazio = padrão da configuração)"
+    )
+
     # Status
     ativo = Column(Boolean, default=True, nullable=False)
 
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+
+class ReciclagemEnvio(Base):
+    """
+    Registro das mensagens de reciclagem enviadas.
+
+    Um envio por cliente por período de inatividade: o período é identificado
+    pela data do último agendamento no momento do envio.
+    """
+    __tablename__ = "reciclagem_envios"
+    __table_args__ = (
+        UniqueConstraint("cliente_id", "ultimo_agendamento", name="uq_reciclagem_envios_cliente_periodo"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="CASCADE"), nullable=False)
+    estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=False)
+    ultimo_agendamento = Column(DateTime(timezone=True), nullable=False)
+    mensagem_id = Column(String(255), nullable=True)  # ID retornado pelo WAHA
+    enviado_em = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    # Relationships
+    cliente = relationship("Cliente")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -6,6 +6,13 @@ from app.database import Base
 
 class ResgatePremio(Base):
     __tablename__ = "resgates_premios"
+    __table_args__ = (
+        # Expiração e aviso: só os disponíveis com validade, por data
+        Index(
+            'ix_resgates_premios_disponiveis_expiracao', 'data_expiracao',
+            postgresql_where=text("status = 'DISPONIVEL' AND data_expiracao IS NOT NULL")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -34,6 +41,8 @@ class ResgatePremio(Base):
 
     # Data de expiração (opcional)
     data_expiracao = Column(DateTime(timezone=True), nullable=True)
+    # Quando o aviso de expiração próxima foi disparado
+    aviso_expiracao_em = Column(DateTime(timezone=True), nullable=True)
 
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
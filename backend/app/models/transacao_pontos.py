@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class TransacaoPontos(Base):
+    """
+    Extrato de pontos de fidelidade do cliente (razão).
+
+    Todo movimento de `clientes.pontos` grava uma linha aqui na mesma
+    transação: crédito de agendamento concluído (positivo), diferença de
+    recálculo do agendamento, resgate de prêmio (negativo), ajuste manual e
+    saldo inicial da migração. A soma das linhas de um cliente é o saldo dele
+    (conferido pela reconciliação diária).
+
+    Um crédito por agendamento e um débito por resgate: creditar de novo o
+    mesmo agendamento não credita duas vezes.
+    """
+    __tablename__ = "transacoes_pontos"
+    __table_args__ = (
+        # Um crédito por agendamento; recálculos (RECALCULO) podem se repetir
+        Index(
+            'uq_transacoes_pontos_agendamento_credito', 'agendamento_id', unique=True,
+            postgresql_where=text("agendamento_id IS NOT NULL AND tipo = 'CREDITO'")
+        ),
+        Index('ix_transacoes_pontos_agendamento_id', 'agendamento_id', postgresql_where=text("agendamento_id IS NOT NULL")),
+        Index(
+            'uq_transacoes_pontos_resgate_tipo', 'resgate_id', 'tipo', unique=True,
+            postgresql_where=text("resgate_id IS NOT NULL")
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="CASCADE"), nullable=False, index=True)
+    estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=True)
+    tipo = Column(String(20), nullable=False)  # CREDITO, RECALCULO, RESGATE, AJUSTE, SALDO_INICIAL
+    pontos = Column(Integer, nullable=False)  # positivo credita, negativo debita
+
+    # Origem do movimento
+    agendamento_id = Column(Integer, ForeignKey("agendamentos.id", ondelete="SET NULL"), nullable=True)
+    resgate_id = Column(Integer, ForeignKey("resgates_premios.id", ondelete="SET NULL"), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,42 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+
+class WhatsAppAgendado(Base):
+    """
+    Mensagem de WhatsApp programada para um horário exato (lembrete antes do
+    agendamento, pós-atendimento depois da conclusão).
+
+    O horário já vem deslocado para fora do horário de silêncio do
+    estabelecimento. Remarcar ou cancelar o agendamento atualiza/cancela as
+    linhas pendentes; o agendador em memória carrega as pendentes do próximo
+    horizonte numa timing wheel e dispara cada uma no horário.
+    """
+    __tablename__ = "whatsapp_agendados"
+    __table_args__ = (
+        # Carga do horizonte: só as pendentes, por horário
+        Index('ix_whatsapp_agendados_pendentes', 'enviar_em', postgresql_where=text("status = 'pendente'")),
+        # Um envio pendente por tipo por agendamento
+        Index(
+            'uq_whatsapp_agendados_agendamento_tipo', 'agendamento_id', 'tipo', unique=True,
+            postgresql_where=text("status = 'pendente'")
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=False)
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="CASCADE"), nullable=False)
+    agendamento_id = Column(Integer, ForeignKey("agendamentos.id", ondelete="CASCADE"), nullable=True)
+    tipo = Column(String(30), nullable=False)  # LEMBRETE, POS_ATENDIMENTO
+
+    enviar_em = Column(DateTime(timezone=True), nullable=False)
+    status = Column(String(20), nullable=False, default='pendente')  # pendente, enviando, enviado, falhou, ignorado, cancelado
+    erro = Column(String(500), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processado_em = Column(DateTime(timezone=True), nullable=True)
+
+    # Relationships
+    agendamento = relationship("Agendamento")
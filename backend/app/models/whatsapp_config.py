@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Time
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -16,7 +16,7 @@ class WhatsAppConfig(Base):
     # WAHA Credentials
     waha_url = Column(String(500), nullable=False)              # URL do WAHA (ex: https://waha.onrender.com)
     waha_api_key = Column(String(500), nullable=False)          # API Key do WAHA (X-Api-Key header)
-    waha_session_name = Column(String(100), nullable=False)     # Nome da sessão WAHA (padrão: "default")
+    waha_session_name = Column(String(100), nullable=False, index=True)  # Nome da sessão WAHA (padrão: "default")
 
     # Templates de Mensagens (texto livre com placeholders {nome_cliente}, {data}, {hora}, {endereco}, etc.)
     template_agendamento = Column(Text, nullable=True)  # Confirmação de novo agendamento
@@ -25,6 +25,7 @@ class WhatsAppConfig(Base):
     template_cancelamento = Column(Text, nullable=True) # Notificação de cancelamento
     template_reciclagem = Column(Text, nullable=True)   # Reciclagem de clientes inativos
     template_aniversario = Column(Text, nullable=True)  # Mensagem de aniversário
+    template_pos_atendimento = Column(Text, nullable=True)  # Pós-atendimento (horas depois da conclusão)
 
     # Configurações de envio
     ativado = Column(Boolean, default=False)  # Ativar/desativar WhatsApp para este estabelecimento
@@ -34,11 +35,22 @@ class WhatsAppConfig(Base):
     enviar_cancelamento = Column(Boolean, default=True)     # Enviar ao cancelar
     enviar_reciclagem = Column(Boolean, default=False)      # Enviar campanhas de reciclagem
     enviar_aniversario = Column(Boolean, default=True)      # Enviar mensagem de aniversário
+    enviar_pos_atendimento = Column(Boolean, default=False) # Enviar mensagem pós-atendimento
+
+    # Envios programados: antecedência do lembrete, atraso do pós-atendimento e
+    # horário de silêncio (horário do Brasil; pode virar a meia-noite, ex: 21:00-08:00)
+    lembrete_horas_antes = Column(Integer, default=24)
+    pos_atendimento_horas = Column(Integer, default=2)
+    silencio_inicio = Column(Time, nullable=True)
+    silencio_fim = Column(Time, nullable=True)
 
     # Configurações de reciclagem/inatividade
     meses_inatividade = Column(Integer, default=3)  # Meses sem agendamento para considerar inativo
     link_agendamento = Column(String(500), nullable=True)  # Link direto para agendamento online
 
+    # Retenção das mensagens do webhook (meses); NULL usa o padrão da aplicação
+    retencao_mensagens_meses = Column(Integer, nullable=True)
+
     # Foreign Key
     estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=False, unique=True)
 
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+
+class WhatsAppEnvio(Base):
+    """
+    Registro de cada mensagem enviada pelo sistema (notificações, lembretes,
+    reciclagem, aniversário).
+
+    Liga o message_id devolvido pelo WAHA ao tipo da mensagem e ao
+    agendamento/cliente; os acks recebidos no webhook avançam o status e
+    marcam quando a mensagem chegou a cada etapa (funil de entrega).
+    """
+    __tablename__ = "whatsapp_envios"
+    __table_args__ = (
+        # Ack do webhook -> envio
+        Index('ix_whatsapp_envios_message_id', 'message_id'),
+        # Funil por período
+        Index('ix_whatsapp_envios_estabelecimento_enviado', 'estabelecimento_id', 'enviado_em'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=False)
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="SET NULL"), nullable=True)
+    agendamento_id = Column(Integer, ForeignKey("agendamentos.id", ondelete="SET NULL"), nullable=True)
+    tipo = Column(String(30), nullable=False)  # AGENDAMENTO, LEMBRETE, RECICLAGEM, ANIVERSARIO...
+
+    message_id = Column(String(255), nullable=True)  # ID retornado pelo WAHA (NULL se o envio falhou)
+    erro = Column(String(500), nullable=True)  # Erro do envio
+
+    # Funil: último ack e quando cada etapa foi alcançada
+    ack_status = Column(String(20), nullable=True)  # server, delivery, read, played, error
+    enviado_em = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    servidor_em = Column(DateTime(timezone=True), nullable=True)
+    entregue_em = Column(DateTime(timezone=True), nullable=True)
+    lido_em = Column(DateTime(timezone=True), nullable=True)
+    falha_em = Column(DateTime(timezone=True), nullable=True)
+
+    # Relationships
+    cliente = relationship("Cliente")
+    agendamento = relationship("Agendamento")
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class WhatsAppMensagemDiaria(Base):
+    """
+    Resumo diário das mensagens WhatsApp por estabelecimento.
+
+    Mantido por triggers de whatsapp_messages (um upsert agregado por
+    statement), então estatísticas por período não varrem as mensagens.
+    O dia é o de message_timestamp em America/Sao_Paulo. Sobrevive à
+    retenção das partições de mensagens.
+    """
+    __tablename__ = "whatsapp_mensagens_diarias"
+
+    estabelecimento_id = Column(
+        Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), primary_key=True
+    )
+    dia = Column(Date, primary_key=True)
+
+    enviadas = Column(Integer, nullable=False, default=0, server_default="0")
+    recebidas = Column(Integer, nullable=False, default=0, server_default="0")
+    entregues = Column(Integer, nullable=False, default=0, server_default="0")  # ack delivery ou mais
+    lidas = Column(Integer, nullable=False, default=0, server_default="0")  # ack read/played
+    falhas = Column(Integer, nullable=False, default=0, server_default="0")  # ack error
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
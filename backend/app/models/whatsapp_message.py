@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -13,17 +14,33 @@ class WhatsAppMessage(Base):
     - Auditoria de comunicações
     - Relatórios de engajamento
     - Histórico completo
+
+    Particionada por mês em message_timestamp (whatsapp_messages_AAAA_MM);
+    a retenção remove partições inteiras (WhatsAppParticoesService).
     """
     __tablename__ = "whatsapp_messages"
+    __table_args__ = (
+        # Um registro por mensagem (a chave de partição precisa fazer parte da unique)
+        UniqueConstraint(
+            'estabelecimento_id', 'message_id', 'message_timestamp',
+            name='uq_whatsapp_messages_estabelecimento_message'
+        ),
+        Index('ix_whatsapp_messages_estabelecimento_timestamp', 'estabelecimento_id', 'message_timestamp'),
+        Index(
+            'ix_whatsapp_messages_estabelecimento_from_timestamp',
+            'estabelecimento_id', 'from_number', 'message_timestamp'
+        ),
+        {'postgresql_partition_by': 'RANGE (message_timestamp)'},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
 
     # Identificação da mensagem
-    message_id = Column(String(255), nullable=False, index=True)  # ID único do WhatsApp
+    message_id = Column(String(255), nullable=False)  # ID único do WhatsApp
     session_name = Column(String(100), nullable=False)  # Nome da sessão WAHA
 
     # Remetente e destinatário
-    from_number = Column(String(50), nullable=False, index=True)  # Número do remetente
+    from_number = Column(String(50), nullable=False)  # Número do remetente
     to_number = Column(String(50), nullable=True)  # Número do destinatário
     from_me = Column(Boolean, default=False)  # True se enviada por nós
 
@@ -34,11 +51,11 @@ class WhatsAppMessage(Base):
 
     # Metadata
     event_type = Column(String(50), nullable=False)  # message.any, message.ack, etc
-    message_timestamp = Column(DateTime(timezone=True), nullable=False)  # Timestamp do WhatsApp
+    message_timestamp = Column(DateTime(timezone=True), primary_key=True)  # Timestamp do WhatsApp (chave de partição)
     ack_status = Column(String(20), nullable=True)  # server, delivery, read, played
 
     # Payload completo (para casos especiais)
-    payload_json = Column(JSON, nullable=True)  # Payload completo do webhook
+    payload_json = Column(JSONB, nullable=True)  # Payload do webhook (compacto, sem _data/environment)
 
     # Relacionamento
     estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=False)
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+
+class WhatsAppSessao(Base):
+    """
+    Sessões WAHA adicionais de um estabelecimento (outros números ou outras
+    instâncias), além da sessão principal da WhatsAppConfig.
+
+    Os envios são distribuídos entre as sessões saudáveis; o mesmo cliente
+    fica sempre na mesma sessão enquanto ela estiver saudável.
+    """
+    __tablename__ = "whatsapp_sessoes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    estabelecimento_id = Column(Integer, ForeignKey("estabelecimentos.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    waha_url = Column(String(500), nullable=False)
+    waha_api_key = Column(String(500), nullable=False)
+    waha_session_name = Column(String(100), nullable=False, unique=True)  # Identifica a sessão no webhook
+
+    ativo = Column(Boolean, default=True, nullable=False)  # Inativa não recebe envios
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Relationships
+    estabelecimento = relationship("Estabelecimento")
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
+from decimal import Decimal
 import re
 
 
@@ -76,6 +77,10 @@ class ClienteResponse(BaseModel):
     observacoes: Optional[str] = None
     preferencias: Optional[str] = None
     pontos: int = 0
+    total_visitas: int = 0
+    total_gasto: Decimal = Decimal("0")
+    total_faltas: int = 0
+    ultimo_servico_id: Optional[int] = None
     is_active: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -105,4 +110,17 @@ class ClienteSearch(BaseModel):
     nome: Optional[str] = None
     telefone: Optional[str] = None
     email: Optional[str] = None
-    cpf: Optional[str] = None
\ No newline at end of file
+    cpf: Optional[str] = None
+
+class ClienteImportErro(BaseModel):
+    """Linha do CSV que não foi importada"""
+    linha: int
+    erro: str
+
+
+class ClienteImportResponse(BaseModel):
+    """Relatório da importação de clientes via CSV"""
+    total_linhas: int
+    importados: int
+    rejeitados: int
+    erros: List[ClienteImportErro]
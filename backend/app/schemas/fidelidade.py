@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime
 from decimal import Decimal
 
 
@@ -8,6 +8,7 @@ from decimal import Decimal
 
 class ConfiguracaoFidelidadeBase(BaseModel):
     reais_por_ponto: Decimal = Field(..., description="Valor em reais para ganhar 1 ponto")
+    dias_validade_resgate: Optional[int] = Field(None, gt=0, description="Validade dos resgates em dias (vazio = não expiram)")
     ativo: bool = False
 
 
@@ -17,6 +18,7 @@ class ConfiguracaoFidelidadeCreate(ConfiguracaoFidelidadeBase):
 
 class ConfiguracaoFidelidadeUpdate(BaseModel):
     reais_por_ponto: Optional[Decimal] = None
+    dias_validade_resgate: Optional[int] = Field(None, gt=0)
     ativo: Optional[bool] = None
 
 
@@ -39,6 +41,7 @@ class PremioBase(BaseModel):
     tipo_premio: str = Field(..., description="DESCONTO_PERCENTUAL, DESCONTO_FIXO, SERVICO_GRATIS, PRODUTO")
     valor_desconto: Optional[Decimal] = None
     servico_id: Optional[int] = None
+    dias_validade: Optional[int] = Field(None, gt=0, description="Validade do resgate em dias (vazio = padrão da configuração)")
     ativo: bool = True
 
 
@@ -53,6 +56,7 @@ class PremioUpdate(BaseModel):
     tipo_premio: Optional[str] = None
     valor_desconto: Optional[Decimal] = None
     servico_id: Optional[int] = None
+    dias_validade: Optional[int] = Field(None, gt=0)
     ativo: Optional[bool] = None
 
 
@@ -118,3 +122,52 @@ class PremiosDisponiveisResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ==================== Recálculo de pontos ====================
+
+class RecalculoPontosRequest(BaseModel):
+    """Período (data do agendamento) a recalcular com o reais_por_ponto atual"""
+    data_inicio: date
+    data_fim: date
+
+
+class RecalculoPontosCliente(BaseModel):
+    cliente_id: int
+    nome: str
+    saldo_atual: int
+    ajuste: int
+    saldo_novo: int
+    agendamentos: int
+
+
+class RecalculoPontosSimulacao(BaseModel):
+    """Diferença que o recálculo aplicaria (nada é gravado)"""
+    estabelecimento_id: int
+    data_inicio: date
+    data_fim: date
+    reais_por_ponto: Decimal
+    agendamentos: int
+    agendamentos_ajustar: int
+    clientes_ajustar: int
+    pontos_creditar: int
+    pontos_debitar: int
+    clientes_saldo_negativo: int
+    clientes: List[RecalculoPontosCliente] = Field(..., description="Maiores ajustes primeiro (até `limite`)")
+
+
+class RecalculoPontosTarefa(BaseModel):
+    """Recálculo em segundo plano e seu progresso"""
+    id: str
+    estabelecimento_id: int
+    data_inicio: date
+    data_fim: date
+    reais_por_ponto: Decimal
+    status: str = Field(..., description="na_fila, executando, concluido, interrompido, falhou")
+    total: int
+    processados: int
+    ajustados: int
+    pontos: int
+    criado_em: datetime
+    concluido_em: Optional[datetime]
+    erro: Optional[str]
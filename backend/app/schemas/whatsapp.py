@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, time
 
 
 # ==================== WhatsAppConfig ====================
@@ -23,6 +23,7 @@ class WhatsAppConfigBase(BaseModel):
     template_cancelamento: Optional[str] = Field(None, description="Template para cancelamento")
     template_reciclagem: Optional[str] = Field(None, description="Template para reciclagem")
     template_aniversario: Optional[str] = Field(None, description="Template para aniversário")
+    template_pos_atendimento: Optional[str] = Field(None, description="Template para pós-atendimento")
 
     # Configurações de envio
     ativado: bool = False
@@ -32,11 +33,23 @@ class WhatsAppConfigBase(BaseModel):
     enviar_cancelamento: bool = True
     enviar_reciclagem: bool = False
     enviar_aniversario: bool = True
+    enviar_pos_atendimento: bool = False
+
+    # Envios programados (lembrete e pós-atendimento) e horário de silêncio
+    lembrete_horas_antes: int = Field(24, ge=1, le=168, description="Horas antes do agendamento para o lembrete")
+    pos_atendimento_horas: int = Field(2, ge=0, le=168, description="Horas depois da conclusão para o pós-atendimento")
+    silencio_inicio: Optional[time] = Field(None, description="Início do horário sem envios programados (ex: 21:00)")
+    silencio_fim: Optional[time] = Field(None, description="Fim do horário sem envios programados (ex: 08:00)")
 
     # Configurações de reciclagem
     meses_inatividade: int = Field(3, description="Meses sem agendamento para considerar inativo")
     link_agendamento: Optional[str] = Field(None, description="Link direto para agendamento online")
 
+    # Retenção das mensagens recebidas via webhook
+    retencao_mensagens_meses: Optional[int] = Field(
+        None, ge=1, le=120, description="Meses de histórico de mensagens (vazio = padrão do sistema)"
+    )
+
 
 class WhatsAppConfigCreate(WhatsAppConfigBase):
     estabelecimento_id: Optional[int] = None  # Será preenchido automaticamente pelo backend
@@ -60,6 +73,7 @@ class WhatsAppConfigUpdate(BaseModel):
     template_cancelamento: Optional[str] = None
     template_reciclagem: Optional[str] = None
     template_aniversario: Optional[str] = None
+    template_pos_atendimento: Optional[str] = None
 
     # Configurações
     ativado: Optional[bool] = None
@@ -69,8 +83,14 @@ class WhatsAppConfigUpdate(BaseModel):
     enviar_cancelamento: Optional[bool] = None
     enviar_reciclagem: Optional[bool] = None
     enviar_aniversario: Optional[bool] = None
+    enviar_pos_atendimento: Optional[bool] = None
+    lembrete_horas_antes: Optional[int] = Field(None, ge=1, le=168)
+    pos_atendimento_horas: Optional[int] = Field(None, ge=0, le=168)
+    silencio_inicio: Optional[time] = None
+    silencio_fim: Optional[time] = None
     meses_inatividade: Optional[int] = None
     link_agendamento: Optional[str] = None
+    retencao_mensagens_meses: Optional[int] = Field(None, ge=1, le=120)
 
 
 class WhatsAppConfigResponse(WhatsAppConfigBase):
@@ -83,11 +103,36 @@ class WhatsAppConfigResponse(WhatsAppConfigBase):
         from_attributes = True
 
 
+# ==================== Sessões WAHA adicionais ====================
+
+class WhatsAppSessaoCreate(BaseModel):
+    waha_url: str = Field(..., description="URL do WAHA desta sessão")
+    waha_api_key: str = Field(..., description="API Key do WAHA (X-Api-Key)")
+    waha_session_name: str = Field(..., min_length=1, max_length=100, description="Nome da sessão WAHA (único)")
+    ativo: bool = True
+
+
+class WhatsAppSessaoUpdate(BaseModel):
+    waha_url: Optional[str] = None
+    waha_api_key: Optional[str] = None
+    ativo: Optional[bool] = None
+
+
+class WhatsAppSessaoResponse(BaseModel):
+    id: Optional[int] = None  # None para a sessão principal (WhatsAppConfig)
+    principal: bool = False
+    waha_url: str
+    waha_session_name: str
+    ativo: bool
+    status: Optional[str] = Field(None, description="Último status conhecido (webhook/consulta)")
+    saudavel: bool = Field(..., description="Recebe envios (circuito fechado e sessão WORKING ou desconhecida)")
+
+
 # ==================== WhatsApp Message ====================
 
 class WhatsAppMessageRequest(BaseModel):
     cliente_id: int = Field(..., description="ID do cliente para enviar mensagem")
-    tipo_mensagem: str = Field(..., description="Tipo: AGENDAMENTO, LEMBRETE, CONFIRMACAO, CANCELAMENTO, RECICLAGEM, ANIVERSARIO")
+    tipo_mensagem: str = Field(..., description="Tipo: AGENDAMENTO, LEMBRETE, CONFIRMACAO, CANCELAMENTO, RECICLAGEM, ANIVERSARIO, POS_ATENDIMENTO")
     agendamento_id: Optional[int] = Field(None, description="ID do agendamento (se aplicável)")
     mensagem_customizada: Optional[str] = Field(None, description="Mensagem customizada (sobrescreve template)")
 
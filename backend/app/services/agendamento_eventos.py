@@ -0,0 +1,149 @@
+"""
+Eventos do agendamento e seus efeitos (barramento em eventos_dominio).
+
+Na transação da mudança (um commit só, objetos já carregados):
+- estatísticas do cliente e inatividade para a reciclagem;
+- pontos de fidelidade ao concluir;
+- envios programados de WhatsApp (lembrete / pós-atendimento), em savepoint:
+  uma falha ali não impede a mudança do agendamento.
+
+Depois do commit, em segundo plano: notificações de WhatsApp.
+"""
+import logging
+from typing import FrozenSet, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.agendamento import Agendamento, StatusAgendamento
+from app.services.cliente_stats_service import ClienteStatsService, _status_valor
+from app.services.eventos_dominio import EventosDominio
+from app.services.inatividade_service import InatividadeService
+
+logger = logging.getLogger(__name__)
+
+# Campos que, numa visita já concluída, mudam as estatísticas do cliente
+# (deleted_at: soft delete tira a visita do histórico)
+CAMPOS_ESTATISTICA = frozenset({'data_inicio', 'valor_final', 'valor_desconto', 'servico_id', 'deleted_at'})
+# Campos que movem ou cancelam os envios programados
+CAMPOS_ENVIOS = frozenset({'data_inicio', 'deleted_at'})
+
+
+class AgendamentoCriado(NamedTuple):
+    agendamento: Agendamento
+    agendamento_id: int
+    estabelecimento_id: int
+    cliente_id: Optional[int]
+
+
+class StatusAgendamentoAlterado(NamedTuple):
+    agendamento: Agendamento
+    agendamento_id: int
+    estabelecimento_id: int
+    cliente_id: Optional[int]
+    status_anterior: Optional[str]
+    status_novo: str
+
+
+class AgendamentoAlterado(NamedTuple):
+    """Campos alterados (exceto status, que tem evento próprio)"""
+    agendamento: Agendamento
+    agendamento_id: int
+    estabelecimento_id: int
+    cliente_id: Optional[int]
+    campos: FrozenSet[str]
+
+
+def criado(agendamento: Agendamento) -> AgendamentoCriado:
+    return AgendamentoCriado(agendamento, agendamento.id, agendamento.estabelecimento_id, agendamento.cliente_id)
+
+
+def status_alterado(agendamento: Agendamento, status_anterior) -> StatusAgendamentoAlterado:
+    return StatusAgendamentoAlterado(
+        agendamento, agendamento.id, agendamento.estabelecimento_id, agendamento.cliente_id,
+        _status_valor(status_anterior), _status_valor(agendamento.status)
+    )
+
+
+def alterado(agendamento: Agendamento, campos) -> AgendamentoAlterado:
+    return AgendamentoAlterado(
+        agendamento, agendamento.id, agendamento.estabelecimento_id, agendamento.cliente_id, frozenset(campos)
+    )
+
+
+# ==================== Na transação ====================
+
+@EventosDominio.ao_publicar(AgendamentoCriado)
+def _registrar_inatividade(db: Session, evento: AgendamentoCriado) -> None:
+    # Cliente deixa de contar como inativo para a reciclagem
+    agendamento = evento.agendamento
+    InatividadeService.registrar_agendamento(
+        db, agendamento.cliente_id, agendamento.estabelecimento_id, agendamento.data_inicio
+    )
+
+
+@EventosDominio.ao_publicar(StatusAgendamentoAlterado)
+def _atualizar_estatisticas(db: Session, evento: StatusAgendamentoAlterado) -> None:
+    # Visitas, gasto, última visita e faltas do cliente
+    ClienteStatsService.registrar_mudanca_status(db, evento.agendamento, evento.status_anterior)
+
+
+@EventosDominio.ao_publicar(AgendamentoAlterado)
+def _recalcular_visita(db: Session, evento: AgendamentoAlterado) -> None:
+    # Data/valor/serviço de uma visita concluída, ou a exclusão dela
+    if (evento.campos & CAMPOS_ESTATISTICA
+            and _status_valor(evento.agendamento.status) == StatusAgendamento.CONCLUIDO.value):
+        ClienteStatsService.recalcular_cliente(db, evento.cliente_id)
+
+
+@EventosDominio.ao_publicar(StatusAgendamentoAlterado)
+def _creditar_pontos(db: Session, evento: StatusAgendamentoAlterado) -> None:
+    if evento.status_novo == StatusAgendamento.CONCLUIDO.value:
+        from app.services.fidelidade_service import FidelidadeService
+        FidelidadeService.processar_pontos_agendamento(db, evento.agendamento)
+
+
+def _sincronizar_envios(db: Session, agendamento: Agendamento) -> None:
+    from app.services.whatsapp_agendador import WhatsAppAgendador
+    try:
+        with db.begin_nested():
+            WhatsAppAgendador.sincronizar_agendamento(db, agendamento)
+    except Exception as e:
+        logger.error(f"[AGENDAMENTO] Erro ao programar envios WhatsApp do agendamento {agendamento.id}: {e}")
+
+
+@EventosDominio.ao_publicar(AgendamentoCriado)
+@EventosDominio.ao_publicar(StatusAgendamentoAlterado)
+def _programar_envios(db: Session, evento) -> None:
+    _sincronizar_envios(db, evento.agendamento)
+
+
+@EventosDominio.ao_publicar(AgendamentoAlterado)
+def _remarcar_envios(db: Session, evento: AgendamentoAlterado) -> None:
+    if evento.campos & CAMPOS_ENVIOS:
+        _sincronizar_envios(db, evento.agendamento)
+
+
+# ==================== Depois do commit ====================
+
+NOTIFICACAO_POR_STATUS = {
+    StatusAgendamento.CONCLUIDO.value: 'CONCLUSAO',
+    StatusAgendamento.CANCELADO.value: 'CANCELAMENTO',
+}
+
+
+@EventosDominio.apos_commit(AgendamentoCriado)
+def _notificar_novo(db: Session, evento: AgendamentoCriado) -> None:
+    from app.services.whatsapp_service import WhatsAppService
+    WhatsAppService.notificar_agendamento(
+        db, evento.estabelecimento_id, evento.cliente_id, evento.agendamento_id, 'AGENDAMENTO'
+    )
+
+
+@EventosDominio.apos_commit(StatusAgendamentoAlterado)
+def _notificar_status(db: Session, evento: StatusAgendamentoAlterado) -> None:
+    tipo = NOTIFICACAO_POR_STATUS.get(evento.status_novo)
+    if tipo:
+        from app.services.whatsapp_service import WhatsAppService
+        WhatsAppService.notificar_agendamento(
+            db, evento.estabelecimento_id, evento.cliente_id, evento.agendamento_id, tipo
+        )
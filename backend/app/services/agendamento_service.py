@@ -10,12 +10,21 @@ from app.models.user import User
 from app.models.cliente import Cliente
 from app.models.servico import Servico
 from app.schemas.agendamento import AgendamentoCreate, AgendamentoUpdate
+from app.services.cliente_stats_service import ClienteStatsService
+from app.services.eventos_dominio import EventosDominio
+from app.services import agendamento_eventos
 
 # Timezone do Brasil
 BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
 
 
 class AgendamentoService:
+    """
+    Mudanças de agendamento publicam eventos (agendamento_eventos): os efeitos
+    (estatísticas, fidelidade, envios programados) entram no mesmo commit e
+    as notificações de WhatsApp saem depois dele, fora do request.
+    """
+
     @staticmethod
     def get_agendamentos_by_estabelecimento(
         db: Session,
@@ -178,18 +187,14 @@ class AgendamentoService:
         )
 
         db.add(db_agendamento)
+        db.flush()
+
+        # Inatividade e envios programados na mesma transação; notificação após o commit
+        EventosDominio.publicar(db, agendamento_eventos.criado(db_agendamento))
+
         db.commit()
         db.refresh(db_agendamento)
 
-        # WhatsApp: Notificar novo agendamento (não-bloqueante)
-        try:
-            from app.services.whatsapp_service import WhatsAppService
-            WhatsAppService.notify_novo_agendamento(db=db, agendamento=db_agendamento)
-            print(f"[AGENDAMENTO] Tentativa de envio de notificação WhatsApp para agendamento ID {db_agendamento.id}")
-        except Exception as e:
-            print(f"[AGENDAMENTO] Erro ao enviar notificação WhatsApp: {e}")
-            # Não falha a criação do agendamento se WhatsApp falhar
-
         return db_agendamento
 
     @staticmethod
@@ -231,6 +236,7 @@ class AgendamentoService:
 
         # Atualizar campos fornecidos
         update_data = agendamento_data.model_dump(exclude_unset=True)
+        status_anterior = agendamento.status
 
         for field, value in update_data.items():
             if hasattr(agendamento, field):
@@ -242,6 +248,16 @@ class AgendamentoService:
             if servico and servico.duracao_minutos:
                 agendamento.data_fim = agendamento_data.data_inicio + timedelta(minutes=servico.duracao_minutos)
 
+        # Estatísticas do cliente, fidelidade e envios programados (mesma transação).
+        # Status e demais campos na mesma edição publicam os dois eventos: o de
+        # status primeiro, para o recálculo dos campos já partir do status novo
+        campos = update_data.keys() - {'status'}
+        mudanca_status = agendamento_eventos.status_alterado(agendamento, status_anterior)
+        if mudanca_status.status_novo != mudanca_status.status_anterior:
+            EventosDominio.publicar(db, mudanca_status)
+        if campos:
+            EventosDominio.publicar(db, agendamento_eventos.alterado(agendamento, campos))
+
         db.commit()
         db.refresh(agendamento)
 
@@ -264,6 +280,7 @@ class AgendamentoService:
 
         print(f"[AGENDAMENTO] Status atual: {agendamento.status}, Mudando para: {novo_status}")
 
+        status_anterior = agendamento.status
         agendamento.status = novo_status
 
         # Atualizar timestamps específicos
@@ -276,34 +293,15 @@ class AgendamentoService:
         elif status_valor == StatusAgendamento.CONCLUIDO.value:
             agendamento.completed_at = datetime.now(BRAZIL_TZ)
 
-            # Sistema de fidelidade: adicionar pontos automaticamente
-            print(f"[AGENDAMENTO] Concluindo agendamento {agendamento_id}, processando fidelidade...")
-            try:
-                from app.services.fidelidade_service import FidelidadeService
-                pontos = FidelidadeService.processar_pontos_agendamento(db, agendamento_id)
-                print(f"[AGENDAMENTO] Fidelidade processada! Pontos adicionados: {pontos}")
-            except Exception as e:
-                # Não falhar o agendamento se houver erro no sistema de fidelidade
-                print(f"[AGENDAMENTO] ERRO ao processar pontos de fidelidade: {e}")
-                import traceback
-                traceback.print_exc()
+        # Estatísticas, fidelidade e envios programados no mesmo commit;
+        # notificação de conclusão/cancelamento depois dele
+        mudanca_status = agendamento_eventos.status_alterado(agendamento, status_anterior)
+        if mudanca_status.status_novo != mudanca_status.status_anterior:
+            EventosDominio.publicar(db, mudanca_status)
 
         db.commit()
         db.refresh(agendamento)
 
-        # WhatsApp: Notificar mudança de status (não-bloqueante)
-        try:
-            from app.services.whatsapp_service import WhatsAppService
-            if status_valor == StatusAgendamento.CONCLUIDO.value:
-                WhatsAppService.notify_conclusao(db=db, agendamento=agendamento)
-                print(f"[AGENDAMENTO] Tentativa de envio de notificação de conclusão para agendamento ID {agendamento.id}")
-            elif status_valor == StatusAgendamento.CANCELADO.value:
-                WhatsAppService.notify_cancelamento(db=db, agendamento=agendamento)
-                print(f"[AGENDAMENTO] Tentativa de envio de notificação de cancelamento para agendamento ID {agendamento.id}")
-        except Exception as e:
-            print(f"[AGENDAMENTO] Erro ao enviar notificação WhatsApp: {e}")
-            # Não falha a atualização do agendamento se WhatsApp falhar
-
         return agendamento
 
     @staticmethod
@@ -355,9 +353,11 @@ class AgendamentoService:
 
         # Se agendamento está CANCELADO ou NAO_COMPARECEU: hard delete (exclusão permanente)
         if agendamento.status in [StatusAgendamento.CANCELADO, StatusAgendamento.NAO_COMPARECEU]:
+            ClienteStatsService.registrar_exclusao(db, agendamento)
             db.delete(agendamento)
+            db.commit()
         else:
             # Outros status: soft delete (apenas oculta do calendário)
             agendamento.deleted_at = datetime.now(BRAZIL_TZ)
-
-        db.commit()
\ No newline at end of file
+            EventosDominio.publicar(db, agendamento_eventos.alterado(agendamento, {'deleted_at'}))
+            db.commit()
\ No newline at end of file
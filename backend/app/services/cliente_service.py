@@ -1,10 +1,117 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
-from typing import Optional, List
+from pydantic import ValidationError
+from typing import Optional, List, BinaryIO
+from datetime import datetime
+import csv
+import io
 
 from app.models.cliente import Cliente
-from app.schemas.cliente import ClienteCreate, ClienteUpdate
+from app.schemas.cliente import ClienteCreate, ClienteUpdate, ClienteImportResponse
+from app.utils.phone import normalize_phone
+
+
+# Índices únicos parciais de clientes (por estabelecimento) -> mensagem do conflito
+CONFLITOS_UNICOS = {
+    "uq_clientes_estabelecimento_cpf": "Já existe um cliente com este CPF neste estabelecimento",
+    "uq_clientes_estabelecimento_telefone": "Já existe um cliente com este telefone neste estabelecimento",
+    "uq_clientes_estabelecimento_email": "Já existe um cliente com este email neste estabelecimento",
+}
+
+# Importação CSV: colunas aceitas (campos de ClienteCreate) e linhas por COPY
+IMPORT_COLUNAS = [
+    "nome", "telefone", "email", "cpf", "data_aniversario", "genero", "endereco",
+    "cidade", "estado", "cep", "observacoes", "preferencias"
+]
+IMPORT_BATCH_SIZE = 5000
+
+IMPORT_CREATE_TEMP_SQL = f"""
+    CREATE TEMP TABLE clientes_import (
+        linha integer NOT NULL,
+        {", ".join(f"{coluna} text" for coluna in IMPORT_COLUNAS)},
+        telefone_normalizado text NOT NULL
+    ) ON COMMIT DROP
+"""
+
+IMPORT_COPY_SQL = (
+    f"COPY clientes_import (linha, {', '.join(IMPORT_COLUNAS)}, telefone_normalizado) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+# Um único statement: descarta duplicados do próprio arquivo (fica a primeira
+# linha de cada telefone/CPF/email), insere o resto ignorando conflitos com
+# clientes existentes e devolve só as linhas que não entraram, com o motivo
+IMPORT_MERGE_SQL = f"""
+    WITH candidatos AS (
+        SELECT i.*,
+               first_value(linha) OVER (PARTITION BY telefone_normalizado ORDER BY linha) AS primeira_telefone,
+               CASE WHEN cpf IS NULL THEN linha
+                    ELSE first_value(linha) OVER (PARTITION BY cpf ORDER BY linha) END AS primeira_cpf,
+               CASE WHEN email IS NULL THEN linha
+                    ELSE first_value(linha) OVER (PARTITION BY email ORDER BY linha) END AS primeira_email
+        FROM clientes_import i
+    ),
+    inseridos AS (
+        INSERT INTO clientes ({", ".join(IMPORT_COLUNAS)}, telefone_normalizado, pontos, is_active, estabelecimento_id)
+        SELECT {", ".join(IMPORT_COLUNAS)}, telefone_normalizado, 0, true, %(estabelecimento_id)s
+        FROM candidatos
+        WHERE linha = primeira_telefone AND linha = primeira_cpf AND linha = primeira_email
+        ON CONFLICT DO NOTHING
+        RETURNING telefone_normalizado
+    )
+    SELECT c.linha, c.primeira_telefone, c.primeira_cpf, c.primeira_email,
+           EXISTS (
+               SELECT 1 FROM clientes e
+               WHERE e.estabelecimento_id = %(estabelecimento_id)s
+                 AND e.telefone_normalizado = c.telefone_normalizado
+           ) AS existe_telefone,
+           c.cpf IS NOT NULL AND EXISTS (
+               SELECT 1 FROM clientes e
+               WHERE e.estabelecimento_id = %(estabelecimento_id)s AND e.cpf = c.cpf
+           ) AS existe_cpf,
+           c.email IS NOT NULL AND EXISTS (
+               SELECT 1 FROM clientes e
+               WHERE e.estabelecimento_id = %(estabelecimento_id)s AND e.email = c.email
+           ) AS existe_email
+    FROM candidatos c
+    LEFT JOIN inseridos ins
+        ON ins.telefone_normalizado = c.telefone_normalizado AND c.linha = c.primeira_telefone
+    WHERE ins.telefone_normalizado IS NULL
+"""
+
+# Termos menores que um trigrama não usam os índices GIN (pg_trgm)
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _like_escape(termo: str) -> str:
+    """Escapa os curingas do LIKE para o termo ser buscado literalmente."""
+    return termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _mensagem_validacao(error: ValidationError) -> str:
+    """Resume os erros do Pydantic em uma linha (campo: mensagem)."""
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+
+
+def _motivo_rejeicao(row: dict) -> str:
+    """Motivo de uma linha válida do CSV não ter sido inserida."""
+    if row["linha"] != row["primeira_telefone"]:
+        return f"Telefone duplicado no arquivo (linha {row['primeira_telefone']})"
+    if row["linha"] != row["primeira_cpf"]:
+        return f"CPF duplicado no arquivo (linha {row['primeira_cpf']})"
+    if row["linha"] != row["primeira_email"]:
+        return f"Email duplicado no arquivo (linha {row['primeira_email']})"
+    if row["existe_telefone"]:
+        return CONFLITOS_UNICOS["uq_clientes_estabelecimento_telefone"]
+    if row["existe_cpf"]:
+        return CONFLITOS_UNICOS["uq_clientes_estabelecimento_cpf"]
+    if row["existe_email"]:
+        return CONFLITOS_UNICOS["uq_clientes_estabelecimento_email"]
+    return "Conflito com cliente cadastrado durante a importação"
 
 
 class ClienteService:
@@ -17,31 +124,51 @@ class ClienteService:
         nome: Optional[str] = None,
         telefone: Optional[str] = None,
         email: Optional[str] = None,
-        ativo: Optional[bool] = True
+        ativo: Optional[bool] = True,
+        ordenar_por: str = "nome",
+        ultima_visita_antes: Optional[datetime] = None,
+        ultima_visita_depois: Optional[datetime] = None
     ) -> tuple[List[Cliente], int]:
-        """Listar clientes com filtros."""
+        """
+        Listar clientes com filtros.
+        ordenar_por="last_visit" lista os mais recentes primeiro (nunca visitaram por último).
+        """
 
         query = db.query(Cliente).filter(
             Cliente.estabelecimento_id == estabelecimento_id
         )
 
-        # Aplicar filtros
+        # Aplicar filtros (ilike '%termo%' é servido pelos índices trigram)
         if nome:
-            query = query.filter(Cliente.nome.ilike(f"%{nome}%"))
+            query = query.filter(Cliente.nome.ilike(f"%{_like_escape(nome)}%"))
 
         if telefone:
-            query = query.filter(Cliente.telefone.ilike(f"%{telefone}%"))
+            digitos = normalize_phone(telefone)
+            if digitos:
+                query = query.filter(Cliente.telefone_normalizado.like(f"%{digitos}%"))
+            else:
+                query = query.filter(Cliente.telefone.ilike(f"%{_like_escape(telefone)}%"))
 
         if email:
-            query = query.filter(Cliente.email.ilike(f"%{email}%"))
+            query = query.filter(Cliente.email.ilike(f"%{_like_escape(email)}%"))
 
         if ativo is not None:
             query = query.filter(Cliente.is_active == ativo)
 
-        # Ordenar por nome
-        query = query.order_by(Cliente.nome)
+        # Recência via last_visit desnormalizado (índice estabelecimento_id, last_visit)
+        if ultima_visita_antes:
+            query = query.filter(Cliente.last_visit < ultima_visita_antes)
 
-        total = query.count()
+        if ultima_visita_depois:
+            query = query.filter(Cliente.last_visit >= ultima_visita_depois)
+
+        if ordenar_por == "last_visit":
+            query = query.order_by(Cliente.last_visit.desc().nulls_last(), Cliente.id)
+        else:
+            query = query.order_by(Cliente.nome)
+
+        # Contagem sem ORDER BY: o sort da subquery não muda o total
+        total = query.order_by(None).count()
         clientes = query.offset(skip).limit(limit).all()
 
         return clientes, total
@@ -53,17 +180,47 @@ class ClienteService:
         termo: str,
         limit: int = 10
     ) -> List[Cliente]:
-        """Buscar clientes por termo (nome, telefone, email)."""
+        """
+        Buscar clientes por termo (nome, telefone, email).
+
+        Telefone é comparado só pelos dígitos ("11999" encontra "(11) 9 99..").
+        Resultados ordenados por similaridade (pg_trgm) e depois por nome.
+        Termos com menos de 3 caracteres buscam só pelo início do nome, do
+        email ou do telefone ("11" encontra "(11) 9...", "9" não).
+        """
 
-        clientes = db.query(Cliente).filter(
+        termo = termo.strip()
+        digitos = normalize_phone(termo)
+
+        query = db.query(Cliente).filter(
             Cliente.estabelecimento_id == estabelecimento_id,
-            Cliente.is_active == True,
-            or_(
-                Cliente.nome.ilike(f"%{termo}%"),
-                Cliente.telefone.ilike(f"%{termo}%"),
-                Cliente.email.ilike(f"%{termo}%")
+            Cliente.is_active == True
+        )
+
+        # Termo curto (sem trigramas): prefixo do nome, do email e dos dígitos do telefone
+        if len(termo) < TRIGRAM_MIN_LENGTH:
+            prefixo = f"{_like_escape(termo)}%"
+            condicoes = [Cliente.nome.ilike(prefixo), Cliente.email.ilike(prefixo)]
+            if digitos:
+                condicoes.append(Cliente.telefone_normalizado.like(f"{digitos}%"))
+            return query.filter(or_(*condicoes)).order_by(Cliente.nome).limit(limit).all()
+
+        padrao = f"%{_like_escape(termo)}%"
+        condicoes = [Cliente.nome.ilike(padrao), Cliente.email.ilike(padrao)]
+        relevancia = [
+            func.word_similarity(termo, Cliente.nome),
+            func.word_similarity(termo, func.coalesce(Cliente.email, ''))
+        ]
+        if len(digitos) >= TRIGRAM_MIN_LENGTH:
+            condicoes.append(Cliente.telefone_normalizado.like(f"%{digitos}%"))
+            relevancia.append(
+                func.word_similarity(digitos, func.coalesce(Cliente.telefone_normalizado, ''))
             )
-        ).order_by(Cliente.nome).limit(limit).all()
+
+        clientes = query.filter(or_(*condicoes)).order_by(
+            func.greatest(*relevancia).desc(),
+            Cliente.nome
+        ).limit(limit).all()
 
         return clientes
 
@@ -81,49 +238,34 @@ class ClienteService:
 
         return cliente
 
+    @staticmethod
+    def _raise_conflito(db: Session, error: IntegrityError):
+        """Converte violação dos índices únicos de clientes em erro 400 com o campo em conflito."""
+        db.rollback()
+        constraint = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+        detail = CONFLITOS_UNICOS.get(constraint)
+        if detail is None:
+            raise error
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
+
     @staticmethod
     def create_cliente(db: Session, cliente_data: ClienteCreate, estabelecimento_id: int) -> Cliente:
         """Criar novo cliente."""
 
-        # Verificar se já existe cliente com mesmo CPF ou telefone no estabelecimento
-        if cliente_data.cpf:
-            existing_cpf = db.query(Cliente).filter(
-                Cliente.cpf == cliente_data.cpf,
-                Cliente.estabelecimento_id == estabelecimento_id
-            ).first()
-            if existing_cpf:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Já existe um cliente com este CPF neste estabelecimento"
-                )
-
-        existing_telefone = db.query(Cliente).filter(
-            Cliente.telefone == cliente_data.telefone,
-            Cliente.estabelecimento_id == estabelecimento_id
-        ).first()
-        if existing_telefone:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Já existe um cliente com este telefone neste estabelecimento"
-            )
-
-        if cliente_data.email:
-            existing_email = db.query(Cliente).filter(
-                Cliente.email == cliente_data.email,
-                Cliente.estabelecimento_id == estabelecimento_id
-            ).first()
-            if existing_email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Já existe um cliente com este email neste estabelecimento"
-                )
-
-        # Criar cliente vinculado ao estabelecimento
+        # CPF, telefone e email únicos por estabelecimento são garantidos pelos
+        # índices únicos parciais: um único INSERT, sem SELECTs prévios
         cliente_dict = cliente_data.dict()
         cliente_dict['estabelecimento_id'] = estabelecimento_id
+        cliente_dict['telefone_normalizado'] = normalize_phone(cliente_data.telefone)
         db_cliente = Cliente(**cliente_dict)
         db.add(db_cliente)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError as e:
+            ClienteService._raise_conflito(db, e)
         db.refresh(db_cliente)
 
         return db_cliente
@@ -138,53 +280,140 @@ class ClienteService:
 
         cliente = ClienteService.get_cliente(db, cliente_id)
 
-        # Verificar conflitos apenas se os campos mudaram (dentro do estabelecimento)
         update_data = cliente_data.dict(exclude_unset=True)
 
-        if 'cpf' in update_data and update_data['cpf'] != cliente.cpf:
-            existing_cpf = db.query(Cliente).filter(
-                Cliente.cpf == update_data['cpf'],
-                Cliente.estabelecimento_id == cliente.estabelecimento_id,
-                Cliente.id != cliente_id
-            ).first()
-            if existing_cpf:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Já existe um cliente com este CPF neste estabelecimento"
-                )
+        # Atualizar campos
+        for field, value in update_data.items():
+            setattr(cliente, field, value)
+
+        if 'telefone' in update_data:
+            cliente.telefone_normalizado = normalize_phone(cliente.telefone)
+
+        # Conflitos (dentro do estabelecimento) são detectados pelos índices únicos
+        try:
+            db.commit()
+        except IntegrityError as e:
+            ClienteService._raise_conflito(db, e)
+        db.refresh(cliente)
 
-        if 'telefone' in update_data and update_data['telefone'] != cliente.telefone:
-            existing_telefone = db.query(Cliente).filter(
-                Cliente.telefone == update_data['telefone'],
-                Cliente.estabelecimento_id == cliente.estabelecimento_id,
-                Cliente.id != cliente_id
-            ).first()
-            if existing_telefone:
+        return cliente
+
+    @staticmethod
+    def import_clientes(db: Session, arquivo: BinaryIO, estabelecimento_id: int) -> ClienteImportResponse:
+        """
+        Importar clientes de um CSV (cabeçalho com os campos de ClienteCreate).
+
+        O arquivo é lido em streaming e validado linha a linha; as linhas válidas
+        vão em lotes via COPY para uma tabela temporária e entram em clientes
+        num único INSERT, deduplicado por telefone normalizado, CPF e email.
+        """
+        texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+        erros = []
+        total_linhas = 0
+        validas = 0
+
+        try:
+            cabecalho_bruto = texto.readline()
+            # Planilhas em pt-BR costumam exportar com ';'
+            delimitador = ";" if cabecalho_bruto.count(";") > cabecalho_bruto.count(",") else ","
+            cabecalho = [
+                coluna.strip().lower()
+                for coluna in next(csv.reader([cabecalho_bruto], delimiter=delimitador), [])
+            ]
+            faltando = {"nome", "telefone"} - set(cabecalho)
+            if faltando:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Já existe um cliente com este telefone neste estabelecimento"
+                    detail=f"CSV sem as colunas obrigatórias: {', '.join(sorted(faltando))}"
                 )
 
-        if 'email' in update_data and update_data['email'] != cliente.email:
-            existing_email = db.query(Cliente).filter(
-                Cliente.email == update_data['email'],
-                Cliente.estabelecimento_id == cliente.estabelecimento_id,
-                Cliente.id != cliente_id
-            ).first()
-            if existing_email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Já existe um cliente com este email neste estabelecimento"
+            cursor = db.connection().connection.cursor()
+            cursor.execute(IMPORT_CREATE_TEMP_SQL)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            reader = csv.reader(texto, delimiter=delimitador)
+
+            for valores in reader:
+                if not any(valor.strip() for valor in valores):
+                    continue
+
+                # +1 pelo cabeçalho, lido fora do reader
+                linha = reader.line_num + 1
+                total_linhas += 1
+
+                dados = {
+                    coluna: valor.strip() or None
+                    for coluna, valor in zip(cabecalho, valores)
+                    if coluna in IMPORT_COLUNAS
+                }
+                try:
+                    cliente = ClienteCreate(**dados)
+                except ValidationError as e:
+                    erros.append({"linha": linha, "erro": _mensagem_validacao(e)})
+                    continue
+
+                telefone_normalizado = normalize_phone(cliente.telefone)
+                if not telefone_normalizado:
+                    erros.append({"linha": linha, "erro": "telefone: deve conter dígitos"})
+                    continue
+
+                writer.writerow(
+                    [linha, *(getattr(cliente, coluna) for coluna in IMPORT_COLUNAS), telefone_normalizado]
                 )
+                validas += 1
 
-        # Atualizar campos
-        for field, value in update_data.items():
-            setattr(cliente, field, value)
+                if validas % IMPORT_BATCH_SIZE == 0:
+                    ClienteService._copy_lote_importacao(cursor, buffer)
 
-        db.commit()
-        db.refresh(cliente)
+            ClienteService._copy_lote_importacao(cursor, buffer)
 
-        return cliente
+            # Estatísticas da tabela temporária e memória para as ordenações em RAM
+            cursor.execute("ANALYZE clientes_import")
+            cursor.execute("SET LOCAL work_mem = '64MB'")
+            cursor.execute(IMPORT_MERGE_SQL, {"estabelecimento_id": estabelecimento_id})
+            rejeitadas = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
+            cursor.close()
+
+            db.commit()
+        except UnicodeDecodeError:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="O arquivo CSV deve estar codificado em UTF-8"
+            )
+        except csv.Error as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"CSV inválido: {e}"
+            )
+        except Exception:
+            db.rollback()
+            raise
+
+        for valores in rejeitadas:
+            row = dict(zip(colunas, valores))
+            erros.append({"linha": row["linha"], "erro": _motivo_rejeicao(row)})
+        erros.sort(key=lambda erro: erro["linha"])
+
+        return ClienteImportResponse(
+            total_linhas=total_linhas,
+            importados=validas - len(rejeitadas),
+            rejeitados=len(erros),
+            erros=erros
+        )
+
+    @staticmethod
+    def _copy_lote_importacao(cursor, buffer: io.StringIO):
+        """Envia o lote acumulado para a tabela temporária via COPY e limpa o buffer."""
+        if not buffer.tell():
+            return
+        buffer.seek(0)
+        cursor.copy_expert(IMPORT_COPY_SQL, buffer)
+        buffer.seek(0)
+        buffer.truncate()
 
     @staticmethod
     def deactivate_cliente(db: Session, cliente_id: int) -> Cliente:
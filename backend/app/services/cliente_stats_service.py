@@ -0,0 +1,162 @@
+"""
+Estatísticas desnormalizadas de clientes (última visita, visitas, gasto, faltas).
+
+Mantidas incrementalmente com UPDATEs atômicos quando o status de um
+agendamento muda, para listagens e relatórios não agregarem o histórico.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Optional
+import logging
+
+from app.models.agendamento import Agendamento, StatusAgendamento
+
+logger = logging.getLogger(__name__)
+
+
+# Recalcula as estatísticas a partir do histórico (um cliente, um estabelecimento ou todos).
+# Agendamentos excluídos (soft delete) não contam.
+RECALCULAR_SQL = """
+    UPDATE clientes c
+    SET total_visitas = coalesce(s.total_visitas, 0),
+        total_gasto = coalesce(s.total_gasto, 0),
+        total_faltas = coalesce(s.total_faltas, 0),
+        last_visit = s.last_visit,
+        ultimo_servico_id = s.ultimo_servico_id
+    FROM clientes alvo
+    LEFT JOIN LATERAL (
+        SELECT count(*) FILTER (WHERE a.status = 'CONCLUIDO') AS total_visitas,
+               sum(a.valor_final) FILTER (WHERE a.status = 'CONCLUIDO') AS total_gasto,
+               count(*) FILTER (WHERE a.status = 'NAO_COMPARECEU') AS total_faltas,
+               max(a.data_inicio) FILTER (WHERE a.status = 'CONCLUIDO') AS last_visit,
+               (array_agg(a.servico_id ORDER BY a.data_inicio DESC)
+                   FILTER (WHERE a.status = 'CONCLUIDO'))[1] AS ultimo_servico_id
+        FROM agendamentos a
+        WHERE a.cliente_id = alvo.id AND a.deleted_at IS NULL
+    ) s ON true
+    WHERE c.id = alvo.id
+      AND (CAST(:cliente_id AS integer) IS NULL OR alvo.id = :cliente_id)
+      AND (CAST(:estabelecimento_id AS integer) IS NULL OR alvo.estabelecimento_id = :estabelecimento_id)
+      AND (CAST(:ultimo_id AS integer) IS NULL OR alvo.id > :ultimo_id)
+      AND (CAST(:ate_id AS integer) IS NULL OR alvo.id <= :ate_id)
+"""
+
+
+def _status_valor(status_agendamento) -> Optional[str]:
+    """Valor string do status (aceita enum do model, do schema ou string)."""
+    if status_agendamento is None:
+        return None
+    return status_agendamento.value if hasattr(status_agendamento, 'value') else str(status_agendamento)
+
+
+class ClienteStatsService:
+    @staticmethod
+    def registrar_mudanca_status(db: Session, agendamento: Agendamento, status_anterior) -> bool:
+        """
+        Atualizar as estatísticas do cliente após mudança de status do agendamento.
+        Deve ser chamado antes do commit (participa da mesma transação).
+        Retorna False se o status não mudou.
+        """
+        anterior = _status_valor(status_anterior)
+        novo = _status_valor(agendamento.status)
+        if anterior == novo:
+            return False
+
+        concluido = StatusAgendamento.CONCLUIDO.value
+        falta = StatusAgendamento.NAO_COMPARECEU.value
+
+        if novo == concluido:
+            # Visita nova: contadores e última visita (se for a mais recente)
+            db.execute(text("""
+                UPDATE clientes
+                SET total_visitas = total_visitas + 1,
+                    total_gasto = total_gasto + :valor,
+                    ultimo_servico_id = CASE
+                        WHEN last_visit IS NULL OR :data_inicio >= last_visit THEN :servico_id
+                        ELSE ultimo_servico_id
+                    END,
+                    last_visit = greatest(last_visit, :data_inicio)
+                WHERE id = :cliente_id
+            """), {
+                "valor": agendamento.valor_final or 0,
+                "data_inicio": agendamento.data_inicio,
+                "servico_id": agendamento.servico_id,
+                "cliente_id": agendamento.cliente_id,
+            })
+        elif anterior == concluido:
+            # Visita desfeita: a última visita pode ter mudado, recalcula o cliente
+            ClienteStatsService.recalcular_cliente(db, agendamento.cliente_id)
+            return True
+
+        if novo == falta:
+            db.execute(
+                text("UPDATE clientes SET total_faltas = total_faltas + 1 WHERE id = :cliente_id"),
+                {"cliente_id": agendamento.cliente_id}
+            )
+        elif anterior == falta:
+            db.execute(
+                text("UPDATE clientes SET total_faltas = greatest(total_faltas - 1, 0) WHERE id = :cliente_id"),
+                {"cliente_id": agendamento.cliente_id}
+            )
+        return True
+
+    @staticmethod
+    def registrar_exclusao(db: Session, agendamento: Agendamento) -> None:
+        """
+        Atualizar as estatísticas antes da exclusão definitiva de um agendamento.
+        Só CANCELADO/NAO_COMPARECEU são excluídos de fato; o soft delete de uma
+        visita concluída recalcula o cliente (evento AgendamentoAlterado).
+        """
+        if _status_valor(agendamento.status) == StatusAgendamento.NAO_COMPARECEU.value:
+            db.execute(
+                text("UPDATE clientes SET total_faltas = greatest(total_faltas - 1, 0) WHERE id = :cliente_id"),
+                {"cliente_id": agendamento.cliente_id}
+            )
+
+    @staticmethod
+    def recalcular_cliente(db: Session, cliente_id: int) -> None:
+        """Recalcular as estatísticas de um cliente a partir do histórico."""
+        db.flush()
+        db.execute(text(RECALCULAR_SQL), {
+            "cliente_id": cliente_id, "estabelecimento_id": None, "ultimo_id": None, "ate_id": None
+        })
+
+    @staticmethod
+    def backfill(
+        db: Session,
+        estabelecimento_id: Optional[int] = None,
+        lote: int = 5000
+    ) -> int:
+        """
+        Recalcular as estatísticas de todos os clientes (ou de um estabelecimento)
+        em lotes por faixa de id, com commit a cada lote.
+        Retorna o número de clientes atualizados.
+        """
+        ultimo_id = 0
+        total = 0
+        while True:
+            ate_id = db.execute(text("""
+                SELECT max(id) FROM (
+                    SELECT id FROM clientes
+                    WHERE id > :ultimo_id
+                      AND (CAST(:estabelecimento_id AS integer) IS NULL OR estabelecimento_id = :estabelecimento_id)
+                    ORDER BY id
+                    LIMIT :lote
+                ) faixa
+            """), {"ultimo_id": ultimo_id, "estabelecimento_id": estabelecimento_id, "lote": lote}).scalar()
+            if ate_id is None:
+                break
+
+            result = db.execute(text(RECALCULAR_SQL), {
+                "cliente_id": None,
+                "estabelecimento_id": estabelecimento_id,
+                "ultimo_id": ultimo_id,
+                "ate_id": ate_id,
+            })
+            db.commit()
+
+            total += result.rowcount
+            ultimo_id = ate_id
+            logger.info(f"[CLIENTE_STATS] Backfill: {total} clientes atualizados (até id {ate_id})")
+
+        return total
@@ -0,0 +1,115 @@
+"""
+Barramento de eventos de domínio em processo.
+
+Quem muda o estado publica um evento na sessão (`publicar`); os efeitos são
+registrados por tipo de evento em duas fases:
+
+- `ao_publicar`: roda na hora, na transação de quem publicou e com os
+  objetos já carregados (pontos, estatísticas, linhas derivadas). Não faz
+  commit; um erro desfaz a transação inteira.
+- `apos_commit`: roda só depois do commit da sessão, fora do request, com
+  sessão própria (bulkhead de notificações). Para efeitos lentos (WhatsApp).
+  O evento chega depois do commit: use os ids, não os objetos ORM dele.
+
+`ao_confirmar` registra uma função avulsa para depois do commit, na thread
+de quem fez o commit (ex: atualizar estruturas em memória). Não pode usar a
+sessão. Se a transação for desfeita, nada roda depois do commit.
+
+Com o bulkhead de notificações cheio, o handler `apos_commit` é descartado
+(log de erro e contador em `stats()`), nunca executado na thread de quem fez
+o commit: isso prenderia o request justamente quando o sistema está
+sobrecarregado.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Type
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database import executar_com_sessao
+from app.utils.bulkhead import NOTIFICACOES, BulkheadCheio
+
+logger = logging.getLogger(__name__)
+
+_PENDENTES = "eventos_apos_commit"  # chave em Session.info
+
+
+class EventosDominio:
+    _ao_publicar: Dict[Type, List[Callable[[Session, Any], None]]] = {}
+    _apos_commit: Dict[Type, List[Callable[[Session, Any], None]]] = {}
+    _descartados: Dict[str, int] = {}  # "Evento.handler" -> descartados por bulkhead cheio
+    _lock = threading.Lock()
+
+    @staticmethod
+    def ao_publicar(tipo_evento: Type) -> Callable:
+        """Decorator: handler(db, evento) na transação de quem publicou"""
+        def registrar(handler):
+            EventosDominio._ao_publicar.setdefault(tipo_evento, []).append(handler)
+            return handler
+        return registrar
+
+    @staticmethod
+    def apos_commit(tipo_evento: Type) -> Callable:
+        """Decorator: handler(db, evento) depois do commit, com sessão própria, em segundo plano"""
+        def registrar(handler):
+            EventosDominio._apos_commit.setdefault(tipo_evento, []).append(handler)
+            return handler
+        return registrar
+
+    @staticmethod
+    def publicar(db: Session, evento: Any) -> None:
+        for handler in EventosDominio._ao_publicar.get(type(evento), []):
+            handler(db, evento)
+        for handler in EventosDominio._apos_commit.get(type(evento), []):
+            EventosDominio.ao_confirmar(db, lambda handler=handler: EventosDominio._despachar(handler, evento))
+
+    @staticmethod
+    def ao_confirmar(db: Session, funcao: Callable[[], None]) -> None:
+        """Roda `funcao()` logo depois do próximo commit da sessão"""
+        db.info.setdefault(_PENDENTES, []).append(funcao)
+
+    @staticmethod
+    def _executar_handler(handler: Callable[[Session, Any], None], evento: Any) -> None:
+        try:
+            executar_com_sessao(handler, evento)
+        except Exception as e:
+            logger.error(f"[EVENTOS] Erro em {handler.__name__} ({type(evento).__name__}): {str(e)}")
+
+    @staticmethod
+    def _despachar(handler: Callable[[Session, Any], None], evento: Any) -> None:
+        try:
+            NOTIFICACOES.submeter(EventosDominio._executar_handler, handler, evento)
+        except BulkheadCheio:
+            # Fila de notificações cheia: descarta (não roda na thread do commit)
+            chave = f"{type(evento).__name__}.{handler.__name__}"
+            with EventosDominio._lock:
+                EventosDominio._descartados[chave] = EventosDominio._descartados.get(chave, 0) + 1
+            logger.error(f"[EVENTOS] Bulkhead de notificações cheio, {chave} descartado")
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Handlers apos_commit descartados por bulkhead cheio"""
+        with EventosDominio._lock:
+            return {
+                "descartados": sum(EventosDominio._descartados.values()),
+                "descartados_por_handler": dict(EventosDominio._descartados),
+            }
+
+
+@event.listens_for(Session, "after_commit")
+def _apos_commit(session: Session) -> None:
+    if session.in_nested_transaction():
+        return  # RELEASE de savepoint também dispara after_commit
+    for funcao in session.info.pop(_PENDENTES, []):
+        try:
+            funcao()
+        except Exception as e:
+            logger.error(f"[EVENTOS] Erro após commit: {str(e)}")
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _fim_transacao(session: Session, transaction) -> None:
+    # Transação principal desfeita (ou sessão fechada sem commit): descarta o pendente
+    if transaction.parent is None:
+        session.info.pop(_PENDENTES, None)
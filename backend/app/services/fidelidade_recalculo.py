@@ -0,0 +1,306 @@
+"""
+Recálculo em lote dos pontos de fidelidade de um estabelecimento.
+
+Para cada agendamento CONCLUIDO do período, os pontos devidos são
+`valor_final / reais_por_ponto` (regra atual) e os já lançados são a soma do
+extrato do agendamento (CREDITO + RECALCULO). A diferença vira um lançamento:
+CREDITO quando o agendamento nunca foi creditado (programa ativado depois),
+RECALCULO quando já foi (reais_por_ponto mudou). O saldo dos clientes é
+ajustado no mesmo statement.
+
+Rodar de novo não muda nada (diferença zero): idempotente em relação ao
+extrato e aos saldos. Pontos de agendamentos anteriores ao extrato estão no
+SALDO_INICIAL do cliente e não são atribuídos a agendamento: recalculá-los
+creditaria de novo. Por isso os agendamentos de um cliente com SALDO_INICIAL
+anteriores a esse lançamento ficam fora; os demais clientes (e
+estabelecimentos sem saldo inicial) entram com o período inteiro.
+
+- `simular`: diferença por cliente, sem gravar (uma consulta);
+- `iniciar`: aplica em segundo plano, em lotes de agendamentos por id (um
+  statement e um commit por lote), com progresso em `tarefa`.
+"""
+import logging
+import threading
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services.fidelidade_service import FidelidadeService
+from app.utils.bulkhead import RECALCULO_FIDELIDADE, BulkheadCheio
+from app.utils.timezone import get_brazil_now, start_of_day_brazil
+
+logger = logging.getLogger(__name__)
+
+# Agendamentos concluídos do período com pontos devidos e já lançados
+_AGENDAMENTOS = """
+    SELECT a.id AS agendamento_id, a.cliente_id, a.estabelecimento_id,
+           floor(a.valor_final / :reais_por_ponto)::integer AS devidos,
+           coalesce(t.lancados, 0) AS lancados,
+           coalesce(t.creditado, false) AS creditado
+    FROM agendamentos a
+    LEFT JOIN LATERAL (
+        SELECT sum(tp.pontos) AS lancados, bool_or(tp.tipo = 'CREDITO') AS creditado
+        FROM transacoes_pontos tp
+        WHERE tp.agendamento_id = a.id AND tp.tipo IN ('CREDITO', 'RECALCULO')
+    ) t ON true
+    WHERE a.estabelecimento_id = :estabelecimento_id
+      AND a.status = 'CONCLUIDO' AND a.deleted_at IS NULL
+      AND a.data_inicio >= :inicio AND a.data_inicio < :fim
+      AND a.cliente_id IS NOT NULL
+      -- Já incluídos no saldo inicial do cliente
+      AND NOT EXISTS (
+          SELECT 1 FROM transacoes_pontos s
+          WHERE s.cliente_id = a.cliente_id AND s.tipo = 'SALDO_INICIAL'
+            AND s.created_at > a.data_inicio
+      )
+"""
+
+_SIMULAR = f"""
+    WITH agendamentos_periodo AS ({_AGENDAMENTOS}),
+    diferencas AS (
+        SELECT cliente_id,
+               count(*) AS agendamentos,
+               sum(devidos - lancados)::integer AS ajuste,
+               sum(greatest(devidos - lancados, 0))::integer AS creditar,
+               sum(least(devidos - lancados, 0))::integer AS debitar
+        FROM agendamentos_periodo
+        WHERE devidos <> lancados
+        GROUP BY cliente_id
+    )
+    SELECT d.cliente_id, c.nome, c.pontos AS saldo_atual, d.agendamentos,
+           d.ajuste, d.creditar, d.debitar, c.pontos + d.ajuste AS saldo_novo,
+           (SELECT count(*) FROM agendamentos_periodo) AS total_agendamentos
+    FROM diferencas d
+    JOIN clientes c ON c.id = d.cliente_id
+    ORDER BY abs(d.ajuste) DESC, d.cliente_id
+"""
+
+# Um lote: lança as diferenças e ajusta os saldos num statement só
+_APLICAR_LOTE = f"""
+    WITH lote AS (
+        {_AGENDAMENTOS}
+          AND a.id > :apos_id
+        ORDER BY a.id
+        LIMIT :lote
+    ),
+    lancados AS (
+        INSERT INTO transacoes_pontos (cliente_id, estabelecimento_id, tipo, pontos, agendamento_id)
+        SELECT cliente_id, estabelecimento_id,
+               CASE WHEN creditado THEN 'RECALCULO' ELSE 'CREDITO' END,
+               devidos - lancados, agendamento_id
+        FROM lote
+        WHERE devidos <> lancados
+        ON CONFLICT DO NOTHING
+        RETURNING cliente_id, pontos
+    ),
+    saldos AS (
+        UPDATE clientes c
+        SET pontos = c.pontos + l.total
+        FROM (SELECT cliente_id, sum(pontos) AS total FROM lancados GROUP BY cliente_id) l
+        WHERE c.id = l.cliente_id
+        RETURNING c.id
+    )
+    -- Statements de escrita no WITH rodam mesmo sem serem lidos
+    SELECT (SELECT max(agendamento_id) FROM lote) AS ultimo_id,
+           (SELECT count(*) FROM lote) AS processados,
+           (SELECT count(*) FROM lancados) AS ajustados,
+           (SELECT coalesce(sum(pontos), 0)::integer FROM lancados) AS pontos
+"""
+
+_CONTAR = f"SELECT count(*) FROM ({_AGENDAMENTOS}) agendamentos_periodo"
+
+_MAX_TAREFAS_GUARDADAS = 50
+
+
+class RecalculoFidelidade:
+    _lock = threading.Lock()
+    _tarefas: Dict[str, Dict[str, Any]] = {}
+    _parar = threading.Event()
+
+    @staticmethod
+    def _parametros(
+        db: Session,
+        estabelecimento_id: int,
+        data_inicio: date,
+        data_fim: date
+    ) -> Dict[str, Any]:
+        if data_fim < data_inicio:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Data final anterior à data inicial"
+            )
+
+        config = FidelidadeService.get_configuracao(db, estabelecimento_id)
+        if not config or not config.ativo or not config.reais_por_ponto or config.reais_por_ponto <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Programa de fidelidade não está ativo para este estabelecimento"
+            )
+
+        return {
+            "estabelecimento_id": estabelecimento_id,
+            "reais_por_ponto": Decimal(str(config.reais_por_ponto)),
+            "inicio": start_of_day_brazil(data_inicio),
+            "fim": start_of_day_brazil(data_fim + timedelta(days=1)),
+        }
+
+    @staticmethod
+    def simular(
+        db: Session,
+        estabelecimento_id: int,
+        data_inicio: date,
+        data_fim: date,
+        limite: int = 100
+    ) -> Dict[str, Any]:
+        """Diferença por cliente que o recálculo aplicaria (não grava nada)"""
+        parametros = RecalculoFidelidade._parametros(db, estabelecimento_id, data_inicio, data_fim)
+        linhas = db.execute(text(_SIMULAR), parametros).mappings().all()
+        total = linhas[0]["total_agendamentos"] if linhas else db.execute(text(_CONTAR), parametros).scalar()
+
+        return {
+            "estabelecimento_id": estabelecimento_id,
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "reais_por_ponto": parametros["reais_por_ponto"],
+            "agendamentos": total,
+            "agendamentos_ajustar": sum(linha["agendamentos"] for linha in linhas),
+            "clientes_ajustar": len(linhas),
+            "pontos_creditar": sum(linha["creditar"] for linha in linhas),
+            "pontos_debitar": sum(linha["debitar"] for linha in linhas),
+            "clientes_saldo_negativo": sum(1 for linha in linhas if linha["saldo_novo"] < 0),
+            "clientes": [
+                {
+                    "cliente_id": linha["cliente_id"],
+                    "nome": linha["nome"],
+                    "saldo_atual": linha["saldo_atual"],
+                    "ajuste": linha["ajuste"],
+                    "saldo_novo": linha["saldo_novo"],
+                    "agendamentos": linha["agendamentos"],
+                }
+                for linha in linhas[:limite]
+            ],
+        }
+
+    @staticmethod
+    def aplicar_lote(db: Session, parametros: Dict[str, Any], apos_id: int, lote: int) -> Dict[str, Any]:
+        """
+        Aplica o recálculo aos próximos `lote` agendamentos depois de `apos_id`
+        e faz commit. O lock por estabelecimento serializa recálculos
+        simultâneos (outro processo): cada lote relê o extrato já gravado.
+        """
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext('recalculo_fidelidade'), :estabelecimento_id)"),
+            {"estabelecimento_id": parametros["estabelecimento_id"]}
+        )
+        resultado = dict(db.execute(
+            text(_APLICAR_LOTE), {**parametros, "apos_id": apos_id, "lote": lote}
+        ).mappings().one())
+        db.commit()
+        return resultado
+
+    @staticmethod
+    def iniciar(
+        db: Session,
+        estabelecimento_id: int,
+        data_inicio: date,
+        data_fim: date
+    ) -> Dict[str, Any]:
+        """Agenda o recálculo em segundo plano; acompanhe por `tarefa(id)`"""
+        parametros = RecalculoFidelidade._parametros(db, estabelecimento_id, data_inicio, data_fim)
+        total = db.execute(text(_CONTAR), parametros).scalar()
+
+        with RecalculoFidelidade._lock:
+            for tarefa in RecalculoFidelidade._tarefas.values():
+                if tarefa["estabelecimento_id"] == estabelecimento_id and tarefa["status"] in ("na_fila", "executando"):
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"Já existe um recálculo em andamento para este estabelecimento ({tarefa['id']})"
+                    )
+
+            tarefa = {
+                "id": uuid.uuid4().hex[:12],
+                "estabelecimento_id": estabelecimento_id,
+                "data_inicio": data_inicio,
+                "data_fim": data_fim,
+                "reais_por_ponto": parametros["reais_por_ponto"],
+                "status": "na_fila",
+                "total": total,
+                "processados": 0,
+                "ajustados": 0,
+                "pontos": 0,
+                "criado_em": get_brazil_now(),
+                "concluido_em": None,
+                "erro": None,
+            }
+            try:
+                RECALCULO_FIDELIDADE.submeter(RecalculoFidelidade._executar, tarefa["id"], parametros)
+            except BulkheadCheio:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Muitos recálculos na fila. Tente novamente em instantes.",
+                    headers={"Retry-After": "60"}
+                )
+            RecalculoFidelidade._tarefas[tarefa["id"]] = tarefa
+            RecalculoFidelidade._descartar_antigas()
+            return dict(tarefa)
+
+    @staticmethod
+    def tarefa(tarefa_id: str) -> Optional[Dict[str, Any]]:
+        with RecalculoFidelidade._lock:
+            tarefa = RecalculoFidelidade._tarefas.get(tarefa_id)
+            return dict(tarefa) if tarefa else None
+
+    @staticmethod
+    def _atualizar(tarefa_id: str, **campos) -> None:
+        with RecalculoFidelidade._lock:
+            RecalculoFidelidade._tarefas[tarefa_id].update(campos)
+
+    @staticmethod
+    def _descartar_antigas() -> None:
+        # Chamado com o lock; mantém as mais recentes terminadas
+        terminadas = [t for t in RecalculoFidelidade._tarefas.values() if t["concluido_em"] is not None]
+        excesso = len(terminadas) - _MAX_TAREFAS_GUARDADAS
+        for tarefa in sorted(terminadas, key=lambda t: t["concluido_em"])[:max(0, excesso)]:
+            del RecalculoFidelidade._tarefas[tarefa["id"]]
+
+    @staticmethod
+    def _executar(tarefa_id: str, parametros: Dict[str, Any]) -> None:
+        RecalculoFidelidade._atualizar(tarefa_id, status="executando")
+        lote = max(1, settings.fidelidade_recalculo_lote)
+        totais = {"processados": 0, "ajustados": 0, "pontos": 0}
+        apos_id = 0
+        db = SessionLocal()
+        try:
+            while not RecalculoFidelidade._parar.is_set():
+                resultado = RecalculoFidelidade.aplicar_lote(db, parametros, apos_id, lote)
+                if not resultado["processados"]:
+                    break
+                apos_id = resultado["ultimo_id"]
+                for campo in totais:
+                    totais[campo] += resultado[campo]
+                RecalculoFidelidade._atualizar(tarefa_id, **totais)
+
+            situacao = "interrompido" if RecalculoFidelidade._parar.is_set() else "concluido"
+            RecalculoFidelidade._atualizar(tarefa_id, status=situacao, concluido_em=get_brazil_now())
+            logger.info(
+                f"[FIDELIDADE] Recálculo {tarefa_id} {situacao} - Estabelecimento {parametros['estabelecimento_id']}: "
+                f"{totais['processados']} agendamentos, {totais['ajustados']} ajustados, {totais['pontos']} pontos"
+            )
+        except Exception as e:
+            db.rollback()
+            RecalculoFidelidade._atualizar(tarefa_id, status="falhou", erro=str(e), concluido_em=get_brazil_now())
+            logger.error(f"[FIDELIDADE] Erro no recálculo {tarefa_id}: {str(e)}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def parar() -> None:
+        """Interrompe os recálculos entre lotes (o que foi gravado fica; rodar de novo continua)"""
+        RecalculoFidelidade._parar.set()
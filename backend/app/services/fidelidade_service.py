@@ -1,14 +1,17 @@
+import logging
+
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from typing import List, Optional
+from sqlalchemy import and_, text
+from typing import Any, Dict, List, Optional
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
 from fastapi import HTTPException, status
 
 from app.models import (
     ConfiguracaoFidelidade,
     Premio,
     ResgatePremio,
+    TransacaoPontos,
     Cliente,
     Agendamento,
     StatusAgendamento
@@ -23,6 +26,9 @@ from app.schemas.fidelidade import (
     PremiosDisponiveisResponse,
     PontosClienteResponse
 )
+from app.utils.timezone import get_brazil_now
+
+logger = logging.getLogger(__name__)
 
 
 class FidelidadeService:
@@ -155,18 +161,18 @@ class FidelidadeService:
         valor_gasto: Decimal
     ) -> int:
         """Calcula quantos pontos o cliente deve receber"""
-        print(f"[FIDELIDADE] Calculando pontos - Estabelecimento: {estabelecimento_id}, Valor: {valor_gasto}")
+        logger.debug(f"[FIDELIDADE] Calculando pontos - Estabelecimento: {estabelecimento_id}, Valor: {valor_gasto}")
 
         config = FidelidadeService.get_configuracao(db, estabelecimento_id)
         if not config:
-            print(f"[FIDELIDADE] Configuração não encontrada para estabelecimento {estabelecimento_id}")
+            logger.debug(f"[FIDELIDADE] Configuração não encontrada para estabelecimento {estabelecimento_id}")
             return 0
 
         if not config.ativo:
-            print(f"[FIDELIDADE] Configuração está inativa para estabelecimento {estabelecimento_id}")
+            logger.debug(f"[FIDELIDADE] Configuração está inativa para estabelecimento {estabelecimento_id}")
             return 0
 
-        print(f"[FIDELIDADE] Configuração encontrada - Reais por ponto: {config.reais_por_ponto}")
+        logger.debug(f"[FIDELIDADE] Configuração encontrada - Reais por ponto: {config.reais_por_ponto}")
 
         # Ex: R$ 250 / R$ 100 por ponto = 2.5 = 2 pontos
         # Garante que ambos são Decimal para evitar erro de tipos
@@ -174,60 +180,81 @@ class FidelidadeService:
         reais_por_ponto = Decimal(str(config.reais_por_ponto))
         pontos = int(valor / reais_por_ponto)
 
-        print(f"[FIDELIDADE] Cálculo: {valor} / {reais_por_ponto} = {pontos} pontos")
+        logger.debug(f"[FIDELIDADE] Cálculo: {valor} / {reais_por_ponto} = {pontos} pontos")
 
         return pontos
 
+    @staticmethod
+    def lancar_pontos(
+        db: Session,
+        cliente_id: int,
+        pontos: int,
+        tipo: str,
+        agendamento_id: Optional[int] = None,
+        resgate_id: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Lança pontos no extrato e no saldo do cliente num único statement.
+        Idempotente por origem: se o agendamento já tem CREDITO (ou o resgate
+        já tem lançamento desse tipo, ou o cliente não existe), nada muda e
+        retorna None.
+        Retorna o novo saldo. Não faz commit.
+        """
+        return db.execute(text("""
+            WITH lancamento AS (
+                INSERT INTO transacoes_pontos (cliente_id, estabelecimento_id, tipo, pontos, agendamento_id, resgate_id)
+                SELECT id, estabelecimento_id, :tipo, :pontos, :agendamento_id, :resgate_id
+                FROM clientes
+                WHERE id = :cliente_id
+                ON CONFLICT DO NOTHING
+                RETURNING cliente_id, pontos
+            )
+            UPDATE clientes c
+            SET pontos = c.pontos + l.pontos
+            FROM lancamento l
+            WHERE c.id = l.cliente_id
+            RETURNING c.pontos
+        """), {
+            "cliente_id": cliente_id,
+            "pontos": pontos,
+            "tipo": tipo,
+            "agendamento_id": agendamento_id,
+            "resgate_id": resgate_id,
+        }).scalar()
+
     @staticmethod
     def adicionar_pontos_cliente(
         db: Session,
         cliente_id: int,
         pontos: int
     ) -> Cliente:
-        """Adiciona pontos ao cliente"""
-        cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
-        if not cliente:
+        """Adiciona pontos ao cliente (ajuste manual, registrado no extrato)"""
+        saldo = FidelidadeService.lancar_pontos(db, cliente_id, pontos, "AJUSTE")
+        if saldo is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Cliente não encontrado"
             )
 
-        cliente.pontos += pontos
         db.commit()
-        db.refresh(cliente)
-        return cliente
+        return db.query(Cliente).filter(Cliente.id == cliente_id).first()
 
     @staticmethod
     def processar_pontos_agendamento(
         db: Session,
-        agendamento_id: int
+        agendamento: Agendamento
     ) -> Optional[int]:
-        """Processa pontos de um agendamento concluído"""
-        print(f"[FIDELIDADE] Processando pontos para agendamento ID: {agendamento_id}")
-
-        agendamento = db.query(Agendamento).filter(
-            Agendamento.id == agendamento_id
-        ).first()
-
-        if not agendamento:
-            print(f"[FIDELIDADE] Agendamento {agendamento_id} não encontrado")
-            return None
-
-        print(f"[FIDELIDADE] Status do agendamento: {agendamento.status}")
-        print(f"[FIDELIDADE] Valor final: {agendamento.valor_final}")
-        print(f"[FIDELIDADE] Cliente ID: {agendamento.cliente_id}")
-        print(f"[FIDELIDADE] Estabelecimento ID: {agendamento.estabelecimento_id}")
-
-        # Só adiciona pontos se agendamento estiver concluído
+        """
+        Credita os pontos de um agendamento concluído (objeto já carregado).
+        Participa da transação de quem chamou; não faz commit. Concluir de
+        novo o mesmo agendamento não credita duas vezes.
+        """
         # Comparar por .value porque pode vir do schema (Pydantic) e não do model (SQLAlchemy)
         status_valor = agendamento.status.value if hasattr(agendamento.status, 'value') else str(agendamento.status)
-
         if status_valor != StatusAgendamento.CONCLUIDO.value:
-            print(f"[FIDELIDADE] Agendamento não está concluído, pulando... (status_valor: {status_valor}, esperado: {StatusAgendamento.CONCLUIDO.value})")
+            logger.debug(f"[FIDELIDADE] Agendamento {agendamento.id} não está concluído, pulando...")
             return None
 
-        print(f"[FIDELIDADE] Status confirmado como CONCLUIDO! Processando pontos...")
-
         # Calcula pontos baseado no valor final
         pontos = FidelidadeService.calcular_pontos(
             db,
@@ -235,21 +262,72 @@ class FidelidadeService:
             agendamento.valor_final
         )
 
-        print(f"[FIDELIDADE] Pontos calculados: {pontos}")
-
         if pontos > 0:
-            print(f"[FIDELIDADE] Adicionando {pontos} pontos ao cliente {agendamento.cliente_id}")
-            FidelidadeService.adicionar_pontos_cliente(
-                db,
-                agendamento.cliente_id,
-                pontos
+            saldo = FidelidadeService.lancar_pontos(
+                db, agendamento.cliente_id, pontos, "CREDITO", agendamento_id=agendamento.id
             )
-            print(f"[FIDELIDADE] Pontos adicionados com sucesso!")
-        else:
-            print(f"[FIDELIDADE] Nenhum ponto para adicionar")
+            if saldo is None:
+                logger.debug(f"[FIDELIDADE] Agendamento {agendamento.id} já creditado, pulando...")
+                return 0
+            logger.info(f"[FIDELIDADE] {pontos} pontos para o cliente {agendamento.cliente_id} (agendamento {agendamento.id})")
 
         return pontos
 
+    @staticmethod
+    def reconciliar_saldos(
+        db: Session,
+        estabelecimento_id: Optional[int] = None,
+        corrigir: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Confere o saldo de cada cliente com a soma do extrato (uma consulta).
+        Retorna os divergentes. Com `corrigir`, o saldo passa a ser o do
+        extrato (no mesmo statement) e faz commit; clientes com lançamento
+        concorrente ficam para a próxima conferência.
+        """
+        divergentes = """
+            SELECT c.id AS cliente_id, c.estabelecimento_id, c.pontos AS saldo,
+                   coalesce(t.total, 0) AS saldo_extrato
+            FROM clientes c
+            LEFT JOIN (
+                SELECT cliente_id, sum(pontos) AS total
+                FROM transacoes_pontos
+                GROUP BY cliente_id
+            ) t ON t.cliente_id = c.id
+            WHERE c.pontos <> coalesce(t.total, 0)
+              AND (CAST(:estabelecimento_id AS integer) IS NULL OR c.estabelecimento_id = :estabelecimento_id)
+        """
+        if corrigir:
+            # `c.pontos = d.saldo`: se um lançamento mudou o saldo depois da leitura, a linha não é tocada
+            sql = f"""
+                WITH divergentes AS ({divergentes}),
+                corrigidos AS (
+                    UPDATE clientes c
+                    SET pontos = d.saldo_extrato
+                    FROM divergentes d
+                    WHERE c.id = d.cliente_id AND c.pontos = d.saldo
+                    RETURNING c.id
+                )
+                SELECT d.*, (d.cliente_id IN (SELECT id FROM corrigidos)) AS corrigido
+                FROM divergentes d
+                ORDER BY d.cliente_id
+            """
+        else:
+            sql = divergentes + " ORDER BY c.id"
+
+        linhas = db.execute(text(sql), {"estabelecimento_id": estabelecimento_id}).mappings().all()
+        if corrigir:
+            db.commit()
+
+        if linhas:
+            # Uma linha por conferência; o detalhe de cada cliente está no retorno
+            corrigidos = sum(1 for linha in linhas if linha['corrigido']) if corrigir else 0
+            logger.warning(
+                f"[FIDELIDADE] {len(linhas)} saldo(s) divergente(s) do extrato, {corrigidos} corrigido(s). "
+                f"Primeiros clientes: {[linha['cliente_id'] for linha in linhas[:10]]}"
+            )
+        return [dict(linha) for linha in linhas]
+
     # ==================== Resgates ====================
 
     @staticmethod
@@ -282,29 +360,55 @@ class FidelidadeService:
                 detail="Prêmio não está ativo"
             )
 
-        # Verifica se cliente tem pontos suficientes
-        if cliente.pontos < premio.pontos_necessarios:
+        # Débito atômico: só desconta se o saldo cobre o prêmio (sem ler-e-gravar)
+        saldo = db.execute(text("""
+            UPDATE clientes
+            SET pontos = pontos - :custo
+            WHERE id = :cliente_id AND pontos >= :custo
+            RETURNING pontos
+        """), {"cliente_id": cliente.id, "custo": premio.pontos_necessarios}).scalar()
+
+        if saldo is None:
+            disponivel = db.query(Cliente.pontos).filter(Cliente.id == cliente.id).scalar()
+            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Pontos insuficientes. Necessário: {premio.pontos_necessarios}, Disponível: {cliente.pontos}"
+                detail=f"Pontos insuficientes. Necessário: {premio.pontos_necessarios}, Disponível: {disponivel}"
             )
 
-        # Deduz pontos do cliente
-        cliente.pontos -= premio.pontos_necessarios
-
         # Cria resgate
         resgate = ResgatePremio(
             cliente_id=resgate_data.cliente_id,
             premio_id=resgate_data.premio_id,
             pontos_utilizados=premio.pontos_necessarios,
-            status="DISPONIVEL"
+            status="DISPONIVEL",
+            data_expiracao=FidelidadeService.calcular_expiracao_resgate(db, premio)
         )
-
         db.add(resgate)
+        db.flush()
+
+        # Débito no extrato, na mesma transação
+        db.add(TransacaoPontos(
+            cliente_id=cliente.id,
+            estabelecimento_id=cliente.estabelecimento_id,
+            tipo="RESGATE",
+            pontos=-premio.pontos_necessarios,
+            resgate_id=resgate.id
+        ))
+
         db.commit()
         db.refresh(resgate)
         return resgate
 
+    @staticmethod
+    def calcular_expiracao_resgate(db: Session, premio: Premio) -> Optional[datetime]:
+        """Validade do prêmio; sem ela, a padrão da configuração; sem nenhuma, não expira"""
+        dias = premio.dias_validade
+        if dias is None:
+            config = FidelidadeService.get_configuracao(db, premio.estabelecimento_id)
+            dias = config.dias_validade_resgate if config else None
+        return get_brazil_now() + timedelta(days=dias) if dias else None
+
     @staticmethod
     def listar_resgates_cliente(
         db: Session,
@@ -338,6 +442,15 @@ class FidelidadeService:
                 detail="Resgate já foi usado ou expirou"
             )
 
+        # Vencido e ainda não marcado pelo job de expiração
+        if resgate.data_expiracao and resgate.data_expiracao <= get_brazil_now():
+            resgate.status = "EXPIRADO"
+            db.commit()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Resgate já foi usado ou expirou"
+            )
+
         resgate.status = "USADO"
         resgate.usado_em_agendamento_id = agendamento_id
         db.commit()
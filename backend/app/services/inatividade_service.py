@@ -0,0 +1,186 @@
+"""
+Índice de inatividade de clientes e registro de campanhas de reciclagem.
+
+clientes_inatividade guarda o último agendamento de cada cliente (refresh
+noturno + atualização ao agendar) e reciclagem_envios registra um envio por
+cliente por período de inatividade, para o cron não repetir mensagens.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Recalcula o último agendamento de todos os clientes. Só toca nas linhas que
+# mudaram; mudança de período (cliente voltou) libera nova reciclagem.
+REFRESH_UPSERT_SQL = """
+    INSERT INTO clientes_inatividade (cliente_id, estabelecimento_id, ultimo_agendamento, atualizado_em)
+    SELECT c.id, c.estabelecimento_id, u.ultimo_agendamento, now()
+    FROM (
+        SELECT cliente_id, max(data_inicio) AS ultimo_agendamento
+        FROM agendamentos
+        WHERE deleted_at IS NULL
+        GROUP BY cliente_id
+    ) u
+    JOIN clientes c ON c.id = u.cliente_id
+    WHERE c.estabelecimento_id IS NOT NULL
+    ON CONFLICT (cliente_id) DO UPDATE
+    SET ultimo_agendamento = EXCLUDED.ultimo_agendamento,
+        estabelecimento_id = EXCLUDED.estabelecimento_id,
+        reciclagem_enviada_em = CASE
+            WHEN clientes_inatividade.ultimo_agendamento = EXCLUDED.ultimo_agendamento
+            THEN clientes_inatividade.reciclagem_enviada_em
+        END,
+        atualizado_em = now()
+    WHERE clientes_inatividade.ultimo_agendamento IS DISTINCT FROM EXCLUDED.ultimo_agendamento
+       OR clientes_inatividade.estabelecimento_id IS DISTINCT FROM EXCLUDED.estabelecimento_id
+"""
+
+# Clientes cujos agendamentos foram todos excluídos saem do índice
+REFRESH_DELETE_SQL = """
+    DELETE FROM clientes_inatividade ci
+    WHERE NOT EXISTS (
+        SELECT 1 FROM agendamentos a
+        WHERE a.cliente_id = ci.cliente_id AND a.deleted_at IS NULL
+    )
+"""
+
+# Reserva (em um statement) os clientes elegíveis ainda não contatados neste
+# período: marca o índice e grava o registro do envio
+RESERVAR_ELEGIVEIS_SQL = """
+    WITH elegiveis AS (
+        SELECT ci.cliente_id, ci.estabelecimento_id, ci.ultimo_agendamento
+        FROM clientes_inatividade ci
+        JOIN clientes c ON c.id = ci.cliente_id
+        WHERE ci.estabelecimento_id = :estabelecimento_id
+          AND ci.reciclagem_enviada_em IS NULL
+          AND ci.ultimo_agendamento < :data_limite
+          AND c.is_active = true
+        FOR UPDATE OF ci SKIP LOCKED
+    ),
+    marcados AS (
+        UPDATE clientes_inatividade ci
+        SET reciclagem_enviada_em = now()
+        FROM elegiveis e
+        WHERE ci.cliente_id = e.cliente_id
+    )
+    INSERT INTO reciclagem_envios (cliente_id, estabelecimento_id, ultimo_agendamento)
+    SELECT cliente_id, estabelecimento_id, ultimo_agendamento FROM elegiveis
+    ON CONFLICT (cliente_id, ultimo_agendamento) DO NOTHING
+    RETURNING id, cliente_id, ultimo_agendamento
+"""
+
+
+class InatividadeService:
+    @staticmethod
+    def refresh(db: Session) -> Dict[str, int]:
+        """Recalcular o índice de inatividade (job noturno)."""
+        atualizados = db.execute(text(REFRESH_UPSERT_SQL)).rowcount
+        removidos = db.execute(text(REFRESH_DELETE_SQL)).rowcount
+        db.commit()
+
+        logger.info(f"[INATIVIDADE] Refresh: {atualizados} atualizados, {removidos} removidos")
+        return {"atualizados": atualizados, "removidos": removidos}
+
+    @staticmethod
+    def registrar_agendamento(
+        db: Session,
+        cliente_id: int,
+        estabelecimento_id: int,
+        data_inicio: datetime
+    ) -> None:
+        """
+        Adiantar o último agendamento do cliente (novo agendamento).
+        Participa da transação de quem chamou; não faz commit.
+        """
+        db.execute(text("""
+            INSERT INTO clientes_inatividade (cliente_id, estabelecimento_id, ultimo_agendamento, atualizado_em)
+            VALUES (:cliente_id, :estabelecimento_id, :data_inicio, now())
+            ON CONFLICT (cliente_id) DO UPDATE
+            SET ultimo_agendamento = EXCLUDED.ultimo_agendamento,
+                reciclagem_enviada_em = NULL,
+                atualizado_em = now()
+            WHERE clientes_inatividade.ultimo_agendamento < EXCLUDED.ultimo_agendamento
+        """), {
+            "cliente_id": cliente_id,
+            "estabelecimento_id": estabelecimento_id,
+            "data_inicio": data_inicio,
+        })
+
+    @staticmethod
+    def listar_inativos(
+        db: Session,
+        estabelecimento_id: int,
+        data_limite: datetime
+    ) -> List[Dict[str, Any]]:
+        """Clientes ativos com último agendamento antes de data_limite (uma consulta por faixa)."""
+        rows = db.execute(text("""
+            SELECT c.id, c.nome, c.telefone, c.email, ci.ultimo_agendamento, ci.reciclagem_enviada_em
+            FROM clientes_inatividade ci
+            JOIN clientes c ON c.id = ci.cliente_id
+            WHERE ci.estabelecimento_id = :estabelecimento_id
+              AND ci.ultimo_agendamento < :data_limite
+              AND c.is_active = true
+            ORDER BY ci.ultimo_agendamento
+        """), {"estabelecimento_id": estabelecimento_id, "data_limite": data_limite}).mappings().all()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def reservar_elegiveis(
+        db: Session,
+        estabelecimento_id: int,
+        data_limite: datetime
+    ) -> List[Dict[str, Any]]:
+        """
+        Reservar os clientes que devem receber reciclagem neste período e ainda não receberam.
+        Faz commit: a reserva vale mesmo se o processo cair no meio dos envios
+        (no máximo uma mensagem por período).
+        """
+        rows = db.execute(text(RESERVAR_ELEGIVEIS_SQL), {
+            "estabelecimento_id": estabelecimento_id,
+            "data_limite": data_limite,
+        }).mappings().all()
+        db.commit()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def confirmar_envio(db: Session, envio_id: int, mensagem_id: Optional[str]) -> None:
+        """Guardar o ID da mensagem no registro do envio."""
+        db.execute(
+            text("UPDATE reciclagem_envios SET mensagem_id = :mensagem_id WHERE id = :id"),
+            {"id": envio_id, "mensagem_id": mensagem_id}
+        )
+        db.commit()
+
+    @staticmethod
+    def liberar_envio(db: Session, envio_id: int, cliente_id: int) -> None:
+        """Desfazer a reserva de um envio que falhou (o próximo cron tenta de novo)."""
+        db.execute(text("DELETE FROM reciclagem_envios WHERE id = :id"), {"id": envio_id})
+        db.execute(
+            text("UPDATE clientes_inatividade SET reciclagem_enviada_em = NULL WHERE cliente_id = :cliente_id"),
+            {"cliente_id": cliente_id}
+        )
+        db.commit()
+
+    @staticmethod
+    def registrar_envio_manual(
+        db: Session,
+        cliente_id: int,
+        mensagem_id: Optional[str]
+    ) -> None:
+        """Registrar reciclagem enviada manualmente, para o cron não repetir no mesmo período."""
+        db.execute(text("""
+            WITH atual AS (
+                UPDATE clientes_inatividade
+                SET reciclagem_enviada_em = now()
+                WHERE cliente_id = :cliente_id
+                RETURNING cliente_id, estabelecimento_id, ultimo_agendamento
+            )
+            INSERT INTO reciclagem_envios (cliente_id, estabelecimento_id, ultimo_agendamento, mensagem_id)
+            SELECT cliente_id, estabelecimento_id, ultimo_agendamento, :mensagem_id FROM atual
+            ON CONFLICT (cliente_id, ultimo_agendamento) DO NOTHING
+        """), {"cliente_id": cliente_id, "mensagem_id": mensagem_id})
+        db.commit()
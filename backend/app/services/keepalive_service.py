@@ -3,97 +3,185 @@ Serviço de Keep-Alive para evitar hibernação do WAHA no Render
 """
 import requests
 import logging
-from typing import List, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
-from app.services.whatsapp_service import WhatsAppService
+
+from app.config import settings
+from app.services.waha_estado import WAHACircuito
 
 logger = logging.getLogger(__name__)
 
 
 class KeepAliveService:
-    """Serviço para manter WAHA ativo com pings periódicos"""
+    """
+    Serviço para manter WAHA ativo com pings periódicos.
+
+    Estabelecimentos que compartilham o mesmo WAHA (mesma waha_url) geram um
+    único ping. Os pings rodam em paralelo (limite KEEPALIVE_CONCORRENCIA) e
+    só uma varredura roda por vez: chamadas simultâneas esperam a varredura
+    em andamento e recebem o mesmo resultado.
+    """
+
+    _lock = threading.Lock()
+    _em_andamento: Optional[threading.Event] = None
+    _ultimo_resultado: Optional[Dict[str, Any]] = None
+    _ultimo_em: float = 0.0  # time.monotonic() do fim da última varredura
 
     @staticmethod
-    def ping_waha_instances(db: Session) -> Dict[str, any]:
-        """
-        Faz ping em todas as instâncias WAHA configuradas para evitar hibernação.
+    def _ping(waha_url: str, waha_api_key: Optional[str], estabelecimentos: List[int]) -> Dict[str, Any]:
+        """Ping em uma instância WAHA (resultado vale para todos os estabelecimentos dela)"""
+        # Endpoint /health requer versão Plus, /api/sessions é gratuito
+        sessions_url = f"{waha_url}/api/sessions"
+        resultado = {'url': sessions_url, 'estabelecimentos': estabelecimentos}
 
-        Returns:
-            Dict com estatísticas dos pings (total, sucesso, falhas)
-        """
+        try:
+            response = requests.get(
+                sessions_url,
+                headers={'X-Api-Key': waha_api_key},
+                timeout=10
+            )
+            if response.status_code < 500:
+                WAHACircuito.registrar_sucesso(waha_url)
+            else:
+                WAHACircuito.registrar_falha(waha_url, f"HTTP {response.status_code}")
+
+            if response.status_code == 200:
+                logger.info(f"[KEEP-ALIVE] ✓ WAHA ping OK - {waha_url} (estabelecimentos {estabelecimentos})")
+                return {**resultado, 'status': 'success'}
+
+            logger.warning(
+                f"[KEEP-ALIVE] ✗ WAHA ping FAILED (HTTP {response.status_code}) - "
+                f"{waha_url} (estabelecimentos {estabelecimentos})"
+            )
+            return {**resultado, 'status': 'failed', 'error': f"HTTP {response.status_code}"}
+
+        except requests.exceptions.RequestException as e:
+            WAHACircuito.registrar_falha(waha_url, str(e))
+            logger.error(f"[KEEP-ALIVE] ✗ Erro ao pingar WAHA - {waha_url}: {str(e)}")
+            return {**resultado, 'status': 'error', 'error': str(e)}
+
+    @staticmethod
+    def _varrer(db: Session) -> Dict[str, Any]:
+        """Uma varredura: agrupa as configs por waha_url e pinga em paralelo"""
         from app.models.whatsapp_config import WhatsAppConfig
+        from app.models.whatsapp_sessao import WhatsAppSessao
 
+        inicio = time.monotonic()
         stats = {
             'total': 0,
             'success': 0,
             'failed': 0,
+            'estabelecimentos': 0,
             'results': []
         }
 
         try:
-            # Buscar todas as configurações WAHA ativas
-            configs = db.query(WhatsAppConfig).filter(
+            configs = db.query(
+                WhatsAppConfig.estabelecimento_id,
+                WhatsAppConfig.waha_url,
+                WhatsAppConfig.waha_api_key
+            ).filter(
                 WhatsAppConfig.ativado == True,
                 WhatsAppConfig.waha_url.isnot(None)
             ).all()
 
-            stats['total'] = len(configs)
-
-            if not configs:
-                logger.info("[KEEP-ALIVE] Nenhuma configuração WAHA ativa encontrada")
-                return stats
+            # Sessões adicionais dos estabelecimentos ativos (podem estar em outras instâncias)
+            adicionais = db.query(
+                WhatsAppSessao.estabelecimento_id,
+                WhatsAppSessao.waha_url,
+                WhatsAppSessao.waha_api_key
+            ).join(
+                WhatsAppConfig, WhatsAppConfig.estabelecimento_id == WhatsAppSessao.estabelecimento_id
+            ).filter(
+                WhatsAppConfig.ativado == True,
+                WhatsAppSessao.ativo == True
+            ).all()
 
-            for config in configs:
-                try:
-                    # Fazer ping no endpoint de sessões do WAHA (disponível na versão free)
-                    # Endpoint /health requer versão Plus, /api/sessions é gratuito
-                    sessions_url = f"{config.waha_url.rstrip('/')}/api/sessions"
+            # Uma instância por URL (a primeira api key encontrada é usada no ping)
+            instancias: Dict[str, Dict[str, Any]] = {}
+            for config in list(configs) + list(adicionais):
+                url = config.waha_url.strip().rstrip('/')
+                instancia = instancias.setdefault(url, {'api_key': config.waha_api_key, 'estabelecimentos': []})
+                if config.estabelecimento_id not in instancia['estabelecimentos']:
+                    instancia['estabelecimentos'].append(config.estabelecimento_id)
 
-                    response = requests.get(
-                        sessions_url,
-                        headers={'X-Api-Key': config.waha_api_key},
-                        timeout=10
-                    )
+            stats['total'] = len(instancias)
+            stats['estabelecimentos'] = len(configs)
 
-                    if response.status_code == 200:
+            if not instancias:
+                logger.info("[KEEP-ALIVE] Nenhuma configuração WAHA ativa encontrada")
+            else:
+                workers = max(1, min(settings.keepalive_concorrencia, len(instancias)))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="keepalive") as executor:
+                    resultados = list(executor.map(
+                        lambda item: KeepAliveService._ping(item[0], item[1]['api_key'], item[1]['estabelecimentos']),
+                        instancias.items()
+                    ))
+
+                for resultado in resultados:
+                    if resultado['status'] == 'success':
                         stats['success'] += 1
-                        logger.info(
-                            f"[KEEP-ALIVE] ✓ WAHA ping OK - Estabelecimento {config.estabelecimento_id}"
-                        )
-                        stats['results'].append({
-                            'estabelecimento_id': config.estabelecimento_id,
-                            'status': 'success',
-                            'url': sessions_url
-                        })
                     else:
                         stats['failed'] += 1
-                        logger.warning(
-                            f"[KEEP-ALIVE] ✗ WAHA ping FAILED (HTTP {response.status_code}) - "
-                            f"Estabelecimento {config.estabelecimento_id}"
-                        )
-                        stats['results'].append({
-                            'estabelecimento_id': config.estabelecimento_id,
-                            'status': 'failed',
-                            'error': f"HTTP {response.status_code}"
-                        })
-
-                except requests.exceptions.RequestException as e:
-                    stats['failed'] += 1
-                    logger.error(
-                        f"[KEEP-ALIVE] ✗ Erro ao pingar WAHA - Estabelecimento {config.estabelecimento_id}: {str(e)}"
-                    )
-                    stats['results'].append({
-                        'estabelecimento_id': config.estabelecimento_id,
-                        'status': 'error',
-                        'error': str(e)
-                    })
+                stats['results'] = resultados
 
         except Exception as e:
             logger.error(f"[KEEP-ALIVE] Erro geral ao executar pings: {str(e)}")
             stats['error'] = str(e)
 
+        stats['executado_em'] = datetime.now(timezone.utc).isoformat()
+        stats['duracao_segundos'] = round(time.monotonic() - inicio, 2)
         logger.info(
-            f"[KEEP-ALIVE] Resumo: {stats['success']}/{stats['total']} pings bem-sucedidos"
+            f"[KEEP-ALIVE] Resumo: {stats['success']}/{stats['total']} instâncias OK "
+            f"({stats['estabelecimentos']} estabelecimentos) em {stats['duracao_segundos']}s"
         )
-
         return stats
+
+    @staticmethod
+    def ping_waha_instances(db: Session) -> Dict[str, Any]:
+        """
+        Faz ping em todas as instâncias WAHA configuradas para evitar hibernação.
+        Se uma varredura já está rodando, espera por ela e retorna o mesmo resultado.
+
+        Returns:
+            Dict com estatísticas dos pings (total de instâncias, sucesso, falhas)
+        """
+        with KeepAliveService._lock:
+            em_andamento = KeepAliveService._em_andamento
+            lider = em_andamento is None
+            if lider:
+                em_andamento = threading.Event()
+                KeepAliveService._em_andamento = em_andamento
+
+        if not lider:
+            em_andamento.wait()
+            return dict(KeepAliveService._ultimo_resultado or {}, compartilhado=True)
+
+        try:
+            stats = KeepAliveService._varrer(db)
+            with KeepAliveService._lock:
+                KeepAliveService._ultimo_resultado = stats
+                KeepAliveService._ultimo_em = time.monotonic()
+            return stats
+        finally:
+            with KeepAliveService._lock:
+                KeepAliveService._em_andamento = None
+            em_andamento.set()
+
+    @staticmethod
+    def resultado_recente(db: Session, max_idade: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Último resultado se tiver menos de `max_idade` segundos (padrão
+        KEEPALIVE_CACHE_TTL); senão executa (ou aguarda) uma varredura.
+        """
+        max_idade = settings.keepalive_cache_ttl if max_idade is None else max_idade
+        with KeepAliveService._lock:
+            ultimo = KeepAliveService._ultimo_resultado
+            idade = time.monotonic() - KeepAliveService._ultimo_em
+        if ultimo is not None and idade < max_idade:
+            return dict(ultimo, cache=True, idade_segundos=round(idade, 1))
+        return KeepAliveService.ping_waha_instances(db)
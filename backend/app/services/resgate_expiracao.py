@@ -0,0 +1,106 @@
+"""
+Expiração dos resgates de prêmios e aviso de expiração próxima.
+
+A validade é definida no resgate (`data_expiracao`, a partir dos dias do
+prêmio ou da configuração de fidelidade). Um job periódico:
+
+- marca como EXPIRADO os DISPONIVEL vencidos;
+- marca `aviso_expiracao_em` nos que vencem nos próximos dias e publica um
+  `ResgateExpirando` por resgate (eventos_dominio). Quem quiser avisar o
+  cliente registra um handler: `@EventosDominio.apos_commit(ResgateExpirando)`.
+
+Os dois trabalham em lotes pelo índice parcial dos disponíveis com validade
+(UPDATE de no máximo `lote` linhas por transação, FOR UPDATE SKIP LOCKED):
+não bloqueia a tabela nem espera por resgates sendo usados no momento.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.eventos_dominio import EventosDominio
+
+
+class ResgateExpirando(NamedTuple):
+    resgate_id: int
+    cliente_id: int
+    premio_id: int
+    estabelecimento_id: int
+    data_expiracao: datetime
+
+
+_EXPIRAR_LOTE = """
+    WITH lote AS (
+        SELECT id
+        FROM resgates_premios
+        WHERE status = 'DISPONIVEL' AND data_expiracao IS NOT NULL AND data_expiracao < now()
+        ORDER BY data_expiracao
+        LIMIT :lote
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE resgates_premios r
+    SET status = 'EXPIRADO', updated_at = now()
+    FROM lote
+    WHERE r.id = lote.id
+"""
+
+_AVISAR_LOTE = """
+    WITH lote AS (
+        SELECT id
+        FROM resgates_premios
+        WHERE status = 'DISPONIVEL' AND data_expiracao IS NOT NULL
+          AND data_expiracao >= now() AND data_expiracao < now() + make_interval(days => :dias)
+          AND aviso_expiracao_em IS NULL
+        ORDER BY data_expiracao
+        LIMIT :lote
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE resgates_premios r
+    SET aviso_expiracao_em = now()
+    FROM lote, premios p
+    WHERE r.id = lote.id AND p.id = r.premio_id
+    RETURNING r.id, r.cliente_id, r.premio_id, p.estabelecimento_id, r.data_expiracao
+"""
+
+
+class ExpiracaoResgates:
+
+    @staticmethod
+    def expirar_vencidos(db: Session, lote: Optional[int] = None) -> int:
+        """Marca os resgates vencidos como EXPIRADO, um commit por lote. Retorna o total"""
+        lote = max(1, lote or settings.fidelidade_expiracao_lote)
+        total = 0
+        while True:
+            expirados = db.execute(text(_EXPIRAR_LOTE), {"lote": lote}).rowcount
+            db.commit()
+            total += expirados
+            if expirados < lote:
+                return total
+
+    @staticmethod
+    def avisar_expiracao(db: Session, dias: Optional[int] = None, lote: Optional[int] = None) -> int:
+        """
+        Marca os resgates que vencem nos próximos `dias` (uma vez por resgate)
+        e publica ResgateExpirando para cada um. Retorna o total.
+        """
+        dias = dias or settings.fidelidade_aviso_expiracao_dias
+        lote = max(1, lote or settings.fidelidade_expiracao_lote)
+        total = 0
+        while True:
+            linhas = db.execute(text(_AVISAR_LOTE), {"dias": dias, "lote": lote}).all()
+            for linha in linhas:
+                EventosDominio.publicar(db, ResgateExpirando(*linha))
+            db.commit()
+            total += len(linhas)
+            if len(linhas) < lote:
+                return total
+
+    @staticmethod
+    def processar(db: Session) -> dict:
+        """Rotina do job: expira os vencidos e avisa os que estão para vencer"""
+        return {
+            "expirados": ExpiracaoResgates.expirar_vencidos(db),
+            "avisados": ExpiracaoResgates.avisar_expiracao(db),
+        }
@@ -0,0 +1,169 @@
+"""
+Estado das instâncias WAHA em memória: circuit breaker e status das sessões.
+
+Circuit breaker por instância (URL base do WAHA): depois de
+WAHA_CIRCUITO_FALHAS falhas seguidas (timeout, erro de conexão ou HTTP 5xx)
+o circuito abre e as chamadas falham na hora por WAHA_CIRCUITO_ESPERA
+segundos; depois disso uma única chamada de teste passa (meio-aberto) e o
+resultado dela fecha ou reabre o circuito.
+
+O status das sessões vem dos eventos session.status/state.change do webhook
+e das consultas ao WAHA, para o /waha/status responder sem chamar o WAHA.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+# state.change usa estados do WhatsApp; o /waha/status usa os status de sessão do WAHA
+ESTADOS_SESSAO = {"CONNECTED": "WORKING"}
+
+
+def instancia_waha(url: str) -> str:
+    """URL base da instância WAHA (chave do circuito)"""
+    return url.split("/api/")[0].strip().rstrip("/")
+
+
+class _Circuito:
+    __slots__ = ("estado", "falhas", "aberto_ate", "sondando", "ultimo_erro", "aberturas")
+
+    def __init__(self):
+        self.estado = FECHADO
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self.sondando = False
+        self.ultimo_erro: Optional[str] = None
+        self.aberturas = 0
+
+
+class WAHACircuito:
+    _lock = threading.Lock()
+    _circuitos: Dict[str, _Circuito] = {}
+
+    @staticmethod
+    def permitir(url: str) -> None:
+        """Libera a chamada ou levanta 503 enquanto a instância está marcada como fora do ar"""
+        chave = instancia_waha(url)
+        with WAHACircuito._lock:
+            circuito = WAHACircuito._circuitos.get(chave)
+            if circuito is None or circuito.estado == FECHADO:
+                return
+
+            agora = time.monotonic()
+            if circuito.estado == ABERTO and agora >= circuito.aberto_ate:
+                # Esta chamada é o teste do meio-aberto
+                circuito.estado = MEIO_ABERTO
+                circuito.sondando = True
+                return
+            if circuito.estado == MEIO_ABERTO and not circuito.sondando:
+                circuito.sondando = True
+                return
+
+            espera = max(0, int(circuito.aberto_ate - agora))
+            ultimo_erro = circuito.ultimo_erro
+
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"WAHA indisponível ({chave}); nova tentativa em {espera}s. Último erro: {ultimo_erro}"
+        )
+
+    @staticmethod
+    def registrar_sucesso(url: str) -> None:
+        chave = instancia_waha(url)
+        with WAHACircuito._lock:
+            circuito = WAHACircuito._circuitos.get(chave)
+            if circuito is not None:
+                circuito.estado = FECHADO
+                circuito.falhas = 0
+                circuito.sondando = False
+
+    @staticmethod
+    def registrar_falha(url: str, erro: str) -> None:
+        chave = instancia_waha(url)
+        with WAHACircuito._lock:
+            circuito = WAHACircuito._circuitos.setdefault(chave, _Circuito())
+            circuito.falhas += 1
+            circuito.ultimo_erro = erro[:200]
+            circuito.sondando = False
+            if circuito.estado == MEIO_ABERTO or circuito.falhas >= settings.waha_circuito_falhas:
+                if circuito.estado != ABERTO:
+                    circuito.aberturas += 1
+                circuito.estado = ABERTO
+                circuito.aberto_ate = time.monotonic() + settings.waha_circuito_espera
+
+    @staticmethod
+    def estado(url: str) -> str:
+        with WAHACircuito._lock:
+            circuito = WAHACircuito._circuitos.get(instancia_waha(url))
+            return circuito.estado if circuito else FECHADO
+
+    @staticmethod
+    def limpar() -> None:
+        with WAHACircuito._lock:
+            WAHACircuito._circuitos.clear()
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Estado de cada instância que já falhou"""
+        agora = time.monotonic()
+        with WAHACircuito._lock:
+            return {
+                chave: {
+                    "estado": c.estado,
+                    "falhas_seguidas": c.falhas,
+                    "aberturas": c.aberturas,
+                    "reabre_em_segundos": max(0, round(c.aberto_ate - agora, 1)) if c.estado == ABERTO else 0,
+                    "ultimo_erro": c.ultimo_erro,
+                }
+                for chave, c in WAHACircuito._circuitos.items()
+            }
+
+
+# (instância, sessão) -> status
+_ChaveSessao = Tuple[str, str]
+
+
+class WAHASessaoCache:
+    _lock = threading.Lock()
+    _sessoes: Dict[_ChaveSessao, Dict[str, Any]] = {}
+
+    @staticmethod
+    def atualizar(waha_url: str, session_name: str, status_sessao: str,
+                  me: Optional[Dict[str, Any]] = None, fonte: str = "waha") -> None:
+        status_sessao = ESTADOS_SESSAO.get(status_sessao, status_sessao)
+        chave = (instancia_waha(waha_url), session_name)
+        with WAHASessaoCache._lock:
+            anterior = WAHASessaoCache._sessoes.get(chave)
+            # state.change não traz o número conectado: mantém o já conhecido
+            if me is None and status_sessao == "WORKING" and anterior:
+                me = anterior["me"]
+            WAHASessaoCache._sessoes[chave] = {
+                "status": status_sessao,
+                "me": me,
+                "fonte": fonte,
+                "atualizado_em": datetime.now(timezone.utc).isoformat(),
+                "_monotonic": time.monotonic(),
+            }
+
+    @staticmethod
+    def obter(waha_url: str, session_name: str, max_idade: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Status em cache (None se não há ou se é mais antigo que max_idade; padrão WAHA_SESSAO_CACHE_TTL)"""
+        max_idade = settings.waha_sessao_cache_ttl if max_idade is None else max_idade
+        with WAHASessaoCache._lock:
+            entrada = WAHASessaoCache._sessoes.get((instancia_waha(waha_url), session_name))
+        if entrada is None or time.monotonic() - entrada["_monotonic"] > max_idade:
+            return None
+        return {k: v for k, v in entrada.items() if not k.startswith("_")}
+
+    @staticmethod
+    def invalidar(waha_url: str, session_name: str) -> None:
+        with WAHASessaoCache._lock:
+            WAHASessaoCache._sessoes.pop((instancia_waha(waha_url), session_name), None)
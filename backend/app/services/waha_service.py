@@ -2,11 +2,14 @@
 Serviço para integração com WAHA (WhatsApp HTTP API)
 Documentação: https://waha.devlike.pro
 """
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Optional, Tuple
 import requests
 import logging
 from fastapi import HTTPException, status
 
+from app.services.waha_estado import WAHACircuito, WAHASessaoCache, instancia_waha
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,7 +27,12 @@ class WAHAService:
         """
         Faz requisição para API do WAHA com tratamento de erros.
         Timeout padrão: 120s (suficiente para cold start do Render free tier)
+
+        Passa pelo circuit breaker da instância: com a instância fora do ar
+        (falhas seguidas) levanta 503 na hora, sem esperar o timeout.
         """
+        WAHACircuito.permitir(url)
+
         headers = {
             "X-Api-Key": api_key,
             "Content-Type": "application/json"
@@ -53,12 +61,19 @@ class WAHAService:
             logger.info(f"Response Text: {response.text[:500]}")
             logger.info("=" * 80)
 
+            # 5xx (ex.: instância hibernando atrás do proxy) conta como falha da instância
+            if response.status_code >= 500:
+                WAHACircuito.registrar_falha(url, f"HTTP {response.status_code}")
+            else:
+                WAHACircuito.registrar_sucesso(url)
+
             response.raise_for_status()
             result = response.json() if response.text else {}
             logger.info(f"WAHA Response Parsed: {result}")
             return result
 
         except requests.exceptions.Timeout as e:
+            WAHACircuito.registrar_falha(url, f"Timeout (>{timeout}s)")
             logger.error("=" * 80)
             logger.error(f"WAHA TIMEOUT ERROR após {timeout}s")
             logger.error(f"URL: {url}")
@@ -69,6 +84,8 @@ class WAHAService:
                 detail=f"Timeout ao comunicar com WAHA (>{timeout}s): {str(e)}"
             )
         except requests.exceptions.RequestException as e:
+            if getattr(e, 'response', None) is None:
+                WAHACircuito.registrar_falha(url, str(e))
             logger.error("=" * 80)
             logger.error(f"WAHA REQUEST ERROR")
             logger.error(f"URL: {url}")
@@ -125,6 +142,7 @@ class WAHAService:
                 }
             ]
 
+        WAHASessaoCache.invalidar(waha_url, session_name)
         try:
             result = WAHAService._make_request("POST", url, waha_api_key, payload)
             logger.info(f"Sessão WAHA '{session_name}' iniciada com sucesso")
@@ -155,6 +173,7 @@ class WAHAService:
             "name": session_name
         }
 
+        WAHASessaoCache.invalidar(waha_url, session_name)
         result = WAHAService._make_request("POST", url, waha_api_key, payload)
         logger.info(f"Sessão WAHA '{session_name}' parada com sucesso")
         return result
@@ -232,6 +251,8 @@ class WAHAService:
 
         result = WAHAService._make_request("GET", url, waha_api_key)
         logger.info(f"Status da sessão '{session_name}': {result.get('status')}")
+        if result.get("status"):
+            WAHASessaoCache.atualizar(waha_url, session_name, result["status"], result.get("me"))
         return result
 
     @staticmethod
@@ -313,6 +334,7 @@ class WAHAService:
             "X-Api-Key": waha_api_key
         }
 
+        WAHASessaoCache.invalidar(waha_url, session_name)
         try:
             logger.info(f"WAHA Request: DELETE {url}")
             response = requests.delete(url, headers=headers, timeout=120)
@@ -365,3 +387,35 @@ class WAHAService:
 
         logger.info(f"Sessão '{session_name}' reconectada - novo QR Code disponível")
         return result
+
+    @staticmethod
+    def aquecer(sessoes: Iterable[Tuple[str, str, str]]) -> Dict[Tuple[str, str], Optional[str]]:
+        """
+        Acorda as instâncias antes de um envio em lote: consulta o status de
+        cada sessão (waha_url, waha_api_key, session_name) em paralelo.
+        Instância fora do ar abre o circuito (o lote falha rápido em vez de
+        esperar o timeout por mensagem).
+
+        Returns:
+            {(instância, sessão): status} (None se a consulta falhou)
+        """
+        distintas: Dict[Tuple[str, str], Tuple[str, str, str]] = {}
+        for waha_url, waha_api_key, session_name in sessoes:
+            distintas.setdefault((instancia_waha(waha_url), session_name), (waha_url, waha_api_key, session_name))
+        if not distintas:
+            return {}
+
+        def consultar(sessao: Tuple[str, str, str]) -> Optional[str]:
+            waha_url, waha_api_key, session_name = sessao
+            cache = WAHASessaoCache.obter(waha_url, session_name)
+            if cache:
+                return cache["status"]
+            try:
+                return WAHAService.get_session_status(waha_url, waha_api_key, session_name).get("status")
+            except HTTPException as e:
+                logger.warning(f"[WAHA] Aquecimento falhou - {waha_url} sessão {session_name}: {e.detail}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(8, len(distintas)), thread_name_prefix="waha-aquecer") as executor:
+            status_sessoes = list(executor.map(consultar, distintas.values()))
+        return dict(zip(distintas.keys(), status_sessoes))
@@ -0,0 +1,352 @@
+"""
+Ingestão em lote dos eventos de mensagem recebidos via webhook do WAHA.
+
+O endpoint só valida o evento e o coloca numa fila em memória; uma thread
+grava os eventos em lotes com INSERT ... ON CONFLICT, mesclando os acks na
+própria linha da mensagem. Na parada da aplicação a fila é esvaziada antes
+de encerrar.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from psycopg2.extras import Json, execute_values
+
+from app.database import SessionLocal
+from app.schemas.whatsapp import WAHAWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+# -1/0=error, 1=pending, 2=server, 3=delivery, 4=read, 5=played
+ACK_STATUS = {-1: "error", 0: "error", 1: "pending", 2: "server", 3: "delivery", 4: "read", 5: "played"}
+ORDEM_ACK = ["error", "pending", "server", "delivery", "read", "played"]
+
+# Campos de conteúdo: um ack recebido antes da mensagem é completado quando ela chega
+CAMPOS_CONTEUDO = [
+    "from_number", "to_number", "from_me", "body", "has_media",
+    "event_type", "message_timestamp", "payload_json",
+]
+
+COLUNAS = [
+    "message_id", "session_name", "estabelecimento_id", "ack_status",
+] + CAMPOS_CONTEUDO
+
+# Tipos das colunas no VALUES (o VALUES não herda os tipos da tabela)
+TIPOS = {
+    "estabelecimento_id": "integer", "from_me": "boolean", "has_media": "boolean",
+    "message_timestamp": "timestamptz", "payload_json": "jsonb",
+}
+TEMPLATE_VALUES = "(" + ", ".join(f"%s::{TIPOS.get(c, 'text')}" for c in COLUNAS) + ")"
+
+# Posição do ack (para só avançar: server < delivery < read < played)
+_ORDEM_SQL = "ARRAY[" + ", ".join(f"'{a}'" for a in ORDEM_ACK) + "]::text[]"
+
+
+def _ack_posicao_sql(expr: str) -> str:
+    return f"array_position({_ORDEM_SQL}, {expr}::text)"
+
+
+def _ack_mais_avancado_sql(atual: str, novo: str) -> str:
+    return (
+        f"CASE WHEN {novo} IS NOT NULL AND ({atual} IS NULL "
+        f"OR {_ack_posicao_sql(novo)} > coalesce({_ack_posicao_sql(atual)}, 0)) "
+        f"THEN {novo} ELSE {atual} END"
+    )
+
+
+# Mensagens (message.any, message...): a unique inclui message_timestamp (chave de
+# partição). Linhas criadas por acks que chegaram antes da mensagem são removidas
+# e o ack delas passa para a linha da mensagem.
+UPSERT_MENSAGENS_SQL = f"""
+    WITH novos ({", ".join(COLUNAS)}) AS (VALUES %s),
+    orfaos AS (
+        DELETE FROM whatsapp_messages m
+        USING novos n
+        WHERE m.estabelecimento_id = n.estabelecimento_id
+          AND m.message_id = n.message_id
+          AND m.event_type = 'message.ack'
+        RETURNING m.estabelecimento_id, m.message_id, m.ack_status
+    ),
+    ack_orfaos AS (
+        SELECT estabelecimento_id, message_id,
+               ({_ORDEM_SQL})[max({_ack_posicao_sql("ack_status")})] AS ack_status
+        FROM orfaos
+        GROUP BY estabelecimento_id, message_id
+    )
+    INSERT INTO whatsapp_messages ({", ".join(COLUNAS)})
+    SELECT {", ".join(
+        _ack_mais_avancado_sql("o.ack_status", "n.ack_status") if c == "ack_status" else f"n.{c}"
+        for c in COLUNAS
+    )}
+    FROM novos n
+    LEFT JOIN ack_orfaos o ON o.estabelecimento_id = n.estabelecimento_id AND o.message_id = n.message_id
+    ON CONFLICT (estabelecimento_id, message_id, message_timestamp) DO UPDATE
+    SET ack_status = {_ack_mais_avancado_sql("whatsapp_messages.ack_status", "EXCLUDED.ack_status")}
+"""
+
+# Acks: atualizam a linha da mensagem (qualquer partição, pelo índice único);
+# sem mensagem gravada, o ack é guardado numa linha própria até ela chegar.
+UPSERT_ACKS_SQL = f"""
+    WITH acks ({", ".join(COLUNAS)}) AS (VALUES %s),
+    atualizados AS (
+        UPDATE whatsapp_messages m
+        SET ack_status = {_ack_mais_avancado_sql("m.ack_status", "a.ack_status")}
+        FROM acks a
+        WHERE m.estabelecimento_id = a.estabelecimento_id AND m.message_id = a.message_id
+        RETURNING m.estabelecimento_id, m.message_id
+    )
+    INSERT INTO whatsapp_messages ({", ".join(COLUNAS)})
+    SELECT {", ".join(f"a.{c}" for c in COLUNAS)}
+    FROM acks a
+    WHERE NOT EXISTS (
+        SELECT 1 FROM atualizados u
+        WHERE u.estabelecimento_id = a.estabelecimento_id AND u.message_id = a.message_id
+    )
+    ON CONFLICT (estabelecimento_id, message_id, message_timestamp) DO UPDATE
+    SET ack_status = {_ack_mais_avancado_sql("whatsapp_messages.ack_status", "EXCLUDED.ack_status")}
+"""
+
+# Campos do evento/payload que não são guardados (dados brutos da engine e mídia em base64)
+CAMPOS_IGNORADOS_EVENTO = ("environment",)
+CAMPOS_IGNORADOS_PAYLOAD = ("_data",)
+
+TAMANHO_LOTE = 500
+INTERVALO_FLUSH = 0.2  # segundos
+TAMANHO_FILA = 50000
+
+
+def _limpar_numero(numero: Optional[str]) -> str:
+    """Remove @c.us e @s.whatsapp.net"""
+    return (numero or "").replace("@c.us", "").replace("@s.whatsapp.net", "")
+
+
+def _posicao_ack(ack_status: Optional[str]) -> int:
+    return ORDEM_ACK.index(ack_status) if ack_status in ORDEM_ACK else -1
+
+
+def compactar_payload(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Evento sem os campos grandes/irrelevantes (guardado em payload_json)"""
+    compacto = {k: v for k, v in event_data.items() if k not in CAMPOS_IGNORADOS_EVENTO}
+    payload = compacto.get("payload")
+    if isinstance(payload, dict):
+        payload = {k: v for k, v in payload.items() if k not in CAMPOS_IGNORADOS_PAYLOAD}
+        media = payload.get("media")
+        if isinstance(media, dict) and "data" in media:
+            payload["media"] = {k: v for k, v in media.items() if k != "data"}
+        compacto["payload"] = payload
+    return compacto
+
+
+def extrair_mensagem(
+    evento: WAHAWebhookEvent,
+    session_name: str,
+    estabelecimento_id: int,
+    payload_json: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Linha de whatsapp_messages a partir de um evento message.* (payload_json: evento original)"""
+    payload = evento.payload
+
+    # Converter timestamp (WAHA envia segundos; algumas engines, milissegundos)
+    timestamp = payload.get("timestamp") or 0
+    try:
+        timestamp = float(timestamp)
+        if timestamp > 1e11:
+            timestamp /= 1000
+        message_timestamp = datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp else None
+    except (TypeError, ValueError, OverflowError):
+        message_timestamp = None
+
+    # WAHA retorna ack em payload._data.ack ou payload.ack
+    ack_status = None
+    if evento.event == "message.ack":
+        ack = payload.get("ack") or (payload.get("_data") or {}).get("ack")
+        if ack:
+            try:
+                ack_status = ACK_STATUS.get(int(ack), str(ack))
+            except (TypeError, ValueError):
+                ack_status = str(ack)
+
+    return {
+        "message_id": payload.get("id", ""),
+        "session_name": session_name,
+        "estabelecimento_id": estabelecimento_id,
+        "ack_status": ack_status,
+        "from_number": _limpar_numero(payload.get("from")),
+        "to_number": _limpar_numero(payload.get("to")) or None,
+        "from_me": bool(payload.get("fromMe", False)),
+        "body": payload.get("body", ""),
+        "has_media": bool(payload.get("hasMedia", False)),
+        "event_type": evento.event,
+        "message_timestamp": message_timestamp or datetime.now(timezone.utc),
+        "payload_json": compactar_payload(payload_json if payload_json is not None else evento.model_dump()),
+    }
+
+
+def _mesclar(atual: Dict[str, Any], novo: Dict[str, Any]) -> Dict[str, Any]:
+    """Mesma regra do ON CONFLICT, para eventos da mesma mensagem no mesmo lote"""
+    resultado = dict(atual)
+    if atual["event_type"] == "message.ack" and novo["event_type"] != "message.ack":
+        for campo in CAMPOS_CONTEUDO:
+            resultado[campo] = novo[campo]
+    if novo["ack_status"] and _posicao_ack(novo["ack_status"]) > _posicao_ack(atual["ack_status"]):
+        resultado["ack_status"] = novo["ack_status"]
+    return resultado
+
+
+class WebhookIngestaoService:
+    _fila: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=TAMANHO_FILA)
+    _thread: Optional[threading.Thread] = None
+    _parar = threading.Event()
+    _lock = threading.Lock()
+    _contadores = {"enfileirados": 0, "gravados": 0, "lotes": 0, "erros": 0, "gravacao_direta": 0}
+
+    @staticmethod
+    def gravar_lote(eventos: List[Dict[str, Any]]) -> int:
+        """Grava os eventos (até dois statements por lote). Retorna o número de mensagens."""
+        # Uma linha por mensagem: o ON CONFLICT não aceita a mesma chave duas vezes no statement
+        linhas: Dict[tuple, Dict[str, Any]] = {}
+        for evento in eventos:
+            chave = (evento["estabelecimento_id"], evento["message_id"])
+            linhas[chave] = _mesclar(linhas[chave], evento) if chave in linhas else evento
+
+        mensagens, acks = [], []
+        for linha in linhas.values():
+            valores = tuple(Json(linha[c]) if c == "payload_json" else linha[c] for c in COLUNAS)
+            (acks if linha["event_type"] == "message.ack" else mensagens).append(valores)
+
+        db = SessionLocal()
+        try:
+            cursor = db.connection().connection.cursor()
+            if mensagens:
+                execute_values(cursor, UPSERT_MENSAGENS_SQL, mensagens, template=TEMPLATE_VALUES, page_size=TAMANHO_LOTE)
+            if acks:
+                execute_values(cursor, UPSERT_ACKS_SQL, acks, template=TEMPLATE_VALUES, page_size=TAMANHO_LOTE)
+
+            # Funil de entrega: acks das mensagens enviadas pelo sistema
+            from app.services.whatsapp_envio_service import WhatsAppEnvioService
+            WhatsAppEnvioService.aplicar_acks(db, [
+                (linha["estabelecimento_id"], linha["message_id"], linha["ack_status"])
+                for linha in linhas.values() if linha["ack_status"]
+            ])
+            db.commit()
+            return len(linhas)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def enfileirar(mensagem: Dict[str, Any]) -> bool:
+        """
+        Coloca o evento na fila do gravador. Sem gravador ativo ou com a fila
+        cheia, grava direto (a requisição espera, nada é descartado).
+        Retorna True se foi enfileirado.
+        """
+        if WebhookIngestaoService._thread and WebhookIngestaoService._thread.is_alive():
+            try:
+                WebhookIngestaoService._fila.put(mensagem, timeout=0.5)
+                with WebhookIngestaoService._lock:
+                    WebhookIngestaoService._contadores["enfileirados"] += 1
+                return True
+            except queue.Full:
+                logger.warning("[WEBHOOK] Fila cheia - gravando evento diretamente")
+
+        WebhookIngestaoService.gravar_lote([mensagem])
+        with WebhookIngestaoService._lock:
+            WebhookIngestaoService._contadores["gravacao_direta"] += 1
+            WebhookIngestaoService._contadores["gravados"] += 1
+        return False
+
+    @staticmethod
+    def _drenar(limite: int) -> List[Dict[str, Any]]:
+        eventos = []
+        while len(eventos) < limite:
+            try:
+                eventos.append(WebhookIngestaoService._fila.get_nowait())
+            except queue.Empty:
+                break
+        return eventos
+
+    @staticmethod
+    def _gravar_com_retentativa(eventos: List[Dict[str, Any]]) -> None:
+        """Grava o lote; em erro tenta de novo (o lote não é descartado enquanto o processo vive)"""
+        espera = 0.5
+        while True:
+            try:
+                gravados = WebhookIngestaoService.gravar_lote(eventos)
+                with WebhookIngestaoService._lock:
+                    WebhookIngestaoService._contadores["gravados"] += len(eventos)
+                    WebhookIngestaoService._contadores["lotes"] += 1
+                logger.debug(f"[WEBHOOK] Lote gravado: {len(eventos)} eventos, {gravados} linhas")
+                return
+            except Exception as e:
+                with WebhookIngestaoService._lock:
+                    WebhookIngestaoService._contadores["erros"] += 1
+                logger.error(f"[WEBHOOK] Erro ao gravar lote de {len(eventos)} eventos: {str(e)}")
+                if WebhookIngestaoService._parar.is_set() and espera > 8:
+                    logger.error(f"[WEBHOOK] {len(eventos)} eventos não gravados na parada")
+                    return
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+
+    @staticmethod
+    def _executar() -> None:
+        """Loop do gravador: lote cheio ou INTERVALO_FLUSH, o que vier primeiro"""
+        while not WebhookIngestaoService._parar.is_set():
+            try:
+                primeiro = WebhookIngestaoService._fila.get(timeout=INTERVALO_FLUSH)
+            except queue.Empty:
+                continue
+
+            eventos = [primeiro]
+            limite_tempo = time.monotonic() + INTERVALO_FLUSH
+            while len(eventos) < TAMANHO_LOTE and time.monotonic() < limite_tempo:
+                eventos.extend(WebhookIngestaoService._drenar(TAMANHO_LOTE - len(eventos)))
+                if len(eventos) < TAMANHO_LOTE:
+                    time.sleep(0.01)
+
+            WebhookIngestaoService._gravar_com_retentativa(eventos)
+
+        # Parada: grava o que sobrou na fila
+        while True:
+            eventos = WebhookIngestaoService._drenar(TAMANHO_LOTE)
+            if not eventos:
+                break
+            WebhookIngestaoService._gravar_com_retentativa(eventos)
+
+    @staticmethod
+    def iniciar() -> None:
+        """Inicia a thread gravadora (startup da aplicação)"""
+        if WebhookIngestaoService._thread and WebhookIngestaoService._thread.is_alive():
+            return
+        WebhookIngestaoService._parar.clear()
+        WebhookIngestaoService._thread = threading.Thread(
+            target=WebhookIngestaoService._executar, name="webhook-ingestao", daemon=True
+        )
+        WebhookIngestaoService._thread.start()
+
+    @staticmethod
+    def parar(timeout: float = 30) -> None:
+        """Para a thread depois de gravar a fila (shutdown da aplicação)"""
+        thread = WebhookIngestaoService._thread
+        if not thread:
+            return
+        WebhookIngestaoService._parar.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error(f"[WEBHOOK] Gravador não terminou em {timeout}s; {WebhookIngestaoService._fila.qsize()} eventos na fila")
+        WebhookIngestaoService._thread = None
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Contadores e tamanho atual da fila"""
+        with WebhookIngestaoService._lock:
+            return {
+                **WebhookIngestaoService._contadores,
+                "fila": WebhookIngestaoService._fila.qsize(),
+                "ativo": bool(WebhookIngestaoService._thread and WebhookIngestaoService._thread.is_alive()),
+            }
@@ -0,0 +1,418 @@
+"""
+Envios programados de WhatsApp (lembrete e pós-atendimento) em horário exato.
+
+Os envios ficam em whatsapp_agendados. Uma thread mantém em memória uma
+timing wheel com as pendentes do próximo horizonte (WHATSAPP_AGENDADOR_HORIZONTE
+segundos, recarregado a cada meio horizonte) e, a cada segundo, despacha as
+vencidas. Criar, remarcar, concluir ou cancelar um agendamento sincroniza as
+linhas pendentes dele e a roda (inserir/cancelar O(1)), sem varreduras.
+
+Antes de enviar, a linha é reivindicada (pendente -> enviando, só se o
+horário ainda é o da roda), então entradas antigas de uma remarcação ou
+de outro processo não geram envio duplicado. Um erro depois da reivindicação
+marca as linhas como falhou; as que ficaram em enviando (processo
+interrompido) voltam a pendente na carga seguinte, passado
+WHATSAPP_AGENDADOR_TIMEOUT_ENVIO.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dtime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Agendamento, WhatsAppAgendado
+from app.models.agendamento import StatusAgendamento
+from app.services.eventos_dominio import EventosDominio
+from app.services.whatsapp_config_cache import WhatsAppConfigCache
+from app.utils.timezone import BRAZIL_TZ, get_brazil_now, to_brazil_tz
+from app.utils.timing_wheel import RodaTemporal
+
+logger = logging.getLogger(__name__)
+
+PENDENTE = 'pendente'
+ENVIANDO = 'enviando'  # Reivindicada para envio (REIVINDICAR_SQL)
+ENVIADO = 'enviado'
+FALHOU = 'falhou'
+IGNORADO = 'ignorado'  # Tipo desabilitado ou WhatsApp desativado na hora do envio
+CANCELADO = 'cancelado'
+
+# Reivindica as vencidas (o horário na roda pode estar desatualizado por uma remarcação)
+REIVINDICAR_SQL = text("""
+    UPDATE whatsapp_agendados SET status = 'enviando', processado_em = now()
+    WHERE id = ANY(:ids) AND status = 'pendente' AND enviar_em <= now() + interval '1 second'
+    RETURNING id, estabelecimento_id, cliente_id, agendamento_id, tipo
+""")
+
+# Reivindicadas há mais de :timeout segundos sem resultado (processo interrompido no
+# envio): voltam a pendente, exceto se já existe outra pendente do mesmo agendamento e
+# tipo (remarcação) ou se é um lembrete de agendamento que já começou
+RECUPERAR_SQL = text("""
+    UPDATE whatsapp_agendados w
+    SET status = CASE
+            WHEN EXISTS (
+                SELECT 1 FROM whatsapp_agendados p
+                WHERE p.agendamento_id = w.agendamento_id AND p.tipo = w.tipo AND p.status = 'pendente'
+            ) THEN 'cancelado'
+            WHEN w.tipo = 'LEMBRETE' AND EXISTS (
+                SELECT 1 FROM agendamentos a WHERE a.id = w.agendamento_id AND a.data_inicio <= now()
+            ) THEN 'falhou'
+            ELSE 'pendente'
+        END,
+        erro = 'Envio interrompido',
+        processado_em = now()
+    WHERE w.status = 'enviando' AND w.processado_em < now() - make_interval(secs => :timeout)
+    RETURNING w.id, w.status
+""")
+
+
+def deslocar_silencio(
+    momento: datetime,
+    inicio: Optional[dtime],
+    fim: Optional[dtime],
+    limite: Optional[datetime] = None
+) -> datetime:
+    """
+    Tira o momento do horário de silêncio [inicio, fim) (horário do Brasil,
+    pode virar a meia-noite): vai para o fim do silêncio ou, se isso passar
+    do `limite` (ex: início do agendamento), para logo antes do silêncio.
+    """
+    if inicio is None or fim is None or inicio == fim:
+        return momento
+
+    local = to_brazil_tz(momento)
+    hora = local.time()
+    vira_meia_noite = inicio > fim
+    if vira_meia_noite:
+        no_silencio = hora >= inicio or hora < fim
+    else:
+        no_silencio = inicio <= hora < fim
+    if not no_silencio:
+        return momento
+
+    dia = local.date()
+    # Fim do silêncio: hoje se ainda não passou, senão amanhã
+    dia_fim = dia if hora < fim else dia + timedelta(days=1)
+    depois = datetime.combine(dia_fim, fim, tzinfo=BRAZIL_TZ)
+    if limite is None or depois < limite:
+        return depois
+
+    # Início deste silêncio: hoje se já começou, senão ontem
+    dia_inicio = dia if hora >= inicio else dia - timedelta(days=1)
+    return datetime.combine(dia_inicio, inicio, tzinfo=BRAZIL_TZ) - timedelta(minutes=1)
+
+
+class WhatsAppAgendador:
+    _lock = threading.Lock()
+    _roda: Optional[RodaTemporal] = None
+    _carregado_ate = 0.0  # epoch até onde as pendentes estão na roda
+    _thread: Optional[threading.Thread] = None
+    _executor: Optional[ThreadPoolExecutor] = None
+    _parar = threading.Event()
+    _contadores = {'despachados': 0, 'enviados': 0, 'falhas': 0, 'ignorados': 0, 'descartados': 0}
+
+    # ==================== Programação ====================
+
+    @staticmethod
+    def _desejados(db: Session, agendamento: Agendamento) -> Dict[str, datetime]:
+        """Envios que o agendamento deve ter agora (tipo -> horário)"""
+        if agendamento.deleted_at is not None:
+            return {}
+        config = WhatsAppConfigCache.get_por_estabelecimento(db, agendamento.estabelecimento_id)
+        if not config or not config.ativado:
+            return {}
+
+        agora = get_brazil_now()
+        desejados = {}
+
+        if agendamento.status == StatusAgendamento.AGENDADO and config.enviar_lembrete and config.template_lembrete:
+            horas = config.lembrete_horas_antes or 24
+            momento = deslocar_silencio(
+                agendamento.data_inicio - timedelta(hours=horas),
+                config.silencio_inicio, config.silencio_fim,
+                limite=agendamento.data_inicio
+            )
+            if agora < momento < agendamento.data_inicio:
+                desejados['LEMBRETE'] = momento
+
+        if (agendamento.status == StatusAgendamento.CONCLUIDO and config.enviar_pos_atendimento
+                and config.template_pos_atendimento):
+            base = agendamento.completed_at or agora
+            horas = config.pos_atendimento_horas if config.pos_atendimento_horas is not None else 2
+            momento = deslocar_silencio(base + timedelta(hours=horas), config.silencio_inicio, config.silencio_fim)
+            desejados['POS_ATENDIMENTO'] = max(momento, agora)
+
+        return desejados
+
+    @staticmethod
+    def sincronizar_agendamento(db: Session, agendamento: Agendamento) -> None:
+        """
+        Ajusta os envios pendentes do agendamento ao estado atual (cria,
+        remarca ou cancela). Participa da transação de quem chamou (não faz
+        commit); a roda é atualizada depois do commit.
+        """
+        desejados = WhatsAppAgendador._desejados(db, agendamento)
+        pendentes = {
+            linha.tipo: linha
+            for linha in db.query(WhatsAppAgendado).filter(
+                WhatsAppAgendado.agendamento_id == agendamento.id,
+                WhatsAppAgendado.status == PENDENTE
+            ).all()
+        }
+        if not desejados and not pendentes:
+            return
+
+        cancelados = []
+        for tipo, linha in pendentes.items():
+            if tipo not in desejados:
+                linha.status = CANCELADO
+                linha.processado_em = get_brazil_now()
+                cancelados.append(linha)
+
+        alterados = []
+        for tipo, momento in desejados.items():
+            linha = pendentes.get(tipo)
+            if linha is None:
+                linha = WhatsAppAgendado(
+                    estabelecimento_id=agendamento.estabelecimento_id,
+                    cliente_id=agendamento.cliente_id,
+                    agendamento_id=agendamento.id,
+                    tipo=tipo,
+                    enviar_em=momento,
+                    status=PENDENTE
+                )
+                db.add(linha)
+            elif linha.enviar_em != momento:
+                linha.enviar_em = momento
+            else:
+                continue
+            alterados.append(linha)
+
+        db.flush()
+        cancelados_ids = [linha.id for linha in cancelados]
+        prazos = [(linha.id, linha.enviar_em.timestamp()) for linha in alterados]
+        EventosDominio.ao_confirmar(db, lambda: WhatsAppAgendador._atualizar_roda(cancelados_ids, prazos))
+
+    @staticmethod
+    def _atualizar_roda(cancelados_ids: List[int], prazos: List[Tuple[int, float]]) -> None:
+        with WhatsAppAgendador._lock:
+            roda = WhatsAppAgendador._roda
+            if roda is None:
+                return
+            for linha_id in cancelados_ids:
+                roda.remover(linha_id)
+            for linha_id, prazo in prazos:
+                if prazo <= WhatsAppAgendador._carregado_ate:
+                    roda.adicionar(linha_id, prazo)
+                else:
+                    # Fora do horizonte: entra na próxima carga
+                    roda.remover(linha_id)
+
+    @staticmethod
+    def programar_pendentes(db: Session, horas: int = 48) -> Dict[str, Any]:
+        """
+        Programa os envios dos agendamentos das próximas `horas` que ainda não
+        têm lembrete (agendamentos anteriores ao agendador ou alterados por
+        fora da API).
+        """
+        agora = get_brazil_now()
+        agendamentos = db.query(Agendamento).filter(
+            Agendamento.data_inicio > agora,
+            Agendamento.data_inicio <= agora + timedelta(hours=horas),
+            Agendamento.deleted_at.is_(None),
+            Agendamento.status == StatusAgendamento.AGENDADO,
+            ~db.query(WhatsAppAgendado.id).filter(
+                WhatsAppAgendado.agendamento_id == Agendamento.id,
+                WhatsAppAgendado.tipo == 'LEMBRETE'
+            ).exists()
+        ).all()
+
+        stats = {'agendamentos_processados': len(agendamentos), 'erros': 0}
+        for agendamento in agendamentos:
+            try:
+                WhatsAppAgendador.sincronizar_agendamento(db, agendamento)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                stats['erros'] += 1
+                logger.error(f"[WHATSAPP_AGENDADOR] Erro ao programar agendamento {agendamento.id}: {str(e)}")
+        return stats
+
+    # ==================== Despacho ====================
+
+    @staticmethod
+    def _recuperar_interrompidos(db: Session) -> None:
+        """Devolve à fila as linhas presas em enviando (ver RECUPERAR_SQL)"""
+        linhas = db.execute(RECUPERAR_SQL, {'timeout': settings.whatsapp_agendador_timeout_envio}).all()
+        db.commit()
+        if linhas:
+            por_status: Dict[str, int] = {}
+            for linha in linhas:
+                por_status[linha.status] = por_status.get(linha.status, 0) + 1
+            logger.warning(f"[WHATSAPP_AGENDADOR] {len(linhas)} envios interrompidos recuperados: {por_status}")
+
+    @staticmethod
+    def _carregar() -> None:
+        """Coloca na roda as pendentes até o fim do próximo horizonte"""
+        with WhatsAppAgendador._lock:
+            ate = min(time.time() + settings.whatsapp_agendador_horizonte, WhatsAppAgendador._roda.alcance)
+        db = SessionLocal()
+        try:
+            WhatsAppAgendador._recuperar_interrompidos(db)
+            linhas = db.query(WhatsAppAgendado.id, WhatsAppAgendado.enviar_em).filter(
+                WhatsAppAgendado.status == PENDENTE,
+                WhatsAppAgendado.enviar_em <= datetime.fromtimestamp(ate, BRAZIL_TZ)
+            ).all()
+        finally:
+            db.close()
+
+        with WhatsAppAgendador._lock:
+            roda = WhatsAppAgendador._roda
+            for linha in linhas:
+                roda.adicionar(linha.id, linha.enviar_em.timestamp())
+            WhatsAppAgendador._carregado_ate = ate
+        if linhas:
+            logger.info(f"[WHATSAPP_AGENDADOR] {len(linhas)} envios pendentes no horizonte")
+
+    @staticmethod
+    def _despachar(ids: List[int]) -> None:
+        """Reivindica e envia as programadas vencidas"""
+        from app.services.whatsapp_service import WhatsAppService, PedidoEnvio
+
+        db = SessionLocal()
+        linhas = []
+        try:
+            linhas = db.execute(REIVINDICAR_SQL, {'ids': ids}).all()
+            db.commit()
+            WhatsAppAgendador._contadores['descartados'] += len(ids) - len(linhas)
+            if not linhas:
+                return
+
+            respostas = WhatsAppService.send_pedidos(db, [
+                PedidoEnvio(
+                    estabelecimento_id=linha.estabelecimento_id,
+                    cliente_id=linha.cliente_id,
+                    tipo=linha.tipo,
+                    agendamento_id=linha.agendamento_id
+                )
+                for linha in linhas
+            ], apenas_habilitados=True)
+
+            lembretes = []
+            for linha, resposta in zip(linhas, respostas):
+                if resposta is None:
+                    status_envio, erro = IGNORADO, None
+                    WhatsAppAgendador._contadores['ignorados'] += 1
+                elif resposta.sucesso:
+                    status_envio, erro = ENVIADO, None
+                    WhatsAppAgendador._contadores['enviados'] += 1
+                    if linha.tipo == 'LEMBRETE' and linha.agendamento_id:
+                        lembretes.append(linha.agendamento_id)
+                else:
+                    status_envio, erro = FALHOU, (resposta.erro or '')[:500]
+                    WhatsAppAgendador._contadores['falhas'] += 1
+                db.query(WhatsAppAgendado).filter(WhatsAppAgendado.id == linha.id).update(
+                    {'status': status_envio, 'erro': erro, 'processado_em': get_brazil_now()},
+                    synchronize_session=False
+                )
+
+            if lembretes:
+                db.query(Agendamento).filter(Agendamento.id.in_(lembretes)).update(
+                    {'lembrete_enviado': True}, synchronize_session=False
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[WHATSAPP_AGENDADOR] Erro ao despachar {len(ids)} envios: {str(e)}")
+            if linhas:
+                WhatsAppAgendador._marcar_falha([linha.id for linha in linhas], str(e))
+        finally:
+            db.close()
+
+    @staticmethod
+    def _marcar_falha(ids: List[int], erro: str) -> None:
+        """Reivindicadas que não chegaram ao status final (sessão própria)"""
+        db = SessionLocal()
+        try:
+            db.query(WhatsAppAgendado).filter(
+                WhatsAppAgendado.id.in_(ids),
+                WhatsAppAgendado.status == ENVIANDO
+            ).update(
+                {'status': FALHOU, 'erro': erro[:500], 'processado_em': get_brazil_now()},
+                synchronize_session=False
+            )
+            db.commit()
+            WhatsAppAgendador._contadores['falhas'] += len(ids)
+        except Exception as e:
+            db.rollback()
+            # Ficam em enviando: a próxima carga recupera (RECUPERAR_SQL)
+            logger.error(f"[WHATSAPP_AGENDADOR] Erro ao marcar {len(ids)} envios como falhou: {str(e)}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _executar() -> None:
+        proxima_carga = 0.0
+        while not WhatsAppAgendador._parar.is_set():
+            agora = time.time()
+            if agora >= proxima_carga:
+                try:
+                    WhatsAppAgendador._carregar()
+                except Exception as e:
+                    logger.error(f"[WHATSAPP_AGENDADOR] Erro ao carregar pendentes: {str(e)}")
+                proxima_carga = agora + settings.whatsapp_agendador_horizonte / 2
+
+            with WhatsAppAgendador._lock:
+                vencidos = WhatsAppAgendador._roda.avancar(time.time())
+            if vencidos:
+                WhatsAppAgendador._contadores['despachados'] += len(vencidos)
+                WhatsAppAgendador._executor.submit(WhatsAppAgendador._despachar, vencidos)
+
+            WhatsAppAgendador._parar.wait(1.0)
+
+    @staticmethod
+    def iniciar() -> None:
+        """Inicia o agendador (startup da aplicação)"""
+        if WhatsAppAgendador._thread and WhatsAppAgendador._thread.is_alive():
+            return
+        WhatsAppAgendador._parar.clear()
+        with WhatsAppAgendador._lock:
+            WhatsAppAgendador._roda = RodaTemporal(time.time())
+            WhatsAppAgendador._carregado_ate = 0.0
+        WhatsAppAgendador._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="whatsapp-agendados")
+        WhatsAppAgendador._thread = threading.Thread(
+            target=WhatsAppAgendador._executar, name="whatsapp-agendador", daemon=True
+        )
+        WhatsAppAgendador._thread.start()
+
+    @staticmethod
+    def parar(timeout: float = 30) -> None:
+        """Para o agendador; o que não venceu continua pendente no banco"""
+        thread = WhatsAppAgendador._thread
+        if not thread:
+            return
+        WhatsAppAgendador._parar.set()
+        thread.join(timeout)
+        WhatsAppAgendador._executor.shutdown(wait=True)
+        WhatsAppAgendador._thread = None
+        with WhatsAppAgendador._lock:
+            WhatsAppAgendador._roda = None
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        with WhatsAppAgendador._lock:
+            roda = WhatsAppAgendador._roda
+            return {
+                "ativo": roda is not None,
+                "na_roda": len(roda) if roda else 0,
+                "carregado_ate": (
+                    datetime.fromtimestamp(WhatsAppAgendador._carregado_ate, BRAZIL_TZ).isoformat()
+                    if WhatsAppAgendador._carregado_ate else None
+                ),
+                **WhatsAppAgendador._contadores,
+            }
@@ -0,0 +1,137 @@
+"""
+Cache em memória das configurações de WhatsApp.
+
+A WhatsAppConfig é lida a cada notificação, evento de webhook e chamada
+/waha/*, mas quase nunca muda. O cache guarda uma cópia somente leitura por
+estabelecimento_id e por waha_session_name, com TTL curto (outros processos
+enxergam alterações após o TTL) e invalidação explícita ao criar, alterar ou
+remover a configuração neste processo.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import WhatsAppConfig, WhatsAppSessao
+
+
+class WhatsAppConfigSnapshot:
+    """Cópia somente leitura de uma WhatsAppConfig (independe da sessão do banco)"""
+
+    __slots__ = ('_valores',)
+
+    def __init__(self, config: WhatsAppConfig):
+        valores = {coluna.key: getattr(config, coluna.key) for coluna in WhatsAppConfig.__table__.columns}
+        object.__setattr__(self, '_valores', valores)
+
+    def __getattr__(self, nome: str) -> Any:
+        try:
+            return self._valores[nome]
+        except KeyError:
+            raise AttributeError(nome)
+
+    def __setattr__(self, nome: str, valor: Any) -> None:
+        raise AttributeError("WhatsAppConfigSnapshot é somente leitura")
+
+
+# (expira_em, snapshot ou None para "não existe")
+_Entrada = Tuple[float, Optional[WhatsAppConfigSnapshot]]
+
+
+class WhatsAppConfigCache:
+    _lock = threading.Lock()
+    _por_estabelecimento: Dict[int, _Entrada] = {}
+    _por_sessao: Dict[str, _Entrada] = {}
+    _contadores = {'hits': 0, 'misses': 0, 'invalidacoes': 0}
+
+    @staticmethod
+    def _ler(indice: Dict[Any, _Entrada], chave: Any) -> Tuple[bool, Optional[WhatsAppConfigSnapshot]]:
+        """Busca no índice; retorna (encontrado, snapshot)"""
+        with WhatsAppConfigCache._lock:
+            entrada = indice.get(chave)
+            if entrada and entrada[0] > time.monotonic():
+                WhatsAppConfigCache._contadores['hits'] += 1
+                return True, entrada[1]
+            WhatsAppConfigCache._contadores['misses'] += 1
+            return False, None
+
+    @staticmethod
+    def _guardar(config: Optional[WhatsAppConfig], estabelecimento_id: Optional[int] = None,
+                 session_name: Optional[str] = None) -> Optional[WhatsAppConfigSnapshot]:
+        """Guarda a config nos dois índices (ou a ausência, na chave consultada)"""
+        snapshot = WhatsAppConfigSnapshot(config) if config else None
+        expira_em = time.monotonic() + settings.whatsapp_config_cache_ttl
+        with WhatsAppConfigCache._lock:
+            if snapshot:
+                WhatsAppConfigCache._por_estabelecimento[snapshot.estabelecimento_id] = (expira_em, snapshot)
+                WhatsAppConfigCache._por_sessao[snapshot.waha_session_name] = (expira_em, snapshot)
+                if session_name is not None:
+                    # Sessão adicional (whatsapp_sessoes) do estabelecimento
+                    WhatsAppConfigCache._por_sessao[session_name] = (expira_em, snapshot)
+            elif estabelecimento_id is not None:
+                WhatsAppConfigCache._por_estabelecimento[estabelecimento_id] = (expira_em, None)
+            elif session_name is not None:
+                WhatsAppConfigCache._por_sessao[session_name] = (expira_em, None)
+        return snapshot
+
+    @staticmethod
+    def get_por_estabelecimento(db: Session, estabelecimento_id: int) -> Optional[WhatsAppConfigSnapshot]:
+        """Configuração do estabelecimento (somente leitura)"""
+        encontrado, snapshot = WhatsAppConfigCache._ler(WhatsAppConfigCache._por_estabelecimento, estabelecimento_id)
+        if encontrado:
+            return snapshot
+
+        config = db.query(WhatsAppConfig).filter(
+            WhatsAppConfig.estabelecimento_id == estabelecimento_id
+        ).first()
+        return WhatsAppConfigCache._guardar(config, estabelecimento_id=estabelecimento_id)
+
+    @staticmethod
+    def get_por_sessao(db: Session, session_name: str) -> Optional[WhatsAppConfigSnapshot]:
+        """Configuração da sessão WAHA, principal ou adicional (somente leitura)"""
+        encontrado, snapshot = WhatsAppConfigCache._ler(WhatsAppConfigCache._por_sessao, session_name)
+        if encontrado:
+            return snapshot
+
+        config = db.query(WhatsAppConfig).filter(
+            WhatsAppConfig.waha_session_name == session_name
+        ).first()
+        if config is None:
+            config = db.query(WhatsAppConfig).join(
+                WhatsAppSessao, WhatsAppSessao.estabelecimento_id == WhatsAppConfig.estabelecimento_id
+            ).filter(WhatsAppSessao.waha_session_name == session_name).first()
+        return WhatsAppConfigCache._guardar(config, session_name=session_name)
+
+    @staticmethod
+    def invalidar(estabelecimento_id: int, *session_names: Optional[str]) -> None:
+        """Remove o estabelecimento e as sessões informadas (nome antigo e novo)"""
+        with WhatsAppConfigCache._lock:
+            entrada = WhatsAppConfigCache._por_estabelecimento.pop(estabelecimento_id, None)
+            if entrada and entrada[1]:
+                WhatsAppConfigCache._por_sessao.pop(entrada[1].waha_session_name, None)
+            for session_name in session_names:
+                if session_name:
+                    WhatsAppConfigCache._por_sessao.pop(session_name, None)
+            WhatsAppConfigCache._contadores['invalidacoes'] += 1
+
+    @staticmethod
+    def limpar() -> None:
+        """Esvazia o cache"""
+        with WhatsAppConfigCache._lock:
+            WhatsAppConfigCache._por_estabelecimento.clear()
+            WhatsAppConfigCache._por_sessao.clear()
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Contadores de acerto/falha e tamanho do cache"""
+        with WhatsAppConfigCache._lock:
+            total = WhatsAppConfigCache._contadores['hits'] + WhatsAppConfigCache._contadores['misses']
+            return {
+                **WhatsAppConfigCache._contadores,
+                'hit_rate': round(WhatsAppConfigCache._contadores['hits'] / total, 4) if total else 0.0,
+                'estabelecimentos': len(WhatsAppConfigCache._por_estabelecimento),
+                'sessoes': len(WhatsAppConfigCache._por_sessao),
+                'ttl_segundos': settings.whatsapp_config_cache_ttl,
+            }
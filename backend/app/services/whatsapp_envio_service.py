@@ -0,0 +1,187 @@
+"""
+Registro dos envios de WhatsApp e funil de entrega.
+
+Cada mensagem enviada pelo sistema vira uma linha em whatsapp_envios com o
+message_id do WAHA, o tipo e o agendamento/cliente. Os acks do webhook
+avançam a linha (busca pelo índice de message_id) e o relatório agrega o
+funil enviado -> servidor -> entregue -> lido por tipo em uma consulta.
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+from sqlalchemy import insert, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.models.whatsapp_envio import WhatsAppEnvio
+from app.models.whatsapp_message import WhatsAppMessage
+from app.schemas.whatsapp import WhatsAppMessageResponse
+from app.services.webhook_ingestao_service import ORDEM_ACK
+from app.utils.timezone import BRAZIL_TZ
+
+logger = logging.getLogger(__name__)
+
+_ORDEM_SQL = "ARRAY[" + ", ".join(f"'{a}'" for a in ORDEM_ACK) + "]::text[]"
+
+
+def _posicao(expr: str) -> str:
+    return f"coalesce(array_position({_ORDEM_SQL}, {expr}), 0)"
+
+
+def _marcar_etapa(coluna: str, etapa: str) -> str:
+    """Preenche a etapa (uma vez) quando o ack chega nela ou além"""
+    return (
+        f"{coluna} = CASE WHEN e.{coluna} IS NULL AND {_posicao('a.ack_status')} >= {_posicao(repr(etapa))} "
+        f"THEN now() ELSE e.{coluna} END"
+    )
+
+
+# Acks (estabelecimento_id, message_id, ack_status) -> envios; o ack só avança
+APLICAR_ACKS_SQL = f"""
+    UPDATE whatsapp_envios e SET
+        ack_status = CASE WHEN {_posicao('a.ack_status')} > {_posicao('e.ack_status')}
+                          THEN a.ack_status ELSE e.ack_status END,
+        {_marcar_etapa('servidor_em', 'server')},
+        {_marcar_etapa('entregue_em', 'delivery')},
+        {_marcar_etapa('lido_em', 'read')},
+        falha_em = CASE WHEN e.falha_em IS NULL AND a.ack_status = 'error' THEN now() ELSE e.falha_em END
+    FROM (VALUES %s) AS a (estabelecimento_id, message_id, ack_status)
+    WHERE e.message_id = a.message_id AND e.estabelecimento_id = a.estabelecimento_id
+"""
+
+# Funil por tipo + total (GROUPING SETS): uma varredura do período no índice
+FUNIL_SQL = """
+    SELECT tipo,
+           GROUPING(tipo) = 1 AS total,
+           count(*) AS tentativas,
+           count(message_id) AS enviadas,
+           count(servidor_em) AS servidor,
+           count(entregue_em) AS entregues,
+           count(lido_em) AS lidas,
+           count(falha_em) AS falhas_entrega,
+           count(*) - count(message_id) AS falhas_envio,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM lido_em - enviado_em)) AS leitura_p50,
+           percentile_cont(0.9) WITHIN GROUP (ORDER BY extract(epoch FROM lido_em - enviado_em)) AS leitura_p90,
+           percentile_cont(0.95) WITHIN GROUP (ORDER BY extract(epoch FROM lido_em - enviado_em)) AS leitura_p95,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM entregue_em - enviado_em)) AS entrega_p50
+    FROM whatsapp_envios
+    WHERE estabelecimento_id = :estabelecimento_id
+      AND enviado_em >= :inicio AND enviado_em < :fim
+    GROUP BY GROUPING SETS ((tipo), ())
+    ORDER BY GROUPING(tipo), tipo
+"""
+
+
+def _taxa(parte: int, total: int) -> float:
+    return round(parte / total, 4) if total else 0.0
+
+
+def _segundos(valor: Optional[float]) -> Optional[float]:
+    return round(valor, 1) if valor is not None else None
+
+
+class WhatsAppEnvioService:
+    @staticmethod
+    def aplicar_acks(db: Session, acks: Sequence[Tuple[int, str, str]]) -> None:
+        """Avança os envios com os acks recebidos (não faz commit)"""
+        if not acks:
+            return
+        cursor = db.connection().connection.cursor()
+        execute_values(
+            cursor, APLICAR_ACKS_SQL, list(acks),
+            template="(%s::integer, %s::text, %s::text)", page_size=500
+        )
+
+    @staticmethod
+    def registrar(db: Session, mensagens: Sequence[Any], respostas: Sequence[WhatsAppMessageResponse]) -> None:
+        """
+        Registra os envios (MensagemPreparada + resposta, na mesma ordem).
+        Acks que chegaram antes do registro são aplicados a partir de
+        whatsapp_messages. Erros são só logados (não afetam o envio).
+        """
+        linhas = [
+            {
+                "estabelecimento_id": mensagem.estabelecimento_id,
+                "cliente_id": mensagem.cliente_id,
+                "agendamento_id": mensagem.agendamento_id,
+                "tipo": mensagem.tipo or "AVULSA",
+                "message_id": resposta.mensagem_id if resposta.sucesso else None,
+                "erro": None if resposta.sucesso else (resposta.erro or "")[:500],
+            }
+            for mensagem, resposta in zip(mensagens, respostas)
+        ]
+        if not linhas:
+            return
+
+        try:
+            db.execute(insert(WhatsAppEnvio), linhas)
+
+            chaves = [(l["estabelecimento_id"], l["message_id"]) for l in linhas if l["message_id"]]
+            if chaves:
+                acks = db.query(
+                    WhatsAppMessage.estabelecimento_id,
+                    WhatsAppMessage.message_id,
+                    WhatsAppMessage.ack_status
+                ).filter(
+                    tuple_(WhatsAppMessage.estabelecimento_id, WhatsAppMessage.message_id).in_(chaves),
+                    WhatsAppMessage.ack_status.isnot(None)
+                ).all()
+                WhatsAppEnvioService.aplicar_acks(db, [tuple(ack) for ack in acks])
+
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[WHATSAPP_ENVIOS] Erro ao registrar {len(linhas)} envio(s): {str(e)}")
+
+    @staticmethod
+    def funil(
+        db: Session,
+        estabelecimento_id: int,
+        data_inicio: date,
+        data_fim: date
+    ) -> Dict[str, Any]:
+        """Funil de entrega por tipo de mensagem no período (datas no horário do Brasil)"""
+        inicio = datetime.combine(data_inicio, time.min, tzinfo=BRAZIL_TZ)
+        fim = datetime.combine(data_fim + timedelta(days=1), time.min, tzinfo=BRAZIL_TZ)
+
+        rows = db.execute(text(FUNIL_SQL), {
+            "estabelecimento_id": estabelecimento_id,
+            "inicio": inicio,
+            "fim": fim,
+        }).all()
+
+        def montar(row) -> Dict[str, Any]:
+            return {
+                "tentativas": row.tentativas,
+                "enviadas": row.enviadas,
+                "servidor": row.servidor,
+                "entregues": row.entregues,
+                "lidas": row.lidas,
+                "falhas_envio": row.falhas_envio,
+                "falhas_entrega": row.falhas_entrega,
+                "taxa_entrega": _taxa(row.entregues, row.enviadas),
+                "taxa_leitura": _taxa(row.lidas, row.enviadas),
+                "tempo_leitura_segundos": {
+                    "p50": _segundos(row.leitura_p50),
+                    "p90": _segundos(row.leitura_p90),
+                    "p95": _segundos(row.leitura_p95),
+                },
+                "tempo_entrega_p50_segundos": _segundos(row.entrega_p50),
+            }
+
+        # O conjunto vazio () sempre retorna a linha de total, mesmo sem envios
+        total: Dict[str, Any] = {}
+        tipos: List[Dict[str, Any]] = []
+        for row in rows:
+            if row.total:
+                total = montar(row)
+            else:
+                tipos.append({"tipo": row.tipo, **montar(row)})
+
+        return {
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "total": total,
+            "tipos": tipos,
+        }
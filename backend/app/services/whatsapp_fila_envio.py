@@ -0,0 +1,262 @@
+"""
+Fila de envio de WhatsApp: limite de taxa por sessão e prioridade por tipo.
+
+Todas as mensagens passam por três faixas com prioridade estrita:
+transacionais (agendamento, cancelamento, conclusão, envios manuais) antes
+dos lembretes, que vão antes das campanhas (reciclagem, aniversário).
+Dentro da faixa, os estabelecimentos são atendidos por weighted fair
+queuing (tag de término virtual por estabelecimento), então a campanha
+grande de um estabelecimento não atrasa a dos outros.
+
+Cada sessão WAHA tem um token bucket (WHATSAPP_ENVIO_TAXA mensagens/s,
+rajada WHATSAPP_ENVIO_RAJADA) para não disparar em rajada no mesmo número.
+Uma thread despacha as mensagens liberadas para um pool de
+WHATSAPP_ENVIO_WORKERS envios simultâneos.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.config import settings
+from app.services.waha_estado import instancia_waha
+
+logger = logging.getLogger(__name__)
+
+TRANSACIONAL = "transacional"
+LEMBRETE = "lembrete"
+CAMPANHA = "campanha"
+FAIXAS = [TRANSACIONAL, LEMBRETE, CAMPANHA]  # ordem de prioridade
+
+# Tipo da mensagem -> faixa (tipos não listados, como envios manuais, são transacionais)
+FAIXA_POR_TIPO = {
+    'AGENDAMENTO': TRANSACIONAL,
+    'CONFIRMACAO': TRANSACIONAL,
+    'CONCLUSAO': TRANSACIONAL,
+    'CANCELAMENTO': TRANSACIONAL,
+    'LEMBRETE': LEMBRETE,
+    'POS_ATENDIMENTO': LEMBRETE,
+    'RECICLAGEM': CAMPANHA,
+    'ANIVERSARIO': CAMPANHA,
+}
+
+AMOSTRAS_ESPERA = 1000  # esperas guardadas por faixa para os percentis
+
+
+def faixa_do_tipo(tipo: Optional[str]) -> str:
+    return FAIXA_POR_TIPO.get((tipo or '').upper(), TRANSACIONAL)
+
+
+class _Balde:
+    """Token bucket de uma sessão WAHA"""
+    __slots__ = ("tokens", "atualizado")
+
+    def __init__(self, agora: float):
+        self.tokens = float(settings.whatsapp_envio_rajada)
+        self.atualizado = agora
+
+    def _repor(self, agora: float) -> None:
+        self.tokens = min(
+            float(settings.whatsapp_envio_rajada),
+            self.tokens + (agora - self.atualizado) * settings.whatsapp_envio_taxa
+        )
+        self.atualizado = agora
+
+    def espera(self, agora: float) -> float:
+        """Segundos até haver um token (0 se já há)"""
+        self._repor(agora)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / settings.whatsapp_envio_taxa
+
+
+class _Item:
+    __slots__ = ("mensagem", "future", "sessao", "inicio", "fim", "enfileirado_em")
+
+    def __init__(self, mensagem: Any, future: Future, sessao: Tuple[str, str], inicio: float, fim: float):
+        self.mensagem = mensagem
+        self.future = future
+        self.sessao = sessao
+        self.inicio = inicio  # tag de início virtual (WFQ)
+        self.fim = fim  # tag de término virtual (WFQ)
+        self.enfileirado_em = time.monotonic()
+
+
+class _Faixa:
+    """Filas por estabelecimento de uma faixa, com relógio virtual do WFQ"""
+
+    def __init__(self):
+        self.filas: Dict[int, Deque[_Item]] = {}
+        self.tempo_virtual = 0.0
+        self.ultimo_fim: Dict[int, float] = {}
+        self.enfileiradas = 0
+        self.enviadas = 0
+        self.esperas: Deque[float] = deque(maxlen=AMOSTRAS_ESPERA)
+
+    def profundidade(self) -> int:
+        return sum(len(fila) for fila in self.filas.values())
+
+
+class FilaEnvioWhatsApp:
+    _cond = threading.Condition()
+    _faixas: Dict[str, _Faixa] = {faixa: _Faixa() for faixa in FAIXAS}
+    _baldes: Dict[Tuple[str, str], _Balde] = {}
+    _thread: Optional[threading.Thread] = None
+    _executor: Optional[ThreadPoolExecutor] = None
+    _livres: Optional[threading.Semaphore] = None
+    _parar = threading.Event()
+
+    @staticmethod
+    def ativa() -> bool:
+        return bool(FilaEnvioWhatsApp._thread and FilaEnvioWhatsApp._thread.is_alive())
+
+    @staticmethod
+    def enfileirar(mensagem: Any, peso: float = 1.0) -> Future:
+        """
+        Coloca uma MensagemPreparada na faixa do tipo dela.
+        O Future recebe a WhatsAppMessageResponse quando o envio terminar.
+        """
+        future: Future = Future()
+        faixa_nome = faixa_do_tipo(mensagem.tipo)
+        sessao = (instancia_waha(mensagem.waha_url), mensagem.session_name)
+
+        with FilaEnvioWhatsApp._cond:
+            faixa = FilaEnvioWhatsApp._faixas[faixa_nome]
+            estabelecimento_id = mensagem.estabelecimento_id
+            inicio = max(faixa.tempo_virtual, faixa.ultimo_fim.get(estabelecimento_id, 0.0))
+            fim = inicio + 1.0 / max(peso, 0.01)
+            faixa.ultimo_fim[estabelecimento_id] = fim
+            faixa.filas.setdefault(estabelecimento_id, deque()).append(_Item(mensagem, future, sessao, inicio, fim))
+            faixa.enfileiradas += 1
+            FilaEnvioWhatsApp._cond.notify()
+
+        return future
+
+    @staticmethod
+    def _proximo(agora: float) -> Tuple[Optional[_Item], Optional[float]]:
+        """
+        Escolhe a próxima mensagem (chamar com o lock): faixa mais prioritária,
+        menor tag de término entre os estabelecimentos cuja sessão tem token.
+        Sem mensagem liberada, retorna a espera até o próximo token.
+        """
+        menor_espera: Optional[float] = None
+        for faixa_nome in FAIXAS:
+            faixa = FilaEnvioWhatsApp._faixas[faixa_nome]
+            escolhido: Optional[Tuple[int, _Item]] = None
+            for estabelecimento_id, fila in faixa.filas.items():
+                item = fila[0]
+                balde = FilaEnvioWhatsApp._baldes.get(item.sessao)
+                if balde is None:
+                    balde = FilaEnvioWhatsApp._baldes[item.sessao] = _Balde(agora)
+                espera = balde.espera(agora)
+                if espera > 0:
+                    menor_espera = espera if menor_espera is None else min(menor_espera, espera)
+                    continue
+                if escolhido is None or item.fim < escolhido[1].fim:
+                    escolhido = (estabelecimento_id, item)
+
+            if escolhido:
+                estabelecimento_id, item = escolhido
+                fila = faixa.filas[estabelecimento_id]
+                fila.popleft()
+                if not fila:
+                    del faixa.filas[estabelecimento_id]
+                faixa.tempo_virtual = max(faixa.tempo_virtual, item.inicio)
+                if not faixa.filas:
+                    # Faixa vazia: reinicia o relógio virtual
+                    faixa.tempo_virtual = 0.0
+                    faixa.ultimo_fim.clear()
+                FilaEnvioWhatsApp._baldes[item.sessao].tokens -= 1
+                faixa.enviadas += 1
+                faixa.esperas.append(agora - item.enfileirado_em)
+                return item, None
+
+        return None, menor_espera
+
+    @staticmethod
+    def _enviar(item: _Item) -> None:
+        from app.services.whatsapp_service import WhatsAppService
+        try:
+            item.future.set_result(WhatsAppService.enviar_uma(item.mensagem))
+        except Exception as e:
+            item.future.set_exception(e)
+        finally:
+            FilaEnvioWhatsApp._livres.release()
+
+    @staticmethod
+    def _executar() -> None:
+        """Despachante: espera um worker livre e a próxima mensagem liberada"""
+        while True:
+            FilaEnvioWhatsApp._livres.acquire()
+            with FilaEnvioWhatsApp._cond:
+                while True:
+                    item, espera = FilaEnvioWhatsApp._proximo(time.monotonic())
+                    if item:
+                        break
+                    if FilaEnvioWhatsApp._parar.is_set() and espera is None:
+                        FilaEnvioWhatsApp._livres.release()
+                        return
+                    FilaEnvioWhatsApp._cond.wait(timeout=espera if espera is not None else 1.0)
+            FilaEnvioWhatsApp._executor.submit(FilaEnvioWhatsApp._enviar, item)
+
+    @staticmethod
+    def iniciar() -> None:
+        """Inicia o despachante (startup da aplicação)"""
+        if FilaEnvioWhatsApp.ativa():
+            return
+        workers = max(1, settings.whatsapp_envio_workers)
+        FilaEnvioWhatsApp._parar.clear()
+        FilaEnvioWhatsApp._livres = threading.Semaphore(workers)
+        FilaEnvioWhatsApp._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whatsapp-envio")
+        FilaEnvioWhatsApp._thread = threading.Thread(
+            target=FilaEnvioWhatsApp._executar, name="whatsapp-fila-envio", daemon=True
+        )
+        FilaEnvioWhatsApp._thread.start()
+
+    @staticmethod
+    def parar(timeout: float = 60) -> None:
+        """Envia o que está na fila (até `timeout`) e para; o que sobrar falha"""
+        thread = FilaEnvioWhatsApp._thread
+        if not thread:
+            return
+        with FilaEnvioWhatsApp._cond:
+            FilaEnvioWhatsApp._parar.set()
+            FilaEnvioWhatsApp._cond.notify_all()
+        thread.join(timeout)
+
+        with FilaEnvioWhatsApp._cond:
+            restantes = [item for faixa in FilaEnvioWhatsApp._faixas.values()
+                         for fila in faixa.filas.values() for item in fila]
+            for faixa in FilaEnvioWhatsApp._faixas.values():
+                faixa.filas.clear()
+        for item in restantes:
+            item.future.set_exception(RuntimeError("Fila de envio encerrada antes do envio"))
+        if restantes:
+            logger.error(f"[WHATSAPP_FILA] {len(restantes)} mensagens não enviadas na parada")
+
+        FilaEnvioWhatsApp._executor.shutdown(wait=True)
+        FilaEnvioWhatsApp._thread = None
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Profundidade, totais e espera (segundos) por faixa"""
+        with FilaEnvioWhatsApp._cond:
+            faixas = {}
+            for nome, faixa in FilaEnvioWhatsApp._faixas.items():
+                esperas = sorted(faixa.esperas)
+                faixas[nome] = {
+                    "profundidade": faixa.profundidade(),
+                    "estabelecimentos": len(faixa.filas),
+                    "enfileiradas": faixa.enfileiradas,
+                    "enviadas": faixa.enviadas,
+                    "espera_media": round(sum(esperas) / len(esperas), 3) if esperas else 0.0,
+                    "espera_p95": round(esperas[int(0.95 * (len(esperas) - 1))], 3) if esperas else 0.0,
+                    "espera_max": round(esperas[-1], 3) if esperas else 0.0,
+                }
+            return {
+                "ativa": FilaEnvioWhatsApp.ativa(),
+                "sessoes": len(FilaEnvioWhatsApp._baldes),
+                "taxa_por_sessao": settings.whatsapp_envio_taxa,
+                "rajada_por_sessao": settings.whatsapp_envio_rajada,
+                "faixas": faixas,
+            }
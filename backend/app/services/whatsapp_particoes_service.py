@@ -0,0 +1,150 @@
+"""
+Manutenção das partições mensais de whatsapp_messages.
+
+Cria as partições dos próximos meses e aplica a retenção removendo
+partições inteiras (DETACH + DROP) em vez de DELETEs linha a linha.
+"""
+import logging
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TABELA = "whatsapp_messages"
+PARTICAO_DEFAULT = "whatsapp_messages_default"
+_NOME_PARTICAO = re.compile(r"^whatsapp_messages_(\d{4})_(\d{2})$")
+
+
+def _somar_meses(dia: date, meses: int) -> date:
+    total = dia.year * 12 + dia.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _limite(mes: date) -> str:
+    """Limite da partição em UTC (independe do timezone da conexão)"""
+    return f"{mes.isoformat()} 00:00:00+00"
+
+
+def _nome_particao(mes: date) -> str:
+    return f"{TABELA}_{mes.year:04d}_{mes.month:02d}"
+
+
+class WhatsAppParticoesService:
+    @staticmethod
+    def listar_particoes(db: Session) -> List[Tuple[str, date]]:
+        """Partições mensais existentes (nome, primeiro dia do mês), em ordem"""
+        nomes = db.execute(text("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :tabela
+        """), {"tabela": TABELA}).scalars().all()
+
+        particoes = []
+        for nome in nomes:
+            match = _NOME_PARTICAO.match(nome)
+            if match:
+                particoes.append((nome, date(int(match.group(1)), int(match.group(2)), 1)))
+        return sorted(particoes, key=lambda p: p[1])
+
+    @staticmethod
+    def garantir_particoes(
+        db: Session,
+        meses_a_frente: int = 3,
+        desde: Optional[date] = None,
+        hoje: Optional[date] = None
+    ) -> List[str]:
+        """
+        Cria as partições que faltam de `desde` (padrão: mês atual) até
+        `meses_a_frente`. Linhas que tinham caído na partição default no
+        intervalo são movidas para a nova partição. Retorna as partições criadas.
+        """
+        hoje = (hoje or date.today()).replace(day=1)
+        mes = (desde or hoje).replace(day=1)
+        existentes = {inicio for _, inicio in WhatsAppParticoesService.listar_particoes(db)}
+
+        criadas = []
+        while mes <= _somar_meses(hoje, meses_a_frente):
+            proximo = _somar_meses(mes, 1)
+            if mes not in existentes:
+                nome = _nome_particao(mes)
+                params = {"inicio": _limite(mes), "fim": _limite(proximo)}
+
+                # Cria fora da tabela, move as linhas da default e anexa
+                db.execute(text(f"CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+                db.execute(text(f"""
+                    WITH movidas AS (
+                        DELETE FROM {PARTICAO_DEFAULT}
+                        WHERE message_timestamp >= CAST(:inicio AS timestamptz)
+                          AND message_timestamp < CAST(:fim AS timestamptz)
+                        RETURNING *
+                    )
+                    INSERT INTO {nome} SELECT * FROM movidas
+                """), params)
+                db.execute(text(f"""
+                    ALTER TABLE {TABELA} ATTACH PARTITION {nome}
+                    FOR VALUES FROM ('{_limite(mes)}') TO ('{_limite(proximo)}')
+                """))
+                criadas.append(nome)
+            mes = proximo
+
+        db.commit()
+        if criadas:
+            logger.info(f"[WHATSAPP_PARTICOES] Partições criadas: {criadas}")
+        return criadas
+
+    @staticmethod
+    def aplicar_retencao(db: Session, hoje: Optional[date] = None) -> Dict[str, Any]:
+        """
+        Remove mensagens mais antigas que a retenção.
+
+        Partições mais antigas que a maior retenção em uso são removidas
+        inteiras. Estabelecimentos com retenção menor têm suas linhas removidas
+        apenas das partições já vencidas para eles (DELETE restrito à partição).
+        """
+        hoje = (hoje or date.today()).replace(day=1)
+        padrao = settings.whatsapp_retencao_meses
+
+        retencoes = db.execute(text("""
+            SELECT estabelecimento_id, coalesce(retencao_mensagens_meses, :padrao) AS meses
+            FROM whatsapp_configs
+        """), {"padrao": padrao}).all()
+        maior = max([padrao] + [r.meses for r in retencoes])
+
+        # Mantém o mês atual e os `meses` anteriores completos
+        limite_global = _somar_meses(hoje, -maior)
+        removidas = []
+        linhas_removidas = 0
+
+        for nome, inicio in WhatsAppParticoesService.listar_particoes(db):
+            fim = _somar_meses(inicio, 1)
+            if fim <= limite_global:
+                db.execute(text(f"ALTER TABLE {TABELA} DETACH PARTITION {nome}"))
+                db.execute(text(f"DROP TABLE {nome}"))
+                removidas.append(nome)
+                continue
+
+            # Retenções menores: estabelecimentos para os quais a partição inteira venceu
+            vencidos = [r.estabelecimento_id for r in retencoes if fim <= _somar_meses(hoje, -r.meses)]
+            if vencidos:
+                result = db.execute(
+                    text(f"DELETE FROM {nome} WHERE estabelecimento_id = ANY(:ids)"),
+                    {"ids": vencidos}
+                )
+                linhas_removidas += result.rowcount
+
+        db.commit()
+        stats = {
+            "retencao_maxima_meses": maior,
+            "particoes_removidas": removidas,
+            "linhas_removidas": linhas_removidas,
+        }
+        logger.info(f"[WHATSAPP_PARTICOES] Retenção aplicada: {stats}")
+        return stats
@@ -3,13 +3,15 @@ Serviço de WhatsApp usando WAHA (WhatsApp HTTP API)
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, func
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple, Union
 from datetime import datetime, timedelta
+from concurrent.futures import Future
+import calendar
 from fastapi import HTTPException, status
 import logging
-import re
 
 from app.models import WhatsAppConfig, Cliente, Agendamento, User, Estabelecimento
+from app.models.agendamento import StatusAgendamento
 from app.schemas.whatsapp import (
     WhatsAppConfigCreate,
     WhatsAppConfigUpdate,
@@ -18,10 +20,54 @@ from app.schemas.whatsapp import (
     WhatsAppTestRequest
 )
 from app.services.waha_service import WAHAService
+from app.services.waha_estado import instancia_waha
+from app.services.whatsapp_fila_envio import FilaEnvioWhatsApp
+from app.services.whatsapp_config_cache import WhatsAppConfigCache, WhatsAppConfigSnapshot
+from app.services.whatsapp_envio_service import WhatsAppEnvioService
+from app.services.whatsapp_sessoes_service import SessaoWAHA, WhatsAppSessoesService
+from app.utils.phone import normalize_phone
+from app.utils.timezone import get_brazil_now, to_brazil_tz
+from app.utils import template as message_template
 
 logger = logging.getLogger(__name__)
 
 
+class MensagemPreparada(NamedTuple):
+    """Mensagem já renderizada, pronta para envio (sem acesso ao banco)"""
+    estabelecimento_id: int
+    cliente_id: int
+    waha_url: str
+    waha_api_key: str
+    session_name: str
+    telefone: str  # Já formatado (5511999999999)
+    texto: str
+    tipo: Optional[str] = None  # Registrado em whatsapp_envios
+    agendamento_id: Optional[int] = None
+    alternativas: Tuple[SessaoWAHA, ...] = ()  # Outras sessões do estabelecimento, em ordem de preferência
+
+
+class PedidoEnvio(NamedTuple):
+    """Mensagem a enviar: cliente, tipo e (opcional) agendamento de referência"""
+    estabelecimento_id: int
+    cliente_id: int
+    tipo: str
+    agendamento_id: Optional[int] = None
+    mensagem_customizada: Optional[str] = None
+
+
+# Tipo de mensagem -> (campo do template, flag de envio automático) na WhatsAppConfig
+TIPOS_MENSAGEM = {
+    'AGENDAMENTO': ('template_agendamento', 'enviar_agendamento'),
+    'LEMBRETE': ('template_lembrete', 'enviar_lembrete'),
+    'CONFIRMACAO': ('template_conclusao', 'enviar_conclusao'),  # DEPRECATED - manter por compatibilidade
+    'CONCLUSAO': ('template_conclusao', 'enviar_conclusao'),
+    'CANCELAMENTO': ('template_cancelamento', 'enviar_cancelamento'),
+    'RECICLAGEM': ('template_reciclagem', 'enviar_reciclagem'),
+    'ANIVERSARIO': ('template_aniversario', 'enviar_aniversario'),
+    'POS_ATENDIMENTO': ('template_pos_atendimento', 'enviar_pos_atendimento'),
+}
+
+
 class WhatsAppService:
     """Service para gerenciar WhatsApp via WAHA"""
 
@@ -34,6 +80,11 @@ class WhatsAppService:
             WhatsAppConfig.estabelecimento_id == estabelecimento_id
         ).first()
 
+    @staticmethod
+    def get_config_cached(db: Session, estabelecimento_id: int) -> Optional[WhatsAppConfigSnapshot]:
+        """Configuração do estabelecimento via cache (somente leitura)"""
+        return WhatsAppConfigCache.get_por_estabelecimento(db, estabelecimento_id)
+
     @staticmethod
     def create_config(
         db: Session,
@@ -48,10 +99,14 @@ class WhatsAppService:
                 detail="Configuração do WhatsApp já existe"
             )
 
+        WhatsAppService._validar_templates(config_data.model_dump())
+
         config = WhatsAppConfig(**config_data.model_dump())
         db.add(config)
         db.commit()
         db.refresh(config)
+
+        WhatsAppConfigCache.invalidar(config.estabelecimento_id, config.waha_session_name)
         return config
 
     @staticmethod
@@ -69,12 +124,22 @@ class WhatsAppService:
             )
 
         update_data = config_data.model_dump(exclude_unset=True)
+        WhatsAppService._validar_templates(update_data)
+
+        # Templates substituídos saem do cache de templates compilados
+        for campo in message_template.CAMPOS_TEMPLATE:
+            if campo in update_data and update_data[campo] != getattr(config, campo):
+                message_template.invalidar(getattr(config, campo))
+
+        session_anterior = config.waha_session_name
         for field, value in update_data.items():
             setattr(config, field, value)
 
         config.updated_at = datetime.now()
         db.commit()
         db.refresh(config)
+
+        WhatsAppConfigCache.invalidar(estabelecimento_id, session_anterior, config.waha_session_name)
         return config
 
     @staticmethod
@@ -87,18 +152,36 @@ class WhatsAppService:
                 detail="Configuração não encontrada"
             )
 
+        session_name = config.waha_session_name
         db.delete(config)
         db.commit()
 
+        WhatsAppConfigCache.invalidar(estabelecimento_id, session_name)
+
     # ==================== Utilidades ====================
 
+    @staticmethod
+    def _validar_templates(dados: Dict[str, Any]) -> None:
+        """Rejeita templates com placeholders desconhecidos (erro de digitação no template)"""
+        erros = []
+        for campo in message_template.CAMPOS_TEMPLATE:
+            desconhecidos = message_template.placeholders_desconhecidos(dados.get(campo))
+            if desconhecidos:
+                erros.append(f"{campo}: " + ", ".join(f"{{{nome}}}" for nome in desconhecidos))
+
+        if erros:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Placeholders desconhecidos nos templates - " + "; ".join(erros)
+            )
+
     @staticmethod
     def _format_phone_number(phone: str) -> str:
         """
         Formata número para padrão internacional.
         Exemplo: (11) 99999-9999 -> 5511999999999
         """
-        clean_phone = ''.join(filter(str.isdigit, phone))
+        clean_phone = normalize_phone(phone)
 
         # Adiciona código do país se não tiver
         if not clean_phone.startswith('55'):
@@ -109,24 +192,11 @@ class WhatsAppService:
     @staticmethod
     def _replace_placeholders(template: str, data: Dict[str, Any]) -> str:
         """
-        Substitui placeholders no template.
+        Substitui placeholders no template (compilado uma vez e mantido em cache).
         Todos os placeholders são OPCIONAIS - se não existirem nos dados, são removidos.
+        Quebras de linha do template são preservadas.
         """
-        message = template
-        for key, value in data.items():
-            placeholder = f"{{{key}}}"
-            # Se valor é None ou vazio, substitui por string vazia
-            safe_value = str(value) if value is not None else ""
-            message = message.replace(placeholder, safe_value)
-
-        # Remove placeholders restantes que não foram fornecidos nos dados
-        # Regex para encontrar {qualquer_coisa} e substituir por vazio
-        message = re.sub(r'\{[^}]+\}', '', message)
-
-        # Limpa espaços duplicados que possam ter sobrado
-        message = re.sub(r'\s+', ' ', message).strip()
-
-        return message
+        return message_template.render(template, data)
 
     # ==================== Envio de Mensagens ====================
 
@@ -145,7 +215,7 @@ class WhatsAppService:
         print("=" * 80)
 
         # Busca config
-        config = WhatsAppService.get_config(db, estabelecimento_id)
+        config = WhatsAppService.get_config_cached(db, estabelecimento_id)
         if not config:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -194,305 +264,293 @@ class WhatsAppService:
         message_request: WhatsAppMessageRequest
     ) -> WhatsAppMessageResponse:
         """Envia mensagem WhatsApp usando template"""
-        # Busca config
-        config = WhatsAppService.get_config(db, estabelecimento_id)
-        if not config or not config.ativado:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="WhatsApp não configurado ou desativado"
-            )
+        preparada = WhatsAppService.preparar_mensagens(db, [PedidoEnvio(
+            estabelecimento_id=estabelecimento_id,
+            cliente_id=message_request.cliente_id,
+            tipo=message_request.tipo_mensagem.upper(),
+            agendamento_id=message_request.agendamento_id,
+            mensagem_customizada=message_request.mensagem_customizada
+        )])[0]
 
-        # Busca cliente
-        cliente = db.query(Cliente).filter(
-            Cliente.id == message_request.cliente_id,
-            Cliente.estabelecimento_id == estabelecimento_id
-        ).first()
+        if isinstance(preparada, HTTPException):
+            raise preparada
 
-        if not cliente:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Cliente não encontrado"
-            )
+        resposta = WhatsAppService.send_batch([preparada])[0]
+        WhatsAppEnvioService.registrar(db, [preparada], [resposta])
+        return resposta
 
-        if not cliente.telefone:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Cliente não possui telefone cadastrado"
-            )
+    # ==================== Envio em Lote ====================
 
-        # Prepara mensagem
-        if message_request.mensagem_customizada:
-            message_text = message_request.mensagem_customizada
-        else:
-            # Busca template
-            template = None
-            tipo = message_request.tipo_mensagem.upper()
-
-            if tipo == 'AGENDAMENTO':
-                template = config.template_agendamento
-            elif tipo == 'LEMBRETE':
-                template = config.template_lembrete
-            elif tipo == 'CONFIRMACAO':
-                template = config.template_conclusao  # DEPRECATED - manter por compatibilidade
-            elif tipo == 'CONCLUSAO':
-                template = config.template_conclusao
-            elif tipo == 'CANCELAMENTO':
-                template = config.template_cancelamento
-            elif tipo == 'RECICLAGEM':
-                template = config.template_reciclagem
-            elif tipo == 'ANIVERSARIO':
-                template = config.template_aniversario
-
-            if not template:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Template não configurado para tipo {tipo}"
-                )
-
-            # Busca nome da empresa e endereço do estabelecimento
-            from app.models.estabelecimento import Estabelecimento
-            from app.models.empresa import Empresa
-            estabelecimento = db.query(Estabelecimento).filter(
-                Estabelecimento.id == estabelecimento_id
-            ).first()
-            nome_empresa = ''
-            endereco_estabelecimento = ''
-            if estabelecimento:
-                if estabelecimento.empresa_id:
-                    empresa = db.query(Empresa).filter(Empresa.id == estabelecimento.empresa_id).first()
-                    nome_empresa = empresa.nome if empresa else estabelecimento.nome
-                else:
-                    nome_empresa = estabelecimento.nome
-                # Endereço do estabelecimento
-                endereco_estabelecimento = estabelecimento.endereco or ''
-
-            # Busca dados do agendamento se fornecido
-            # TODOS os placeholders são opcionais - valores None são tratados automaticamente
-            placeholders = {
-                'nome_cliente': cliente.nome or '',
-                'telefone_cliente': cliente.telefone or '',
-                'email_cliente': cliente.email or '',
-                'nome_empresa': nome_empresa,
-                'endereco': endereco_estabelecimento
-            }
+    @staticmethod
+    def _placeholders_agendamento(agendamento: Agendamento) -> Dict[str, Any]:
+        """Placeholders do agendamento (data/hora no horário do Brasil)"""
+        data_inicio_br = to_brazil_tz(agendamento.data_inicio) if agendamento.data_inicio else None
+        data_fim_br = to_brazil_tz(agendamento.data_fim) if agendamento.data_fim else None
+
+        # Todos os campos são opcionais - valores None/inexistentes são tratados
+        return {
+            'data': data_inicio_br.strftime('%d/%m/%Y') if data_inicio_br else '',
+            'hora': data_inicio_br.strftime('%H:%M') if data_inicio_br else '',
+            'hora_fim': data_fim_br.strftime('%H:%M') if data_fim_br else '',
+            'servico': agendamento.servico.nome if agendamento.servico else (agendamento.servico_personalizado_nome or ''),
+            'vendedor': agendamento.vendedor.full_name if agendamento.vendedor else '',
+            'valor': f"R$ {agendamento.valor_final:.2f}" if agendamento.valor_final else '',
+            'status': agendamento.status.value if agendamento.status else '',
+            'veiculo': agendamento.veiculo or ''
+        }
+
+    @staticmethod
+    def preparar_mensagens(
+        db: Session,
+        pedidos: List[PedidoEnvio],
+        apenas_habilitados: bool = False
+    ) -> List[Union[MensagemPreparada, HTTPException, None]]:
+        """
+        Carrega o contexto de todos os pedidos em um número fixo de consultas
+        (configs + estabelecimento + empresa, clientes, agendamentos e, para
+        RECICLAGEM, o último agendamento) e renderiza as mensagens.
 
-            if message_request.agendamento_id:
-                from sqlalchemy.orm import joinedload
-                from zoneinfo import ZoneInfo
+        Retorna, na ordem dos pedidos, a mensagem pronta, o HTTPException que
+        impede o envio ou None (tipo desabilitado, com apenas_habilitados=True).
+        """
+        from sqlalchemy.orm import joinedload
+        from app.models.empresa import Empresa
+
+        if not pedidos:
+            return []
+
+        # 1. Configs com estabelecimento e empresa
+        estabelecimento_ids = {pedido.estabelecimento_id for pedido in pedidos}
+        contextos = {
+            row.WhatsAppConfig.estabelecimento_id: row
+            for row in db.query(
+                WhatsAppConfig,
+                Estabelecimento.nome.label('nome_estabelecimento'),
+                Estabelecimento.endereco,
+                Empresa.nome.label('nome_empresa')
+            ).join(
+                Estabelecimento, Estabelecimento.id == WhatsAppConfig.estabelecimento_id
+            ).outerjoin(
+                Empresa, Empresa.id == Estabelecimento.empresa_id
+            ).filter(
+                WhatsAppConfig.estabelecimento_id.in_(estabelecimento_ids)
+            ).all()
+        }
 
-                BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
+        # 2. Clientes
+        cliente_ids = {pedido.cliente_id for pedido in pedidos}
+        clientes = {
+            cliente.id: cliente
+            for cliente in db.query(Cliente).filter(Cliente.id.in_(cliente_ids)).all()
+        }
 
-                agendamento = db.query(Agendamento).options(
-                    joinedload(Agendamento.cliente),
+        # 3. Agendamentos com serviço e vendedor
+        agendamento_ids = {pedido.agendamento_id for pedido in pedidos if pedido.agendamento_id}
+        agendamentos = {}
+        if agendamento_ids:
+            agendamentos = {
+                agendamento.id: agendamento
+                for agendamento in db.query(Agendamento).options(
                     joinedload(Agendamento.servico),
                     joinedload(Agendamento.vendedor)
-                ).filter(
-                    Agendamento.id == message_request.agendamento_id
-                ).first()
-
-                if agendamento:
-                    # Converter para timezone do Brasil antes de formatar
-                    # Se o datetime não tem timezone (naive), assume que já está em horário do Brasil
-                    if agendamento.data_inicio.tzinfo is None:
-                        # Datetime naive - adiciona timezone do Brasil
-                        data_inicio_br = agendamento.data_inicio.replace(tzinfo=BRAZIL_TZ)
-                    else:
-                        # Datetime aware - converte para timezone do Brasil
-                        data_inicio_br = agendamento.data_inicio.astimezone(BRAZIL_TZ)
-
-                    if agendamento.data_fim:
-                        if agendamento.data_fim.tzinfo is None:
-                            data_fim_br = agendamento.data_fim.replace(tzinfo=BRAZIL_TZ)
-                        else:
-                            data_fim_br = agendamento.data_fim.astimezone(BRAZIL_TZ)
-                    else:
-                        data_fim_br = None
-
-                    # Log para debug
-                    logger.info(f"[WHATSAPP] Agendamento ID {agendamento.id}:")
-                    logger.info(f"  data_inicio original: {agendamento.data_inicio} (tzinfo: {agendamento.data_inicio.tzinfo})")
-                    logger.info(f"  data_inicio_br: {data_inicio_br}")
-                    logger.info(f"  hora formatada: {data_inicio_br.strftime('%H:%M')}")
-                    logger.info(f"  veiculo no agendamento: '{agendamento.veiculo}'")
-
-                    # Todos os campos são opcionais - valores None/inexistentes são tratados
-                    placeholders.update({
-                        'data': data_inicio_br.strftime('%d/%m/%Y') if data_inicio_br else '',
-                        'hora': data_inicio_br.strftime('%H:%M') if data_inicio_br else '',
-                        'hora_fim': data_fim_br.strftime('%H:%M') if data_fim_br else '',
-                        'servico': agendamento.servico.nome if agendamento.servico else (agendamento.servico_personalizado_nome or ''),
-                        'vendedor': agendamento.vendedor.full_name if agendamento.vendedor else '',
-                        'valor': f"R$ {agendamento.valor_final:.2f}" if agendamento.valor_final else '',
-                        'status': agendamento.status.value if agendamento.status else '',
-                        'veiculo': agendamento.veiculo or ''
-                    })
-
-                    logger.info(f"[WHATSAPP] Placeholders preparados: {placeholders}")
-
-            # Placeholders extras para mensagens de RECICLAGEM
-            if tipo == 'RECICLAGEM':
-                from zoneinfo import ZoneInfo
-                BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
-
-                # Buscar último agendamento do cliente
-                ultimo_agendamento = db.query(Agendamento).filter(
-                    Agendamento.cliente_id == cliente.id,
-                    Agendamento.deleted_at.is_(None)
-                ).order_by(Agendamento.data_inicio.desc()).first()
-
-                if ultimo_agendamento and ultimo_agendamento.data_inicio:
-                    # Garantir que está no timezone do Brasil
-                    agora_br = datetime.now(BRAZIL_TZ)
-                    if ultimo_agendamento.data_inicio.tzinfo is None:
-                        ultimo_br = ultimo_agendamento.data_inicio.replace(tzinfo=BRAZIL_TZ)
-                    else:
-                        ultimo_br = ultimo_agendamento.data_inicio.astimezone(BRAZIL_TZ)
-
-                    # Calcular meses de inatividade
-                    delta = agora_br - ultimo_br
-                    meses_inativo = int(delta.days / 30)  # Aproximação
-
-                    # Formatar data do último serviço
-                    data_ultimo_servico = ultimo_br.strftime('%d/%m/%Y')
-
-                    placeholders.update({
-                        'meses_inativo': str(meses_inativo) if meses_inativo else '0',
-                        'data_ultimo_servico': data_ultimo_servico or ''
-                    })
-
-                    logger.info(f"[WHATSAPP] Placeholders reciclagem: meses={meses_inativo}, data={data_ultimo_servico}")
-                else:
-                    # Se não tem agendamento anterior, usar valores padrão
-                    placeholders.update({
-                        'meses_inativo': '',
-                        'data_ultimo_servico': ''
-                    })
+                ).filter(Agendamento.id.in_(agendamento_ids)).all()
+            }
 
-            message_text = WhatsAppService._replace_placeholders(template, placeholders)
-            logger.info(f"[WHATSAPP] Mensagem final após substituir placeholders: {message_text}")
+        # 4. Último agendamento dos clientes de RECICLAGEM
+        reciclagem_ids = {pedido.cliente_id for pedido in pedidos if pedido.tipo == 'RECICLAGEM'}
+        ultimos = {}
+        if reciclagem_ids:
+            ultimos = dict(db.query(
+                Agendamento.cliente_id,
+                func.max(Agendamento.data_inicio)
+            ).filter(
+                Agendamento.cliente_id.in_(reciclagem_ids),
+                Agendamento.deleted_at.is_(None)
+            ).group_by(Agendamento.cliente_id).all())
+
+        # 5. Sessões WAHA de cada estabelecimento e, com mais de uma, a última
+        #    sessão em que cada cliente conversou
+        pools = WhatsAppSessoesService.pools(db, {
+            estabelecimento_id: contexto.WhatsAppConfig
+            for estabelecimento_id, contexto in contextos.items()
+            if contexto.WhatsAppConfig.ativado
+        })
+        conversas = WhatsAppSessoesService.ultimas_conversas(db, (
+            (pedido.estabelecimento_id, WhatsAppService._format_phone_number(clientes[pedido.cliente_id].telefone))
+            for pedido in pedidos
+            if len(pools.get(pedido.estabelecimento_id, ())) > 1
+            and pedido.cliente_id in clientes and clientes[pedido.cliente_id].telefone
+        ))
+
+        agora_br = get_brazil_now()
+        resultado: List[Union[MensagemPreparada, HTTPException, None]] = []
+
+        for pedido in pedidos:
+            contexto = contextos.get(pedido.estabelecimento_id)
+            config = contexto.WhatsAppConfig if contexto else None
+            campo_template, flag = TIPOS_MENSAGEM.get(pedido.tipo, (None, None))
+
+            if apenas_habilitados and (not config or not config.ativado or not flag or not getattr(config, flag)):
+                resultado.append(None)
+                continue
 
-        # Formata telefone
-        formatted_phone = WhatsAppService._format_phone_number(cliente.telefone)
+            if not config or not config.ativado:
+                resultado.append(HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="WhatsApp não configurado ou desativado"
+                ))
+                continue
 
-        # Envia via WAHA
-        try:
-            result = WAHAService.send_text_message(
-                waha_url=config.waha_url,
-                waha_api_key=config.waha_api_key,
-                session_name=config.waha_session_name,
-                to_phone=formatted_phone,
-                message_text=message_text
-            )
+            cliente = clientes.get(pedido.cliente_id)
+            if not cliente or cliente.estabelecimento_id != pedido.estabelecimento_id:
+                resultado.append(HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Cliente não encontrado"
+                ))
+                continue
 
-            message_id = result.get('key', {}).get('id')
+            if not cliente.telefone:
+                resultado.append(HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Cliente não possui telefone cadastrado"
+                ))
+                continue
 
-            return WhatsAppMessageResponse(
-                sucesso=True,
-                mensagem_id=message_id,
-                telefone_destino=formatted_phone
+            if pedido.mensagem_customizada:
+                message_text = pedido.mensagem_customizada
+            else:
+                template = getattr(config, campo_template) if campo_template else None
+                if not template:
+                    resultado.append(HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Template não configurado para tipo {pedido.tipo}"
+                    ))
+                    continue
+
+                # TODOS os placeholders são opcionais - valores None são tratados automaticamente
+                placeholders = {
+                    'nome_cliente': cliente.nome or '',
+                    'telefone_cliente': cliente.telefone or '',
+                    'email_cliente': cliente.email or '',
+                    'nome_empresa': contexto.nome_empresa or contexto.nome_estabelecimento or '',
+                    'endereco': contexto.endereco or '',
+                    'link_agendamento': config.link_agendamento or ''
+                }
+
+                agendamento = agendamentos.get(pedido.agendamento_id)
+                if agendamento and agendamento.estabelecimento_id == pedido.estabelecimento_id:
+                    placeholders.update(WhatsAppService._placeholders_agendamento(agendamento))
+
+                # Placeholders extras para mensagens de RECICLAGEM
+                if pedido.tipo == 'RECICLAGEM':
+                    ultimo = ultimos.get(cliente.id)
+                    if ultimo:
+                        ultimo_br = to_brazil_tz(ultimo)
+                        meses_inativo = int((agora_br - ultimo_br).days / 30)  # Aproximação
+                        placeholders.update({
+                            'meses_inativo': str(meses_inativo),
+                            'data_ultimo_servico': ultimo_br.strftime('%d/%m/%Y')
+                        })
+
+                message_text = WhatsAppService._replace_placeholders(template, placeholders)
+
+            telefone = WhatsAppService._format_phone_number(cliente.telefone)
+            sessoes = WhatsAppSessoesService.ordenar(
+                pools[pedido.estabelecimento_id], telefone,
+                conversas.get((pedido.estabelecimento_id, telefone))
             )
+            resultado.append(MensagemPreparada(
+                estabelecimento_id=pedido.estabelecimento_id,
+                cliente_id=cliente.id,
+                waha_url=sessoes[0].waha_url,
+                waha_api_key=sessoes[0].waha_api_key,
+                session_name=sessoes[0].session_name,
+                telefone=telefone,
+                texto=message_text,
+                tipo=pedido.tipo,
+                agendamento_id=pedido.agendamento_id,
+                alternativas=tuple(sessoes[1:])
+            ))
 
-        except Exception as e:
-            logger.error(f"Erro ao enviar mensagem: {str(e)}")
-            return WhatsAppMessageResponse(
-                sucesso=False,
-                erro=str(e),
-                telefone_destino=formatted_phone
-            )
+        return resultado
+
+    @staticmethod
+    def send_pedidos(
+        db: Session,
+        pedidos: List[PedidoEnvio],
+        apenas_habilitados: bool = False
+    ) -> List[Optional[WhatsAppMessageResponse]]:
+        """
+        Prepara (consultas em lote) e envia os pedidos.
+        Retorna a resposta de cada pedido, na ordem; None para pedidos ignorados.
+        """
+        preparadas = WhatsAppService.preparar_mensagens(db, pedidos, apenas_habilitados)
+        mensagens = [p for p in preparadas if isinstance(p, MensagemPreparada)]
+        respostas_envio = WhatsAppService.send_batch(mensagens)
+        WhatsAppEnvioService.registrar(db, mensagens, respostas_envio)
+        enviadas = iter(respostas_envio)
+
+        respostas: List[Optional[WhatsAppMessageResponse]] = []
+        for preparada in preparadas:
+            if preparada is None:
+                respostas.append(None)
+            elif isinstance(preparada, HTTPException):
+                respostas.append(WhatsAppMessageResponse(sucesso=False, erro=preparada.detail, telefone_destino=''))
+            else:
+                respostas.append(next(enviadas))
+        return respostas
 
     # ==================== Notificações Automáticas ====================
 
     @staticmethod
-    def notify_novo_agendamento(db: Session, agendamento: Agendamento) -> None:
-        """Envia notificação de novo agendamento"""
-        if not agendamento.cliente or not agendamento.estabelecimento_id:
-            return
-
-        config = WhatsAppService.get_config(db, agendamento.estabelecimento_id)
-        if not config or not config.ativado or not config.enviar_agendamento:
+    def notificar_agendamento(
+        db: Session,
+        estabelecimento_id: Optional[int],
+        cliente_id: Optional[int],
+        agendamento_id: int,
+        tipo: str
+    ) -> None:
+        """Envia notificação automática do agendamento (se o tipo estiver habilitado)"""
+        if not cliente_id or not estabelecimento_id:
             return
 
         try:
-            WhatsAppService.send_message(
-                db=db,
-                estabelecimento_id=agendamento.estabelecimento_id,
-                message_request=WhatsAppMessageRequest(
-                    cliente_id=agendamento.cliente_id,
-                    tipo_mensagem='AGENDAMENTO',
-                    agendamento_id=agendamento.id
-                )
-            )
+            resposta = WhatsAppService.send_pedidos(db, [PedidoEnvio(
+                estabelecimento_id=estabelecimento_id,
+                cliente_id=cliente_id,
+                tipo=tipo,
+                agendamento_id=agendamento_id
+            )], apenas_habilitados=True)[0]
+            if resposta and not resposta.sucesso:
+                logger.error(f"Erro ao enviar notificação {tipo} do agendamento {agendamento_id}: {resposta.erro}")
         except Exception as e:
-            logger.error(f"Erro ao enviar notificação de agendamento: {str(e)}")
+            logger.error(f"Erro ao enviar notificação {tipo} do agendamento {agendamento_id}: {str(e)}")
 
     @staticmethod
-    def notify_confirmacao(db: Session, agendamento: Agendamento) -> None:
-        """Envia notificação de confirmação (DEPRECATED - manter por compatibilidade)"""
-        if not agendamento.cliente or not agendamento.estabelecimento_id:
-            return
+    def _notificar(db: Session, agendamento: Agendamento, tipo: str) -> None:
+        WhatsAppService.notificar_agendamento(
+            db, agendamento.estabelecimento_id, agendamento.cliente_id, agendamento.id, tipo
+        )
 
-        config = WhatsAppService.get_config(db, agendamento.estabelecimento_id)
-        if not config or not config.ativado or not config.enviar_confirmacao:
-            return
+    @staticmethod
+    def notify_novo_agendamento(db: Session, agendamento: Agendamento) -> None:
+        """Envia notificação de novo agendamento"""
+        WhatsAppService._notificar(db, agendamento, 'AGENDAMENTO')
 
-        try:
-            WhatsAppService.send_message(
-                db=db,
-                estabelecimento_id=agendamento.estabelecimento_id,
-                message_request=WhatsAppMessageRequest(
-                    cliente_id=agendamento.cliente_id,
-                    tipo_mensagem='CONFIRMACAO',
-                    agendamento_id=agendamento.id
-                )
-            )
-        except Exception as e:
-            logger.error(f"Erro ao enviar notificação de confirmação: {str(e)}")
+    @staticmethod
+    def notify_confirmacao(db: Session, agendamento: Agendamento) -> None:
+        """Envia notificação de confirmação (DEPRECATED - manter por compatibilidade)"""
+        WhatsAppService._notificar(db, agendamento, 'CONFIRMACAO')
 
     @staticmethod
     def notify_conclusao(db: Session, agendamento: Agendamento) -> None:
         """Envia notificação de conclusão de serviço"""
-        if not agendamento.cliente or not agendamento.estabelecimento_id:
-            return
-
-        config = WhatsAppService.get_config(db, agendamento.estabelecimento_id)
-        if not config or not config.ativado or not config.enviar_conclusao:
-            return
-
-        try:
-            WhatsAppService.send_message(
-                db=db,
-                estabelecimento_id=agendamento.estabelecimento_id,
-                message_request=WhatsAppMessageRequest(
-                    cliente_id=agendamento.cliente_id,
-                    tipo_mensagem='CONCLUSAO',
-                    agendamento_id=agendamento.id
-                )
-            )
-        except Exception as e:
-            logger.error(f"Erro ao enviar notificação de conclusão: {str(e)}")
+        WhatsAppService._notificar(db, agendamento, 'CONCLUSAO')
 
     @staticmethod
     def notify_cancelamento(db: Session, agendamento: Agendamento) -> None:
         """Envia notificação de cancelamento"""
-        if not agendamento.cliente or not agendamento.estabelecimento_id:
-            return
-
-        config = WhatsAppService.get_config(db, agendamento.estabelecimento_id)
-        if not config or not config.ativado or not config.enviar_cancelamento:
-            return
-
-        try:
-            WhatsAppService.send_message(
-                db=db,
-                estabelecimento_id=agendamento.estabelecimento_id,
-                message_request=WhatsAppMessageRequest(
-                    cliente_id=agendamento.cliente_id,
-                    tipo_mensagem='CANCELAMENTO',
-                    agendamento_id=agendamento.id
-                )
-            )
-        except Exception as e:
-            logger.error(f"Erro ao enviar notificação de cancelamento: {str(e)}")
+        WhatsAppService._notificar(db, agendamento, 'CANCELAMENTO')
 
     # ==================== Reciclagem de Clientes ====================
 
@@ -502,54 +560,26 @@ class WhatsAppService:
         estabelecimento_id: int,
         meses_inatividade: int = 3
     ) -> List[Dict[str, Any]]:
-        """Lista clientes sem agendamento há X meses"""
+        """Lista clientes sem agendamento há X meses (índice clientes_inatividade)"""
         from zoneinfo import ZoneInfo
+        from app.services.inatividade_service import InatividadeService
         BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
 
-        data_limite = datetime.now(BRAZIL_TZ) - timedelta(days=meses_inatividade * 30)
+        agora_br = datetime.now(BRAZIL_TZ)
+        data_limite = agora_br - timedelta(days=meses_inatividade * 30)
         logger.info(f"[CLIENTES_INATIVOS] Data limite: {data_limite} (inatividade: {meses_inatividade} meses)")
 
-        # Subquery: último agendamento de cada cliente
-        subq = db.query(
-            Agendamento.cliente_id,
-            func.max(Agendamento.data_inicio).label('ultima_data')
-        ).filter(
-            Agendamento.estabelecimento_id == estabelecimento_id,
-            Agendamento.deleted_at.is_(None)
-        ).group_by(Agendamento.cliente_id).subquery()
-
-        # Clientes com último agendamento antes da data limite
-        clientes_inativos = db.query(Cliente).join(
-            subq, Cliente.id == subq.c.cliente_id
-        ).filter(
-            Cliente.estabelecimento_id == estabelecimento_id,
-            Cliente.is_active == True,
-            subq.c.ultima_data < data_limite
-        ).all()
-
         resultado = []
-        for cliente in clientes_inativos:
-            # Busca data do último agendamento
-            ultimo = db.query(Agendamento).filter(
-                Agendamento.cliente_id == cliente.id,
-                Agendamento.deleted_at.is_(None)
-            ).order_by(Agendamento.data_inicio.desc()).first()
-
-            # Calcular dias de inatividade usando timezone do Brasil
-            dias_inativo = None
-            if ultimo and ultimo.data_inicio:
-                # Garantir que ambos datetimes estão no mesmo timezone
-                agora_br = datetime.now(BRAZIL_TZ)
-                ultimo_br = ultimo.data_inicio.astimezone(BRAZIL_TZ) if ultimo.data_inicio.tzinfo else ultimo.data_inicio.replace(tzinfo=BRAZIL_TZ)
-                dias_inativo = (agora_br - ultimo_br).days
-
+        for cliente in InatividadeService.listar_inativos(db, estabelecimento_id, data_limite):
+            ultimo = cliente['ultimo_agendamento']
             resultado.append({
-                'id': cliente.id,
-                'nome': cliente.nome,
-                'telefone': cliente.telefone,
-                'email': cliente.email,
-                'ultimo_agendamento': ultimo.data_inicio if ultimo else None,
-                'dias_inativo': dias_inativo
+                'id': cliente['id'],
+                'nome': cliente['nome'],
+                'telefone': cliente['telefone'],
+                'email': cliente['email'],
+                'ultimo_agendamento': ultimo,
+                'dias_inativo': (agora_br - ultimo.astimezone(BRAZIL_TZ)).days,
+                'reciclagem_enviada_em': cliente['reciclagem_enviada_em']
             })
 
         return resultado
@@ -561,14 +591,16 @@ class WhatsAppService:
         cliente_id: int
     ) -> WhatsAppMessageResponse:
         """Envia mensagem de reciclagem para cliente específico"""
-        config = WhatsAppService.get_config(db, estabelecimento_id)
+        from app.services.inatividade_service import InatividadeService
+
+        config = WhatsAppService.get_config_cached(db, estabelecimento_id)
         if not config or not config.ativado:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="WhatsApp não configurado"
             )
 
-        return WhatsAppService.send_message(
+        response = WhatsAppService.send_message(
             db=db,
             estabelecimento_id=estabelecimento_id,
             message_request=WhatsAppMessageRequest(
@@ -577,9 +609,23 @@ class WhatsAppService:
             )
         )
 
+        # Registra no histórico de campanhas (o cron não repete neste período)
+        if response.sucesso:
+            InatividadeService.registrar_envio_manual(db, cliente_id, response.mensagem_id)
+
+        return response
+
     @staticmethod
     def process_reciclagem_cron(db: Session) -> Dict[str, Any]:
-        """Processa envio de reciclagem para todos estabelecimentos (CRON)"""
+        """
+        Processa envio de reciclagem para todos estabelecimentos (CRON).
+        Cada cliente recebe no máximo uma mensagem por período de inatividade:
+        os elegíveis são reservados em reciclagem_envios antes do envio.
+        """
+        from zoneinfo import ZoneInfo
+        from app.services.inatividade_service import InatividadeService
+        BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
+
         stats = {
             'estabelecimentos_processados': 0,
             'mensagens_enviadas': 0,
@@ -592,86 +638,197 @@ class WhatsAppService:
             WhatsAppConfig.enviar_reciclagem == True
         ).all()
 
+        agora_br = datetime.now(BRAZIL_TZ)
+
+        # Reserva os elegíveis de todos os estabelecimentos e envia num lote só
+        # (a fila de envio intercala os estabelecimentos)
+        envios = []
         for config in configs:
             stats['estabelecimentos_processados'] += 1
 
-            # Lista clientes inativos
-            clientes_inativos = WhatsAppService.get_clientes_inativos(
-                db=db,
-                estabelecimento_id=config.estabelecimento_id,
-                meses_inatividade=config.meses_inatividade
-            )
+            # Apenas clientes inativos ainda não contatados neste período
+            data_limite = agora_br - timedelta(days=config.meses_inatividade * 30)
+            for envio in InatividadeService.reservar_elegiveis(db, config.estabelecimento_id, data_limite):
+                envios.append((config.estabelecimento_id, envio))
 
-            # Envia para cada cliente
-            for cliente in clientes_inativos:
-                try:
-                    WhatsAppService.send_reciclagem_message(
-                        db=db,
-                        estabelecimento_id=config.estabelecimento_id,
-                        cliente_id=cliente['id']
-                    )
-                    stats['mensagens_enviadas'] += 1
-                except Exception as e:
-                    logger.error(f"Erro ao enviar reciclagem para cliente {cliente['id']}: {str(e)}")
-                    stats['erros'] += 1
+        if not envios:
+            return stats
+
+        respostas = WhatsAppService.send_pedidos(db, [
+            PedidoEnvio(
+                estabelecimento_id=estabelecimento_id,
+                cliente_id=envio['cliente_id'],
+                tipo='RECICLAGEM'
+            )
+            for estabelecimento_id, envio in envios
+        ])
+
+        for (_, envio), response in zip(envios, respostas):
+            if response.sucesso:
+                InatividadeService.confirmar_envio(db, envio['id'], response.mensagem_id)
+                stats['mensagens_enviadas'] += 1
+            else:
+                logger.error(f"Erro ao enviar reciclagem para cliente {envio['cliente_id']}: {response.erro}")
+                InatividadeService.liberar_envio(db, envio['id'], envio['cliente_id'])
+                stats['erros'] += 1
 
+        logger.info(f"[RECICLAGEM_CRON] Finalizado. Stats: {stats}")
         return stats
 
     @staticmethod
     def process_lembretes_cron(db: Session) -> Dict[str, Any]:
-        """Processa envio de lembretes 24h antes (CRON)"""
-        from zoneinfo import ZoneInfo
-        BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
+        """
+        Reconciliação dos lembretes (CRON/manual): programa os lembretes dos
+        agendamentos das próximas 48h que ainda não têm envio programado.
+        O envio em si é feito pelo WhatsAppAgendador no horário exato.
+        """
+        from app.services.whatsapp_agendador import WhatsAppAgendador
 
-        stats = {
-            'agendamentos_processados': 0,
-            'lembretes_enviados': 0,
-            'erros': 0
-        }
+        stats = WhatsAppAgendador.programar_pendentes(db)
+        logger.info(f"[LEMBRETES_CRON] {stats}")
+        return stats
+
+    @staticmethod
+    def enviar_uma(mensagem: MensagemPreparada) -> WhatsAppMessageResponse:
+        """Envia uma mensagem já renderizada direto ao WAHA (sem fila)"""
+        try:
+            result = WAHAService.send_text_message(
+                waha_url=mensagem.waha_url,
+                waha_api_key=mensagem.waha_api_key,
+                session_name=mensagem.session_name,
+                to_phone=mensagem.telefone,
+                message_text=mensagem.texto
+            )
+            return WhatsAppMessageResponse(
+                sucesso=True,
+                mensagem_id=result.get('key', {}).get('id'),
+                telefone_destino=mensagem.telefone
+            )
+        except Exception as e:
+            erro = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Erro ao enviar mensagem para cliente {mensagem.cliente_id}: {erro}")
+            return WhatsAppMessageResponse(
+                sucesso=False,
+                erro=erro,
+                telefone_destino=mensagem.telefone
+            )
+
+    @staticmethod
+    def _na_sessao(mensagem: MensagemPreparada, sessao: SessaoWAHA) -> MensagemPreparada:
+        """A mesma mensagem em outra sessão (a atual passa para as alternativas)"""
+        atual = SessaoWAHA(mensagem.waha_url, mensagem.waha_api_key, mensagem.session_name)
+        return mensagem._replace(
+            waha_url=sessao.waha_url,
+            waha_api_key=sessao.waha_api_key,
+            session_name=sessao.session_name,
+            alternativas=tuple(s for s in mensagem.alternativas if s != sessao) + (atual,)
+        )
+
+    @staticmethod
+    def send_batch(mensagens: List[MensagemPreparada]) -> List[WhatsAppMessageResponse]:
+        """
+        Envia mensagens já renderizadas (mesma ordem da entrada) e espera o resultado.
+        Não acessa o banco: o contexto é montado antes por quem chama.
 
-        # Busca agendamentos entre 23h e 25h no futuro (usar horário do Brasil)
-        agora = datetime.now(BRAZIL_TZ)
-        inicio_janela = agora + timedelta(hours=23)
-        fim_janela = agora + timedelta(hours=25)
+        Com a fila de envio ativa, as mensagens entram na faixa do seu tipo
+        (limite de taxa por sessão, transacionais primeiro, justiça entre
+        estabelecimentos); sem ela, são enviadas direto, em sequência.
 
-        logger.info(f"[LEMBRETES_CRON] Processando lembretes. Agora: {agora}")
-        logger.info(f"[LEMBRETES_CRON] Janela: {inicio_janela} até {fim_janela}")
+        Lotes (mais de uma mensagem) aquecem as instâncias WAHA antes: sessões
+        desconectadas falham sem chamar o WAHA e instâncias fora do ar abrem
+        o circuito (as mensagens delas falham na hora).
 
-        agendamentos = db.query(Agendamento).filter(
-            Agendamento.data_inicio >= inicio_janela,
-            Agendamento.data_inicio <= fim_janela,
-            Agendamento.deleted_at.is_(None),
-            Agendamento.status.in_(['AGENDADO', 'CONFIRMADO'])
-        ).all()
+        Estabelecimentos com várias sessões: a mensagem vai para a primeira
+        sessão saudável da sua ordem de preferência e, se o envio falhar e a
+        sessão deixar de estar saudável, é reenviada uma vez pela próxima.
+        """
+        status_sessoes = {}
+        if len(mensagens) > 1:
+            status_sessoes = WAHAService.aquecer(
+                (s.waha_url, s.waha_api_key, s.session_name)
+                for m in mensagens
+                for s in (SessaoWAHA(m.waha_url, m.waha_api_key, m.session_name),) + m.alternativas
+            )
 
-        for agendamento in agendamentos:
-            stats['agendamentos_processados'] += 1
+        def status_de(sessao) -> Optional[str]:
+            return status_sessoes.get((instancia_waha(sessao.waha_url), sessao.session_name))
+
+        # Status do aquecimento/webhook (cache) e circuito, atualizados também durante o envio
+        saudavel = WhatsAppSessoesService.saudavel
+
+        def proxima_saudavel(mensagem: MensagemPreparada) -> Optional[SessaoWAHA]:
+            return next((s for s in mensagem.alternativas if saudavel(s)), None)
+
+        def disparar(mensagens_envio: List[MensagemPreparada]) -> List[WhatsAppMessageResponse]:
+            usar_fila = FilaEnvioWhatsApp.ativa()
+            pendentes: List[Union[WhatsAppMessageResponse, Future]] = []
+            for mensagem in mensagens_envio:
+                status_sessao = status_de(SessaoWAHA(mensagem.waha_url, mensagem.waha_api_key, mensagem.session_name))
+                if status_sessao and status_sessao != 'WORKING':
+                    pendentes.append(WhatsAppMessageResponse(
+                        sucesso=False,
+                        erro=f"Sessão WAHA '{mensagem.session_name}' não conectada (status {status_sessao})",
+                        telefone_destino=mensagem.telefone
+                    ))
+                elif usar_fila:
+                    pendentes.append(FilaEnvioWhatsApp.enfileirar(mensagem))
+                else:
+                    pendentes.append(WhatsAppService.enviar_uma(mensagem))
 
-            # Verifica config
-            config = WhatsAppService.get_config(db, agendamento.estabelecimento_id)
-            if not config or not config.ativado or not config.enviar_lembrete:
+            respostas = []
+            for mensagem, pendente in zip(mensagens_envio, pendentes):
+                if not isinstance(pendente, Future):
+                    respostas.append(pendente)
+                    continue
+                try:
+                    respostas.append(pendente.result())
+                except Exception as e:
+                    respostas.append(WhatsAppMessageResponse(
+                        sucesso=False,
+                        erro=str(e),
+                        telefone_destino=mensagem.telefone
+                    ))
+            return respostas
+
+        # Sessão escolhida não saudável: vai para a próxima saudável
+        envio = []
+        for mensagem in mensagens:
+            atual = SessaoWAHA(mensagem.waha_url, mensagem.waha_api_key, mensagem.session_name)
+            if mensagem.alternativas and not saudavel(atual):
+                alternativa = proxima_saudavel(mensagem)
+                if alternativa:
+                    mensagem = WhatsAppService._na_sessao(mensagem, alternativa)
+            envio.append(mensagem)
+
+        respostas = disparar(envio)
+
+        # Drenagem: falhas em sessões que deixaram de estar saudáveis são reenviadas pela próxima
+        reenvio = []
+        for indice, (mensagem, resposta) in enumerate(zip(envio, respostas)):
+            if resposta.sucesso or not mensagem.alternativas:
+                continue
+            if saudavel(SessaoWAHA(mensagem.waha_url, mensagem.waha_api_key, mensagem.session_name)):
                 continue
+            alternativa = proxima_saudavel(mensagem)
+            if alternativa:
+                reenvio.append((indice, WhatsAppService._na_sessao(mensagem, alternativa)))
 
-            try:
-                WhatsAppService.send_message(
-                    db=db,
-                    estabelecimento_id=agendamento.estabelecimento_id,
-                    message_request=WhatsAppMessageRequest(
-                        cliente_id=agendamento.cliente_id,
-                        tipo_mensagem='LEMBRETE',
-                        agendamento_id=agendamento.id
-                    )
-                )
-                stats['lembretes_enviados'] += 1
-            except Exception as e:
-                logger.error(f"Erro ao enviar lembrete para agendamento {agendamento.id}: {str(e)}")
-                stats['erros'] += 1
+        if reenvio:
+            logger.warning(f"[WHATSAPP] Reenviando {len(reenvio)} mensagens por outra sessão")
+            for (indice, _), resposta in zip(reenvio, disparar([m for _, m in reenvio])):
+                respostas[indice] = resposta
 
-        return stats
+        return respostas
 
     @staticmethod
     def process_aniversarios_cron(db: Session) -> Dict[str, Any]:
-        """Processa envio de mensagens de aniversário (CRON)"""
+        """
+        Processa envio de mensagens de aniversário (CRON).
+        Busca os aniversariantes de todos os estabelecimentos habilitados em uma
+        consulta (índice aniversario_mes/aniversario_dia) e envia em lote por
+        send_pedidos: mesmo contexto de placeholders e mesmo pool de sessões
+        (com failover) das demais mensagens.
+        """
         from zoneinfo import ZoneInfo
 
         BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
@@ -682,47 +839,51 @@ class WhatsAppService:
             'erros': 0
         }
 
-        # Busca todos estabelecimentos com WhatsApp ativo e aniversário habilitado
-        configs = db.query(WhatsAppConfig).filter(
-            WhatsAppConfig.ativado == True,
-            WhatsAppConfig.enviar_aniversario == True
-        ).all()
+        # Dia e mês atual (Brasil timezone)
+        hoje = datetime.now(BRAZIL_TZ).date()
+        dias = [hoje.day]
 
-        # Pega dia e mês atual (Brasil timezone) no formato DD/MM
-        hoje = datetime.now(BRAZIL_TZ)
-        data_hoje_formatada = hoje.strftime('%d/%m')  # Formato: "15/03"
+        # Nascidos em 29/02 comemoram em 28/02 nos anos não bissextos
+        if hoje.month == 2 and hoje.day == 28 and not calendar.isleap(hoje.year):
+            dias.append(29)
 
-        logger.info(f"[ANIVERSARIOS_CRON] Processando aniversariantes. Hoje: {hoje.strftime('%d/%m/%Y')} (buscando {data_hoje_formatada})")
+        logger.info(f"[ANIVERSARIOS_CRON] Processando aniversariantes. Hoje: {hoje.strftime('%d/%m/%Y')} (dias {dias})")
 
-        for config in configs:
-            stats['estabelecimentos_processados'] += 1
+        aniversariantes = db.query(
+            Cliente.id,
+            Cliente.estabelecimento_id
+        ).join(
+            WhatsAppConfig, WhatsAppConfig.estabelecimento_id == Cliente.estabelecimento_id
+        ).filter(
+            WhatsAppConfig.ativado == True,
+            WhatsAppConfig.enviar_aniversario == True,
+            WhatsAppConfig.template_aniversario.isnot(None),
+            Cliente.is_active == True,
+            Cliente.telefone.isnot(None),
+            Cliente.aniversario_mes == hoje.month,
+            Cliente.aniversario_dia.in_(dias)
+        ).all()
 
-            # Busca clientes aniversariantes do dia (compara string DD/MM)
-            clientes_aniversariantes = db.query(Cliente).filter(
-                Cliente.estabelecimento_id == config.estabelecimento_id,
-                Cliente.is_active == True,
-                Cliente.data_aniversario.isnot(None),
-                Cliente.data_aniversario == data_hoje_formatada
-            ).all()
+        stats['estabelecimentos_processados'] = len({row.estabelecimento_id for row in aniversariantes})
+        logger.info(f"[ANIVERSARIOS_CRON] {len(aniversariantes)} aniversariante(s) em {stats['estabelecimentos_processados']} estabelecimento(s)")
 
-            logger.info(f"[ANIVERSARIOS_CRON] Estabelecimento {config.estabelecimento_id}: {len(clientes_aniversariantes)} aniversariante(s)")
+        respostas = WhatsAppService.send_pedidos(db, [
+            PedidoEnvio(
+                estabelecimento_id=row.estabelecimento_id,
+                cliente_id=row.id,
+                tipo='ANIVERSARIO'
+            )
+            for row in aniversariantes
+        ], apenas_habilitados=True)
 
-            # Envia para cada aniversariante
-            for cliente in clientes_aniversariantes:
-                try:
-                    WhatsAppService.send_message(
-                        db=db,
-                        estabelecimento_id=config.estabelecimento_id,
-                        message_request=WhatsAppMessageRequest(
-                            cliente_id=cliente.id,
-                            tipo_mensagem='ANIVERSARIO'
-                        )
-                    )
-                    stats['mensagens_enviadas'] += 1
-                    logger.info(f"[ANIVERSARIOS_CRON] Mensagem enviada para {cliente.nome}")
-                except Exception as e:
-                    logger.error(f"Erro ao enviar aniversário para cliente {cliente.id}: {str(e)}")
-                    stats['erros'] += 1
+        for row, resposta in zip(aniversariantes, respostas):
+            if resposta is None:
+                continue
+            if resposta.sucesso:
+                stats['mensagens_enviadas'] += 1
+            else:
+                logger.error(f"Erro ao enviar aniversário para cliente {row.id}: {resposta.erro}")
+                stats['erros'] += 1
 
         logger.info(f"[ANIVERSARIOS_CRON] Finalizado. Stats: {stats}")
         return stats
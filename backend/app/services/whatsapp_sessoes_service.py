@@ -0,0 +1,196 @@
+"""
+Sessões WAHA de um estabelecimento e escolha da sessão de cada envio.
+
+O pool de um estabelecimento é a sessão principal da WhatsAppConfig mais as
+sessões ativas de whatsapp_sessoes. Cada mensagem vai para:
+
+1. a sessão em que o cliente conversou por último (se saudável), para a
+   resposta sair do mesmo número;
+2. senão, a primeira sessão saudável na ordem de rendezvous hashing do
+   telefone: a carga se divide entre as sessões e o cliente fica na mesma
+   sessão enquanto ela estiver saudável (se uma cai, só os clientes dela
+   mudam de sessão).
+
+Saudável = circuito da instância não aberto e status conhecido WORKING (ou
+ainda desconhecido). O status vem dos eventos do webhook (WAHASessaoCache),
+então sessões que caem param de receber envios (drenagem).
+"""
+import hashlib
+from datetime import timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models import WhatsAppConfig, WhatsAppSessao
+from app.services.waha_estado import ABERTO, WAHACircuito, WAHASessaoCache, instancia_waha
+from app.services.whatsapp_config_cache import WhatsAppConfigCache
+from app.utils.timezone import get_brazil_now
+
+# Conversas mais antigas que isso não prendem o cliente a uma sessão
+DIAS_CONVERSA = 30
+
+# Última sessão em que cada (estabelecimento, telefone) mandou mensagem
+ULTIMA_CONVERSA_SQL = text("""
+    SELECT DISTINCT ON (estabelecimento_id, from_number) estabelecimento_id, from_number, session_name
+    FROM whatsapp_messages
+    WHERE estabelecimento_id = ANY(:estabelecimentos)
+      AND from_number = ANY(:telefones)
+      AND from_me = false
+      AND message_timestamp >= :desde
+    ORDER BY estabelecimento_id, from_number, message_timestamp DESC
+""")
+
+
+class SessaoWAHA(NamedTuple):
+    waha_url: str
+    waha_api_key: str
+    session_name: str
+
+
+def _peso(chave: str, sessao: SessaoWAHA) -> bytes:
+    return hashlib.blake2b(
+        f"{chave}|{instancia_waha(sessao.waha_url)}|{sessao.session_name}".encode(), digest_size=8
+    ).digest()
+
+
+class WhatsAppSessoesService:
+    @staticmethod
+    def pools(db: Session, configs: Dict[int, WhatsAppConfig]) -> Dict[int, List[SessaoWAHA]]:
+        """Sessões de cada estabelecimento (principal primeiro), em uma consulta"""
+        pools = {
+            estabelecimento_id: [SessaoWAHA(config.waha_url, config.waha_api_key, config.waha_session_name)]
+            for estabelecimento_id, config in configs.items()
+        }
+        if not pools:
+            return pools
+        for sessao in db.query(WhatsAppSessao).filter(
+            WhatsAppSessao.estabelecimento_id.in_(pools.keys()),
+            WhatsAppSessao.ativo == True
+        ).order_by(WhatsAppSessao.id).all():
+            pools[sessao.estabelecimento_id].append(
+                SessaoWAHA(sessao.waha_url, sessao.waha_api_key, sessao.waha_session_name)
+            )
+        return pools
+
+    @staticmethod
+    def ultimas_conversas(
+        db: Session,
+        pares: Iterable[Tuple[int, str]]
+    ) -> Dict[Tuple[int, str], str]:
+        """(estabelecimento_id, telefone) -> sessão da última mensagem recebida do cliente"""
+        pares = set(pares)
+        if not pares:
+            return {}
+        rows = db.execute(ULTIMA_CONVERSA_SQL, {
+            "estabelecimentos": sorted({estabelecimento_id for estabelecimento_id, _ in pares}),
+            "telefones": sorted({telefone for _, telefone in pares}),
+            "desde": get_brazil_now() - timedelta(days=DIAS_CONVERSA),
+        }).all()
+        return {
+            (row.estabelecimento_id, row.from_number): row.session_name
+            for row in rows
+            if (row.estabelecimento_id, row.from_number) in pares
+        }
+
+    @staticmethod
+    def saudavel(sessao: SessaoWAHA, status_sessao: Optional[str] = None) -> bool:
+        """Circuito não aberto e sessão WORKING (ou status ainda desconhecido)"""
+        if WAHACircuito.estado(sessao.waha_url) == ABERTO:
+            return False
+        if status_sessao is None:
+            cache = WAHASessaoCache.obter(sessao.waha_url, sessao.session_name)
+            status_sessao = cache["status"] if cache else None
+        return status_sessao in (None, "WORKING")
+
+    @staticmethod
+    def ordenar(
+        pool: Sequence[SessaoWAHA],
+        telefone: str,
+        sessao_conversa: Optional[str] = None
+    ) -> List[SessaoWAHA]:
+        """
+        Ordem de preferência das sessões para o telefone: a da conversa, depois
+        rendezvous hashing; sessões não saudáveis vão para o fim.
+        """
+        if len(pool) == 1:
+            return list(pool)
+        ordem = sorted(pool, key=lambda sessao: _peso(telefone, sessao), reverse=True)
+        if sessao_conversa:
+            ordem.sort(key=lambda sessao: sessao.session_name != sessao_conversa)
+        saudaveis = [sessao for sessao in ordem if WhatsAppSessoesService.saudavel(sessao)]
+        return saudaveis + [sessao for sessao in ordem if sessao not in saudaveis]
+
+    # ==================== Cadastro ====================
+
+    @staticmethod
+    def listar(db: Session, estabelecimento_id: int) -> List[WhatsAppSessao]:
+        return db.query(WhatsAppSessao).filter(
+            WhatsAppSessao.estabelecimento_id == estabelecimento_id
+        ).order_by(WhatsAppSessao.id).all()
+
+    @staticmethod
+    def obter(db: Session, estabelecimento_id: int, sessao_id: int) -> WhatsAppSessao:
+        sessao = db.query(WhatsAppSessao).filter(
+            WhatsAppSessao.id == sessao_id,
+            WhatsAppSessao.estabelecimento_id == estabelecimento_id
+        ).first()
+        if not sessao:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Sessão WAHA não encontrada"
+            )
+        return sessao
+
+    @staticmethod
+    def criar(db: Session, estabelecimento_id: int, dados: Dict) -> WhatsAppSessao:
+        if not db.query(WhatsAppConfig.id).filter(WhatsAppConfig.estabelecimento_id == estabelecimento_id).first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Configure o WhatsApp antes de adicionar sessões"
+            )
+
+        session_name = dados['waha_session_name']
+        em_uso = db.query(WhatsAppConfig.id).filter(WhatsAppConfig.waha_session_name == session_name).first() \
+            or db.query(WhatsAppSessao.id).filter(WhatsAppSessao.waha_session_name == session_name).first()
+        if em_uso:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Sessão '{session_name}' já está em uso"
+            )
+
+        sessao = WhatsAppSessao(estabelecimento_id=estabelecimento_id, **dados)
+        db.add(sessao)
+        db.commit()
+        db.refresh(sessao)
+        WhatsAppConfigCache.invalidar(estabelecimento_id, session_name)
+        return sessao
+
+    @staticmethod
+    def atualizar(db: Session, estabelecimento_id: int, sessao_id: int, dados: Dict) -> WhatsAppSessao:
+        sessao = WhatsAppSessoesService.obter(db, estabelecimento_id, sessao_id)
+        for campo, valor in dados.items():
+            setattr(sessao, campo, valor)
+        db.commit()
+        db.refresh(sessao)
+        WAHASessaoCache.invalidar(sessao.waha_url, sessao.waha_session_name)
+        return sessao
+
+    @staticmethod
+    def remover(db: Session, estabelecimento_id: int, sessao_id: int) -> None:
+        sessao = WhatsAppSessoesService.obter(db, estabelecimento_id, sessao_id)
+        session_name = sessao.waha_session_name
+        db.delete(sessao)
+        db.commit()
+        WhatsAppConfigCache.invalidar(estabelecimento_id, session_name)
+
+    @staticmethod
+    def url_da_sessao(db: Session, config, session_name: str) -> str:
+        """waha_url da sessão (principal ou adicional) do estabelecimento"""
+        if session_name == config.waha_session_name:
+            return config.waha_url
+        waha_url = db.query(WhatsAppSessao.waha_url).filter(
+            WhatsAppSessao.waha_session_name == session_name
+        ).scalar()
+        return waha_url or config.waha_url
@@ -71,6 +71,20 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_current_active_user_detached(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> User:
+    """
+    Get current active user and return the request's DB connection to the pool.
+
+    For routes that wait on external integrations (bulkheads): the connection
+    is not held while WAHA is slow. The user comes back detached.
+    """
+    db.close()
+    return current_user
+
+
 async def get_current_verified_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
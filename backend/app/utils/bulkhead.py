@@ -0,0 +1,183 @@
+"""
+Bulkheads: executores dedicados e limitados para I/O de integrações externas.
+
+Rotas síncronas rodam no threadpool compartilhado do Starlette (40 threads);
+com o WAHA lento, poucas chamadas de envio prendiam as threads por até 120s e
+rotas sem relação (fidelidade, keepalive) ficavam esperando thread livre.
+
+As rotas de integração são `async` e entregam o trabalho a um Bulkhead:
+- no máximo `workers` chamadas executando e `fila` aguardando; acima disso a
+  chamada é recusada na hora (503 com Retry-After) em vez de enfileirar;
+- cada chamada tem um prazo (inclui o tempo na fila): estourado, a rota
+  responde 504 (ou 202 quando o trabalho pode continuar em segundo plano,
+  como nos crons). Chamadas que ainda estavam na fila são descartadas.
+
+O trabalho roda em outra thread e pode sobreviver ao request: use uma sessão
+de banco própria (app.database.executar_com_sessao), não a do request.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BulkheadCheio(Exception):
+    """Bulkhead sem vaga (execução + fila)"""
+
+
+class Bulkhead:
+    _todos: List["Bulkhead"] = []
+
+    def __init__(
+        self,
+        nome: str,
+        workers: int,
+        fila: int,
+        prazo: Optional[float] = None,
+        descartar_na_parada: bool = True
+    ):
+        self.nome = nome
+        self.workers = max(1, workers)
+        self.fila = max(0, fila)
+        self.prazo = prazo
+        self.descartar_na_parada = descartar_na_parada
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"bulkhead-{nome}")
+        self._vagas = threading.BoundedSemaphore(self.workers + self.fila)
+        self._lock = threading.Lock()
+        self._executando = 0
+        self._ocupadas = 0
+        self._totais = {"aceitas": 0, "recusadas": 0, "expiradas": 0, "concluidas": 0, "falhas": 0}
+        Bulkhead._todos.append(self)
+
+    def _liberar(self, future: Future) -> None:
+        with self._lock:
+            self._ocupadas -= 1
+            if not future.cancelled():
+                self._totais["falhas" if future.exception() is not None else "concluidas"] += 1
+        self._vagas.release()
+
+    def _rodar(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self._executando += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._executando -= 1
+
+    def submeter(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Agenda fn(*args, **kwargs) no executor; BulkheadCheio se não há vaga"""
+        if not self._vagas.acquire(blocking=False):
+            with self._lock:
+                self._totais["recusadas"] += 1
+            raise BulkheadCheio(self.nome)
+        with self._lock:
+            self._ocupadas += 1
+            self._totais["aceitas"] += 1
+        future = self._executor.submit(self._rodar, fn, args, kwargs)
+        future.add_done_callback(self._liberar)
+        return future
+
+    async def executar(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        prazo: Optional[float] = None,
+        ao_expirar: Optional[Callable[[], Any]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Executa fn no bulkhead sem ocupar o event loop nem o threadpool do
+        Starlette. Sem vaga: 503. Prazo estourado: 504, ou o retorno de
+        `ao_expirar` (o trabalho continua em segundo plano).
+        """
+        try:
+            future = self.submeter(fn, *args, **kwargs)
+        except BulkheadCheio:
+            logger.warning(f"[BULKHEAD] {self.nome} cheio ({self.workers} executando, {self.fila} na fila)")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Integração WhatsApp sobrecarregada. Tente novamente em instantes.",
+                headers={"Retry-After": str(max(1, int(self.prazo or 1)))}
+            )
+
+        resultado = asyncio.wrap_future(future)
+        try:
+            if ao_expirar is not None:
+                # shield: o timeout não cancela o trabalho, que segue em segundo plano
+                return await asyncio.wait_for(asyncio.shield(resultado), timeout=prazo or self.prazo)
+            return await asyncio.wait_for(resultado, timeout=prazo or self.prazo)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._totais["expiradas"] += 1
+            logger.warning(f"[BULKHEAD] {self.nome}: prazo de {prazo or self.prazo}s excedido")
+            if ao_expirar is not None:
+                return ao_expirar()
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="O servidor WhatsApp não respondeu a tempo"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "fila_max": self.fila,
+                "prazo": self.prazo,
+                "executando": self._executando,
+                "na_fila": self._ocupadas - self._executando,
+                **self._totais,
+            }
+
+    def encerrar(self) -> None:
+        """Espera as execuções em andamento (e a fila, se não for descartável)"""
+        self._executor.shutdown(wait=True, cancel_futures=self.descartar_na_parada)
+
+    @staticmethod
+    def stats_todos() -> Dict[str, Dict[str, Any]]:
+        return {bulkhead.nome: bulkhead.stats() for bulkhead in Bulkhead._todos}
+
+    @staticmethod
+    def encerrar_todos() -> None:
+        for bulkhead in Bulkhead._todos:
+            bulkhead.encerrar()
+
+
+# Chamadas interativas ao WAHA (envio manual, teste, sessão, QR code, status)
+WAHA = Bulkhead(
+    "waha",
+    workers=settings.bulkhead_waha_workers,
+    fila=settings.bulkhead_waha_fila,
+    prazo=settings.bulkhead_waha_prazo
+)
+
+# Rotinas em lote disparadas por cron (reciclagem, lembretes, aniversários)
+ROTINAS_WHATSAPP = Bulkhead(
+    "rotinas_whatsapp",
+    workers=settings.bulkhead_rotinas_workers,
+    fila=settings.bulkhead_rotinas_fila,
+    prazo=settings.bulkhead_rotinas_prazo
+)
+
+# Efeitos após o commit (eventos de domínio: notificações de agendamento).
+# Sem prazo (ninguém espera a resposta); na parada, a fila é processada.
+NOTIFICACOES = Bulkhead(
+    "notificacoes",
+    workers=settings.bulkhead_notificacoes_workers,
+    fila=settings.bulkhead_notificacoes_fila,
+    descartar_na_parada=False
+)
+
+# Recálculos de pontos de fidelidade em segundo plano (lotes longos no banco)
+RECALCULO_FIDELIDADE = Bulkhead(
+    "recalculo_fidelidade",
+    workers=settings.bulkhead_recalculo_workers,
+    fila=settings.bulkhead_recalculo_fila
+)
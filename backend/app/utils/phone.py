@@ -0,0 +1,17 @@
+"""
+Utilitários para normalização de telefones
+"""
+import re
+from typing import Optional
+
+_NAO_DIGITOS = re.compile(r"\D")
+
+
+def normalize_phone(telefone: Optional[str]) -> str:
+    """
+    Retorna apenas os dígitos do telefone.
+    Exemplo: (11) 9 9999-9999 -> 11999999999
+    """
+    if not telefone:
+        return ""
+    return _NAO_DIGITOS.sub("", telefone)
@@ -0,0 +1,110 @@
+"""
+Templates de mensagens WhatsApp com placeholders ({nome_cliente}, {data}, ...)
+
+O template é compilado uma vez em segmentos (texto fixo e placeholders) e
+guardado em cache pelo texto; a renderização só preenche os placeholders e
+faz um join. Quebras de linha do template são preservadas.
+"""
+import re
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+# Todos os placeholders são opcionais: ausentes ou None viram texto vazio
+PLACEHOLDERS_DISPONIVEIS = frozenset({
+    'nome_cliente',
+    'telefone_cliente',
+    'email_cliente',
+    'nome_empresa',
+    'endereco',
+    'data',
+    'hora',
+    'hora_fim',
+    'servico',
+    'vendedor',
+    'valor',
+    'status',
+    'veiculo',
+    'meses_inativo',
+    'data_ultimo_servico',
+    'link_agendamento',
+})
+
+# Campos de template da WhatsAppConfig
+CAMPOS_TEMPLATE = (
+    'template_agendamento',
+    'template_lembrete',
+    'template_conclusao',
+    'template_cancelamento',
+    'template_reciclagem',
+    'template_aniversario',
+    'template_pos_atendimento',
+)
+
+_PLACEHOLDER = re.compile(r'\{([^{}]+)\}')
+
+# Limite do cache (templates distintos em uso); ao estourar o cache é limpo
+MAX_TEMPLATES_CACHE = 2048
+
+
+class TemplateCompilado:
+    """Template dividido em segmentos; placeholders ocupam posições fixas da lista"""
+
+    __slots__ = ('partes', 'posicoes', 'placeholders')
+
+    def __init__(self, partes: List[str], posicoes: Tuple[Tuple[int, str], ...]):
+        self.partes = partes
+        self.posicoes = posicoes
+        self.placeholders = frozenset(nome for _, nome in posicoes)
+
+    def render(self, valores: Mapping[str, Any]) -> str:
+        partes = self.partes.copy()
+        for indice, nome in self.posicoes:
+            valor = valores.get(nome)
+            partes[indice] = '' if valor is None else str(valor)
+        return ''.join(partes).strip()
+
+
+_cache: Dict[str, TemplateCompilado] = {}
+
+
+def compilar(template: str) -> TemplateCompilado:
+    """Divide o template em texto fixo e placeholders"""
+    partes: List[str] = []
+    posicoes: List[Tuple[int, str]] = []
+    inicio = 0
+    for match in _PLACEHOLDER.finditer(template):
+        if match.start() > inicio:
+            partes.append(template[inicio:match.start()])
+        posicoes.append((len(partes), match.group(1).strip()))
+        partes.append('')
+        inicio = match.end()
+    if inicio < len(template):
+        partes.append(template[inicio:])
+    return TemplateCompilado(partes, tuple(posicoes))
+
+
+def get_compilado(template: str) -> TemplateCompilado:
+    """Template compilado do cache (compila na primeira vez)"""
+    compilado = _cache.get(template)
+    if compilado is None:
+        if len(_cache) >= MAX_TEMPLATES_CACHE:
+            _cache.clear()
+        compilado = _cache[template] = compilar(template)
+    return compilado
+
+
+def render(template: str, valores: Mapping[str, Any]) -> str:
+    """Substitui os placeholders do template pelos valores"""
+    return get_compilado(template).render(valores)
+
+
+def invalidar(template: Optional[str]) -> None:
+    """Remove um template do cache (template substituído na configuração)"""
+    if template:
+        _cache.pop(template, None)
+
+
+def placeholders_desconhecidos(template: Optional[str]) -> List[str]:
+    """Placeholders do template que não existem em PLACEHOLDERS_DISPONIVEIS"""
+    if not template:
+        return []
+    return sorted(get_compilado(template).placeholders - PLACEHOLDERS_DISPONIVEIS)
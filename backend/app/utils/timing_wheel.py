@@ -0,0 +1,125 @@
+"""
+Timing wheel hierárquico (Varghese & Lauck) para disparos em horário exato.
+
+Cada nível é um anel de slots; o nível 0 avança um slot por tick
+(`resolucao` segundos) e cada nível acima cobre uma volta inteira do nível
+de baixo. Inserir e cancelar são O(1) (o item vai direto para o slot e a
+chave aponta para ele); ao virar um slot de nível alto, os itens dele descem
+para os níveis de baixo (cascata). Itens além do alcance da roda não são
+aceitos: quem usa carrega só o próximo horizonte.
+
+Não é thread-safe: quem usa serializa o acesso.
+"""
+import math
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+
+class RodaTemporal:
+    def __init__(self, agora: float, resolucao: float = 1.0, niveis: Sequence[int] = (60, 60, 24)):
+        self.resolucao = resolucao
+        self.tamanhos = list(niveis)
+        # Ticks por slot em cada nível e ticks por volta completa de cada nível
+        self.unidades: List[int] = []
+        self.voltas: List[int] = []
+        unidade = 1
+        for tamanho in self.tamanhos:
+            self.unidades.append(unidade)
+            unidade *= tamanho
+            self.voltas.append(unidade)
+
+        self.atual = self._tick(agora)
+        self.slots: List[List[Dict[Hashable, int]]] = [[{} for _ in range(t)] for t in self.tamanhos]
+        self.vencidos: Dict[Hashable, int] = {}
+        self.posicoes: Dict[Hashable, Optional[Tuple[int, int]]] = {}  # chave -> (nível, slot); None = vencido
+
+    def _tick(self, momento: float) -> int:
+        return math.floor(momento / self.resolucao)
+
+    @property
+    def alcance(self) -> float:
+        """Último instante (epoch) aceito pela roda"""
+        unidade = self.unidades[-1]
+        return ((self.atual // unidade + self.tamanhos[-1]) * unidade - 1) * self.resolucao
+
+    def __len__(self) -> int:
+        return len(self.posicoes)
+
+    def __contains__(self, chave: Hashable) -> bool:
+        return chave in self.posicoes
+
+    def _colocar(self, chave: Hashable, tick: int) -> bool:
+        if tick <= self.atual:
+            self.vencidos[chave] = tick
+            self.posicoes[chave] = None
+            return True
+        # Menor nível em que o tick está a menos de uma volta de slots do atual.
+        # Uma volta inteira cairia no slot do tick atual, que dispara (ou desce)
+        # agora mesmo: o item sairia uma volta adiantado.
+        for nivel, unidade in enumerate(self.unidades):
+            if tick // unidade - self.atual // unidade < self.tamanhos[nivel]:
+                slot = (tick // unidade) % self.tamanhos[nivel]
+                self.slots[nivel][slot][chave] = tick
+                self.posicoes[chave] = (nivel, slot)
+                return True
+        return False
+
+    def adicionar(self, chave: Hashable, prazo: float) -> bool:
+        """Agenda (ou reagenda) a chave para o instante `prazo` (epoch). False se além do alcance"""
+        self.remover(chave)
+        return self._colocar(chave, math.ceil(prazo / self.resolucao))
+
+    def remover(self, chave: Hashable) -> bool:
+        posicao = self.posicoes.pop(chave, False)
+        if posicao is False:
+            return False
+        if posicao is None:
+            del self.vencidos[chave]
+        else:
+            del self.slots[posicao[0]][posicao[1]][chave]
+        return True
+
+    def avancar(self, agora: float) -> List[Hashable]:
+        """Avança até `agora` e retorna as chaves vencidas (em ordem de prazo)"""
+        alvo = self._tick(agora)
+        disparadas = sorted(self.vencidos, key=self.vencidos.get)
+        self.vencidos.clear()
+
+        if alvo - self.atual > self.voltas[-1]:
+            # Salto maior que a roda (processo parado): varre tudo de uma vez
+            restantes = []
+            for nivel in self.slots:
+                for slot in nivel:
+                    restantes.extend(slot.items())
+                    slot.clear()
+            self.atual = alvo
+            restantes.sort(key=lambda item: item[1])
+            for chave, tick in restantes:
+                if tick <= alvo:
+                    disparadas.append(chave)
+                    del self.posicoes[chave]
+                else:
+                    self._colocar(chave, tick)
+            for chave in disparadas:
+                self.posicoes.pop(chave, None)
+            return disparadas
+
+        while self.atual < alvo:
+            self.atual += 1
+            # Cascata: slots de níveis altos que começam neste tick descem
+            for nivel in range(len(self.tamanhos) - 1, 0, -1):
+                if self.atual % self.unidades[nivel] == 0:
+                    slot = self.slots[nivel][(self.atual // self.unidades[nivel]) % self.tamanhos[nivel]]
+                    itens = list(slot.items())
+                    slot.clear()
+                    for chave, tick in itens:
+                        self._colocar(chave, tick)
+            slot = self.slots[0][self.atual % self.tamanhos[0]]
+            disparadas.extend(slot)
+            slot.clear()
+            # Itens que a cascata deste tick mandou direto para vencidos
+            disparadas.extend(self.vencidos)
+            self.vencidos.clear()
+
+        for chave in disparadas:
+            self.posicoes.pop(chave, None)
+        return disparadas
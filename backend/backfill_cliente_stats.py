@@ -0,0 +1,36 @@
+"""
+Recalcula as estatísticas desnormalizadas dos clientes
+(last_visit, total_visitas, total_gasto, total_faltas, ultimo_servico_id)
+a partir do histórico de agendamentos.
+
+Uso:
+    python backfill_cliente_stats.py                       # todos os clientes
+    python backfill_cliente_stats.py --estabelecimento-id 3
+"""
+import argparse
+import logging
+import time
+
+from app.database import SessionLocal
+from app.services.cliente_stats_service import ClienteStatsService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill das estatísticas de clientes")
+    parser.add_argument("--estabelecimento-id", type=int, default=None)
+    parser.add_argument("--lote", type=int, default=5000, help="Clientes por transação")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    db = SessionLocal()
+    try:
+        inicio = time.perf_counter()
+        total = ClienteStatsService.backfill(db, estabelecimento_id=args.estabelecimento_id, lote=args.lote)
+        print(f"{total} clientes recalculados em {time.perf_counter() - inicio:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
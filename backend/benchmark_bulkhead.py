@@ -0,0 +1,132 @@
+"""
+Benchmark de isolamento das rotas de integração WAHA (bulkheads).
+
+Trava o WAHA falso (fake_waha_server.py) com uma latência alta e dispara,
+contra um backend em execução, várias chamadas simultâneas a uma rota que
+fala com o WAHA. Ao mesmo tempo mede a latência de rotas sem relação
+(keepalive, fidelidade), antes e durante o travamento. Com os bulkheads, as
+rotas de controle mantêm a latência e o excedente de chamadas ao WAHA
+recebe 503 na hora (ou 504 no prazo) em vez de ocupar o threadpool.
+
+Uso:
+    # Terminal 1
+    python fake_waha_server.py --port 3001
+
+    # Terminal 2 (a configuração WhatsApp do usuário aponta para o WAHA falso)
+    uvicorn main:app --port 8000
+
+    # Terminal 3
+    python benchmark_bulkhead.py --backend-url http://localhost:8000 \
+        --fake-waha-url http://localhost:3001 --usuario admin --senha ... \
+        --travamento-ms 60000 --chamadas-waha 80
+"""
+import argparse
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def medir_controle(http, urls, headers, duracao):
+    """Chama as rotas de controle em sequência por `duracao` segundos"""
+    latencias = []
+    erros = 0
+    fim = time.perf_counter() + duracao
+    while time.perf_counter() < fim:
+        for url in urls:
+            inicio = time.perf_counter()
+            try:
+                resposta = http.get(url, headers=headers, timeout=30)
+                if resposta.status_code >= 500:
+                    erros += 1
+            except requests.RequestException:
+                erros += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias, erros
+
+
+def resumo(nome, latencias, erros):
+    if not latencias:
+        print(f"{nome}: sem amostras")
+        return
+    print(
+        f"{nome}: {len(latencias)} req, p50 {percentil(latencias, 50):.1f}ms, "
+        f"p95 {percentil(latencias, 95):.1f}ms, max {max(latencias):.1f}ms, "
+        f"média {statistics.mean(latencias):.1f}ms, erros {erros}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de isolamento das rotas WAHA")
+    parser.add_argument("--backend-url", default="http://localhost:8000")
+    parser.add_argument("--fake-waha-url", default="http://localhost:3001")
+    parser.add_argument("--token", help="Bearer token (alternativa a --usuario/--senha)")
+    parser.add_argument("--usuario")
+    parser.add_argument("--senha")
+    parser.add_argument("--rota-waha", default="/waha/sessions")
+    parser.add_argument("--travamento-ms", type=float, default=60000)
+    parser.add_argument("--chamadas-waha", type=int, default=80)
+    parser.add_argument("--duracao", type=float, default=10)
+    args = parser.parse_args()
+
+    backend = args.backend_url.rstrip('/')
+    fake = args.fake_waha_url.rstrip('/')
+    http = requests.Session()
+    http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.chamadas_waha + 4))
+
+    token = args.token
+    if not token:
+        login = http.post(f"{backend}/auth/login", json={"username": args.usuario, "password": args.senha}, timeout=30)
+        login.raise_for_status()
+        token = login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    controle = [f"{backend}/keepalive/health", f"{backend}/fidelidade/configuracao"]
+
+    print("Linha de base (WAHA normal)...")
+    resumo("Controle", *medir_controle(http, controle, headers, args.duracao))
+
+    http.post(f"{fake}/fake/config", json={"latency_ms": args.travamento_ms}, timeout=10)
+    print(f"\nWAHA travado ({args.travamento_ms:.0f}ms) com {args.chamadas_waha} chamadas a {args.rota_waha}...")
+
+    codigos = Counter()
+    latencias_waha = []
+    lock = threading.Lock()
+
+    def chamar_waha():
+        inicio = time.perf_counter()
+        try:
+            codigo = http.get(f"{backend}{args.rota_waha}", headers=headers, timeout=180).status_code
+        except requests.RequestException as e:
+            codigo = type(e).__name__
+        with lock:
+            codigos[codigo] += 1
+            latencias_waha.append((time.perf_counter() - inicio) * 1000)
+
+    executor = ThreadPoolExecutor(max_workers=args.chamadas_waha)
+    try:
+        for _ in range(args.chamadas_waha):
+            executor.submit(chamar_waha)
+        time.sleep(0.5)  # deixa as chamadas ao WAHA ocuparem o backend
+        resumo("Controle", *medir_controle(http, controle, headers, args.duracao))
+    finally:
+        http.post(f"{fake}/fake/config", json={"latency_ms": 0}, timeout=10)
+        executor.shutdown(wait=True)
+
+    resumo(f"Chamadas WAHA {dict(codigos)}", latencias_waha, 0)
+    status = http.get(f"{backend}/keepalive/status", timeout=30).json()
+    print(f"\nBulkheads: {status['whatsapp'].get('bulkheads')}")
+
+
+if __name__ == "__main__":
+    main()
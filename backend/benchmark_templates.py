@@ -0,0 +1,92 @@
+"""
+Benchmark de renderização dos templates de mensagem WhatsApp.
+
+Compara o renderizador compilado (app/utils/template.py) com a substituição
+antiga (str.replace por placeholder + duas passadas de regex) e falha se o
+compilado ficar abaixo da meta de mensagens por segundo.
+
+Uso:
+    python benchmark_templates.py --mensagens 200000 --meta 100000
+"""
+import argparse
+import re
+import sys
+import time
+
+from app.utils import template as message_template
+
+TEMPLATE_PADRAO = (
+    "Olá {nome_cliente}! 👋\n"
+    "Seu agendamento de {servico} com {vendedor} está confirmado para "
+    "{data} às {hora} (até {hora_fim}).\n"
+    "Valor: {valor}\n\n"
+    "📍 {endereco}\n"
+    "{nome_empresa}"
+)
+
+
+def substituicao_antiga(template, data):
+    """Implementação anterior de WhatsAppService._replace_placeholders"""
+    message = template
+    for key, value in data.items():
+        safe_value = str(value) if value is not None else ""
+        message = message.replace(f"{{{key}}}", safe_value)
+    message = re.sub(r'\{[^}]+\}', '', message)
+    return re.sub(r'\s+', ' ', message).strip()
+
+
+def gerar_valores(quantidade):
+    return [
+        {
+            'nome_cliente': f"Cliente {i}",
+            'telefone_cliente': f"(11) 9{i:08d}",
+            'email_cliente': f"cliente{i}@exemplo.com",
+            'nome_empresa': "Barbearia Moderna",
+            'endereco': "Rua das Flores, 123",
+            'data': "20/10/2026",
+            'hora': f"{8 + i % 10:02d}:00",
+            'hora_fim': f"{9 + i % 10:02d}:00",
+            'servico': "Corte",
+            'vendedor': "Carlos",
+            'valor': "R$ 50.00",
+            'status': "AGENDADO",
+            'veiculo': None,
+        }
+        for i in range(quantidade)
+    ]
+
+
+def medir(nome, funcao, template, valores):
+    inicio = time.perf_counter()
+    for dados in valores:
+        funcao(template, dados)
+    duracao = time.perf_counter() - inicio
+    taxa = len(valores) / duracao
+    print(f"{nome:<12} {duracao:.3f}s | {taxa:,.0f} msg/s | {duracao / len(valores) * 1e6:.2f} µs/msg")
+    return taxa
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de templates WhatsApp")
+    parser.add_argument("--mensagens", type=int, default=200000)
+    parser.add_argument("--meta", type=int, default=100000, help="Mínimo de msg/s do renderizador compilado")
+    parser.add_argument("--sem-antigo", action="store_true", help="Não medir a implementação antiga")
+    args = parser.parse_args()
+
+    valores = gerar_valores(args.mensagens)
+
+    print("=" * 60)
+    print(f"Mensagens: {args.mensagens} | Placeholders no template: "
+          f"{len(message_template.get_compilado(TEMPLATE_PADRAO).posicoes)}")
+    if not args.sem_antigo:
+        medir("antigo", substituicao_antiga, TEMPLATE_PADRAO, valores)
+    taxa = medir("compilado", message_template.render, TEMPLATE_PADRAO, valores)
+    print("=" * 60)
+
+    if taxa < args.meta:
+        print(f"Abaixo da meta: {taxa:,.0f} < {args.meta:,} msg/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark de envio via WAHAService contra o servidor WAHA falso.
+
+Mede throughput e latência (p50/p95/p99) de WAHAService.send_text_message,
+incluindo o efeito de cold start e de erros injetados.
+
+Uso:
+    # Terminal 1
+    python fake_waha_server.py --port 3001 --latency-ms 100 --error-rate 0.02 --session default
+
+    # Terminal 2
+    python benchmark_waha_send.py --waha-url http://127.0.0.1:3001 --mensagens 500 --concorrencia 8
+"""
+import argparse
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from app.services.waha_service import WAHAService
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de envio WAHA")
+    parser.add_argument("--waha-url", default="http://127.0.0.1:3001")
+    parser.add_argument("--api-key", default="fake-waha-key")
+    parser.add_argument("--session", default="default")
+    parser.add_argument("--mensagens", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=1)
+    parser.add_argument("--timeout", type=int, default=120)
+    args = parser.parse_args()
+
+    # Os logs detalhados do WAHAService distorcem a medição
+    logging.disable(logging.CRITICAL)
+
+    def enviar(i):
+        inicio = time.perf_counter()
+        try:
+            WAHAService._make_request(
+                "POST",
+                f"{args.waha_url.rstrip('/')}/api/sendText",
+                args.api_key,
+                {"session": args.session, "chatId": f"55119{i:08d}@s.whatsapp.net", "text": f"Benchmark {i}"},
+                timeout=args.timeout
+            )
+            return True, time.perf_counter() - inicio
+        except HTTPException:
+            return False, time.perf_counter() - inicio
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        resultados = list(executor.map(enviar, range(args.mensagens)))
+    duracao = time.perf_counter() - inicio_total
+
+    latencias = [lat * 1000 for ok, lat in resultados if ok]
+    falhas = sum(1 for ok, _ in resultados if not ok)
+
+    print("=" * 60)
+    print(f"Mensagens: {args.mensagens} | Concorrência: {args.concorrencia}")
+    print(f"Duração total: {duracao:.2f}s | Throughput: {args.mensagens / duracao:.1f} msg/s")
+    print(f"Sucesso: {len(latencias)} | Falhas: {falhas}")
+    if latencias:
+        print(
+            f"Latência (ms): média={statistics.mean(latencias):.1f} "
+            f"p50={percentil(latencias, 50):.1f} p95={percentil(latencias, 95):.1f} "
+            f"p99={percentil(latencias, 99):.1f} max={max(latencias):.1f}"
+        )
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
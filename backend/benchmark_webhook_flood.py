@@ -0,0 +1,131 @@
+"""
+Benchmark de ingestão do webhook WAHA (rajada de mensagens e acks).
+
+Dispara, contra um backend em execução, um message.any por mensagem seguido
+dos acks (server, delivery, read) em ordem embaralhada, como numa campanha
+em massa. Mede o throughput das requisições e o tempo até todas as linhas
+estarem gravadas com o ack final em whatsapp_messages.
+
+Uso:
+    # Terminal 1 (DATABASE_URL apontando para um banco de testes)
+    uvicorn main:app --port 8000
+
+    # Terminal 2 (mesmo DATABASE_URL; a sessão precisa existir em whatsapp_configs)
+    python benchmark_webhook_flood.py --backend-url http://localhost:8000 --session default \
+        --mensagens 2000 --concorrencia 32
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def gerar_eventos(session, prefixo, mensagens):
+    eventos = []
+    agora_ms = int(time.time() * 1000)
+    for i in range(mensagens):
+        message_id = f"{prefixo}_{i}"
+        eventos.append({
+            "event": "message.any",
+            "session": session,
+            "payload": {
+                "id": message_id,
+                "timestamp": agora_ms,
+                "from": "5511900000000@c.us",
+                "to": f"55119{i:08d}@c.us",
+                "fromMe": True,
+                "body": f"Campanha {i}",
+                "hasMedia": False,
+            },
+        })
+        for ack in (2, 3, 4):
+            eventos.append({
+                "event": "message.ack",
+                "session": session,
+                "payload": {"id": message_id, "ack": ack, "fromMe": True},
+            })
+    # Acks podem chegar antes da mensagem e fora de ordem
+    random.shuffle(eventos)
+    return eventos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão do webhook WAHA")
+    parser.add_argument("--backend-url", default="http://localhost:8000")
+    parser.add_argument("--session", default="default")
+    parser.add_argument("--mensagens", type=int, default=1000)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--timeout-gravacao", type=float, default=120)
+    args = parser.parse_args()
+
+    prefixo = f"flood_{uuid.uuid4().hex[:8]}"
+    eventos = gerar_eventos(args.session, prefixo, args.mensagens)
+    url = f"{args.backend_url.rstrip('/')}/waha-webhook/events/{args.session}"
+    http = requests.Session()
+    http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concorrencia))
+
+    def enviar(evento):
+        inicio = time.perf_counter()
+        try:
+            response = http.post(url, json=evento, timeout=30)
+            ok = response.status_code == 200 and response.json().get("status") in ("queued", "received")
+        except requests.RequestException:
+            ok = False
+        return ok, time.perf_counter() - inicio
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        resultados = list(executor.map(enviar, eventos))
+    duracao_http = time.perf_counter() - inicio_total
+
+    # Espera a gravação: todas as mensagens com conteúdo e ack final
+    db = SessionLocal()
+    try:
+        gravadas = 0
+        while time.perf_counter() - inicio_total < args.timeout_gravacao:
+            gravadas = db.execute(text("""
+                SELECT count(*) FROM whatsapp_messages
+                WHERE message_id LIKE :prefixo AND ack_status = 'read' AND event_type = 'message.any'
+            """), {"prefixo": f"{prefixo}_%"}).scalar()
+            db.commit()
+            if gravadas >= args.mensagens:
+                break
+            time.sleep(0.05)
+        duracao_total = time.perf_counter() - inicio_total
+    finally:
+        db.close()
+
+    latencias = [lat * 1000 for ok, lat in resultados if ok]
+    falhas = sum(1 for ok, _ in resultados if not ok)
+
+    print("=" * 60)
+    print(f"Eventos: {len(eventos)} ({args.mensagens} mensagens x 4) | Concorrência: {args.concorrencia}")
+    print(f"Requisições: {duracao_http:.2f}s | {len(eventos) / duracao_http:.1f} eventos/s | Falhas: {falhas}")
+    if latencias:
+        print(
+            f"Latência (ms): média={statistics.mean(latencias):.1f} "
+            f"p50={percentil(latencias, 50):.1f} p95={percentil(latencias, 95):.1f} "
+            f"p99={percentil(latencias, 99):.1f} max={max(latencias):.1f}"
+        )
+    print(f"Gravadas com ack final: {gravadas}/{args.mensagens} em {duracao_total:.2f}s "
+          f"({len(eventos) / duracao_total:.1f} eventos/s ponta a ponta)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
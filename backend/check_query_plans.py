@@ -0,0 +1,519 @@
+"""
+Regressão de planos de execução das queries dos services.
+
+Executa os métodos de consulta dos *Service contra um banco populado com
+dados sintéticos, captura o SQL gerado pelo SQLAlchemy e roda
+`EXPLAIN (FORMAT JSON)` em cada statement. Para cada caso:
+
+1. Valida o formato esperado do plano (índices que devem aparecer e
+   tabelas grandes que NÃO podem sofrer Seq Scan);
+2. Compara o formato do plano com o snapshot salvo em `query_plans/`,
+   para que mudanças de plano apareçam no review.
+
+Tudo roda dentro de uma transação que sofre ROLLBACK no final: os dados
+sintéticos nunca são gravados. Mesmo assim, use um banco de desenvolvimento
+migrado com `alembic upgrade head` (o script não usa DATABASE_URL para não
+rodar contra produção por engano). Os snapshots foram gerados no PostgreSQL
+18 com pg_trgm e btree_gin; outra versão pode escolher planos diferentes.
+
+Uso:
+    export QUERY_PLAN_DATABASE_URL=postgresql://localhost/agenda_dev
+    python check_query_plans.py                 # valida e compara snapshots
+    python check_query_plans.py --update        # regrava snapshots
+    python check_query_plans.py --caso clientes_busca --verbose
+
+Casos marcados com `pendente` documentam problemas conhecidos: são
+reportados, mas não fazem o script falhar (a comparação com o snapshot
+continua valendo para eles).
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from app.models import WhatsAppConfig
+from app.services.agendamento_service import AgendamentoService
+from app.services.cliente_service import ClienteService
+from app.services.fidelidade_service import FidelidadeService
+from app.services.relatorio_service import RelatorioService
+from app.services.whatsapp_service import WhatsAppService
+
+SNAPSHOT_DIR = Path(__file__).parent / "query_plans"
+
+# Estabelecimento usado nas consultas (os demais existem para dar seletividade)
+ESTABELECIMENTO_ALVO = 1
+
+# Tenant comum (poucas dezenas de clientes), para consultas em que o alvo
+# devolve metade da tabela e o Seq Scan é o plano correto
+ESTABELECIMENTO_PEQUENO = 2
+
+# Casos com N+1 são interrompidos após este número de SELECTs
+LIMITE_STATEMENTS = 200
+
+
+# ==================== Dados sintéticos ====================
+
+SEED_SQL = [
+    """
+    INSERT INTO empresas (nome, cnpj, email, is_active)
+    VALUES ('Empresa Plano', substr(md5(random()::text), 1, 18), 'plano@exemplo.com', true)
+    """,
+    """
+    INSERT INTO estabelecimentos (nome, endereco, cidade, estado, cep, is_active, empresa_id)
+    SELECT 'Estab ' || g, 'Rua ' || g, 'São Paulo', 'SP', '01000-000', true,
+           (SELECT max(id) FROM empresas)
+    FROM generate_series(1, :estabelecimentos) g
+    """,
+    """
+    CREATE TEMP TABLE plano_estabs ON COMMIT DROP AS
+    SELECT id, row_number() OVER (ORDER BY id) AS n
+    FROM (SELECT id FROM estabelecimentos ORDER BY id DESC LIMIT :estabelecimentos) novos
+    """,
+    """
+    CREATE TEMP TABLE plano_ids ON COMMIT DROP AS
+    SELECT array_agg(id ORDER BY n) AS ids FROM plano_estabs
+    """,
+    """
+    INSERT INTO servicos (nome, preco, duracao_minutos, is_active, estabelecimento_id)
+    SELECT 'Serviço ' || e.n, 100, 60, true, e.id FROM plano_estabs e
+    """,
+    """
+    INSERT INTO clientes (
+        nome, email, telefone, telefone_normalizado, cpf, data_aniversario, pontos, is_active,
+        last_visit, estabelecimento_id
+    )
+    SELECT 'Cliente ' || md5(g::text),
+           'cliente' || g || '@exemplo.com',
+           '(11) 9' || lpad((g % 100000000)::text, 8, '0'),
+           '119' || lpad((g % 100000000)::text, 8, '0'),
+           lpad(g::text, 11, '0'),
+           lpad((1 + g % 28)::text, 2, '0') || '/' || lpad((1 + g % 12)::text, 2, '0'),
+           0,
+           g % 10 <> 0,
+           CASE WHEN g % 7 = 0 THEN NULL ELSE now() - (g % 720) * interval '1 day' END,
+           -- Metade dos clientes no estabelecimento alvo (tenant grande)
+           (SELECT ids[CASE WHEN g % 2 = 0 THEN 1 ELSE 1 + g % :estabelecimentos END] FROM plano_ids)
+    FROM generate_series(1, :clientes) g
+    """,
+    """
+    INSERT INTO agendamentos (
+        data_agendamento, data_inicio, data_fim, status, valor_servico, valor_desconto,
+        valor_final, cliente_id, estabelecimento_id
+    )
+    SELECT now() - (g % 720) * interval '1 day',
+           now() - (g % 720) * interval '1 day',
+           now() - (g % 720) * interval '1 day' + interval '1 hour',
+           (ARRAY['AGENDADO', 'CONCLUIDO', 'CANCELADO', 'NAO_COMPARECEU'])[1 + g % 4]::statusagendamento,
+           100, 0, 100, c.id, c.estabelecimento_id
+    FROM generate_series(1, :agendamentos) g
+    JOIN LATERAL (
+        SELECT id, estabelecimento_id FROM clientes
+        WHERE id = (SELECT max(id) FROM clientes) - (g % :clientes)
+    ) c ON true
+    """,
+    """
+    INSERT INTO clientes_inatividade (cliente_id, estabelecimento_id, ultimo_agendamento)
+    SELECT c.id, c.estabelecimento_id, max(a.data_inicio)
+    FROM agendamentos a JOIN clientes c ON c.id = a.cliente_id
+    WHERE a.deleted_at IS NULL
+    GROUP BY c.id, c.estabelecimento_id
+    """,
+    """
+    INSERT INTO whatsapp_configs (
+        waha_url, waha_api_key, waha_session_name, ativado, enviar_reciclagem,
+        enviar_aniversario, meses_inatividade, estabelecimento_id
+    )
+    SELECT 'http://waha-' || (e.n % 5) || '.local', 'key', 'sessao_' || e.id, true, true, true, 3, e.id
+    FROM plano_estabs e
+    """,
+    """
+    INSERT INTO configuracao_fidelidade (reais_por_ponto, ativo, estabelecimento_id)
+    SELECT 10, true, e.id FROM plano_estabs e
+    """,
+    """
+    INSERT INTO whatsapp_messages (
+        message_id, session_name, from_number, to_number, from_me, body,
+        event_type, message_timestamp, estabelecimento_id
+    )
+    SELECT 'msg_' || g, 'sessao', '5511' || lpad((g % 50000)::text, 9, '0'), NULL, g % 2 = 0,
+           'Olá', 'message.any', now() - (g % 365) * interval '1 day',
+           (SELECT ids[1 + g % :estabelecimentos] FROM plano_ids)
+    FROM generate_series(1, :mensagens) g
+    """,
+]
+
+ANALYZE_TABLES = [
+    "estabelecimentos", "clientes", "agendamentos", "clientes_inatividade", "whatsapp_configs",
+    "whatsapp_messages", "configuracao_fidelidade"
+]
+
+
+def seed(conn, args) -> Dict[str, Any]:
+    """Popula o banco (dentro da transação) e retorna ids úteis para os casos"""
+    params = {
+        "estabelecimentos": args.estabelecimentos,
+        "clientes": args.clientes,
+        "agendamentos": args.agendamentos,
+        "mensagens": args.mensagens,
+    }
+    for statement in SEED_SQL:
+        conn.execute(text(statement), params)
+    # Amostra do ANALYZE cobrindo a tabela inteira (300 linhas por unidade, até
+    # 3M linhas): com a amostra aleatória padrão as estimativas de ILIKE/LIKE
+    # variavam entre execuções e o plano trocava de índice sem mudança de código
+    conn.execute(text("SET LOCAL default_statistics_target = 10000"))
+    for table in ANALYZE_TABLES:
+        conn.execute(text(f"ANALYZE {table}"))
+
+    estabelecimento_id = conn.execute(
+        text("SELECT id FROM plano_estabs WHERE n = :n"), {"n": ESTABELECIMENTO_ALVO}
+    ).scalar()
+    estabelecimento_pequeno_id = conn.execute(
+        text("SELECT id FROM plano_estabs WHERE n = :n"), {"n": ESTABELECIMENTO_PEQUENO}
+    ).scalar()
+    cliente_id = conn.execute(
+        text("SELECT max(id) FROM clientes WHERE estabelecimento_id = :e"), {"e": estabelecimento_id}
+    ).scalar()
+    session_name = conn.execute(
+        text("SELECT waha_session_name FROM whatsapp_configs WHERE estabelecimento_id = :e"),
+        {"e": estabelecimento_id}
+    ).scalar()
+    return {
+        "estabelecimento_id": estabelecimento_id,
+        "estabelecimento_pequeno_id": estabelecimento_pequeno_id,
+        "cliente_id": cliente_id,
+        "session_name": session_name,
+    }
+
+
+# ==================== Casos ====================
+#
+# Cada caso chama um método de consulta de service. Expectativas:
+# - indices: nomes de índices que precisam aparecer em algum nó do plano
+# - sem_seq_scan: tabelas grandes que não podem ter Seq Scan
+# - max_statements: limite de SELECTs executados (detecta N+1)
+# - max_ms: tempo máximo de execução no servidor, somando os SELECTs
+#   (EXPLAIN ANALYZE, melhor de 3 execuções)
+# - pendente: problema conhecido (reportado sem falhar a execução)
+
+HOJE = date.today()
+
+CASOS: List[Dict[str, Any]] = [
+    {
+        "nome": "clientes_get_cliente",
+        "executar": lambda db, ctx: ClienteService.get_cliente(db, ctx["cliente_id"]),
+        "sem_seq_scan": ["clientes"],
+    },
+    {
+        "nome": "clientes_listagem_por_nome",
+        "executar": lambda db, ctx: ClienteService.get_clientes(
+            db, ctx["estabelecimento_id"], nome="abc"
+        ),
+        "indices": ["ix_clientes_nome_trgm"],
+        "sem_seq_scan": ["clientes"],
+    },
+    {
+        "nome": "clientes_busca",
+        "executar": lambda db, ctx: ClienteService.search_clientes(
+            db, ctx["estabelecimento_id"], "11999"
+        ),
+        "indices": ["ix_clientes_telefone_normalizado_trgm"],
+        "sem_seq_scan": ["clientes"],
+        # Type-ahead no tenant grande (~50k clientes)
+        "max_ms": 20,
+    },
+    {
+        "nome": "clientes_historico_agendamentos",
+        "executar": lambda db, ctx: ClienteService.get_cliente_agendamentos(db, ctx["cliente_id"]),
+        "indices": ["ix_agendamentos_cliente_id_data_inicio"],
+        "sem_seq_scan": ["agendamentos"],
+    },
+    {
+        "nome": "clientes_listagem_por_recencia",
+        "executar": lambda db, ctx: ClienteService.get_clientes(
+            db, ctx["estabelecimento_id"], ordenar_por="last_visit",
+            ultima_visita_antes=HOJE - timedelta(days=90)
+        ),
+        "indices": ["ix_clientes_estabelecimento_last_visit"],
+        "sem_seq_scan": ["clientes"],
+    },
+    {
+        "nome": "agendamentos_por_periodo",
+        "executar": lambda db, ctx: AgendamentoService.get_agendamentos_by_estabelecimento(
+            db, ctx["estabelecimento_id"], data_inicio=HOJE - timedelta(days=7), data_fim=HOJE
+        ),
+        "sem_seq_scan": ["agendamentos"],
+        "pendente": "filtro func.date(... AT TIME ZONE ...) não é sargável",
+    },
+    {
+        "nome": "agendamentos_calendario",
+        "executar": lambda db, ctx: AgendamentoService.get_agendamentos_calendario(
+            db, ctx["estabelecimento_id"], HOJE - timedelta(days=7), HOJE
+        ),
+        "sem_seq_scan": ["agendamentos"],
+        "pendente": "filtro func.date(... AT TIME ZONE ...) não é sargável",
+    },
+    {
+        "nome": "relatorio_resumo_financeiro",
+        "executar": lambda db, ctx: RelatorioService.get_resumo_financeiro(
+            db, ctx["estabelecimento_id"], HOJE - timedelta(days=30), HOJE
+        ),
+        "sem_seq_scan": ["agendamentos"],
+        "pendente": "filtro func.date(func.timezone(...)) não é sargável",
+    },
+    {
+        "nome": "whatsapp_config_por_estabelecimento",
+        "executar": lambda db, ctx: WhatsAppService.get_config(db, ctx["estabelecimento_id"]),
+        "indices": ["whatsapp_configs_estabelecimento_id_key"],
+        "sem_seq_scan": ["whatsapp_configs"],
+    },
+    {
+        # Mesma consulta feita por waha_webhook.receive_waha_event
+        "nome": "whatsapp_config_por_sessao",
+        "executar": lambda db, ctx: db.query(WhatsAppConfig).filter(
+            WhatsAppConfig.waha_session_name == ctx["session_name"]
+        ).first(),
+        "indices": ["ix_whatsapp_configs_waha_session_name"],
+        "sem_seq_scan": ["whatsapp_configs"],
+    },
+    {
+        "nome": "whatsapp_clientes_inativos",
+        # No tenant grande a faixa é ~metade das tabelas e o Seq Scan é o plano
+        # certo; o índice importa nos tenants comuns
+        "executar": lambda db, ctx: WhatsAppService.get_clientes_inativos(
+            db, ctx["estabelecimento_pequeno_id"], meses_inatividade=3
+        ),
+        "indices": ["ix_clientes_inatividade_estabelecimento_ultimo"],
+        "sem_seq_scan": ["agendamentos", "clientes", "clientes_inatividade"],
+        "max_statements": 1,
+    },
+    {
+        "nome": "fidelidade_configuracao",
+        "executar": lambda db, ctx: FidelidadeService.get_configuracao(db, ctx["estabelecimento_id"]),
+        "indices": ["ix_configuracao_fidelidade_estabelecimento_id"],
+    },
+    {
+        "nome": "fidelidade_resgates_cliente",
+        "executar": lambda db, ctx: FidelidadeService.listar_resgates_cliente(db, ctx["cliente_id"]),
+        "indices": ["ix_resgates_premios_cliente_id"],
+    },
+]
+
+
+# ==================== Análise de planos ====================
+
+class StatementLimitExceeded(Exception):
+    """Caso interrompido por executar SELECTs demais (N+1 em dados grandes)"""
+
+
+def capture_statements(conn, func: Callable[[], Any]) -> List[Dict[str, Any]]:
+    """Executa func e retorna os SELECTs emitidos na conexão"""
+    captured = []
+
+    def before_cursor_execute(conn_, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            captured.append({"sql": statement, "params": parameters})
+            if len(captured) > LIMITE_STATEMENTS:
+                raise StatementLimitExceeded()
+
+    event.listen(conn, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    except StatementLimitExceeded:
+        pass
+    finally:
+        event.remove(conn, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+
+def explain(conn, statement: Dict[str, Any]) -> Dict[str, Any]:
+    """Roda EXPLAIN (FORMAT JSON) com os mesmos parâmetros do statement"""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + statement["sql"], statement["params"])
+        result = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]["Plan"]
+
+
+def execution_ms(conn, statement: Dict[str, Any], tentativas: int = 3) -> float:
+    """Melhor tempo de execução (ms) do statement via EXPLAIN ANALYZE"""
+    cursor = conn.connection.cursor()
+    tempos = []
+    try:
+        for _ in range(tentativas):
+            cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + statement["sql"], statement["params"])
+            result = cursor.fetchone()[0]
+            if isinstance(result, str):
+                result = json.loads(result)
+            tempos.append(result[0]["Execution Time"])
+    finally:
+        cursor.close()
+    return min(tempos)
+
+
+def plan_nodes(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lista achatada dos nós do plano (pré-ordem)"""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def plan_shape(plan: Dict[str, Any], depth: int = 0) -> List[str]:
+    """Formato estável do plano: tipo do nó, tabela e índice (sem custos)"""
+    label = plan["Node Type"]
+    if plan.get("Relation Name"):
+        label += f" on {plan['Relation Name']}"
+    if plan.get("Index Name"):
+        label += f" using {plan['Index Name']}"
+    lines = ["  " * depth + label]
+    for child in plan.get("Plans", []):
+        lines.extend(plan_shape(child, depth + 1))
+    return lines
+
+
+def check_case(conn, db: Session, ctx: Dict[str, Any], caso: Dict[str, Any]) -> Dict[str, Any]:
+    statements = capture_statements(conn, lambda: caso["executar"](db, ctx))
+
+    # Statements repetidos (N+1) são analisados uma vez só
+    distinct: Dict[str, Dict[str, Any]] = {}
+    executions: Dict[str, int] = {}
+    for st in statements:
+        distinct.setdefault(st["sql"], st)
+        executions[st["sql"]] = executions.get(st["sql"], 0) + 1
+    plans = [explain(conn, st) for st in distinct.values()]
+
+    shape = []
+    for i, (sql, plan) in enumerate(zip(distinct, plans)):
+        shape.append(f"-- statement {i + 1} (executado {executions[sql]}x)")
+        shape.extend(plan_shape(plan))
+
+    nodes = [node for plan in plans for node in plan_nodes(plan)]
+    used_indexes = {node["Index Name"] for node in nodes if node.get("Index Name")}
+    seq_scans = {node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"}
+
+    problemas = []
+    if not statements:
+        problemas.append("nenhum SELECT capturado")
+    for index in caso.get("indices", []):
+        if index not in used_indexes:
+            problemas.append(f"índice esperado não usado: {index}")
+    for table in caso.get("sem_seq_scan", []):
+        if table in seq_scans:
+            problemas.append(f"Seq Scan em {table}")
+    if len(statements) > LIMITE_STATEMENTS:
+        problemas.append(f"interrompido após {LIMITE_STATEMENTS} SELECTs")
+    elif "max_statements" in caso and len(statements) > caso["max_statements"]:
+        problemas.append(f"{len(statements)} SELECTs executados (máximo {caso['max_statements']})")
+
+    tempo_ms = None
+    if "max_ms" in caso and statements:
+        tempo_ms = sum(execution_ms(conn, st) * executions[sql] for sql, st in distinct.items())
+        if tempo_ms > caso["max_ms"]:
+            problemas.append(f"{tempo_ms:.1f} ms de execução (máximo {caso['max_ms']} ms)")
+
+    return {
+        "shape": shape, "problemas": problemas, "statements": list(distinct.values()), "tempo_ms": tempo_ms
+    }
+
+
+def snapshot_path(nome: str) -> Path:
+    return SNAPSHOT_DIR / f"{nome}.json"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Regressão de planos de execução (EXPLAIN)")
+    parser.add_argument("--database-url", default=os.getenv("QUERY_PLAN_DATABASE_URL"))
+    parser.add_argument("--update", action="store_true", help="Regrava os snapshots de plano")
+    parser.add_argument("--caso", action="append", help="Executa apenas os casos informados")
+    parser.add_argument("--verbose", action="store_true", help="Mostra SQL e plano de cada caso")
+    parser.add_argument("--estabelecimentos", type=int, default=2000)
+    parser.add_argument("--clientes", type=int, default=100_000)
+    parser.add_argument("--agendamentos", type=int, default=300_000)
+    parser.add_argument("--mensagens", type=int, default=200_000)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        print("Informe --database-url ou QUERY_PLAN_DATABASE_URL (banco de desenvolvimento migrado).")
+        return 2
+
+    casos = [c for c in CASOS if not args.caso or c["nome"] in args.caso]
+    SNAPSHOT_DIR.mkdir(exist_ok=True)
+
+    engine = create_engine(args.database_url)
+    falhas = 0
+
+    # O ROLLBACK da execução anterior deixa as tabelas cheias de linhas mortas
+    # até o autovacuum passar; o tamanho entra no custo e mudava o plano
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in ANALYZE_TABLES:
+            conn.execute(text(f"VACUUM {table}"))
+
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            print("Populando dados sintéticos...")
+            ctx = seed(conn, args)
+            db = Session(bind=conn, join_transaction_mode="create_savepoint")
+
+            for caso in casos:
+                resultado = check_case(conn, db, ctx, caso)
+                db.rollback()
+
+                path = snapshot_path(caso["nome"])
+                snapshot_diff = False
+                sem_snapshot = False
+                if args.update:
+                    path.write_text(json.dumps(resultado["shape"], indent=2, ensure_ascii=False) + "\n")
+                elif path.exists():
+                    snapshot_diff = json.loads(path.read_text()) != resultado["shape"]
+                else:
+                    # Caso sem snapshot não está protegido: exige --update
+                    sem_snapshot = True
+
+                # Snapshot diferente falha mesmo em caso pendente: o plano mudou
+                pendente = caso.get("pendente")
+                if snapshot_diff or sem_snapshot or (resultado["problemas"] and not pendente):
+                    status_caso = "FALHOU"
+                    falhas += 1
+                elif resultado["problemas"]:
+                    status_caso = "PENDENTE"
+                else:
+                    status_caso = "OK"
+
+                tempo = f" ({resultado['tempo_ms']:.1f} ms)" if resultado["tempo_ms"] is not None else ""
+                print(f"[{status_caso}] {caso['nome']}{tempo}")
+                for problema in resultado["problemas"]:
+                    print(f"    - {problema}")
+                if pendente and resultado["problemas"]:
+                    print(f"    (conhecido: {pendente})")
+                if snapshot_diff:
+                    print(f"    - plano diferente do snapshot {path.name} (use --update se esperado)")
+                if sem_snapshot:
+                    print(f"    - snapshot {path.name} não existe (gere com --update)")
+                if pendente and not resultado["problemas"]:
+                    print("    - marcado como pendente, mas já passa: remova o 'pendente'")
+                if args.verbose or snapshot_diff:
+                    for st in resultado["statements"]:
+                        print("    SQL: " + " ".join(st["sql"].split()))
+                    for line in resultado["shape"]:
+                        print("    " + line)
+        finally:
+            transaction.rollback()
+
+    print(f"\n{len(casos)} caso(s), {falhas} falha(s)")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
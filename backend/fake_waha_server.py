@@ -0,0 +1,412 @@
+"""
+Servidor WAHA falso para testes offline de throughput e falhas.
+
+Implementa os endpoints do WAHA usados por WAHAService e KeepAliveService:
+- GET    /api/sessions
+- POST   /api/sessions/start
+- POST   /api/sessions/stop
+- GET    /api/sessions/{session}
+- DELETE /api/sessions/{session}
+- GET    /api/{session}/auth/qr
+- GET    /api/server/status
+- POST   /api/sendText
+
+Após cada envio, dispara os webhooks `message.any` e `message.ack` para
+`{webhook_base}/waha-webhook/events/{session}` (ou para a URL registrada
+no start_session), simulando o fluxo real do WAHA.
+
+Latência, taxa de erro e cold start são configuráveis e determinísticos
+(seed fixa), permitindo benchmarks repetíveis.
+
+Uso:
+    python fake_waha_server.py --port 3001 --latency-ms 150 --error-rate 0.05 \\
+        --cold-start-s 20 --hibernate-after-s 900 --webhook-base http://localhost:8000
+
+Depois aponte `waha_url` da WhatsAppConfig para http://localhost:3001.
+
+Endpoints auxiliares (não existem no WAHA real):
+- GET  /fake/stats   contadores de requisições, erros e webhooks
+- POST /fake/config  altera latência/erros em tempo de execução
+- POST /fake/reset   zera contadores e sessões
+- POST /fake/inbound simula mensagem recebida de um cliente
+"""
+import argparse
+import asyncio
+import base64
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import Response
+
+# PNG 1x1 transparente (suficiente para o frontend renderizar o "QR Code")
+QR_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+# Sequência de acks emitida após cada envio: 2=server, 3=delivery, 4=read
+ACK_SEQUENCE = [2, 3, 4]
+
+
+class FakeWAHAState:
+    """Estado mutável do servidor falso (sessões, configuração e contadores)"""
+
+    def __init__(
+        self,
+        api_key: str,
+        latency_ms: float,
+        latency_jitter_ms: float,
+        error_rate: float,
+        timeout_rate: float,
+        cold_start_s: float,
+        hibernate_after_s: float,
+        webhook_base: Optional[str],
+        ack_delay_ms: float,
+        seed: int
+    ):
+        self.api_key = api_key
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.cold_start_s = cold_start_s
+        self.hibernate_after_s = hibernate_after_s
+        self.webhook_base = webhook_base.rstrip('/') if webhook_base else None
+        self.ack_delay_ms = ack_delay_ms
+        self.seed = seed
+        self.reset()
+
+    def reset(self) -> None:
+        self.rng = random.Random(self.seed)
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.last_request_at: Optional[float] = None
+        self.stats = {
+            'requests': 0,
+            'send_text': 0,
+            'send_text_ok': 0,
+            'errors_injected': 0,
+            'timeouts_injected': 0,
+            'cold_starts': 0,
+            'webhooks_sent': 0,
+            'webhooks_failed': 0
+        }
+
+    def webhook_url_for(self, session_name: str) -> Optional[str]:
+        """URL de webhook registrada na sessão ou derivada de --webhook-base"""
+        session = self.sessions.get(session_name) or {}
+        if session.get('webhook_url'):
+            return session['webhook_url']
+        if self.webhook_base:
+            return f"{self.webhook_base}/waha-webhook/events/{session_name}"
+        return None
+
+
+def create_app(state: FakeWAHAState) -> FastAPI:
+    """Cria a aplicação FastAPI do WAHA falso"""
+    app = FastAPI(title="Fake WAHA", version="0.1.0")
+    app.state.fake = state
+    background_tasks: set = set()
+    http_client: Dict[str, httpx.AsyncClient] = {}
+
+    async def simulate_io(check_errors: bool = True) -> None:
+        """Aplica cold start, latência e falhas configuradas"""
+        state.stats['requests'] += 1
+        now = time.monotonic()
+
+        # Cold start: instância "hibernada" demora para responder a 1ª requisição
+        hibernating = (
+            state.last_request_at is None
+            or now - state.last_request_at > state.hibernate_after_s
+        )
+        state.last_request_at = now
+        if hibernating and state.cold_start_s > 0:
+            state.stats['cold_starts'] += 1
+            await asyncio.sleep(state.cold_start_s)
+
+        latency = state.latency_ms + state.rng.uniform(0, state.latency_jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+        if not check_errors:
+            return
+
+        roll = state.rng.random()
+        if roll < state.timeout_rate:
+            state.stats['timeouts_injected'] += 1
+            # Segura a conexão por tempo suficiente para estourar o timeout do cliente
+            await asyncio.sleep(3600)
+        if roll < state.timeout_rate + state.error_rate:
+            state.stats['errors_injected'] += 1
+            raise HTTPException(status_code=500, detail="Fake WAHA: erro injetado")
+
+    def check_api_key(x_api_key: Optional[str]) -> None:
+        if state.api_key and x_api_key != state.api_key:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+
+    def session_or_404(session_name: str) -> Dict[str, Any]:
+        session = state.sessions.get(session_name)
+        if not session:
+            raise HTTPException(status_code=404, detail=f"Session '{session_name}' not found")
+        return session
+
+    async def post_webhook(url: str, event: Dict[str, Any]) -> None:
+        # Cliente compartilhado: criar um AsyncClient por webhook bloqueia o event loop
+        if 'client' not in http_client:
+            http_client['client'] = httpx.AsyncClient(timeout=10)
+        try:
+            response = await http_client['client'].post(url, json=event)
+            if response.status_code < 400:
+                state.stats['webhooks_sent'] += 1
+            else:
+                state.stats['webhooks_failed'] += 1
+        except httpx.HTTPError:
+            state.stats['webhooks_failed'] += 1
+
+    def fire_and_forget(coro) -> None:
+        task = asyncio.create_task(coro)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    def build_event(event: str, session_name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "event": event,
+            "session": session_name,
+            "payload": payload,
+            "environment": {"tier": "FAKE", "version": "fake"},
+            "engine": "NOWEB"
+        }
+
+    async def emit_message_events(session_name: str, message: Dict[str, Any]) -> None:
+        """Emite message.any seguido da sequência de acks, como o WAHA real"""
+        url = state.webhook_url_for(session_name)
+        if not url:
+            return
+
+        await post_webhook(url, build_event("message.any", session_name, message))
+
+        for ack in ACK_SEQUENCE:
+            await asyncio.sleep(state.ack_delay_ms / 1000)
+            ack_payload = {
+                "id": message["id"],
+                "from": message["from"],
+                "to": message["to"],
+                "fromMe": message["fromMe"],
+                "ack": ack
+            }
+            await post_webhook(url, build_event("message.ack", session_name, ack_payload))
+
+    def emit_session_status(session_name: str) -> None:
+        url = state.webhook_url_for(session_name)
+        if not url:
+            return
+        session = state.sessions[session_name]
+        payload = {"name": session_name, "status": session["status"]}
+        fire_and_forget(post_webhook(url, build_event("session.status", session_name, payload)))
+
+    # ==================== Sessões ====================
+
+    @app.get("/api/sessions")
+    async def list_sessions(x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        await simulate_io(check_errors=False)
+        return [
+            {"name": name, "status": session["status"], "me": session.get("me")}
+            for name, session in state.sessions.items()
+        ]
+
+    @app.post("/api/sessions/start")
+    async def start_session(request: Request, x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        await simulate_io()
+        body = await request.json()
+        name = body.get("name") or "default"
+
+        if name in state.sessions and state.sessions[name]["status"] == "WORKING":
+            raise HTTPException(status_code=422, detail=f"Session '{name}' is already started")
+
+        webhooks = (body.get("config") or {}).get("webhooks") or []
+        state.sessions[name] = {
+            "status": "WORKING",
+            "me": {"id": "5511900000000@c.us", "pushName": "Fake WAHA"},
+            "webhook_url": webhooks[0].get("url") if webhooks else None
+        }
+        emit_session_status(name)
+        return {"name": name, "status": "WORKING"}
+
+    @app.post("/api/sessions/stop")
+    async def stop_session(request: Request, x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        await simulate_io()
+        body = await request.json()
+        session = session_or_404(body.get("name") or "default")
+        session["status"] = "STOPPED"
+        emit_session_status(body.get("name") or "default")
+        return {"name": body.get("name"), "status": "STOPPED"}
+
+    @app.get("/api/sessions/{session_name}")
+    async def get_session(session_name: str, x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        await simulate_io()
+        session = session_or_404(session_name)
+        return {"name": session_name, "status": session["status"], "me": session.get("me")}
+
+    @app.delete("/api/sessions/{session_name}")
+    async def delete_session(session_name: str, x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        await simulate_io()
+        session_or_404(session_name)
+        del state.sessions[session_name]
+        return {"success": True}
+
+    @app.get("/api/{session_name}/auth/qr")
+    async def get_qr(session_name: str, x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        await simulate_io()
+        session_or_404(session_name)
+        return Response(content=QR_PNG, media_type="image/png")
+
+    @app.get("/api/server/status")
+    async def server_status(x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        await simulate_io(check_errors=False)
+        return {"status": "ok", "sessions": len(state.sessions)}
+
+    # ==================== Mensagens ====================
+
+    @app.post("/api/sendText")
+    async def send_text(request: Request, x_api_key: Optional[str] = Header(None, alias="X-Api-Key")):
+        check_api_key(x_api_key)
+        state.stats['send_text'] += 1
+        await simulate_io()
+
+        body = await request.json()
+        session_name = body.get("session") or "default"
+        session = session_or_404(session_name)
+        if session["status"] != "WORKING":
+            raise HTTPException(status_code=422, detail=f"Session '{session_name}' is not WORKING")
+
+        message_id = f"true_{body.get('chatId')}_{uuid.UUID(int=state.rng.getrandbits(128)).hex[:20].upper()}"
+        timestamp = int(time.time())
+        message = {
+            "id": message_id,
+            "timestamp": timestamp,
+            "from": session["me"]["id"],
+            "to": body.get("chatId"),
+            "fromMe": True,
+            "body": body.get("text"),
+            "hasMedia": False
+        }
+
+        state.stats['send_text_ok'] += 1
+        fire_and_forget(emit_message_events(session_name, message))
+
+        return {
+            "id": message_id,
+            "key": {"remoteJid": body.get("chatId"), "fromMe": True, "id": message_id},
+            "timestamp": timestamp,
+            "status": "PENDING"
+        }
+
+    # ==================== Controle do servidor falso ====================
+
+    @app.get("/fake/stats")
+    async def fake_stats():
+        return {
+            "stats": state.stats,
+            "sessions": {name: s["status"] for name, s in state.sessions.items()},
+            "pending_webhook_tasks": len(background_tasks)
+        }
+
+    @app.post("/fake/config")
+    async def fake_config(request: Request):
+        body = await request.json()
+        for field in (
+            "latency_ms", "latency_jitter_ms", "error_rate", "timeout_rate",
+            "cold_start_s", "hibernate_after_s", "ack_delay_ms"
+        ):
+            if field in body:
+                setattr(state, field, float(body[field]))
+        if "webhook_base" in body:
+            state.webhook_base = body["webhook_base"].rstrip('/') if body["webhook_base"] else None
+        if "session_status" in body:
+            # Permite simular desconexão: {"session_status": {"default": "FAILED"}}
+            for name, status in body["session_status"].items():
+                session_or_404(name)["status"] = status
+                emit_session_status(name)
+        return {"success": True}
+
+    @app.post("/fake/reset")
+    async def fake_reset():
+        state.reset()
+        return {"success": True}
+
+    @app.post("/fake/inbound")
+    async def fake_inbound(request: Request):
+        """Simula mensagem recebida: {"session": "default", "from": "5511999999999", "body": "Oi"}"""
+        body = await request.json()
+        session_name = body.get("session") or "default"
+        session = session_or_404(session_name)
+        url = state.webhook_url_for(session_name)
+        if not url:
+            raise HTTPException(status_code=400, detail="Nenhuma URL de webhook configurada")
+
+        message = {
+            "id": f"false_{body.get('from')}@c.us_{uuid.uuid4().hex[:20].upper()}",
+            "timestamp": int(time.time()),
+            "from": f"{body.get('from')}@c.us",
+            "to": session["me"]["id"],
+            "fromMe": False,
+            "body": body.get("body", ""),
+            "hasMedia": False
+        }
+        await post_webhook(url, build_event("message.any", session_name, message))
+        return {"success": True, "message_id": message["id"]}
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Servidor WAHA falso para testes offline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--api-key", default="fake-waha-key", help="X-Api-Key esperada (vazio = não valida)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latência base por requisição")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0, help="Jitter uniforme somado à latência")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fração de requisições com HTTP 500")
+    parser.add_argument("--timeout-rate", type=float, default=0, help="Fração de requisições que nunca respondem")
+    parser.add_argument("--cold-start-s", type=float, default=0, help="Atraso da 1ª requisição após hibernar")
+    parser.add_argument("--hibernate-after-s", type=float, default=900, help="Inatividade até hibernar (Render: 15 min)")
+    parser.add_argument("--ack-delay-ms", type=float, default=50, help="Intervalo entre message.any e cada ack")
+    parser.add_argument("--webhook-base", default=None, help="URL do backend (ex: http://localhost:8000)")
+    parser.add_argument("--session", action="append", default=[], help="Sessão pré-iniciada (WORKING)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed para latência/erros determinísticos")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    fake_state = FakeWAHAState(
+        api_key=args.api_key,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        cold_start_s=args.cold_start_s,
+        hibernate_after_s=args.hibernate_after_s,
+        webhook_base=args.webhook_base,
+        ack_delay_ms=args.ack_delay_ms,
+        seed=args.seed
+    )
+    for name in args.session:
+        fake_state.sessions[name] = {
+            "status": "WORKING",
+            "me": {"id": "5511900000000@c.us", "pushName": "Fake WAHA"},
+            "webhook_url": None
+        }
+
+    uvicorn.run(create_app(fake_state), host=args.host, port=args.port, log_level="warning")
@@ -9,6 +9,15 @@ from app.config import settings
 from app.database import engine, Base, SessionLocal
 from app.services.keepalive_service import KeepAliveService
 from app.services.whatsapp_service import WhatsAppService
+from app.services.inatividade_service import InatividadeService
+from app.services.webhook_ingestao_service import WebhookIngestaoService
+from app.services.whatsapp_particoes_service import WhatsAppParticoesService
+from app.services.whatsapp_fila_envio import FilaEnvioWhatsApp
+from app.services.whatsapp_agendador import WhatsAppAgendador
+from app.services.fidelidade_service import FidelidadeService
+from app.services.fidelidade_recalculo import RecalculoFidelidade
+from app.services.resgate_expiracao import ExpiracaoResgates
+from app.utils.bulkhead import Bulkhead
 
 # Scheduler global para keep-alive e aniversários
 scheduler = BackgroundScheduler()
@@ -38,6 +47,56 @@ def scheduled_aniversarios():
         db.close()
 
 
+def scheduled_inatividade_refresh():
+    """Job agendado para recalcular o índice de clientes inativos (reciclagem)"""
+    db = SessionLocal()
+    try:
+        stats = InatividadeService.refresh(db)
+        print(f"[SCHEDULER] Índice de inatividade atualizado: {stats}")
+    except Exception as e:
+        print(f"[SCHEDULER] Erro ao atualizar índice de inatividade: {str(e)}")
+    finally:
+        db.close()
+
+
+def scheduled_whatsapp_particoes():
+    """Job agendado para criar as próximas partições de mensagens e aplicar a retenção"""
+    db = SessionLocal()
+    try:
+        criadas = WhatsAppParticoesService.garantir_particoes(db)
+        stats = WhatsAppParticoesService.aplicar_retencao(db)
+        print(f"[SCHEDULER] Partições de mensagens: criadas={criadas} retenção={stats}")
+    except Exception as e:
+        print(f"[SCHEDULER] Erro na manutenção das partições de mensagens: {str(e)}")
+    finally:
+        db.close()
+
+
+def scheduled_fidelidade_reconciliacao():
+    """Job agendado para conferir o saldo de pontos dos clientes com o extrato"""
+    db = SessionLocal()
+    try:
+        divergentes = FidelidadeService.reconciliar_saldos(db)
+        print(f"[SCHEDULER] Reconciliação de pontos: {len(divergentes)} clientes com saldo divergente")
+    except Exception as e:
+        print(f"[SCHEDULER] Erro na reconciliação de pontos: {str(e)}")
+    finally:
+        db.close()
+
+
+def scheduled_resgates_expiracao():
+    """Job agendado para expirar resgates vencidos e avisar os que estão para vencer"""
+    db = SessionLocal()
+    try:
+        stats = ExpiracaoResgates.processar(db)
+        if stats["expirados"] or stats["avisados"]:
+            print(f"[SCHEDULER] Expiração de resgates: {stats}")
+    except Exception as e:
+        print(f"[SCHEDULER] Erro na expiração de resgates: {str(e)}")
+    finally:
+        db.close()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gerencia ciclo de vida da aplicação"""
@@ -66,9 +125,67 @@ async def lifespan(app: FastAPI):
     )
     print("[STARTUP] Scheduler de aniversarios configurado (diariamente as 09:00 BRT)")
 
+    # Job 3: Índice de clientes inativos (diariamente às 2h - antes do cron de reciclagem)
+    scheduler.add_job(
+        scheduled_inatividade_refresh,
+        'cron',
+        hour=2,
+        minute=0,
+        timezone='America/Sao_Paulo',
+        id='inatividade_refresh',
+        replace_existing=True
+    )
+    print("[STARTUP] Scheduler do indice de inatividade configurado (diariamente as 02:00 BRT)")
+
+    # Job 4: Partições e retenção das mensagens do webhook (diariamente às 3h)
+    scheduler.add_job(
+        scheduled_whatsapp_particoes,
+        'cron',
+        hour=3,
+        minute=0,
+        timezone='America/Sao_Paulo',
+        id='whatsapp_particoes',
+        replace_existing=True
+    )
+    print("[STARTUP] Scheduler de particoes de mensagens configurado (diariamente as 03:00 BRT)")
+
+    # Job 5: Reconciliação do saldo de pontos com o extrato (diariamente às 4h)
+    scheduler.add_job(
+        scheduled_fidelidade_reconciliacao,
+        'cron',
+        hour=4,
+        minute=0,
+        timezone='America/Sao_Paulo',
+        id='fidelidade_reconciliacao',
+        replace_existing=True
+    )
+    print("[STARTUP] Scheduler de reconciliacao de pontos configurado (diariamente as 04:00 BRT)")
+
+    # Job 6: Expiração e aviso de expiração dos resgates de prêmios (a cada 15 minutos)
+    scheduler.add_job(
+        scheduled_resgates_expiracao,
+        'interval',
+        minutes=15,
+        id='resgates_expiracao',
+        replace_existing=True
+    )
+    print("[STARTUP] Scheduler de expiracao de resgates configurado (a cada 15 minutos)")
+
     scheduler.start()
     print("[STARTUP] Schedulers iniciados com sucesso!")
 
+    # Gravador em lote dos eventos do webhook WAHA
+    WebhookIngestaoService.iniciar()
+    print("[STARTUP] Gravador de eventos do webhook iniciado")
+
+    # Fila de envio WhatsApp (limite por sessão e prioridade por tipo)
+    FilaEnvioWhatsApp.iniciar()
+    print("[STARTUP] Fila de envio WhatsApp iniciada")
+
+    # Envios programados (lembrete e pós-atendimento) no horário exato
+    WhatsAppAgendador.iniciar()
+    print("[STARTUP] Agendador de envios WhatsApp iniciado")
+
     yield  # Aplicação rodando
 
     # Shutdown: Parar scheduler
@@ -76,6 +193,25 @@ async def lifespan(app: FastAPI):
     scheduler.shutdown()
     print("[SHUTDOWN] Schedulers parados")
 
+    # Programadas ainda não vencidas continuam pendentes no banco
+    WhatsAppAgendador.parar()
+    print(f"[SHUTDOWN] Agendador de envios WhatsApp parado: {WhatsAppAgendador.stats()}")
+
+    # Recálculos de pontos param no fim do lote atual (rodar de novo continua de onde parou)
+    RecalculoFidelidade.parar()
+
+    # Requests de integração em andamento terminam antes da fila de envio parar
+    Bulkhead.encerrar_todos()
+    print(f"[SHUTDOWN] Bulkheads encerrados: {Bulkhead.stats_todos()}")
+
+    # Envia as mensagens ainda na fila antes de encerrar
+    FilaEnvioWhatsApp.parar()
+    print(f"[SHUTDOWN] Fila de envio WhatsApp parada: {FilaEnvioWhatsApp.stats()['faixas']}")
+
+    # Grava os eventos ainda na fila antes de encerrar
+    WebhookIngestaoService.parar()
+    print(f"[SHUTDOWN] Gravador de eventos do webhook parado: {WebhookIngestaoService.stats()}")
+
 app = FastAPI(
     title="Agenda OnSell API",
     description="Sistema de agendamento empresarial para prestadores de serviços",
@@ -0,0 +1,35 @@
+"""
+Confere o saldo de pontos de fidelidade dos clientes (clientes.pontos) com a
+soma do extrato (transacoes_pontos) e, opcionalmente, corrige o saldo para o
+valor do extrato.
+
+Uso:
+    python reconciliar_pontos.py                        # só lista os divergentes
+    python reconciliar_pontos.py --estabelecimento-id 3
+    python reconciliar_pontos.py --corrigir
+"""
+import argparse
+
+from app.database import SessionLocal
+from app.services.fidelidade_service import FidelidadeService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconciliação do saldo de pontos com o extrato")
+    parser.add_argument("--estabelecimento-id", type=int, default=None)
+    parser.add_argument("--corrigir", action="store_true", help="Ajusta o saldo para a soma do extrato")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        divergentes = FidelidadeService.reconciliar_saldos(
+            db, estabelecimento_id=args.estabelecimento_id, corrigir=args.corrigir
+        )
+        corrigidos = sum(1 for d in divergentes if d.get("corrigido"))
+        print(f"{len(divergentes)} clientes com saldo divergente" + (f", {corrigidos} corrigidos" if args.corrigir else ""))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Teste da timing wheel (app/utils/timing_wheel.py): com prazos aleatórios,
+nenhum item dispara antes do prazo nem depois do tick em que vence.
+
+Uso:
+    python -m pytest test_timing_wheel.py
+    python test_timing_wheel.py
+"""
+import math
+import random
+
+from app.utils.timing_wheel import RodaTemporal
+
+
+def _simular(semente: int, itens: int = 3000, passo_max: float = 90.0) -> None:
+    rng = random.Random(semente)
+    agora = 1_065_000.0 + rng.random() * 3600
+    roda = RodaTemporal(agora)
+    prazos = {}
+
+    for chave in range(itens):
+        prazo = agora + rng.random() * (roda.alcance - agora)
+        # Prazos na fronteira de uma volta de cada nível (caso do off-by-one)
+        if chave % 4 == 0:
+            prazo = math.floor(agora) + rng.choice((60, 3600, 60 * 3600)) + rng.random()
+            prazo = min(prazo, roda.alcance)
+        assert roda.adicionar(chave, prazo), f"prazo {prazo} dentro do alcance {roda.alcance} recusado"
+        prazos[chave] = prazo
+
+    removidas = set(rng.sample(sorted(prazos), itens // 10))
+    for chave in removidas:
+        assert roda.remover(chave)
+
+    disparadas = set()
+    while len(roda):
+        agora += rng.random() * passo_max
+        for chave in roda.avancar(agora):
+            assert chave not in removidas, f"item removido {chave} disparou"
+            assert prazos[chave] <= agora, f"item {chave} com prazo {prazos[chave]} disparou antes, em {agora}"
+            # Disparo no primeiro avanço que alcança o tick do prazo
+            assert math.ceil(prazos[chave]) > agora - passo_max - 1, f"item {chave} disparou atrasado"
+            disparadas.add(chave)
+
+    assert disparadas == set(prazos) - removidas
+
+
+def test_nada_dispara_antes_do_prazo():
+    for semente in range(20):
+        _simular(semente)
+
+
+def test_avanco_por_tick():
+    # Avanços menores que um tick: cada slot é visitado um a um
+    for semente in range(3):
+        _simular(100 + semente, itens=500, passo_max=1.5)
+
+
+if __name__ == "__main__":
+    test_nada_dispara_antes_do_prazo()
+    test_avanco_por_tick()
+    print("ok")
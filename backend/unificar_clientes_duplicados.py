@@ -0,0 +1,159 @@
+"""
+Unifica clientes duplicados no mesmo estabelecimento (mesmo telefone
+normalizado, CPF ou email), que impedem a migration a4e8f2b6c913 de criar os
+índices únicos. Telefones que diferem só na formatação ("(11) 99999-0000" e
+"11999990000") contam como o mesmo.
+
+Em cada grupo, o cadastro mais antigo (menor id) é mantido: recebe os campos
+vazios dos demais, a soma dos pontos e todas as linhas que apontam para os
+duplicados (agendamentos, resgates...; as tabelas são lidas das foreign keys
+do banco, então funciona em qualquer revisão). Linhas que violariam um índice
+único da tabela filha (mesma chave já existente no cliente mantido) são
+descartadas. Os duplicados são excluídos. Um commit por grupo.
+
+As estatísticas desnormalizadas (se já existirem) devem ser recalculadas
+depois com backfill_cliente_stats.py.
+
+Uso:
+    python unificar_clientes_duplicados.py                        # só lista os grupos
+    python unificar_clientes_duplicados.py --estabelecimento-id 3
+    python unificar_clientes_duplicados.py --aplicar
+"""
+import argparse
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+
+# Mesmas chaves dos índices únicos da migration a4e8f2b6c913
+CHAVES = ['telefone_normalizado', 'cpf', 'email']
+
+# Colunas do cliente que não são copiadas do duplicado
+COLUNAS_FIXAS = {'id', 'estabelecimento_id', 'created_at', 'pontos'}
+
+
+def grupos_duplicados(db: Session, coluna: str, estabelecimento_id=None) -> List[Tuple]:
+    return db.execute(text(f"""
+        SELECT estabelecimento_id, {coluna} AS valor, array_agg(id ORDER BY id) AS ids
+        FROM clientes
+        WHERE {coluna} IS NOT NULL AND {coluna} <> ''
+          AND (CAST(:estabelecimento_id AS integer) IS NULL OR estabelecimento_id = :estabelecimento_id)
+        GROUP BY estabelecimento_id, {coluna}
+        HAVING count(*) > 1
+        ORDER BY estabelecimento_id, {coluna}
+    """), {"estabelecimento_id": estabelecimento_id}).all()
+
+
+def referencias(db: Session) -> List[Tuple[str, str, List[List[str]]]]:
+    """(tabela, coluna, índices únicos com a coluna) de cada FK para clientes.id"""
+    fks = db.execute(text("""
+        SELECT c.conrelid::regclass::text AS tabela, a.attname AS coluna, a.attnum
+        FROM pg_constraint c
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+        WHERE c.contype = 'f' AND c.confrelid = 'clientes'::regclass
+          AND array_length(c.conkey, 1) = 1 AND c.conrelid <> 'clientes'::regclass
+        ORDER BY 1
+    """)).all()
+
+    resultado = []
+    for fk in fks:
+        unicos = db.execute(text("""
+            SELECT array_agg(a.attname::text ORDER BY a.attnum)
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = CAST(:tabela AS regclass) AND i.indisunique
+              AND CAST(:attnum AS smallint) = ANY(i.indkey)
+            GROUP BY i.indexrelid
+        """), {"tabela": fk.tabela, "attnum": fk.attnum}).scalars().all()
+        resultado.append((fk.tabela, fk.coluna, unicos))
+    return resultado
+
+
+def colunas_copiaveis(db: Session) -> Dict[str, bool]:
+    """Colunas do cliente preenchidas a partir do duplicado (nome -> é texto)"""
+    linhas = db.execute(text("""
+        SELECT column_name, data_type IN ('character varying', 'text') AS texto
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'clientes' AND is_generated = 'NEVER'
+    """)).all()
+    return {linha.column_name: linha.texto for linha in linhas if linha.column_name not in COLUNAS_FIXAS}
+
+
+def unificar(db: Session, manter: int, duplicado: int, refs, colunas: Dict[str, bool]) -> None:
+    # 1. Linhas das tabelas filhas passam para o mantido
+    for tabela, coluna, unicos in refs:
+        for colunas_indice in unicos:
+            iguais = " AND ".join(
+                f"k.{c} IS NOT DISTINCT FROM d.{c}" for c in colunas_indice if c != coluna
+            ) or "true"
+            db.execute(text(f"""
+                DELETE FROM {tabela} d
+                WHERE d.{coluna} = :duplicado
+                  AND EXISTS (SELECT 1 FROM {tabela} k WHERE k.{coluna} = :manter AND {iguais})
+            """), {"manter": manter, "duplicado": duplicado})
+        db.execute(
+            text(f"UPDATE {tabela} SET {coluna} = :manter WHERE {coluna} = :duplicado"),
+            {"manter": manter, "duplicado": duplicado}
+        )
+
+    # 2. Duplicado sai; campos vazios do mantido vêm dele e os pontos somam.
+    # Excluído no mesmo comando para o email/CPF copiado não colidir com ele
+    # nos índices únicos (banco já migrado).
+    atribuicoes = [
+        f"{coluna} = coalesce(nullif(m.{coluna}, ''), d.{coluna})" if texto
+        else f"{coluna} = coalesce(m.{coluna}, d.{coluna})"
+        for coluna, texto in colunas.items()
+    ]
+    atribuicoes.append("pontos = coalesce(m.pontos, 0) + coalesce(d.pontos, 0)")
+    db.execute(text(f"""
+        WITH d AS (DELETE FROM clientes WHERE id = :duplicado RETURNING *)
+        UPDATE clientes m SET {', '.join(atribuicoes)}
+        FROM d
+        WHERE m.id = :manter
+    """), {"manter": manter, "duplicado": duplicado})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Unificação de clientes duplicados por estabelecimento")
+    parser.add_argument("--estabelecimento-id", type=int, default=None)
+    parser.add_argument("--aplicar", action="store_true", help="Unifica os grupos (sem isso, só lista)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        refs = referencias(db) if args.aplicar else []
+        colunas = colunas_copiaveis(db) if args.aplicar else {}
+        total_grupos = total_excluidos = 0
+
+        # Uma chave por vez: unificar por telefone pode resolver os de email/CPF
+        for chave in CHAVES:
+            for grupo in grupos_duplicados(db, chave, args.estabelecimento_id):
+                manter, duplicados = grupo.ids[0], grupo.ids[1:]
+                print(
+                    f"Estabelecimento {grupo.estabelecimento_id}, {chave}={grupo.valor}: "
+                    f"mantém {manter}, {'unifica' if args.aplicar else 'duplicados'} {duplicados}"
+                )
+                total_grupos += 1
+                if not args.aplicar:
+                    continue
+                try:
+                    for duplicado in duplicados:
+                        unificar(db, manter, duplicado, refs, colunas)
+                    db.commit()
+                    total_excluidos += len(duplicados)
+                except Exception as e:
+                    db.rollback()
+                    print(f"  Erro, grupo não alterado: {str(e)}")
+
+        if args.aplicar:
+            print(f"{total_grupos} grupos, {total_excluidos} clientes unificados")
+        else:
+            print(f"{total_grupos} grupos de clientes duplicados (use --aplicar para unificar)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()